@@ -1,35 +1,31 @@
 import streamlit as st
 import fitz  # PyMuPDF
-import pandas as pd
-import google.generativeai as genai
-from PIL import Image
-import io
-import json
 import time
 import asyncio
-from collections import deque
-import tempfile
-import os
 import logging
-import re
-from reportlab.lib import colors
-from reportlab.lib.pagesizes import A4, landscape
-from reportlab.platypus import SimpleDocTemplate, Table, TableStyle, Paragraph, Spacer, PageBreak
-from reportlab.lib.styles import getSampleStyleSheet, ParagraphStyle
-from reportlab.lib.units import cm
-from reportlab.lib.enums import TA_CENTER, TA_LEFT
-from datetime import datetime
-
-try:
-    import ezdxf
-    from ezdxf.addons.drawing import RenderContext, Frontend
-    from ezdxf.addons.drawing.matplotlib import MatplotlibBackend
-    import matplotlib
-    matplotlib.use('Agg')  # Backend sem GUI
-    import matplotlib.pyplot as plt
-    DWG_SUPPORT = True
-except ImportError:
-    DWG_SUPPORT = False
+import numpy as np
+from concurrent.futures import ThreadPoolExecutor
+from streamlit.runtime.media_file_manager import MediaFileManager
+from streamlit.runtime.scriptrunner import add_script_run_ctx, get_script_run_ctx
+
+from jsj_core import (
+    DWG_SUPPORT,
+    GEMINI_MODELS,
+    cleanup_temp_files,
+    export_file_basename,
+    CROP_PRESETS,
+    get_crop_box,
+    iter_file_tasks,
+    process_tasks,
+)
+from jsj_cache import get_result_cache
+from jsj_ratelimit import create_rate_limiter
+from jsj_export import get_export_cache
+from jsj_masterlist import latest_revision
+from jsj_store import DEFAULT_PROJECT, get_project_store
+from jsj_imageprep import COLOR_MODES, DEFAULT_PIXEL_BUDGET_MP, IMAGE_FORMATS, image_options
+from jsj_raster import DEFAULT_RASTER_WORKERS, MAX_RASTER_WORKERS, create_raster_pool, render_pdf_page
+from jsj_validation import AVISO, ERRO, OK, describe_issues, validate_records, validation_status
 
 # --- CONFIGURAÇÃO DE LOGGING ---
 logging.basicConfig(
@@ -42,91 +38,6 @@ logging.basicConfig(
 )
 logger = logging.getLogger(__name__)
 
-# --- FUNÇÃO DE VALIDAÇÃO DE DADOS ---
-def validate_extracted_data(data, filename=""):
-    """Valida dados extraídos pela IA para garantir integridade.
-
-    Retorna: (is_valid: bool, errors: list, warnings: list)
-    """
-    errors = []
-    warnings = []
-
-    # 1. Validar número de desenho (obrigatório e não vazio)
-    num_desenho = data.get('num_desenho', '').strip()
-    if not num_desenho or num_desenho == 'ERRO':
-        errors.append("Número de desenho vazio ou inválido")
-    elif len(num_desenho) < 3:
-        warnings.append(f"Número de desenho muito curto: '{num_desenho}'")
-
-    # 2. Validar data (formato DD/MM/YYYY ou variações comuns)
-    data_str = data.get('data', '').strip()
-    if data_str:
-        # Aceitar formatos: DD/MM/YYYY, DD-MM-YYYY, DD.MM.YYYY
-        date_patterns = [
-            r'^\d{2}[/\-\.]\d{2}[/\-\.]\d{4}$',  # DD/MM/YYYY
-            r'^\d{1}[/\-\.]\d{2}[/\-\.]\d{4}$',  # D/MM/YYYY
-            r'^\d{2}[/\-\.]\d{1}[/\-\.]\d{4}$',  # DD/M/YYYY
-        ]
-
-        if not any(re.match(pattern, data_str) for pattern in date_patterns):
-            # Verificar se não é placeholder comum
-            if data_str.lower() in ['n/d', 'n/a', '?', '??/??/????', 'ilegível']:
-                warnings.append(f"Data ilegível ou não disponível: '{data_str}'")
-            else:
-                errors.append(f"Formato de data inválido: '{data_str}' (esperado DD/MM/YYYY)")
-        else:
-            # Validar valores numéricos
-            parts = re.split(r'[/\-\.]', data_str)
-            if len(parts) == 3:
-                dia, mes, ano = parts
-                try:
-                    dia_int, mes_int, ano_int = int(dia), int(mes), int(ano)
-                    if not (1 <= dia_int <= 31):
-                        errors.append(f"Dia inválido: {dia_int}")
-                    if not (1 <= mes_int <= 12):
-                        errors.append(f"Mês inválido: {mes_int}")
-                    if not (2000 <= ano_int <= 2100):
-                        warnings.append(f"Ano fora do range esperado: {ano_int}")
-                except ValueError:
-                    errors.append(f"Data contém valores não numéricos: '{data_str}'")
-    else:
-        warnings.append("Data vazia")
-
-    # 3. Validar revisão (letra A-Z maiúscula ou '0' para primeira emissão)
-    revisao = data.get('revisao', '').strip()
-    if revisao:
-        if not re.match(r'^[A-Z0]$', revisao):
-            # Aceitar também minúsculas e converter
-            if re.match(r'^[a-z]$', revisao):
-                warnings.append(f"Revisão em minúscula: '{revisao}' (esperado maiúscula)")
-            else:
-                errors.append(f"Revisão inválida: '{revisao}' (esperado letra A-Z ou '0')")
-    else:
-        warnings.append("Revisão vazia")
-
-    # 4. Validar título (opcional mas recomendado)
-    titulo = data.get('titulo', '').strip()
-    if not titulo:
-        warnings.append("Título vazio")
-    elif len(titulo) < 3:
-        warnings.append(f"Título muito curto: '{titulo}'")
-
-    # 5. Verificar se há erro reportado pela própria IA
-    if 'error' in data:
-        errors.append(f"IA reportou erro: {data['error']}")
-
-    is_valid = len(errors) == 0
-
-    # Log de validação
-    if errors:
-        logger.error(f"Validação FALHOU para {filename}: {errors}")
-    if warnings:
-        logger.warning(f"Validação com avisos para {filename}: {warnings}")
-    if is_valid and not warnings:
-        logger.info(f"Validação OK para {filename}: Rev={revisao}, Data={data_str}")
-
-    return is_valid, errors, warnings
-
 # --- CONFIGURAÇÃO DA PÁGINA ---
 st.set_page_config(
     page_title="JSJ Parser v2 (Unified)",
@@ -134,9 +45,18 @@ st.set_page_config(
     layout="wide"
 )
 
+# --- LISTA MESTRA PERSISTENTE (SQLite, partilhada entre sessões) ---
+store = get_project_store()
+exports = get_export_cache()
+# Streamlit com downloads diferidos (data=função chamada só no clique)
+LAZY_DOWNLOADS = hasattr(MediaFileManager, "add_deferred")
+# Lista Completa paginada no servidor
+PAGE_SIZES = [50, 100, 250, 500]
+ESTADOS_VALIDACAO = {OK: "✅ Válido", AVISO: "⚠️ Aviso", ERRO: "❌ Erro"}
+
 # --- INICIALIZAÇÃO DO ESTADO (MEMÓRIA TEMPORÁRIA) ---
-if 'master_data' not in st.session_state:
-    st.session_state.master_data = []
+if 'project' not in st.session_state:
+    st.session_state.project = (store.projects() or [DEFAULT_PROJECT])[0]
 if 'total_tokens' not in st.session_state:
     st.session_state.total_tokens = 0
 if 'ordem_customizada' not in st.session_state:
@@ -147,6 +67,8 @@ if 'pending_tasks' not in st.session_state:
     st.session_state.pending_tasks = None
 if 'should_process' not in st.session_state:
     st.session_state.should_process = False
+if 'last_latency' not in st.session_state:
+    st.session_state.last_latency = None
 
 # Campos globais para preenchimento em lote (batch fill)
 if 'global_fields' not in st.session_state:
@@ -159,15 +81,6 @@ if 'global_fields' not in st.session_state:
         'DWG_SOURCE': ''
     }
 
-# Lista de colunas normalizadas (ordem exata para exportação)
-COLUNAS_NORMALIZADAS = [
-    'PROJ_NUM', 'PROJ_NOME', 'CLIENTE', 'OBRA', 'LOCALIZACAO', 'ESPECIALIDADE',
-    'PROJETOU', 'FASE', 'FASE_PFIX', 'EMISSAO', 'DATA', 'PFIX', 'LAYOUT',
-    'DES_NUM', 'TIPO', 'ELEMENTO', 'TITULO', 'REV_A', 'DATA_A', 'DESC_A',
-    'REV_B', 'DATA_B', 'DESC_B', 'REV_C', 'DATA_C', 'DESC_C', 'REV_D',
-    'DATA_D', 'DESC_D', 'REV_E', 'DATA_E', 'DESC_E', 'DWG_SOURCE', 'ID_CAD'
-]
-
 # --- BARRA LATERAL (CONFIGURAÇÃO) ---
 with st.sidebar:
     st.header("⚙️ Configuração")
@@ -177,13 +90,59 @@ with st.sidebar:
     turbo_mode = st.checkbox(
         "🚀 Modo TURBO (Paid Tier)",
         value=False,
-        help="Aumenta rate limit de 15 para 1000 req/min e batch size de 5 para 50. Requer conta Google Cloud paga."
+        help="Aumenta rate limit de 15 para 1000 req/min e pedidos em simultâneo de 5 para 50. Requer conta Google Cloud paga."
+    )
+
+    # Janela de concorrência (N pedidos sempre em voo)
+    concurrency = st.number_input(
+        "🔀 Pedidos em simultâneo (N)",
+        min_value=1,
+        max_value=200,
+        value=50 if turbo_mode else 5,
+        step=1,
+        help="Nº de pedidos Gemini mantidos em voo. Usa as latências p50/p95 reportadas no fim de cada lote para afinar."
+    )
+
+    batch_size = st.number_input(
+        "📦 Legendas por pedido (K)",
+        min_value=1,
+        max_value=16,
+        value=1,
+        step=1,
+        help="K > 1: várias legendas num só pedido Gemini (o prompt é pago uma vez). Reduz pedidos/min e tokens de prompt ~K vezes; itens falhados são repetidos em lotes menores."
+    )
+
+    raster_workers = st.number_input(
+        "🧵 Processos de rasterização",
+        min_value=1,
+        max_value=MAX_RASTER_WORKERS,
+        value=DEFAULT_RASTER_WORKERS,
+        step=1,
+        help="Páginas PDF e layouts DWG são rasterizados em paralelo por vários processos (1 = sem process pool, recomendado em servidores partilhados)"
+    )
+
+    use_text_layer = st.checkbox(
+        "📝 Ler camada de texto primeiro (PDF vetorial)",
+        value=True,
+        help="PDFs plotados do AutoCAD têm a legenda em texto: é lida diretamente (zero custo). O Gemini só é usado quando a confiança é baixa."
+    )
+
+    use_result_cache = st.checkbox(
+        "♻️ Reutilizar resultados em cache",
+        value=True,
+        help="Folhas já processadas (mesma imagem, prompt e modelo) não voltam a ser enviadas ao Gemini"
+    )
+
+    incremental = st.checkbox(
+        "🔁 Só processar folhas novas ou alteradas",
+        value=True,
+        help="Ao recarregar um conjunto revisto, páginas PDF e layouts DWG iguais aos da última ingestão do projeto são ignorados; as folhas alteradas substituem as anteriores na Lista Mestra"
     )
 
     if turbo_mode:
-        st.info("⚡ Modo TURBO ativo: 1000 req/min, batch 50")
+        st.info(f"⚡ Modo TURBO ativo: 1000 req/min, {concurrency} em simultâneo")
     else:
-        st.info("🐢 Modo Standard: 15 req/min, batch 5")
+        st.info(f"🐢 Modo Standard: 15 req/min, {concurrency} em simultâneo")
 
     st.divider()
 
@@ -191,16 +150,9 @@ with st.sidebar:
     st.subheader("✂️ Área de Crop")
     crop_preset = st.selectbox(
         "Posição da Legenda",
-        [
-            "Canto Inf. Direito (50%)",
-            "Canto Inf. Direito (40%)",
-            "Canto Inf. Direito (30%)",
-            "Canto Inf. Direito (70%)",
-            "Metade Inferior (100% largura)",
-            "Página Inteira"
-        ],
+        CROP_PRESETS,
         index=0,
-        help="Define que parte da página será analisada pela IA"
+        help="Automático: a legenda (Nº DESENHO + tabela REV) é localizada em cada página e só essa área é enviada à IA. Os presets fixos definem que parte da página será analisada."
     )
 
     # Mostrar preview do crop
@@ -210,19 +162,71 @@ with st.sidebar:
         help="Mostra preview do crop para validação antes de processar (recomendado para primeiro uso)"
     )
 
+    # Preparação da imagem enviada à IA (resolução adaptativa + codificação)
+    with st.expander("🖼️ Imagem enviada à IA"):
+        pixel_budget_mp = st.slider(
+            "Orçamento de píxeis (MP)",
+            min_value=0.5,
+            max_value=4.0,
+            value=DEFAULT_PIXEL_BUDGET_MP,
+            step=0.25,
+            help="O zoom é escolhido pelo tamanho do crop: legendas pequenas mantêm a nitidez máxima, 'Página Inteira' e 'Metade Inferior' descem até à resolução mínima legível"
+        )
+        image_color = st.selectbox(
+            "Cor",
+            list(COLOR_MODES),
+            format_func=COLOR_MODES.get,
+            index=0,
+            help="Tons de cinzento / 1-bit reduzem o tamanho da imagem sem perder o texto da legenda"
+        )
+        image_format = st.selectbox(
+            "Formato",
+            list(IMAGE_FORMATS),
+            format_func=str.upper,
+            index=0,
+            help="PNG sem perdas; JPEG/WebP são muito mais pequenos para crops grandes"
+        )
+        image_quality = 85
+        if image_format != "png":
+            image_quality = st.slider("Qualidade", min_value=40, max_value=95, value=85, step=5)
+
+    image_opts = image_options(
+        pixel_budget_mp=pixel_budget_mp,
+        color=image_color,
+        format=image_format,
+        quality=image_quality
+    )
+
     st.divider()
 
-    # PAINEL DE LOTES CARREGADOS
-    st.subheader("📦 Lotes em Memória")
-    if len(st.session_state.master_data) > 0:
-        # Agrupar por TIPO e contar
-        df_temp = pd.DataFrame(st.session_state.master_data)
-        summary = df_temp.groupby('TIPO').size().sort_index()
+    # PROJETO ATIVO (Lista Mestra gravada em disco)
+    st.subheader("📁 Projeto")
+    projetos = store.projects()
+    if st.session_state.project not in projetos:
+        projetos.append(st.session_state.project)
+    st.session_state.project = st.selectbox(
+        "Projeto ativo",
+        projetos,
+        index=projetos.index(st.session_state.project),
+        help="A Lista Mestra de cada projeto fica gravada em disco: sobrevive a reloads e reinícios do servidor"
+    )
+
+    def criar_projeto():
+        """Ativa o novo projeto (só passa a existir em disco com o primeiro lote)."""
+        if st.session_state.novo_projeto.strip():
+            st.session_state.project = st.session_state.novo_projeto.strip()
+        st.session_state.novo_projeto = ""
 
+    st.text_input("➕ Novo projeto", key="novo_projeto", placeholder="Ex: 2024-001", on_change=criar_projeto)
+
+    # PAINEL DE LOTES CARREGADOS (contagens por TIPO calculadas no SQLite)
+    st.subheader("📦 Lotes do Projeto")
+    summary = store.tipo_counts(st.session_state.project)
+    if summary:
         for tipo, count in summary.items():
             st.metric(label=tipo, value=f"{count} desenhos")
 
-        st.caption(f"**Total:** {len(st.session_state.master_data)} desenhos")
+        st.caption(f"**Total:** {sum(summary.values())} desenhos")
     else:
         st.info("Nenhum lote carregado ainda.")
 
@@ -244,583 +248,28 @@ with st.sidebar:
         st.metric("Custo Estimado", f"€{custo_eur:.4f}")
         st.caption(f"≈ ${custo_usd:.4f} USD")
 
+    # POUPANÇA DA CACHE DE RESULTADOS
+    cache = get_result_cache()
+    if cache and cache.hits:
+        st.caption(f"♻️ Cache: {cache.hits} folhas reutilizadas · {cache.tokens_saved:,} tokens poupados")
+
+    # LATÊNCIA DO ÚLTIMO LOTE (para afinar N)
+    if st.session_state.last_latency:
+        lat = st.session_state.last_latency
+        st.divider()
+        st.subheader("⏱️ Latência Gemini")
+        st.caption(f"Último lote: N={lat['concurrency']}, K={lat.get('batch_size', 1)}, {lat['n']} folhas")
+        st.metric("p50 / p95", f"{lat['p50']:.1f}s / {lat['p95']:.1f}s")
+        st.caption(f"Média {lat['mean']:.1f}s · Máx {lat['max']:.1f}s")
+
     st.divider()
 
-    if st.button("🗑️ Limpar Toda a Memória", type="primary"):
-        st.session_state.master_data = []
+    if st.button("🗑️ Limpar Projeto", type="primary", help="Apaga a Lista Mestra do projeto ativo (também do disco)"):
+        store.clear(st.session_state.project)
         st.session_state.total_tokens = 0
         st.session_state.ordem_customizada = []
         st.rerun()
 
-# --- FUNÇÕES DE PROCESSAMENTO (BACKEND) ---
-
-class RateLimiter:
-    """Rate limiter inteligente para respeitar limites da API Gemini.
-
-    Gemini Flash v2.5/v2.0: 15 requests/minuto
-    Implementa sliding window para máxima eficiência.
-    """
-    def __init__(self, max_requests=15, time_window=60):
-        self.max_requests = max_requests
-        self.time_window = time_window
-        self.requests = deque()
-
-    async def acquire(self):
-        """Aguarda até que seja seguro fazer um novo request."""
-        now = time.time()
-
-        # Remove requests antigos fora da janela
-        while self.requests and self.requests[0] < now - self.time_window:
-            self.requests.popleft()
-
-        # Se atingiu o limite, espera o tempo mínimo necessário
-        if len(self.requests) >= self.max_requests:
-            sleep_time = self.requests[0] + self.time_window - now + 0.1
-            await asyncio.sleep(sleep_time)
-            return await self.acquire()  # Re-check após espera
-
-        # Registra o novo request
-        self.requests.append(now)
-
-def get_crop_coordinates(preset, rect):
-    """Calcula as coordenadas de crop baseadas no preset selecionado.
-
-    Args:
-        preset: String com o preset selecionado
-        rect: fitz.Rect da página
-
-    Returns:
-        tuple: (x_start_pct, y_start_pct, x_end_pct, y_end_pct) em percentagens
-    """
-    if preset == "Canto Inf. Direito (50%)":
-        return (0.50, 0.50, 1.0, 1.0)  # Quadrante inferior direito (padrão)
-    elif preset == "Canto Inf. Direito (40%)":
-        return (0.60, 0.60, 1.0, 1.0)  # 40% da área (60% offset)
-    elif preset == "Canto Inf. Direito (30%)":
-        return (0.70, 0.70, 1.0, 1.0)  # Área menor, mais focada
-    elif preset == "Canto Inf. Direito (70%)":
-        return (0.30, 0.30, 1.0, 1.0)  # Área maior
-    elif preset == "Metade Inferior (100% largura)":
-        return (0.0, 0.50, 1.0, 1.0)  # Toda a metade inferior
-    elif preset == "Página Inteira":
-        return (0.0, 0.0, 1.0, 1.0)  # Página completa
-    else:
-        return (0.50, 0.50, 1.0, 1.0)  # Padrão
-
-def get_image_from_page(doc, page_num, crop_preset="Canto Inf. Direito (50%)"):
-    """Extrai a imagem (crop da legenda) de uma página específica do documento.
-
-    Args:
-        doc: Documento PyMuPDF
-        page_num: Número da página
-        crop_preset: Preset de crop selecionado
-
-    Returns:
-        PIL.Image: Imagem extraída
-    """
-    page = doc.load_page(page_num)
-    rect = page.rect
-
-    # Calcular coordenadas do crop
-    x_start, y_start, x_end, y_end = get_crop_coordinates(crop_preset, rect)
-
-    crop_rect = fitz.Rect(
-        rect.width * x_start,
-        rect.height * y_start,
-        rect.width * x_end,
-        rect.height * y_end
-    )
-
-    logger.debug(f"Crop preset '{crop_preset}': ({x_start:.0%}, {y_start:.0%}) -> ({x_end:.0%}, {y_end:.0%})")
-
-    pix = page.get_pixmap(clip=crop_rect, matrix=fitz.Matrix(2, 2)) # 2x zoom para clareza
-    img_data = pix.tobytes("png")
-
-    return Image.open(io.BytesIO(img_data))
-
-def extract_dwg_native_blocks(dwg_path, layout_name):
-    """Extrai dados nativos de TODOS os blocos LEGENDA_JSJ_V1 num layout.
-    
-    Retorna: list[dict] com dados extraídos de cada bloco encontrado.
-             Lista vazia se não houver blocos LEGENDA ou se falhar.
-    """
-    if not DWG_SUPPORT:
-        return []
-    
-    try:
-        doc = ezdxf.readfile(dwg_path)
-        
-        # Obter layout
-        if layout_name == 'Model':
-            layout = doc.modelspace()
-        else:
-            layout = doc.paperspace(layout_name)
-        
-        # Procurar TODOS os INSERTs de blocos com "LEGENDA" no nome
-        inserts = [i for i in layout.query('INSERT') if "LEGENDA" in i.dxf.name.upper()]
-        
-        if not inserts:
-            logger.info(f"Nenhum bloco LEGENDA encontrado em {layout_name}")
-            return []
-        
-        logger.info(f"Encontrados {len(inserts)} blocos LEGENDA em {layout_name}")
-        
-        extracted_blocks = []
-        
-        for insert_idx, insert in enumerate(inserts):
-            try:
-                # Converter lista de atributos para dict
-                attribs_dict = {a.dxf.tag: a.dxf.text for a in insert.attribs}
-                
-                # Extrair campos diretos
-                tipo = attribs_dict.get('TIPO', '').strip()
-                num_desenho = attribs_dict.get('DES_NUM', '').strip()
-                titulo = attribs_dict.get('TITULO', '').strip()
-                primeira_emissao = attribs_dict.get('DATA', '').strip()  # Data base (1ª Emissão)
-                
-                # HISTÓRICO DE REVISÕES: Verificar ordem crescente A→E, guardar a ÚLTIMA (mais avançada)
-                revisao_letra = ''
-                revisao_data = ''
-                revisao_desc = ''
-                
-                for rev in ['A', 'B', 'C', 'D', 'E']:
-                    rev_tag = attribs_dict.get(f'REV_{rev}', '').strip()
-                    if rev_tag:  # Tag REV_* não vazia → atualizar (última sobrescreve)
-                        revisao_letra = rev
-                        revisao_data = attribs_dict.get(f'DATA_{rev}', '').strip()
-                        revisao_desc = attribs_dict.get(f'DESC_{rev}', '').strip()
-                # Resultado: revisao_letra contém a letra mais avançada no alfabeto
-                
-                # Validar se tem dados mínimos
-                if not num_desenho and not titulo:
-                    logger.warning(f"Bloco {insert_idx+1} em {layout_name}: campos vazios, ignorado")
-                    continue
-                
-                extracted_blocks.append({
-                    'tipo': tipo or 'N/A',
-                    'num_desenho': num_desenho or 'N/A',
-                    'titulo': titulo or 'Sem título',
-                    'primeira_emissao': primeira_emissao or 'N/A',
-                    'revisao': revisao_letra,           # Vazio se sem revisões
-                    'data_revisao': revisao_data,       # Vazio se sem revisões
-                    'desc_revisao': revisao_desc,       # Vazio se sem revisões
-                    'obs': 'Extração nativa (zero custo)'
-                })
-                
-                logger.info(f"Bloco {insert_idx+1}: {num_desenho} - Rev {revisao_letra if revisao_letra else '(1ª Emissão)'}")
-                
-            except Exception as e:
-                logger.error(f"Erro ao extrair bloco {insert_idx+1} em {layout_name}: {e}")
-                continue
-        
-        return extracted_blocks
-        
-    except Exception as e:
-        logger.error(f"Erro na extração nativa de {layout_name}: {e}")
-        return []
-
-def get_image_from_dwg_layout(dwg_path, layout_name):
-    """Extrai imagem de um layout específico de um ficheiro DWG."""
-    if not DWG_SUPPORT:
-        raise ImportError("ezdxf não está instalado. Instala com: pip install ezdxf matplotlib")
-    
-    try:
-        # Carregar o DWG/DXF
-        doc = ezdxf.readfile(dwg_path)
-        
-        # Obter o layout
-        if layout_name == 'Model':
-            msp = doc.modelspace()
-            layout = msp
-        else:
-            layout = doc.paperspace(layout_name)
-        
-        # Configurar figura com fundo branco
-        fig = plt.figure(figsize=(16, 12), dpi=200, facecolor='white')
-        ax = fig.add_axes([0, 0, 1, 1])
-        ax.set_facecolor('white')
-        
-        # Configurar contexto de renderização
-        ctx = RenderContext(doc)
-        out = MatplotlibBackend(ax)
-        
-        # Renderizar o layout
-        Frontend(ctx, out).draw_layout(layout, finalize=True)
-        
-        # Ajustar limites do gráfico
-        ax.autoscale()
-        ax.margins(0.05)
-        
-        # Converter para bytes
-        buf = io.BytesIO()
-        fig.savefig(buf, format='png', bbox_inches='tight', dpi=200, facecolor='white')
-        buf.seek(0)
-        plt.close(fig)
-        
-        # Carregar imagem completa
-        img = Image.open(buf)
-        width, height = img.size
-        
-        # CROP: Quadrante inferior direito (50% x 50%)
-        crop_box = (
-            width // 2,      # left (50% da largura)
-            height // 2,     # top (50% da altura)
-            width,           # right (100%)
-            height           # bottom (100%)
-        )
-        
-        cropped = img.crop(crop_box)
-        
-        # Garantir que a imagem está em RGB
-        if cropped.mode != 'RGB':
-            cropped = cropped.convert('RGB')
-        
-        return cropped
-        
-    except Exception as e:
-        raise Exception(f"Erro ao processar DWG layout '{layout_name}': {str(e)}")
-
-def get_dwg_layouts(dwg_path):
-    """Retorna lista de nomes de layouts Paper Space num ficheiro DWG.
-
-    Model Space é ignorado conforme Regra de Ouro #4 (Multi-Layout).
-    Retorna lista vazia se só existir Model Space.
-    """
-    if not DWG_SUPPORT:
-        return []
-
-    try:
-        doc = ezdxf.readfile(dwg_path)
-
-        # Obter APENAS paperspace layouts (ignora Model Space)
-        paperspace_layouts = []
-        for layout in doc.layouts:
-            if layout.name != 'Model':
-                paperspace_layouts.append(layout.name)
-
-        # Se não houver paperspace layouts, retorna VAZIO (não processar Model)
-        # O código chamador deve avisar o utilizador
-        if not paperspace_layouts:
-            logger.warning(f"DWG sem Paper Space layouts: {dwg_path}")
-            return []
-
-        return sorted(paperspace_layouts)
-
-    except Exception as e:
-        logger.error(f"Erro ao ler layouts DWG {dwg_path}: {e}")
-        return []
-
-def create_pdf_export(df):
-    """Cria PDF profissional com a lista de desenhos."""
-    buffer = io.BytesIO()
-    
-    # Configurar documento em landscape A4
-    doc = SimpleDocTemplate(
-        buffer,
-        pagesize=landscape(A4),
-        rightMargin=1.5*cm,
-        leftMargin=1.5*cm,
-        topMargin=2*cm,
-        bottomMargin=2*cm
-    )
-    
-    # Estilos
-    styles = getSampleStyleSheet()
-    title_style = ParagraphStyle(
-        'CustomTitle',
-        parent=styles['Heading1'],
-        fontSize=18,
-        textColor=colors.HexColor('#1f4788'),
-        spaceAfter=20,
-        alignment=TA_CENTER,
-        fontName='Helvetica-Bold'
-    )
-    
-    subtitle_style = ParagraphStyle(
-        'CustomSubtitle',
-        parent=styles['Heading2'],
-        fontSize=14,
-        textColor=colors.HexColor('#2c5aa0'),
-        spaceAfter=12,
-        spaceBefore=12,
-        fontName='Helvetica-Bold'
-    )
-    
-    # Elementos do documento
-    elements = []
-    
-    # Cabeçalho
-    elements.append(Paragraph("LISTA DE DESENHOS JSJ", title_style))
-    elements.append(Paragraph(f"Gerado em {datetime.now().strftime('%d/%m/%Y às %H:%M')}", styles['Normal']))
-    elements.append(Spacer(1, 0.5*cm))
-    
-    # Processar por tipo
-    for tipo in df['TIPO'].unique():
-        df_tipo = df[df['TIPO'] == tipo]
-        
-        # Subtítulo do tipo
-        elements.append(Paragraph(f"TIPO: {tipo}", subtitle_style))
-        elements.append(Spacer(1, 0.3*cm))
-        
-        # Preparar dados da tabela (colunas normalizadas)
-        table_data = [['Nº Desenho', 'Título', 'Rev', 'Data', 'Cliente', 'Obra']]
-        
-        for _, row in df_tipo.iterrows():
-            table_data.append([
-                str(row.get('DES_NUM', '')),
-                str(row.get('TITULO', ''))[:50] + '...' if len(str(row.get('TITULO', ''))) > 50 else str(row.get('TITULO', '')),
-                str(row.get('REV_A', '')),
-                str(row.get('DATA', '')),
-                str(row.get('CLIENTE', ''))[:25] + '...' if len(str(row.get('CLIENTE', ''))) > 25 else str(row.get('CLIENTE', '')),
-                str(row.get('OBRA', ''))[:25] + '...' if len(str(row.get('OBRA', ''))) > 25 else str(row.get('OBRA', ''))
-            ])
-        
-        # Criar tabela
-        table = Table(table_data, colWidths=[3.5*cm, 6*cm, 1.5*cm, 2*cm, 4*cm, 4*cm])
-        
-        # Estilo da tabela
-        table.setStyle(TableStyle([
-            # Cabeçalho
-            ('BACKGROUND', (0, 0), (-1, 0), colors.HexColor('#1f4788')),
-            ('TEXTCOLOR', (0, 0), (-1, 0), colors.whitesmoke),
-            ('ALIGN', (0, 0), (-1, 0), 'CENTER'),
-            ('FONTNAME', (0, 0), (-1, 0), 'Helvetica-Bold'),
-            ('FONTSIZE', (0, 0), (-1, 0), 10),
-            ('BOTTOMPADDING', (0, 0), (-1, 0), 12),
-            
-            # Dados
-            ('BACKGROUND', (0, 1), (-1, -1), colors.white),
-            ('TEXTCOLOR', (0, 1), (-1, -1), colors.black),
-            ('ALIGN', (0, 1), (-1, -1), 'LEFT'),
-            ('ALIGN', (2, 1), (3, -1), 'CENTER'),  # Rev e Data centralizadas
-            ('FONTNAME', (0, 1), (-1, -1), 'Helvetica'),
-            ('FONTSIZE', (0, 1), (-1, -1), 8),
-            ('TOPPADDING', (0, 1), (-1, -1), 6),
-            ('BOTTOMPADDING', (0, 1), (-1, -1), 6),
-            
-            # Linhas alternadas
-            ('ROWBACKGROUNDS', (0, 1), (-1, -1), [colors.white, colors.HexColor('#f0f4f8')]),
-            
-            # Bordas
-            ('GRID', (0, 0), (-1, -1), 0.5, colors.HexColor('#cccccc')),
-            ('BOX', (0, 0), (-1, -1), 1, colors.HexColor('#1f4788')),
-            
-            # Alinhamento vertical
-            ('VALIGN', (0, 0), (-1, -1), 'MIDDLE'),
-        ]))
-        
-        elements.append(table)
-        elements.append(Spacer(1, 0.8*cm))
-        
-        # Page break entre tipos (exceto último)
-        if tipo != df['TIPO'].unique()[-1]:
-            elements.append(PageBreak())
-    
-    # Rodapé
-    elements.append(Spacer(1, 1*cm))
-    footer_text = f"Total de desenhos: {len(df)} | Tipos: {', '.join(df['TIPO'].unique())}"
-    elements.append(Paragraph(footer_text, styles['Italic']))
-    
-    # Gerar PDF
-    doc.build(elements)
-    buffer.seek(0)
-    
-    return buffer
-
-async def ask_gemini_async(image, file_context, rate_limiter, api_key_param):
-    """O Cérebro Assíncrono: Processa requests em paralelo com rate limiting.
-
-    Args:
-        image: Imagem PIL para análise
-        file_context: Nome do ficheiro (para logging)
-        rate_limiter: Instância de RateLimiter
-        api_key_param: API key do Google Gemini
-
-    Returns:
-        dict: Dados extraídos pela IA
-    """
-    if not api_key_param:
-        logger.error("Tentativa de processar sem API Key")
-        return {"error": "Sem API Key", "num_desenho": "ERRO", "titulo": file_context, "revisao": "?", "data": "??/??/????", "obs": "API Key não fornecida"}, 0
-
-    # Aguarda permissão do rate limiter
-    await rate_limiter.acquire()
-
-    # Executa a chamada síncrona da API em thread separada
-    loop = asyncio.get_event_loop()
-    return await loop.run_in_executor(None, _ask_gemini_sync, image, file_context, api_key_param)
-
-def _ask_gemini_sync(image, file_context, api_key_param):
-    """Wrapper síncrono para chamada ao Gemini (executado em thread pool).
-
-    Args:
-        image: Imagem PIL para análise
-        file_context: Nome do ficheiro (para logging)
-        api_key_param: API key do Google Gemini
-
-    Returns:
-        tuple: (dados_extraidos: dict, tokens_usados: int)
-    """
-    genai.configure(api_key=api_key_param)
-
-    # LISTA DE MODELOS ATUALIZADA
-    models_to_try = [
-        'gemini-2.5-flash',          # PRIORIDADE 1
-        'gemini-2.0-flash',          # PRIORIDADE 2
-        'gemini-1.5-flash',          # Fallback Standard
-        'gemini-1.5-flash-latest',   # Fallback Alias
-        'gemini-pro'                 # Legacy
-    ]
-
-    prompt = """
-    És um técnico de documentação especializado em extrair metadados de desenhos técnicos. Analisa APENAS o que está visualmente desenhado/escrito nesta imagem.
-
-    ╔═══════════════════════════════════════════════════════════════════╗
-    ║ REGRA DE OURO #1: IGNORA COMPLETAMENTE O NOME DO FICHEIRO        ║
-    ║ REGRA DE OURO #2: EXTRAI TODOS OS CAMPOS VISÍVEIS NA LEGENDA     ║
-    ║ REGRA DE OURO #3: EXTRAI TODAS AS REVISÕES (A, B, C, D, E)       ║
-    ╚═══════════════════════════════════════════════════════════════════╝
-
-    📋 CAMPOS A EXTRAIR DA LEGENDA:
-
-    1️⃣ INFORMAÇÃO DO PROJETO (procura na legenda):
-       - CLIENTE: Nome do cliente/dono de obra
-       - OBRA: Nome/descrição da obra
-       - LOCALIZACAO: Local da obra (cidade, morada, etc)
-       - ESPECIALIDADE: Tipo de especialidade (ex: "ESTRUTURA E FUNDAÇÕES", "ARQUITECTURA")
-       - PROJETOU: Nome de quem projetou/autor
-       - FASE: Fase do projeto (ex: "LIC", "EXE", "PROJ")
-
-    2️⃣ INFORMAÇÃO DO DESENHO:
-       - DATA: Data base/1ª emissão do desenho
-       - TIPO: Tipo de desenho (ex: "Betão Armado", "Dimensionamento", "Pormenor")
-       - TITULO: Título/descrição do desenho
-       - PFIX: Prefixo do número do desenho (ex: "EST", "BA", "DIM")
-       - NUM: Número sequencial do desenho (ex: "001", "15")
-       - R: Revisão atual (letra A-Z ou vazio se 1ª emissão)
-
-    3️⃣ TABELA DE REVISÕES (EXTRAIR TODAS AS LINHAS A até E):
-       Procura a tabela de revisões e extrai CADA linha separadamente:
-       ┌─────────────────────────────────────────────────────┐
-       │ REV │   DATA    │      DESCRIÇÃO           │
-       ├─────┼───────────┼──────────────────────────┤
-       │  A  │ 10/01/2025│ Primeira emissão         │ → REV_A, DATA_A, DESC_A
-       │  B  │ 15/02/2025│ Correcção de medidas     │ → REV_B, DATA_B, DESC_B
-       │  C  │ 20/03/2025│ Ajuste de armaduras      │ → REV_C, DATA_C, DESC_C
-       │  D  │           │                          │ → REV_D, DATA_D, DESC_D (vazios)
-       │  E  │           │                          │ → REV_E, DATA_E, DESC_E (vazios)
-       └─────┴───────────┴──────────────────────────┘
-
-    📤 RETORNA APENAS JSON VÁLIDO (sem comentários):
-    {
-        "CLIENTE": "string - Nome do cliente ou vazio",
-        "OBRA": "string - Nome da obra ou vazio",
-        "LOCALIZACAO": "string - Localização ou vazio",
-        "ESPECIALIDADE": "string - Especialidade ou vazio",
-        "PROJETOU": "string - Quem projetou ou vazio",
-        "FASE": "string - Fase do projeto ou vazio",
-        "DATA": "string - Data base/1ª emissão ou vazio",
-        "TIPO": "string - Tipo de desenho ou vazio",
-        "TITULO": "string - Título do desenho",
-        "PFIX": "string - Prefixo do número ou vazio",
-        "NUM": "string - Número do desenho",
-        "R": "string - Revisão atual (letra) ou vazio",
-        "REV_A": "string - 'A' se preenchida, senão vazio",
-        "DATA_A": "string - Data da revisão A ou vazio",
-        "DESC_A": "string - Descrição da revisão A ou vazio",
-        "REV_B": "string - 'B' se preenchida, senão vazio",
-        "DATA_B": "string - Data da revisão B ou vazio",
-        "DESC_B": "string - Descrição da revisão B ou vazio",
-        "REV_C": "string - 'C' se preenchida, senão vazio",
-        "DATA_C": "string - Data da revisão C ou vazio",
-        "DESC_C": "string - Descrição da revisão C ou vazio",
-        "REV_D": "string - 'D' se preenchida, senão vazio",
-        "DATA_D": "string - Data da revisão D ou vazio",
-        "DESC_D": "string - Descrição da revisão D ou vazio",
-        "REV_E": "string - 'E' se preenchida, senão vazio",
-        "DATA_E": "string - Data da revisão E ou vazio",
-        "DESC_E": "string - Descrição da revisão E ou vazio",
-        "obs": "string - Avisos se ilegível/em falta, senão vazio"
-    }
-
-    ⚠️ NOTAS IMPORTANTES:
-    - Se um campo não for visível ou legível, deixa VAZIO (string vazia "")
-    - Para revisões não preenchidas na tabela, deixa os 3 campos vazios
-    - O campo R deve ter a letra da revisão mais recente (última preenchida)
-    - Datas podem estar em qualquer formato (DD/MM/YYYY, YYYY.MM.DD, texto)
-    """
-
-    last_error = ""
-    last_model = ""
-
-    # LOOP DE TENTATIVAS (ROBUST FALLBACK)
-    for model_name in models_to_try:
-        try:
-            logger.info(f"Tentando modelo {model_name} para {file_context}")
-            model = genai.GenerativeModel(model_name)
-            response = model.generate_content([prompt, image])
-            last_model = model_name
-
-            # Se chegou aqui, a chamada à API funcionou!
-            clean_text = response.text.replace("```json", "").replace("```", "").strip()
-
-            # Contabilizar tokens (estimativa)
-            if hasattr(response, 'usage_metadata'):
-                total = response.usage_metadata.total_token_count
-            else:
-                # Estimativa se não houver metadata: ~500 tokens por request
-                total = 500
-
-            # *** VALIDAÇÃO ROBUSTA DO JSON ***
-            try:
-                parsed_data = json.loads(clean_text)
-            except json.JSONDecodeError as e:
-                logger.error(f"JSON inválido retornado pela IA para {file_context}: {e}")
-                logger.debug(f"Resposta bruta: {clean_text[:200]}...")
-                return {
-                    "error": f"IA retornou JSON malformado: {str(e)}",
-                    "num_desenho": "ERRO_JSON",
-                    "titulo": file_context,
-                    "revisao": "?",
-                    "data": "??/??/????",
-                    "obs": f"Erro de parsing JSON: {str(e)}"
-                }, 0
-
-            # *** VALIDAÇÃO DE INTEGRIDADE DOS DADOS ***
-            is_valid, errors, warnings = validate_extracted_data(parsed_data, file_context)
-
-            if not is_valid:
-                # Dados inválidos - reportar mas não falhar completamente
-                logger.error(f"Dados inválidos extraídos de {file_context}: {errors}")
-                parsed_data['obs'] = f"VALIDAÇÃO FALHOU: {'; '.join(errors)}"
-                if warnings:
-                    parsed_data['obs'] += f" | Avisos: {'; '.join(warnings)}"
-            elif warnings:
-                # Dados válidos mas com avisos
-                if parsed_data.get('obs'):
-                    parsed_data['obs'] += f" | {'; '.join(warnings)}"
-                else:
-                    parsed_data['obs'] = '; '.join(warnings)
-
-            logger.info(f"Sucesso com modelo {model_name} para {file_context} ({total} tokens)")
-            return parsed_data, total
-
-        except Exception as e:
-            last_error = str(e)
-            logger.warning(f"Modelo {model_name} falhou para {file_context}: {last_error}")
-            continue
-
-    # Se chegou aqui, todos os modelos falharam
-    logger.error(f"TODOS os modelos falharam para {file_context}. Último erro: {last_error}")
-    return {
-        "error": f"Falha IA. Último erro: {last_error}",
-        "num_desenho": "ERRO",
-        "titulo": file_context,
-        "revisao": "?",
-        "data": "??/??/????",
-        "obs": f"Todos os modelos falharam. Último modelo: {last_model or 'nenhum'}"
-    }, 0
-
 # --- INTERFACE PRINCIPAL (FRONTEND) ---
 
 st.title("🏗️ Gestor de Desenhos JSJ")
@@ -997,10 +446,12 @@ with col_input:
                     try:
                         bytes_data = first_file.read()
                         doc = fitz.open(stream=bytes_data, filetype="pdf")
-                        preview_img = get_image_from_page(doc, 0, crop_preset)
+                        # Exatamente a imagem que a IA recebe (zoom adaptativo + cor/formato)
+                        preview = render_pdf_page(doc, 0, get_crop_box(doc.load_page(0), crop_preset), image_opts)
                         doc.close()
 
-                        st.image(preview_img, caption=f"Preview: {first_file.name} (Página 1) - Crop: {crop_preset}", use_container_width=True)
+                        st.image(preview.to_pil(), caption=f"Preview: {first_file.name} (Página 1) - Crop: {crop_preset}", use_container_width=True)
+                        st.caption(f"🖼️ {preview.size[0]}×{preview.size[1]} px · {len(preview) / 1024:.0f} KB · ~{preview.tokens} tokens")
                         st.caption("⬆️ Esta é a área que a IA vai analisar em TODOS os desenhos")
                         st.warning("⚠️ **ATENÇÃO:** Verifica se a TABELA DE REVISÕES está completamente visível. Se não estiver, ajusta o crop na barra lateral.")
 
@@ -1041,440 +492,78 @@ with col_input:
             progress_bar = st.progress(0)
             status_text = st.empty()
             
-            # Pré-processamento: Extrair todas as páginas/layouts
-            all_tasks = []
-            total_operations = 0
-
-            for file in files_to_process:
-                file_ext = file.name.lower().split('.')[-1]
-                
-                st.write(f"🔍 DEBUG: Ficheiro={file.name}, Extensão={file_ext}, Tipo Selecionado={file_source}")
-                
-                try:
-                    if file_ext == 'json':
-                        # Processar JSON (ficheiro LISP AutoCAD)
-                        status_text.text(f"A processar JSON LISP: {file.name}...")
-                        
-                        try:
-                            json_data = json.loads(file.read().decode('utf-8'))
-                            
-                            st.info(f"📋 JSON carregado: {len(json_data) if isinstance(json_data, list) else 'formato dict'} registos")
-                            
-                            # SUPORTE PARA DOIS FORMATOS DE JSON:
-                            # Formato 1: {"desenhos": [...], "metadata": {...}} (LISP antiga)
-                            # Formato 2: [{atributos: {...}}, ...] (LISP nova)
-                            
-                            desenhos = []
-                            metadata = {}
-                            
-                            # Detectar formato
-                            if isinstance(json_data, list):
-                                # Formato 2: Array direto de desenhos com atributos aninhados
-                                for idx, item in enumerate(json_data):
-                                    # Extrair atributos (estrutura aninhada)
-                                    attrs = item.get('atributos', {})
-                                    
-                                    # Mapear campos necessários
-                                    tipo = attrs.get('TIPO', '').strip()
-                                    num_desenho = attrs.get('DES_NUM', '').strip()
-                                    titulo = attrs.get('TITULO', '').strip()
-                                    primeira_emissao = attrs.get('DATA', '').strip()
-                                    
-                                    # Normalizar data se estiver no formato YYYY.MM.DD
-                                    if '.' in primeira_emissao and len(primeira_emissao.split('.')) == 3:
-                                        partes = primeira_emissao.split('.')
-                                        if len(partes[0]) == 4:  # Formato YYYY.MM.DD
-                                            primeira_emissao = f"{partes[2]}/{partes[1]}/{partes[0]}"
-                                    
-                                    # Histórico de revisões: ordem crescente A→E
-                                    revisao_letra = ''
-                                    revisao_data = ''
-                                    revisao_desc = ''
-                                    
-                                    for rev in ['A', 'B', 'C', 'D', 'E']:
-                                        rev_tag = attrs.get(f'REV_{rev}', '').strip()
-                                        if rev_tag:
-                                            revisao_letra = rev
-                                            revisao_data = attrs.get(f'DATA_{rev}', '').strip()
-                                            revisao_desc = attrs.get(f'DESC_{rev}', '').strip()
-                                            
-                                            # Normalizar data de revisão
-                                            if '.' in revisao_data and len(revisao_data.split('.')) == 3:
-                                                partes = revisao_data.split('.')
-                                                if len(partes[0]) == 4:
-                                                    revisao_data = f"{partes[2]}/{partes[1]}/{partes[0]}"
-                                    
-                                    layout_info = item.get('layout_tab', f'Layout {idx+1}')
-                                    bloco_num = item.get('id_desenho', idx + 1)
-                                    
-                                    # Para JSON, usar tipo do próprio JSON (não precisa de batch_type)
-                                    tipo_final = tipo or (batch_type.upper() if batch_type else 'N/A')
-                                    
-                                    all_tasks.append({
-                                        "native_data": {
-                                            'tipo': tipo_final,
-                                            'num_desenho': num_desenho or 'N/A',
-                                            'titulo': titulo or 'Sem título',
-                                            'primeira_emissao': primeira_emissao or 'N/A',
-                                            'revisao': revisao_letra,
-                                            'data_revisao': revisao_data,
-                                            'desc_revisao': revisao_desc,
-                                            'obs': f'Extração LISP AutoCAD (Layout: {layout_info})'
-                                        },
-                                        "display_name": f"{file.name.replace('.json', '')} (Layout: {layout_info}, Bloco {bloco_num})",
-                                        "batch_type": tipo_final,
-                                        "is_native": True
-                                    })
-                                    total_operations += 1
-                                
-                                st.success(f"✅ {total_operations} desenhos extraídos do JSON (formato array)")
-                                
-                                metadata = {
-                                    'dwg_file': file.name,
-                                    'total_desenhos': len(json_data)
-                                }
-                                
-                            elif isinstance(json_data, dict) and 'desenhos' in json_data:
-                                # Formato 1: Estrutura com wrapper {"desenhos": [...]}
-                                desenhos_raw = json_data['desenhos']
-                                metadata = json_data.get('metadata', {})
-                                
-                                for idx, desenho in enumerate(desenhos_raw):
-                                    tipo = desenho.get('TIPO', '').strip()
-                                    num_desenho = desenho.get('DES_NUM', '').strip()
-                                    titulo = desenho.get('TITULO', '').strip()
-                                    primeira_emissao = desenho.get('DATA', '').strip()
-                                    
-                                    revisao_letra = ''
-                                    revisao_data = ''
-                                    revisao_desc = ''
-                                    
-                                    for rev in ['A', 'B', 'C', 'D', 'E']:
-                                        rev_tag = desenho.get(f'REV_{rev}', '').strip()
-                                        if rev_tag:
-                                            revisao_letra = rev
-                                            revisao_data = desenho.get(f'DATA_{rev}', '').strip()
-                                            revisao_desc = desenho.get(f'DESC_{rev}', '').strip()
-                                    
-                                    layout_info = desenho.get('LAYOUT', 'Layout desconhecido')
-                                    bloco_num = desenho.get('BLOCO_NUM', idx + 1)
-                                    
-                                    # Para JSON, usar tipo do próprio JSON (não precisa de batch_type)
-                                    tipo_final = tipo or (batch_type.upper() if batch_type else 'N/A')
-                                    
-                                    all_tasks.append({
-                                        "native_data": {
-                                            'tipo': tipo_final,
-                                            'num_desenho': num_desenho or 'N/A',
-                                            'titulo': titulo or 'Sem título',
-                                            'primeira_emissao': primeira_emissao or 'N/A',
-                                            'revisao': revisao_letra,
-                                            'data_revisao': revisao_data,
-                                            'desc_revisao': revisao_desc,
-                                            'obs': f'Extração LISP AutoCAD (Layout: {layout_info})'
-                                        },
-                                        "display_name": f"{metadata.get('dwg_file', file.name)} (Layout: {layout_info}, Bloco {bloco_num})",
-                                        "batch_type": tipo_final,
-                                        "is_native": True
-                                    })
-                                    total_operations += 1
-                            else:
-                                st.error(f"❌ {file.name}: Formato JSON não reconhecido")
-                                continue
-                            
-                            status_text.text(f"JSON: {total_operations} desenhos processados de {metadata.get('dwg_file', file.name)}")
-                            logger.info(f"✅ JSON LISP processado: {total_operations} desenhos de {file.name}")
-                            
-                        except json.JSONDecodeError as e:
-                            st.error(f"❌ Erro ao ler JSON {file.name}: {str(e)}")
-                            logger.error(f"JSON decode error: {file.name} - {e}")
-                            continue
-                    
-                    elif file_ext == 'pdf':
-                        # Processar PDF
-                        bytes_data = file.read()
-                        doc = fitz.open(stream=bytes_data, filetype="pdf")
-
-                        for page_num in range(doc.page_count):
-                            display_name = f"{file.name} (Pág. {page_num + 1})"
-                            img = get_image_from_page(doc, page_num, crop_preset)
-
-                            all_tasks.append({
-                                "image": img,
-                                "display_name": display_name,
-                                "batch_type": batch_type.upper(),
-                                "is_native": False
-                            })
-                            total_operations += 1
+            # Process pool de rasterização (None = thread única) e temporários do lote
+            raster_pool = create_raster_pool(int(raster_workers))
+            temp_files = []
+            # O gerador de tasks corre fora do event loop, numa thread com o contexto
+            # desta sessão (as mensagens de report() continuam a aparecer na página)
+            task_thread = ThreadPoolExecutor(
+                max_workers=1, thread_name_prefix="jsj-tasks",
+                initializer=add_script_run_ctx, initargs=(None, get_script_run_ctx())
+            )
 
-                        doc.close()
-                        
-                    elif file_ext in ['dwg', 'dxf'] and DWG_SUPPORT:
-                        # Processar DWG/DXF com HYBRID WORKFLOW
-                        status_text.text(f"A processar {file.name}...")
-                        
-                        # Guardar temporariamente (ezdxf precisa de ficheiro no disco)
-                        with tempfile.NamedTemporaryFile(delete=False, suffix=f'.{file_ext}') as tmp:
-                            tmp.write(file.read())
-                            tmp_path = tmp.name
-                        
-                        try:
-                            # Obter layouts (apenas Paper Space, Model Space é ignorado)
-                            layouts = get_dwg_layouts(tmp_path)
+            # Pré-processamento em streaming: páginas/layouts produzidos sob demanda
+            # (a rasterização é adiada via "render" e corre dentro do pipeline)
+            def report(level, message):
+                """Mensagens de progresso do núcleo → widgets Streamlit."""
+                if level == 'status':
+                    status_text.text(message)
+                else:
+                    getattr(st, level)(message)
 
-                            if not layouts:
-                                st.warning(f"⚠️ **{file.name}**: Apenas contém Model Space. Desenhos devem estar em Paper Space (Layout1, Layout2, etc). Ficheiro ignorado.")
-                                logger.warning(f"DWG ignorado (só Model Space): {file.name}")
-                                continue
+            # Fingerprints da última ingestão do projeto (folhas inalteradas não geram tasks)
+            known_sheets = store.sheet_fingerprints(st.session_state.project) if incremental else None
+            # Folhas atuais de cada ficheiro lido (as removidas saem da Lista Mestra)
+            sheet_index = {}
 
-                            status_text.text(f"Encontrados {len(layouts)} Paper Space layouts em {file.name}")
-                            
-                            for layout_idx, layout_name in enumerate(layouts):
-                                try:
-                                    # TENTATIVA 1: Extração Nativa (zero custo, instant)
-                                    status_text.text(f"Tentando extração nativa de {file.name} (Layout: {layout_name})...")
-                                    native_blocks = extract_dwg_native_blocks(tmp_path, layout_name)
-                                    
-                                    if native_blocks:
-                                        # Sucesso! Adicionar todos os blocos encontrados
-                                        for block_idx, block_data in enumerate(native_blocks):
-                                            display_name = f"{file.name} (Layout: {layout_name}, Bloco {block_idx+1})"
-                                            
-                                            all_tasks.append({
-                                                "native_data": block_data,  # Dados já extraídos!
-                                                "display_name": display_name,
-                                                "batch_type": batch_type.upper(),
-                                                "is_native": True
-                                            })
-                                            total_operations += 1
-                                        
-                                        logger.info(f"✅ Extração nativa: {len(native_blocks)} blocos em {layout_name}")
-                                    else:
-                                        # FALLBACK: Rendering + Gemini (custo API)
-                                        logger.warning(f"Sem blocos LEGENDA em {layout_name}, usando rendering + Gemini")
-                                        display_name = f"{file.name} (Layout: {layout_name})"
-                                        status_text.text(f"A renderizar {display_name} (fallback)...")
-                                        
-                                        img = get_image_from_dwg_layout(tmp_path, layout_name)
-                                        
-                                        all_tasks.append({
-                                            "image": img,
-                                            "display_name": display_name,
-                                            "batch_type": batch_type.upper(),
-                                            "is_native": False
-                                        })
-                                        total_operations += 1
-                                    
-                                except Exception as layout_error:
-                                    st.warning(f"⚠️ Erro no layout '{layout_name}' de {file.name}: {str(layout_error)}")
-                                    continue
-                                    
-                        except Exception as dwg_error:
-                            st.error(f"❌ Erro ao processar {file.name}: {str(dwg_error)}")
-                        finally:
-                            # Limpar ficheiro temporário
-                            try:
-                                if os.path.exists(tmp_path):
-                                    os.unlink(tmp_path)
-                            except (FileNotFoundError, PermissionError, OSError) as e:
-                                logger.warning(f"Não foi possível eliminar ficheiro temporário {tmp_path}: {e}")
-                                pass
-                    
-                except Exception as e:
-                    st.error(f"Erro ao ler {file.name}: {e}")
+            def iter_all_tasks():
+                """Gera as tasks ficheiro a ficheiro, sem manter todas as imagens em memória."""
+                for file in files_to_process:
+                    file_ext = file.name.lower().split('.')[-1]
+                
+                    logger.debug(f"Ficheiro={file.name}, Extensão={file_ext}, Tipo Selecionado={file_source}")
+
+                    yield from iter_file_tasks(
+                        file.name, file.read(), batch_type, crop_preset,
+                        use_text_layer=use_text_layer, raster_pool=raster_pool,
+                        temp_files=temp_files, report=report, image_opts=image_opts,
+                        known_sheets=known_sheets, sheet_index=sheet_index
+                    )
             
             # Processamento Assíncrono em Paralelo (HYBRID: Native + Gemini)
             async def process_all_pages():
-                """Processa todas as páginas em paralelo com rate limiting."""
-                # Configurar rate limiter e batch size baseado no modo
-                if turbo_mode:
-                    rate_limiter = RateLimiter(max_requests=1000, time_window=60)
-                    batch_size = 50
-                    logger.info("Modo TURBO ativo: 1000 req/min, batch 50")
-                else:
-                    rate_limiter = RateLimiter(max_requests=15, time_window=60)
-                    batch_size = 5
-                    logger.info("Modo Standard ativo: 15 req/min, batch 5")
-
-                new_records = []
-
-                # Separar tasks nativas (sem custo) de tasks de imagem (Gemini)
-                native_tasks = [t for t in all_tasks if t.get("is_native", False)]
-                gemini_tasks = [t for t in all_tasks if not t.get("is_native", False)]
-                
-                completed = 0
-                
-                # PROCESSAR TASKS NATIVAS (instantâneo, sem API calls)
-                for task_data in native_tasks:
-                    data = task_data["native_data"]
-                    gf = st.session_state.global_fields  # Campos globais
-                    
-                    record = {
-                        # Campos globais (preenchidos pelo utilizador)
-                        "PROJ_NUM": gf.get('PROJ_NUM', ''),
-                        "PROJ_NOME": gf.get('PROJ_NOME', ''),
-                        # Campos extraídos (normalizados)
-                        "CLIENTE": data.get("cliente", ""),
-                        "OBRA": data.get("obra", ""),
-                        "LOCALIZACAO": data.get("localizacao", ""),
-                        "ESPECIALIDADE": data.get("especialidade", ""),
-                        "PROJETOU": data.get("projetou", ""),
-                        "FASE": data.get("fase", ""),
-                        # Campos globais (preenchidos pelo utilizador)
-                        "FASE_PFIX": gf.get('FASE_PFIX', ''),
-                        "EMISSAO": gf.get('EMISSAO', ''),
-                        # Campos extraídos
-                        "DATA": data.get("primeira_emissao", "-"),
-                        "PFIX": data.get("pfix", ""),
-                        # Campos extraídos
-                        "LAYOUT": data.get("layout", ""),
-                        "DES_NUM": data.get("num_desenho", "N/A"),
-                        "TIPO": data.get("tipo", task_data["batch_type"]),
-                        # Campos globais
-                        "ELEMENTO": gf.get('ELEMENTO', ''),
-                        # Campos extraídos
-                        "TITULO": data.get("titulo", "N/A"),
-                        # Revisões A-E
-                        "REV_A": data.get("rev_a", ""),
-                        "DATA_A": data.get("data_a", ""),
-                        "DESC_A": data.get("desc_a", ""),
-                        "REV_B": data.get("rev_b", ""),
-                        "DATA_B": data.get("data_b", ""),
-                        "DESC_B": data.get("desc_b", ""),
-                        "REV_C": data.get("rev_c", ""),
-                        "DATA_C": data.get("data_c", ""),
-                        "DESC_C": data.get("desc_c", ""),
-                        "REV_D": data.get("rev_d", ""),
-                        "DATA_D": data.get("data_d", ""),
-                        "DESC_D": data.get("desc_d", ""),
-                        "REV_E": data.get("rev_e", ""),
-                        "DATA_E": data.get("data_e", ""),
-                        "DESC_E": data.get("desc_e", ""),
-                        # Campos extraídos/globais
-                        "DWG_SOURCE": gf.get('DWG_SOURCE', ''),
-                        "ID_CAD": data.get("id_cad", ""),
-                        # Flag interna (não exportada)
-                        "_source": "DXF"
-                    }
-                    
-                    new_records.append(record)
-                    completed += 1
-                    progress_bar.progress(completed / total_operations)
-                    status_text.text(f"✅ Nativo: {data.get('num_desenho', 'N/A')} ({completed}/{total_operations})")
-                
-                # PROCESSAR TASKS GEMINI (assíncronas com rate limiting)
-                if gemini_tasks:
-                    async_tasks = []
-                    for task_data in gemini_tasks:
-                        async_tasks.append(
-                            ask_gemini_async(
-                                task_data["image"],
-                                task_data["display_name"],
-                                rate_limiter,
-                                api_key
-                            )
-                        )
-                    
-                    for i in range(0, len(async_tasks), batch_size):
-                        batch = async_tasks[i:i + batch_size]
-                        
-                        status_text.text(f"A processar batch Gemini {i//batch_size + 1} ({len(batch)} páginas)...")
-                        
-                        # Executar batch em paralelo
-                        results = await asyncio.gather(*batch, return_exceptions=True)
-                        
-                        # Processar resultados
-                        for idx, result in enumerate(results):
-                            task_idx = i + idx
-                            task_info = gemini_tasks[task_idx]
-                            
-                            # Desempacotar resultado (data, tokens)
-                            if isinstance(result, Exception):
-                                data = {"error": str(result), "NUM": "ERRO", "TITULO": task_info["display_name"]}
-                                tokens = 0
-                            elif isinstance(result, tuple):
-                                data, tokens = result
-                                st.session_state.total_tokens += tokens
-                            else:
-                                data = result
-                                tokens = 0
-                            
-                            # Construir número do desenho a partir de PFIX + NUM
-                            pfix = data.get("PFIX", "").strip()
-                            num = data.get("NUM", "").strip()
-                            if pfix and num:
-                                num_desenho = f"{pfix}-{num}"
-                            elif num:
-                                num_desenho = num
-                            else:
-                                num_desenho = "N/A"
-                            
-                            # Usar TIPO do JSON se disponível, senão batch_type
-                            tipo_extraido = data.get("TIPO", "").strip()
-                            gf = st.session_state.global_fields  # Campos globais
-                            
-                            record = {
-                                # Campos globais (preenchidos pelo utilizador)
-                                "PROJ_NUM": gf.get('PROJ_NUM', ''),
-                                "PROJ_NOME": gf.get('PROJ_NOME', ''),
-                                # Campos extraídos (normalizados)
-                                "CLIENTE": data.get("CLIENTE", ""),
-                                "OBRA": data.get("OBRA", ""),
-                                "LOCALIZACAO": data.get("LOCALIZACAO", ""),
-                                "ESPECIALIDADE": data.get("ESPECIALIDADE", ""),
-                                "PROJETOU": data.get("PROJETOU", ""),
-                                "FASE": data.get("FASE", ""),
-                                # Campos globais (preenchidos pelo utilizador)
-                                "FASE_PFIX": gf.get('FASE_PFIX', ''),
-                                "EMISSAO": gf.get('EMISSAO', ''),
-                                # Campos extraídos
-                                "DATA": data.get("DATA", "-"),
-                                "PFIX": pfix,
-                                # Campos extraídos
-                                "LAYOUT": data.get("LAYOUT", ""),
-                                "DES_NUM": num_desenho,
-                                "TIPO": tipo_extraido or task_info["batch_type"],
-                                # Campos globais
-                                "ELEMENTO": gf.get('ELEMENTO', ''),
-                                # Campos extraídos
-                                "TITULO": data.get("TITULO", "N/A"),
-                                # Todas as revisões
-                                "REV_A": data.get("REV_A", ""),
-                                "DATA_A": data.get("DATA_A", ""),
-                                "DESC_A": data.get("DESC_A", ""),
-                                "REV_B": data.get("REV_B", ""),
-                                "DATA_B": data.get("DATA_B", ""),
-                                "DESC_B": data.get("DESC_B", ""),
-                                "REV_C": data.get("REV_C", ""),
-                                "DATA_C": data.get("DATA_C", ""),
-                                "DESC_C": data.get("DESC_C", ""),
-                                "REV_D": data.get("REV_D", ""),
-                                "DATA_D": data.get("DATA_D", ""),
-                                "DESC_D": data.get("DESC_D", ""),
-                                "REV_E": data.get("REV_E", ""),
-                                "DATA_E": data.get("DATA_E", ""),
-                                "DESC_E": data.get("DESC_E", ""),
-                                # Campos extraídos/globais
-                                "DWG_SOURCE": gf.get('DWG_SOURCE', ''),
-                                "ID_CAD": data.get("ID_CAD", ""),
-                                # Flag interna (não exportada)
-                                "_source": "PDF"
-                            }
-                            
-                            if "error" in data:
-                                record["_obs"] = f"Erro IA: {data['error']}"
-                            
-                            new_records.append(record)
-                            completed += 1
-                            progress_bar.progress(completed / total_operations)
-                
-                return new_records
+                """Pipeline em streaming: rasterização, Gemini e registos em simultâneo."""
+                # Rate limiter partilhado por todas as sessões/processos com a mesma API key
+                # (token bucket por modelo; N vem da barra lateral)
+                rate_limiter = create_rate_limiter(api_key, turbo=turbo_mode, models=GEMINI_MODELS)
+                logger.info(f"Modo {'TURBO' if turbo_mode else 'Standard'} ativo: {rate_limiter.quotas.get(GEMINI_MODELS[0], rate_limiter.rpm):.0f} req/min partilhados ({GEMINI_MODELS[0]}), N={concurrency}")
+
+                def on_record(record, tokens, task_data, stats):
+                    st.session_state.total_tokens += tokens
+                    if task_data.get("source") == "TEXT":
+                        status_text.text(f"📝 Texto: {task_data['display_name']} ({stats['completed']}/{stats['produced']})")
+                    elif task_data.get("is_native", False):
+                        status_text.text(f"✅ Nativo: {task_data['native_data'].get('num_desenho', 'N/A')} ({stats['completed']}/{stats['produced']})")
+                    else:
+                        status_text.text(f"🤖 Gemini: {task_data['display_name']} ({stats['completed']}/{stats['produced']})")
+                    # Total ainda a crescer enquanto o produtor enumera ficheiros
+                    progress_bar.progress(min(stats["completed"] / max(stats["produced"], 1), 1.0))
+
+                new_records, stats = await process_tasks(
+                    iter_all_tasks(), api_key, st.session_state.global_fields, rate_limiter,
+                    concurrency=concurrency, use_cache=use_result_cache,
+                    raster_pool=raster_pool, raster_workers=raster_workers,
+                    on_record=on_record, batch_size=batch_size, source_executor=task_thread
+                )
+                return new_records, stats["latency"]
             
             # Executar processamento assíncrono
             try:
-                new_records = asyncio.run(process_all_pages())
-                st.session_state.master_data.extend(new_records)
-                status_text.success(f"✅ Processado! ({len(new_records)} desenhos extraídos)")
+                new_records, latency = asyncio.run(process_all_pages())
+                _, replaced = store.merge(st.session_state.project, new_records, sheet_index)
+                status_text.success(f"✅ Processado! ({len(new_records)} desenhos extraídos, {replaced} substituídos)")
+                if latency["n"]:
+                    st.session_state.last_latency = {**latency, "concurrency": int(concurrency), "batch_size": int(batch_size)}
 
                 # Resetar estados para próximo lote
                 st.session_state.crop_validated = False
@@ -1491,16 +580,23 @@ with col_input:
                 st.session_state.crop_validated = False
                 st.session_state.should_process = False
                 st.session_state.pending_tasks = None
+            finally:
+                task_thread.shutdown(wait=False)
+                if raster_pool is not None:
+                    raster_pool.shutdown(wait=False, cancel_futures=True)
+                # Limpar ficheiros temporários do lote
+                cleanup_temp_files(temp_files)
 
 with col_view:
     st.subheader("2. Lista Completa")
-    if len(st.session_state.master_data) > 0:
-        df = pd.DataFrame(st.session_state.master_data)
+    # Lista Mestra em memória (atualizada pela store só quando os dados mudam)
+    master = store.master_list(st.session_state.project)
+    if len(master):
         
         # PAINEL DE REORDENAÇÃO POR TIPO
         st.markdown("### 🔄 Reordenar por Tipo")
         
-        tipos_unicos = sorted(df['TIPO'].unique().tolist())
+        tipos_unicos = master.tipos()
         
         st.caption("Clica nos tipos pela ordem desejada (1º, 2º, 3º...)")
         col_pills, col_btn = st.columns([4, 1])
@@ -1524,29 +620,76 @@ with col_view:
                 st.session_state.ordem_customizada = []
                 st.rerun()
         
-        # Aplicar ordenação
-        if st.session_state.ordem_customizada:
-            # Usar ordem customizada
-            ordem_completa = st.session_state.ordem_customizada + [t for t in tipos_unicos if t not in st.session_state.ordem_customizada]
-            ordem_map = {tipo: idx for idx, tipo in enumerate(ordem_completa)}
-            df['_ordem'] = df['TIPO'].map(ordem_map)
-            df = df.sort_values(by=['_ordem', 'DES_NUM'])
-            df = df.drop('_ordem', axis=1)
-        else:
-            # Ordem alfabética padrão
-            if "DES_NUM" in df.columns and "TIPO" in df.columns:
-                df = df.sort_values(by=["TIPO", "DES_NUM"])
+        # Aplicar ordenação (ordem customizada primeiro, restantes tipos por ordem alfabética;
+        # nº de desenho em ordem natural). Memorizada por ordem de TIPOs: trocar de ordem
+        # só reordena inteiros, e a ordem só é recalculada quando os dados mudam.
+        df = master.sorted_frame(st.session_state.ordem_customizada)
         
         st.divider()
         
+        # VALIDAÇÃO DA LISTA (todas as regras de uma só vez, matriz de erros; memorizada por versão)
+        matriz = master.memo("validacao", validate_records)
+        estado = master.memo("estado", lambda _: validation_status(matriz))
+        n_erros, n_avisos = int((estado == ERRO).sum()), int((estado == AVISO).sum())
+        col_ok, col_av, col_er = st.columns(3)
+        col_ok.metric("✅ Válidos", int((estado == OK).sum()))
+        col_av.metric("⚠️ Com avisos", n_avisos)
+        col_er.metric("❌ Com erros", n_erros)
+        if n_erros or n_avisos:
+            with st.expander(f"🔍 Problemas de validação ({n_erros + n_avisos} registos)"):
+                nums = df.get('DES_NUM', {})
+                # Mensagens só para os primeiros registos com problemas (listas grandes)
+                problemas = matriz[estado > OK].head(200)
+                for idx, (erros, avisos) in describe_issues(df.loc[problemas.index], problemas).items():
+                    st.markdown(f"**{nums.get(idx) or f'Registo {idx}'}**")
+                    for msg in erros:
+                        st.caption(f"❌ {msg}")
+                    for msg in avisos:
+                        st.caption(f"⚠️ {msg}")
+        
         # Detectar se tem registos DXF (extracção nativa)
         has_dxf = '_source' in df.columns and (df['_source'] == 'DXF').any()
         has_pdf = '_source' in df.columns and (df['_source'] == 'PDF').any()
         
-        # VISUALIZAÇÃO: Mostrar colunas principais na UI
+        # FILTROS (aplicados no servidor; a tabela só recebe a página visível)
+        ultima_rev = master.memo("ultima_revisao", latest_revision)
+        col_f1, col_f2, col_f3 = st.columns(3)
+        filtro_tipos = col_f1.multiselect("Tipo", tipos_unicos, placeholder="Todos")
+        opcoes_rev = sorted(set(ultima_rev.tolist()), key=lambda r: (r == '', r))
+        filtro_revs = col_f2.multiselect(
+            "Última revisão", opcoes_rev, format_func=lambda r: r or "(sem revisão)", placeholder="Todas"
+        )
+        filtro_estado = col_f3.multiselect(
+            "Validação", list(ESTADOS_VALIDACAO), format_func=ESTADOS_VALIDACAO.get, placeholder="Todos"
+        )
+
+        mascara = np.ones(len(master), dtype=bool)
+        if filtro_tipos:
+            mascara &= master.df['TIPO'].astype(str).isin(filtro_tipos).to_numpy()
+        if filtro_revs:
+            mascara &= ultima_rev.isin(filtro_revs).to_numpy()
+        if filtro_estado:
+            mascara &= estado.isin(filtro_estado).to_numpy()
+        posicoes = master.filtered_order(st.session_state.ordem_customizada, mascara)
+        
+        # PAGINAÇÃO
+        col_pag1, col_pag2, col_pag3 = st.columns([1, 1, 2])
+        linhas_pagina = col_pag1.selectbox("Linhas por página", PAGE_SIZES, index=1)
+        n_paginas = max(1, -(-len(posicoes) // linhas_pagina))
+        pagina = col_pag2.number_input("Página", min_value=1, max_value=n_paginas, value=1, step=1)
+        inicio = (pagina - 1) * linhas_pagina
+        col_pag3.caption(
+            f"A mostrar {min(inicio + 1, len(posicoes))}–{min(inicio + linhas_pagina, len(posicoes))} "
+            f"de {len(posicoes)} desenhos" + (f" (filtrados de {len(master)})" if len(posicoes) != len(master) else "")
+        )
+        
+        # VISUALIZAÇÃO: Mostrar colunas principais na UI (só a página atual)
+        janela = master.window(posicoes, pagina - 1, linhas_pagina)
         colunas_display = ['PROJ_NUM', 'DES_NUM', 'TIPO', 'TITULO', 'DATA', 'REV_A', 'CLIENTE', 'OBRA']
-        colunas_existentes = [c for c in colunas_display if c in df.columns]
-        df_display = df[colunas_existentes].copy()
+        colunas_existentes = [c for c in colunas_display if c in janela.columns]
+        df_display = janela[colunas_existentes].assign(
+            VALIDACAO=estado.loc[janela.index].map(ESTADOS_VALIDACAO).to_numpy()
+        )
         
         st.dataframe(
             df_display,
@@ -1559,78 +702,58 @@ with col_view:
                 "DATA": st.column_config.TextColumn("Data", width="small"),
                 "REV_A": st.column_config.TextColumn("Rev.A", width="small"),
                 "CLIENTE": st.column_config.TextColumn("Cliente", width="medium"),
-                "OBRA": st.column_config.TextColumn("Obra", width="medium")
+                "OBRA": st.column_config.TextColumn("Obra", width="medium"),
+                "VALIDACAO": st.column_config.TextColumn("Validação", width="small")
             },
             hide_index=True
         )
         
-        # BOTÕES DE EXPORTAÇÃO
+        # BOTÕES DE EXPORTAÇÃO (sempre a lista completa, independentemente dos filtros)
         st.markdown("### 📥 Exportar")
-        col_exp1, col_exp2 = st.columns(2)
+        col_exp1, col_exp2, col_exp3 = st.columns(3)
         
         # Obter nome base do ficheiro a partir de DWG_SOURCE
-        dwg_source = st.session_state.global_fields.get('DWG_SOURCE', '').strip()
-        if dwg_source:
-            # Remover extensão se existir
-            nome_base = dwg_source.rsplit('.', 1)[0] if '.' in dwg_source else dwg_source
-            nome_ficheiro = f"{nome_base}-LD"
-        else:
-            nome_ficheiro = "lista_desenhos_jsj"
+        nome_ficheiro = export_file_basename(st.session_state.global_fields.get('DWG_SOURCE', ''))
+
+        # Ficheiros gerados só no clique (ou memorizados pela revisão dos dados e ordem):
+        # reruns como os da reordenação não reconstroem XLSX/CSV
+        revisao = store.revision(st.session_state.project)
+        ordem = tuple(st.session_state.ordem_customizada)
+
+        def export_data(fmt):
+            # XLSX/CSV escritos em streaming a partir da store (sem copiar o DataFrame)
+            if LAZY_DOWNLOADS:
+                return exports.lazy(fmt, df, st.session_state.project, revisao, ordem, store)
+            return exports.get(fmt, df, st.session_state.project, revisao, ordem, store)
         
         with col_exp1:
             # Exportar XLSX com colunas normalizadas na ordem correta
-            buffer_xlsx = io.BytesIO()
-            
-            # Reordenar colunas conforme COLUNAS_NORMALIZADAS
-            df_export = df.drop(columns=['_source', '_obs'], errors='ignore').copy()
-            
-            # Garantir que todas as colunas existem (preencher com vazio se não)
-            for col in COLUNAS_NORMALIZADAS:
-                if col not in df_export.columns:
-                    df_export[col] = ''
-            
-            # Reordenar para a ordem exata
-            df_export = df_export[COLUNAS_NORMALIZADAS]
-            
-            with pd.ExcelWriter(buffer_xlsx, engine='xlsxwriter') as writer:
-                df_export.to_excel(writer, index=False, sheet_name='Lista Mestra JSJ')
-                worksheet = writer.sheets['Lista Mestra JSJ']
-                # Ajustar larguras de colunas
-                for idx, col in enumerate(COLUNAS_NORMALIZADAS):
-                    max_len = max(df_export[col].astype(str).map(len).max(), len(col)) + 2
-                    worksheet.set_column(idx, idx, min(max_len, 40))
-            
             st.download_button(
                 "📊 Descarregar XLSX",
-                data=buffer_xlsx.getvalue(),
+                data=export_data("xlsx"),
                 file_name=f"{nome_ficheiro}.xlsx",
                 mime="application/vnd.openxmlformats-officedocument.spreadsheetml.sheet",
                 help="Excel com 34 colunas normalizadas na ordem correta"
             )
         
         with col_exp2:
-            # Exportar CSV com colunas normalizadas
-            csv_buffer = io.BytesIO()
-            
-            # Usar o mesmo df_export já preparado
-            df_csv = df.drop(columns=['_source', '_obs'], errors='ignore').copy()
-            for col in COLUNAS_NORMALIZADAS:
-                if col not in df_csv.columns:
-                    df_csv[col] = ''
-            df_csv = df_csv[COLUNAS_NORMALIZADAS]
-            
-            # Escrever CSV com encoding UTF-8 com BOM para Excel reconhecer caracteres especiais
-            csv_content = df_csv.to_csv(index=False, sep=';')
-            csv_buffer.write(b'\xef\xbb\xbf')  # UTF-8 BOM
-            csv_buffer.write(csv_content.encode('utf-8'))
-            csv_buffer.seek(0)
-            
+            # Exportar CSV com colunas normalizadas (UTF-8 com BOM para o Excel)
             st.download_button(
                 "📋 Descarregar CSV",
-                data=csv_buffer.getvalue(),
+                data=export_data("csv"),
                 file_name=f"{nome_ficheiro}.csv",
                 mime="text/csv;charset=utf-8",
                 help="CSV com 34 colunas normalizadas na ordem correta"
             )
+        
+        with col_exp3:
+            # Relatório PDF (A4 horizontal, uma secção por TIPO)
+            st.download_button(
+                "📄 Descarregar PDF",
+                data=export_data("pdf"),
+                file_name=f"{nome_ficheiro}.pdf",
+                mime="application/pdf",
+                help="Relatório com Nº, título, revisão, data, cliente e obra, agrupado por tipo"
+            )
     else:
         st.info("Define um 'Tipo' e carrega ficheiros.")
\ No newline at end of file
@@ -0,0 +1,768 @@
+"""Benchmarks reprodutíveis dos caminhos críticos da extração.
+
+Gera PDFs, DXFs e JSONs LISP sintéticos (10, 100 e 1000 folhas por omissão) e
+mede cada fase isoladamente, num processo próprio (para o pico de RSS ser o da
+fase). O pipeline completo corre contra um Gemini local simulado, com
+latência, erros e 429 configuráveis. Não faz chamadas à API.
+
+Exemplos:
+    python jsj_bench.py
+    python jsj_bench.py --sizes 10 100 --only pipeline --latency 0.8 --rate-429 0.05
+    python jsj_bench.py --json bench.json
+"""
+import argparse
+import asyncio
+import contextlib
+import functools
+import io
+import json
+import logging
+import os
+import random
+import sys
+import tempfile
+import threading
+import time
+from concurrent.futures import ProcessPoolExecutor
+import multiprocessing
+
+import fitz  # PyMuPDF
+import pandas as pd
+from PIL import Image
+
+import jsj_core
+import jsj_gemini
+from jsj_core import (
+    AUTO_CROP_PRESET,
+    CROP_PRESETS,
+    DWG_SUPPORT,
+    FALLBACK_CROP_PRESET,
+    RateLimiter,
+    build_record,
+    create_pdf_export,
+    export_xlsx_bytes,
+    get_crop_box,
+    get_crop_rect,
+    iter_file_tasks,
+    iter_lisp_json_tasks,
+    prepare_export_df,
+    process_tasks,
+    validate_extracted_data,
+)
+from jsj_export import ExportCache, export_records
+from jsj_gemini import GeminiClientPool, get_client_pool
+from jsj_dwg import DwgSession, extract_dwg_native_blocks
+from jsj_imageprep import COLOR_MODES, IMAGE_FORMATS, estimate_image_tokens, image_options
+from jsj_raster import render_dwg_layout, render_pdf_page
+from jsj_pipeline import summarize_latencies
+from jsj_masterlist import _harmonize
+from jsj_ratelimit import SharedRateLimiter
+from jsj_retry import RetryPolicy
+from jsj_store import ProjectStore
+from jsj_textlayer import OUTPUT_FIELDS
+from jsj_validation import validate_records
+
+try:
+    import resource
+except ImportError:  # Windows
+    resource = None
+
+try:
+    from google.api_core.exceptions import ResourceExhausted
+except ImportError:
+    class ResourceExhausted(Exception):
+        pass
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_SIZES = [10, 100, 1000]
+GLOBAL_FIELDS = {'PROJ_NUM': 'BENCH', 'PROJ_NOME': 'Benchmark', 'FASE_PFIX': '', 'EMISSAO': '', 'ELEMENTO': '', 'DWG_SOURCE': ''}
+
+
+# --- DADOS SINTÉTICOS ---
+
+def _draw_legenda(page, i, revs):
+    """Legenda JSJ (tabela de revisões + campos) no canto inferior direito de uma A3."""
+    x, y = 820, 560
+    page.draw_rect(fitz.Rect(800, 540, 1180, 832))
+    page.insert_text((x, y + 10), "REV", fontsize=7)
+    page.insert_text((x + 30, y + 10), "DATA", fontsize=7)
+    page.insert_text((x + 100, y + 10), "DESCRIÇÃO", fontsize=7)
+    for k in range(revs):
+        letter = "ABCDE"[k]
+        yy = y + 22 + k * 12
+        page.insert_text((x + 2, yy), letter, fontsize=7)
+        page.insert_text((x + 30, yy), f"1{k}/0{k + 1}/2025", fontsize=7)
+        page.insert_text((x + 100, yy), f"Revisão {letter}", fontsize=7)
+    rows = [
+        ("CLIENTE", "arcaya"), ("OBRA", "Edifício Altis"), ("LOCALIZAÇÃO", "VILAMOURA"),
+        ("ESPECIALIDADE", "ESTRUTURA E FUNDAÇÕES"), ("FASE", "LIC"), ("DATA", "10/01/2025"),
+        ("TIPO", "Betão Armado"), ("TÍTULO", f"Planta piso {i}"), ("Nº DESENHO", f"EST-{i:04d}"),
+    ]
+    for j, (label, value) in enumerate(rows):
+        yy = 660 + j * 16
+        page.insert_text((x, yy), label, fontsize=7)
+        page.insert_text((x + 90, yy), value, fontsize=9)
+
+
+def make_synthetic_pdf(path, sheets):
+    """PDF A3 vetorial com `sheets` folhas (geometria + legenda JSJ)."""
+    rng = random.Random(sheets)
+    doc = fitz.open()
+    for i in range(sheets):
+        page = doc.new_page(width=1190, height=842)
+        for _ in range(40):
+            page.draw_line((rng.uniform(30, 780), rng.uniform(30, 520)), (rng.uniform(30, 780), rng.uniform(30, 520)))
+        _draw_legenda(page, i, revs=i % 5)
+    doc.save(path)
+    doc.close()
+
+
+def make_synthetic_dxf(path, sheets):
+    """DXF com `sheets` layouts Paper Space, cada um com um bloco LEGENDA_JSJ_V1."""
+    import ezdxf
+
+    doc = ezdxf.new()
+    tags = ['TIPO', 'DES_NUM', 'TITULO', 'DATA'] + [f'{p}_{r}' for r in 'ABCDE' for p in ('REV', 'DATA', 'DESC')]
+    block = doc.blocks.new('LEGENDA_JSJ_V1')
+    block.add_lwpolyline([(0, 0), (180, 0), (180, 60), (0, 60)], close=True)
+    for i, tag in enumerate(tags):
+        block.add_attdef(tag, (2, 2 + i * 3), dxfattribs={'height': 2})
+
+    for i in range(sheets):
+        layout = doc.layouts.new(f'EST-{i:04d}')
+        for k in range(20):
+            layout.add_line((k * 10, 0), (k * 10 + 50, 150))
+        insert = layout.add_blockref('LEGENDA_JSJ_V1', (220, 10))
+        attribs = {'TIPO': 'BETAO', 'DES_NUM': f'EST-{i:04d}', 'TITULO': f'Planta piso {i}', 'DATA': '10/01/2025'}
+        for k in range(i % 5):
+            letter = 'ABCDE'[k]
+            attribs.update({f'REV_{letter}': letter, f'DATA_{letter}': f'1{k}/0{k + 1}/2025', f'DESC_{letter}': f'Revisão {letter}'})
+        insert.add_auto_attribs(attribs)
+    doc.saveas(path)
+
+
+def make_synthetic_lisp_json(sheets):
+    """JSON no formato da LISP nova (lista de desenhos com atributos aninhados)."""
+    items = []
+    for i in range(sheets):
+        attrs = {'TIPO': 'BETAO', 'DES_NUM': f'EST-{i:04d}', 'TITULO': f'Planta piso {i}', 'DATA': '2025.01.10'}
+        for k in range(i % 5):
+            letter = 'ABCDE'[k]
+            attrs.update({f'REV_{letter}': letter, f'DATA_{letter}': f'2025.0{k + 1}.1{k}', f'DESC_{letter}': f'Revisão {letter}'})
+        items.append({'layout_tab': f'EST-{i:04d}', 'id_desenho': i + 1, 'atributos': attrs})
+    return items
+
+
+def prepare_fixtures(workdir, sizes, with_dwg=True):
+    """Gera (ou reutiliza) os ficheiros sintéticos de cada tamanho."""
+    os.makedirs(workdir, exist_ok=True)
+    fixtures = {}
+    for size in sizes:
+        pdf_path = os.path.join(workdir, f"synthetic_{size}.pdf")
+        if not os.path.exists(pdf_path):
+            make_synthetic_pdf(pdf_path, size)
+        json_path = os.path.join(workdir, f"synthetic_{size}.json")
+        if not os.path.exists(json_path):
+            with open(json_path, 'w', encoding='utf-8') as f:
+                json.dump(make_synthetic_lisp_json(size), f, ensure_ascii=False)
+        dxf_path = os.path.join(workdir, f"synthetic_{size}.dxf")
+        if with_dwg and not os.path.exists(dxf_path):
+            make_synthetic_dxf(dxf_path, size)
+        fixtures[size] = {"pdf": pdf_path, "json": json_path, "dxf": dxf_path if with_dwg else None}
+    return fixtures
+
+
+def synthetic_records(json_path):
+    """Registos de 34 colunas (via ingestão LISP) para os benchmarks de exportação."""
+    with open(json_path, encoding='utf-8') as f:
+        items = json.load(f)
+    return [build_record(task, None, GLOBAL_FIELDS)[0] for task in iter_lisp_json_tasks(items, os.path.basename(json_path))]
+
+
+# --- GEMINI SIMULADO ---
+
+class FakeUsage:
+    def __init__(self, total_token_count):
+        self.total_token_count = total_token_count
+
+
+class FakeResponse:
+    def __init__(self, text, total_token_count):
+        self.text = text
+        self.usage_metadata = FakeUsage(total_token_count)
+
+
+def _image_tokens(contents):
+    """Tokens de cada imagem de um pedido (PIL.Image ou blob inline {"mime_type", "data"})."""
+    tokens = []
+    for part in contents:
+        if isinstance(part, dict) and "data" in part:
+            with Image.open(io.BytesIO(part["data"])) as img:
+                tokens.append(estimate_image_tokens(*img.size))
+        elif hasattr(part, "size"):
+            tokens.append(estimate_image_tokens(*part.size))
+    return tokens or [258]
+
+
+class FakeGenerativeModel:
+    """Imita genai.GenerativeModel.generate_content com latência, erros e 429.
+
+    A configuração é partilhada pela classe (ver fake_gemini) e o gerador
+    aleatório é determinístico (seed) para resultados reprodutíveis.
+    """
+    latency = 0.5
+    jitter = 0.3
+    error_rate = 0.0
+    rate_429 = 0.0
+    calls = 0
+    throttled = 0
+    failed = 0
+    fallbacks = 0  # pedidos a modelos que não o principal
+    batch_drop = 0.0  # fração de objetos omitidos nas respostas em lote
+    malformed = 0.0   # fração de respostas com texto extra e vírgulas finais (JSON inválido)
+    dropped = 0
+    _rng = random.Random(0)
+    _lock = threading.Lock()
+
+    def __init__(self, model_name, **kwargs):
+        self.model_name = model_name
+        self._client = None  # como no SDK: o pool injeta o cliente da API key
+
+    def generate_content(self, contents, **kwargs):
+        cls = FakeGenerativeModel
+        with cls._lock:
+            cls.calls += 1
+            call = cls.calls
+            if self.model_name != jsj_core.GEMINI_MODELS[0]:
+                cls.fallbacks += 1
+            delay = max(0.0, cls._rng.gauss(cls.latency, cls.latency * cls.jitter))
+            roll = cls._rng.random()
+
+        time.sleep(delay)
+        if roll < cls.rate_429:
+            with cls._lock:
+                cls.throttled += 1
+            # Como a API real, o 429 sugere quando repetir
+            raise ResourceExhausted(f"429 Resource has been exhausted (e.g. check quota). Please retry in {cls.latency:.1f}s.")
+        if roll < cls.rate_429 + cls.error_rate:
+            with cls._lock:
+                cls.failed += 1
+            raise RuntimeError("500 Internal error encountered.")
+
+        # ~400 tokens de prompt por pedido, seja qual for o nº de imagens
+        images = _image_tokens(contents)
+        tokens = 400 + sum(images)
+        items = []
+        for n in range(1, len(images) + 1):
+            data = {field: '' for field in OUTPUT_FIELDS}
+            data.update({'NUM': f'{call:04d}-{n}', 'PFIX': 'EST', 'TITULO': f'Planta {call}.{n}', 'DATA': '10/01/2025', 'TIPO': 'Betão Armado', 'obs': ''})
+            data['IMAGEM'] = n
+            items.append(data)
+        if len(items) == 1:
+            items[0].pop('IMAGEM')
+            text = json.dumps(items[0], ensure_ascii=False)
+            with cls._lock:
+                malformed = cls._rng.random() < cls.malformed
+            if malformed:
+                # Como os modelos sem modo JSON: prosa à volta e vírgula final
+                text = f"Aqui está o JSON pedido:\n{text[:-1]},}}\nEspero que ajude."
+            return FakeResponse(f"```json\n{text}\n```", tokens)
+        with cls._lock:
+            # Lote: alguns objetos podem faltar na resposta (split-and-retry)
+            kept = [item for item in items if cls._rng.random() >= cls.batch_drop]
+            cls.dropped += len(items) - len(kept)
+        return FakeResponse(f"```json\n{json.dumps(kept, ensure_ascii=False)}\n```", tokens)
+
+
+@contextlib.contextmanager
+def fake_gemini(latency=0.5, jitter=0.3, error_rate=0.0, rate_429=0.0, seed=0, batch_drop=0.0, malformed=0.0):
+    """Substitui o Gemini (jsj_gemini.genai) pelo FakeGenerativeModel durante o bloco.
+
+    O backoff das repetições é escalado pela latência simulada (em vez de segundos).
+    """
+    genai = jsj_gemini.genai
+    original_model, original_configure = genai.GenerativeModel, genai.configure
+    get_client_pool().clear()
+    original_policy = jsj_core.RETRY_POLICY
+    jsj_core.RETRY_POLICY = RetryPolicy(max_attempts=4, base_delay=latency / 2, max_delay=latency * 4)
+    FakeGenerativeModel.latency = latency
+    FakeGenerativeModel.jitter = jitter
+    FakeGenerativeModel.error_rate = error_rate
+    FakeGenerativeModel.rate_429 = rate_429
+    FakeGenerativeModel.calls = FakeGenerativeModel.throttled = FakeGenerativeModel.failed = 0
+    FakeGenerativeModel.fallbacks = FakeGenerativeModel.dropped = 0
+    FakeGenerativeModel.batch_drop = batch_drop
+    FakeGenerativeModel.malformed = malformed
+    FakeGenerativeModel._rng = random.Random(seed)
+    genai.GenerativeModel = FakeGenerativeModel
+    genai.configure = lambda **kwargs: None
+    try:
+        yield FakeGenerativeModel
+    finally:
+        genai.GenerativeModel, genai.configure = original_model, original_configure
+        jsj_core.RETRY_POLICY = original_policy
+        get_client_pool().clear()
+
+
+# --- MEDIÇÃO ---
+
+def peak_rss_mb():
+    """Pico de memória residente do processo (MB), ou None se indisponível."""
+    if resource is None:
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # Linux devolve KB, macOS bytes
+    return peak / 1024 / 1024 if sys.platform == "darwin" else peak / 1024
+
+
+def _result(name, size, items, elapsed, latencies, **extra):
+    lat = summarize_latencies(latencies)
+    return {
+        "bench": name,
+        "size": size,
+        "items": items,
+        "seconds": elapsed,
+        "throughput": items / elapsed if elapsed > 0 else 0.0,
+        "p50_ms": lat["p50"] * 1000,
+        "p95_ms": lat["p95"] * 1000,
+        "peak_rss_mb": peak_rss_mb(),
+        **extra,
+    }
+
+
+def _time_each(calls):
+    """Executa cada callable e devolve (tempo total, latências por chamada)."""
+    latencies = []
+    start = time.perf_counter()
+    for call in calls:
+        t0 = time.perf_counter()
+        call()
+        latencies.append(time.perf_counter() - t0)
+    return time.perf_counter() - start, latencies
+
+
+# --- BENCHMARKS (um processo por benchmark) ---
+
+def _legacy_crop_png(doc, page_num, preset):
+    """Crop como era enviado antes da preparação adaptativa: preset fixo, zoom 2x, PNG RGB."""
+    if preset == AUTO_CROP_PRESET:
+        preset = FALLBACK_CROP_PRESET
+    page = doc.load_page(page_num)
+    pix = page.get_pixmap(clip=get_crop_rect(page, preset), matrix=fitz.Matrix(2, 2))
+    return pix.width, pix.height, len(pix.tobytes("png"))
+
+
+def bench_crop(fixture, size, options):
+    """Crop + preparação da imagem em cada preset (todas as páginas), com poupança face ao zoom 2x PNG.
+
+    O preset automático inclui a localização da legenda e compara com o preset fixo por omissão.
+    """
+    results = []
+    doc = fitz.open(fixture["pdf"])
+    for preset in CROP_PRESETS:
+        images = []
+        boxes = []
+
+        def render(page_num, preset=preset):
+            boxes.append(get_crop_box(doc.load_page(page_num), preset))
+            images.append(render_pdf_page(doc, page_num, boxes[-1], options["image_opts"]))
+
+        elapsed, latencies = _time_each([lambda p=p: render(p) for p in range(doc.page_count)])
+
+        # Referência: zoom fixo 2x + PNG (amostra de páginas)
+        sample = range(0, doc.page_count, max(1, doc.page_count // 10))
+        legacy = [_legacy_crop_png(doc, p, preset) for p in sample]
+        legacy_bytes = sum(b for _, _, b in legacy) / len(legacy)
+        legacy_tokens = sum(estimate_image_tokens(w, h) for w, h, _ in legacy) / len(legacy)
+        page_bytes = sum(len(img) for img in images) / len(images)
+        page_tokens = sum(img.tokens for img in images) / len(images)
+        width, height = images[0].size
+
+        results.append(_result(
+            f"crop[{preset}]", size, doc.page_count, elapsed, latencies,
+            crop_box=boxes[0], image_px=f"{width}x{height}",
+            bytes_per_page=page_bytes, tokens_per_page=page_tokens,
+            bytes_saved_per_page=legacy_bytes - page_bytes,
+            tokens_saved_per_page=legacy_tokens - page_tokens,
+        ))
+    doc.close()
+    return results
+
+
+def bench_dwg_native(fixture, size, options):
+    """Parse do DXF + extract_dwg_native_blocks em todos os layouts."""
+    start = time.perf_counter()
+    session = DwgSession(fixture["dxf"])
+    parse_time = time.perf_counter() - start
+    layouts = session.paperspace_layouts()
+    elapsed, latencies = _time_each([lambda name=name: extract_dwg_native_blocks(session, name) for name in layouts])
+    return [_result("dwg_native_blocks", size, len(layouts), elapsed + parse_time, latencies, parse_s=parse_time)]
+
+
+def bench_dwg_render(fixture, size, options):
+    """Renderização + preparação de layouts DWG numa amostra de layouts (matplotlib é lento)."""
+    session = DwgSession(fixture["dxf"])
+    layouts = session.paperspace_layouts()[:options["render_sample"]]
+    elapsed, latencies = _time_each([lambda name=name: render_dwg_layout(session, name, options["image_opts"]) for name in layouts])
+    return [_result("dwg_render", size, len(layouts), elapsed, latencies, sampled=len(layouts))]
+
+
+def bench_json_ingest(fixture, size, options):
+    """Ingestão JSON LISP: leitura + tasks + registos de 34 colunas."""
+    with open(fixture["json"], 'rb') as f:
+        raw = f.read()
+    latencies = []
+    start = time.perf_counter()
+    items = json.loads(raw.decode('utf-8'))
+    t0 = time.perf_counter()
+    for task in iter_lisp_json_tasks(items, os.path.basename(fixture["json"])):
+        build_record(task, None, GLOBAL_FIELDS)
+        t1 = time.perf_counter()
+        latencies.append(t1 - t0)
+        t0 = t1
+    return [_result("json_lisp_ingest", size, len(items), time.perf_counter() - start, latencies)]
+
+
+def bench_validation(fixture, size, options):
+    """validate_extracted_data por folha e validate_records sobre a Lista Mestra inteira."""
+    rng = random.Random(size)
+    samples = []
+    for i in range(size):
+        samples.append({
+            'PFIX': 'EST',
+            'NUM': f'{i:04d}' if rng.random() > 0.05 else '',
+            'TITULO': f'Planta piso {i}',
+            'R': rng.choice(['A', 'B', '', '?']),
+            'DATA': rng.choice(['10/01/2025', '2025-01-10', '??/??/????', '']),
+        })
+    elapsed, latencies = _time_each([lambda s=s: validate_extracted_data(s, "bench") for s in samples])
+    results = [_result("validate_extracted_data", size, size, elapsed, latencies)]
+
+    # Lista Mestra com datas/revisões variadas (e alguns números repetidos)
+    df = pd.DataFrame(synthetic_records(fixture["json"]))
+    df['DES_NUM'] = [f'EST-{rng.randrange(size * 2):04d}' for _ in range(len(df))]
+    df['DATA_A'] = [rng.choice(['10/01/2025', '32/01/2025', '']) for _ in range(len(df))]
+    df['REV_A'] = [rng.choice(['A', 'a', '']) for _ in range(len(df))]
+    elapsed, latencies = _time_each([lambda: validate_records(df) for _ in range(options["repeat"])])
+    results.append(_result("validate_records", size, len(df) * options["repeat"], elapsed, latencies))
+    return results
+
+
+def bench_pdf_export(fixture, size, options):
+    """create_pdf_export (reportlab) da lista completa."""
+    df = pd.DataFrame(synthetic_records(fixture["json"]))
+    elapsed, latencies = _time_each([lambda: create_pdf_export(df) for _ in range(options["repeat"])])
+    return [_result("pdf_export", size, len(df) * options["repeat"], elapsed, latencies)]
+
+
+def bench_xlsx_export(fixture, size, options):
+    """Exportação XLSX das 34 colunas normalizadas."""
+    df = pd.DataFrame(synthetic_records(fixture["json"]))
+    elapsed, latencies = _time_each([lambda: export_xlsx_bytes(prepare_export_df(df)) for _ in range(options["repeat"])])
+    results = [_result("xlsx_export", size, len(df) * options["repeat"], elapsed, latencies)]
+    # Reruns com os mesmos dados (ex.: reordenar): ExportCache devolve os bytes memorizados
+    cache = ExportCache()
+    elapsed, latencies = _time_each([lambda: cache.get("xlsx", df, "bench", (len(df), size)) for _ in range(options["repeat"])])
+    results.append(_result("xlsx_export_cached", size, len(df) * options["repeat"], elapsed, latencies, builds=cache.builds))
+
+    # Streaming a partir da store (constant_memory), sem DataFrame
+    with tempfile.TemporaryDirectory() as workdir:
+        store = ProjectStore(os.path.join(workdir, "bench.sqlite"))
+        store.append("bench", df.to_dict("records"))
+        out_path = os.path.join(workdir, "bench.xlsx")
+        elapsed, latencies = _time_each([lambda: export_records(store, "bench", "xlsx", out_path) for _ in range(options["repeat"])])
+    results.append(_result("xlsx_export_stream", size, len(df) * options["repeat"], elapsed, latencies))
+    return results
+
+
+def bench_pipeline(fixture, size, options):
+    """Pipeline completo (process_all_pages) sobre o PDF sintético, com Gemini simulado."""
+    rate_limiter = RateLimiter(max_requests=options["rpm"], time_window=60)
+    tokens = 0
+
+    def on_record(record, record_tokens, task, stats):
+        nonlocal tokens
+        tokens += record_tokens
+
+    with fake_gemini(options["latency"], options["jitter"], options["error_rate"], options["rate_429"], options["seed"],
+                     options["batch_drop"], options["malformed"]) as fake:
+        start = time.perf_counter()
+        tasks = iter_file_tasks(
+            os.path.basename(fixture["pdf"]), fixture["pdf"], "BENCH",
+            use_text_layer=options["text_layer"], image_opts=options["image_opts"]
+        )
+        records, stats = asyncio.run(process_tasks(
+            tasks, "fake-key", GLOBAL_FIELDS, rate_limiter,
+            concurrency=options["concurrency"], use_cache=False,
+            on_record=on_record, batch_size=options["batch_size"]
+        ))
+        elapsed = time.perf_counter() - start
+        api_calls, throttled, failed, fallbacks = fake.calls, fake.throttled, fake.failed, fake.fallbacks
+        clients = get_client_pool().created
+
+    # Registos sem dados (todos os modelos falharam)
+    errors = sum(1 for r in records if r.get('_obs', '').startswith('Erro IA'))
+    return [_result(
+        f"pipeline[K={options['batch_size']}]" if options["batch_size"] > 1 else "pipeline",
+        size, len(records), elapsed, stats["latencies"],
+        api_calls=api_calls, api_429=throttled, api_500=failed, errors=errors, fallbacks=fallbacks,
+        concurrency=options["concurrency"], window=rate_limiter.concurrency(options["concurrency"]),
+        clients=clients, tokens=tokens, dropped=fake.dropped
+    )]
+
+
+def bench_reingest(fixture, size, options):
+    """Reingestão de um conjunto revisto (1 folha alterada) com e sem deteção de alterações."""
+    def ingest(pdf_path, store, known_sheets):
+        start = time.perf_counter()
+        tasks = iter_file_tasks(
+            "conjunto.pdf", pdf_path, "BENCH",
+            use_text_layer=options["text_layer"], image_opts=options["image_opts"],
+            known_sheets=known_sheets
+        )
+        records, stats = asyncio.run(process_tasks(
+            tasks, "fake-key", GLOBAL_FIELDS, RateLimiter(max_requests=options["rpm"], time_window=60),
+            concurrency=options["concurrency"], use_cache=False
+        ))
+        store.merge("BENCH", records)
+        return time.perf_counter() - start, stats["latencies"], len(records)
+
+    results = []
+    with tempfile.TemporaryDirectory() as tmp, fake_gemini(options["latency"], options["jitter"], 0.0, 0.0, options["seed"]) as fake:
+        store = ProjectStore(os.path.join(tmp, "projects.sqlite"))
+        ingest(fixture["pdf"], store, None)
+
+        # Conjunto revisto: só a página do meio muda
+        revised = os.path.join(tmp, "revisto.pdf")
+        doc = fitz.open(fixture["pdf"])
+        doc[doc.page_count // 2].insert_text((60, 60), "REVISTO", fontsize=12)
+        doc.save(revised)
+        doc.close()
+
+        for label, known in (("completa", None), ("incremental", store.sheet_fingerprints("BENCH"))):
+            calls_before = fake.calls
+            elapsed, latencies, processed = ingest(revised, store, known)
+            results.append(_result(
+                f"reingest[{label}]", size, processed, elapsed, latencies,
+                api_calls=fake.calls - calls_before, api_429=0, api_500=0, errors=0,
+                drawings=store.count("BENCH")
+            ))
+    return results
+
+
+def bench_gemini_client(fixture, size, options):
+    """Custo de preparar o cliente Gemini em cada pedido: configure() + modelo novo vs pool.
+
+    Usa o SDK real sem rede: mede a construção de objetos e canais gRPC
+    (o handshake TLS de cada canal novo, ausente aqui, agrava o caso sem pool).
+    """
+    genai = jsj_gemini.genai
+    models = jsj_core.GEMINI_MODELS[:2]
+
+    def per_call(model_name):
+        genai.configure(api_key="bench-key")
+        model = genai.GenerativeModel(model_name)
+        model._client = jsj_gemini.genai_client.get_default_generative_client()
+
+    pool = GeminiClientPool()
+    calls = [models[i % len(models)] for i in range(size)]
+    elapsed_old, lat_old = _time_each([functools.partial(per_call, m) for m in calls])
+    elapsed_new, lat_new = _time_each([functools.partial(pool.model, "bench-key", m) for m in calls])
+    return [
+        _result("gemini_client[configure]", size, size, elapsed_old, lat_old, clients=size),
+        _result("gemini_client[pool]", size, size, elapsed_new, lat_new, clients=pool.created),
+    ]
+
+
+def _ratelimit_worker(path, rpm, count):
+    """Processo concorrente: `count` pedidos contra o rate limiter partilhado."""
+    limiter = SharedRateLimiter(max_requests=rpm, time_window=60, api_key="bench", models=["bench"], path=path, burst=1)
+    grants, overhead = [], []
+    for _ in range(count):
+        t0 = time.perf_counter()
+        wait = limiter.reserve()
+        overhead.append(time.perf_counter() - t0)
+        if wait > 0:
+            time.sleep(wait)
+        grants.append(time.time())
+    return grants, overhead
+
+
+def bench_ratelimit(fixture, size, options):
+    """Rate limiter partilhado: 4 processos disputam uma quota calibrada para ~2 s de pedidos.
+
+    O tempo é medido entre o primeiro e o último pedido autorizado (sem o
+    arranque dos processos); latência = custo de cada reserva no SQLite.
+    """
+    workers = 4
+    rpm = max(60, size * 30)
+    per_worker = max(1, size // workers)
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, "ratelimit.sqlite")
+        with ProcessPoolExecutor(max_workers=workers, mp_context=multiprocessing.get_context("spawn")) as pool:
+            parts = list(pool.map(_ratelimit_worker, [path] * workers, [rpm] * workers, [per_worker] * workers))
+
+    grants = sorted(g for part, _ in parts for g in part)
+    overhead = [o for _, part in parts for o in part]
+    rate, capacity = SharedRateLimiter(max_requests=rpm, time_window=60, path=None, burst=1).quota("bench")
+    span = grants[-1] - grants[0] if len(grants) > 1 else 0.0
+    # Nunca mais pedidos do que a capacidade + débito × tempo decorrido
+    allowed = capacity + rate * span
+    return [_result(
+        "ratelimit[4 processos]", size, len(grants), span, overhead,
+        rpm_limit=rpm, rpm_achieved=(len(grants) - capacity) / span * 60 if span else 0.0,
+        within_quota=len(grants) <= allowed + 1
+    )]
+
+
+def bench_master_list(fixture, size, options):
+    """Lista Mestra em memória: DataFrame de dicts (antes) vs MasterList categórica carregada aos blocos."""
+    records = synthetic_records(fixture["json"])
+    with tempfile.TemporaryDirectory() as tmp:
+        store = ProjectStore(os.path.join(tmp, "projects.sqlite"))
+        half = len(records) // 2
+        store.append("BENCH", records[:half])
+        start = time.perf_counter()
+        master = store.master_list("BENCH")
+        full = time.perf_counter() - start
+        # Segundo lote: só os desenhos novos são lidos e acrescentados
+        store.append("BENCH", records[half:])
+        start = time.perf_counter()
+        master = store.master_list("BENCH")
+        incremental = time.perf_counter() - start
+
+        start = time.perf_counter()
+        legacy = _harmonize(pd.DataFrame(store.load("BENCH")))
+        legacy_elapsed = time.perf_counter() - start
+        results = [
+            _result(
+                "master_list[dicts]", size, len(legacy), legacy_elapsed, [legacy_elapsed],
+                memory_kb=int(legacy.memory_usage(deep=True).sum() / 1024)
+            ),
+            _result(
+                "master_list[categorical]", size, len(master), full + incremental, [full, incremental],
+                memory_kb=int(master.memory_usage() / 1024)
+            ),
+        ]
+    return results
+
+
+BENCHMARKS = {
+    "crop": bench_crop,
+    "dwg_native": bench_dwg_native,
+    "dwg_render": bench_dwg_render,
+    "json": bench_json_ingest,
+    "validation": bench_validation,
+    "pdf_export": bench_pdf_export,
+    "xlsx_export": bench_xlsx_export,
+    "pipeline": bench_pipeline,
+    "reingest": bench_reingest,
+    "ratelimit": bench_ratelimit,
+    "gemini_client": bench_gemini_client,
+    "master_list": bench_master_list,
+}
+DWG_BENCHMARKS = {"dwg_native", "dwg_render"}
+
+
+def _run_isolated(name, fixture, size, options):
+    """Corre um benchmark num processo novo (pico de RSS próprio)."""
+    logging.basicConfig(level=logging.INFO if options["verbose"] else logging.CRITICAL)
+    return BENCHMARKS[name](fixture, size, options)
+
+
+def run_benchmarks(names, sizes, workdir, options):
+    with_dwg = DWG_SUPPORT and bool(DWG_BENCHMARKS & set(names))
+    fixtures = prepare_fixtures(workdir, sizes, with_dwg)
+    context = multiprocessing.get_context("spawn")
+    results = []
+    for size in sizes:
+        for name in names:
+            if name in DWG_BENCHMARKS and not with_dwg:
+                logger.warning(f"{name}: ignorado (ezdxf/matplotlib não instalados)")
+                continue
+            with ProcessPoolExecutor(max_workers=1, mp_context=context) as pool:
+                for row in pool.submit(_run_isolated, name, fixtures[size], size, options).result():
+                    results.append(row)
+                    print(format_row(row), flush=True)
+    return results
+
+
+def format_row(row):
+    rss = f"{row['peak_rss_mb']:.0f}" if row['peak_rss_mb'] is not None else "n/d"
+    line = (
+        f"{row['bench']:<44} {row['size']:>5} {row['items']:>6} {row['seconds']:>9.2f}s "
+        f"{row['throughput']:>10.1f}/s p50={row['p50_ms']:>9.2f}ms p95={row['p95_ms']:>9.2f}ms RSS={rss:>5} MB"
+    )
+    if "bytes_saved_per_page" in row:
+        line += (
+            f" | {row['image_px']} {row['bytes_per_page'] / 1024:.0f} KB/{row['tokens_per_page']:.0f} tok por folha,"
+            f" poupa {row['bytes_saved_per_page'] / 1024:.0f} KB/{row['tokens_saved_per_page']:.0f} tok"
+        )
+    if "rpm_limit" in row:
+        line += f" | {row['rpm_achieved']:.0f}/{row['rpm_limit']} req/min, {'dentro' if row['within_quota'] else 'FORA'} da quota"
+    if "api_calls" in row:
+        line += f" | {row['api_calls']} pedidos ({row['api_429']}×429, {row['api_500']}×500), {row['errors']} registos com erro"
+        if "fallbacks" in row:
+            line += f", {row['fallbacks']} em modelos de fallback, janela final {row['window']}/{row['concurrency']}"
+    if "tokens" in row:
+        line += f" | {row['tokens']} tokens"
+        if row.get("dropped"):
+            line += f" ({row['dropped']} itens de lote repetidos)"
+    if "clients" in row:
+        line += f" | {row['clients']} clientes Gemini criados"
+    if "memory_kb" in row:
+        line += f" | {row['memory_kb']} KB em memória"
+    return line
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmarks do JSJ Parser com Gemini simulado.")
+    parser.add_argument("--sizes", type=int, nargs="+", default=DEFAULT_SIZES, help="Nº de folhas dos ficheiros sintéticos")
+    parser.add_argument("--only", nargs="+", choices=list(BENCHMARKS), default=list(BENCHMARKS), help="Benchmarks a correr")
+    parser.add_argument("--workdir", default=os.path.join(tempfile.gettempdir(), "jsj_bench"), help="Pasta dos ficheiros sintéticos (reutilizados)")
+    parser.add_argument("--latency", type=float, default=0.5, help="Latência média do Gemini simulado (s)")
+    parser.add_argument("--jitter", type=float, default=0.3, help="Desvio da latência (fração da média)")
+    parser.add_argument("--error-rate", type=float, default=0.0, help="Fração de pedidos com erro 500")
+    parser.add_argument("--rate-429", type=float, default=0.0, help="Fração de pedidos com 429 (ResourceExhausted)")
+    parser.add_argument("--concurrency", type=int, default=50, help="Pedidos em voo no pipeline")
+    parser.add_argument("--batch-size", type=int, default=1, help="Legendas por pedido no pipeline (K)")
+    parser.add_argument("--batch-drop", type=float, default=0.0, help="Fração de objetos omitidos nas respostas em lote")
+    parser.add_argument("--malformed", type=float, default=0.0, help="Fração de respostas com JSON mal formatado (texto extra, vírgulas finais)")
+    parser.add_argument("--rpm", type=int, default=1000, help="Limite do RateLimiter (pedidos/minuto)")
+    parser.add_argument("--text-layer", action="store_true", help="Pipeline com leitura da camada de texto (por omissão tudo passa pelo Gemini)")
+    parser.add_argument("--image-budget", type=float, default=None, help="Orçamento de píxeis por imagem (MP)")
+    parser.add_argument("--image-color", choices=list(COLOR_MODES), default=None, help="Modo de cor da imagem")
+    parser.add_argument("--image-format", choices=list(IMAGE_FORMATS), default=None, help="Codificação da imagem")
+    parser.add_argument("--image-quality", type=int, default=None, help="Qualidade JPEG/WebP")
+    parser.add_argument("--render-sample", type=int, default=25, help="Nº máximo de layouts DWG renderizados por tamanho")
+    parser.add_argument("--repeat", type=int, default=3, help="Repetições das exportações")
+    parser.add_argument("--seed", type=int, default=0, help="Seed do Gemini simulado")
+    parser.add_argument("--json", default=None, help="Gravar os resultados neste ficheiro JSON")
+    parser.add_argument("-v", "--verbose", action="store_true", help="Mostrar o logging dos módulos medidos")
+    args = parser.parse_args(argv)
+
+    logging.basicConfig(level=logging.WARNING, format='%(asctime)s - %(levelname)s - %(message)s')
+    options = {
+        "latency": args.latency, "jitter": args.jitter, "error_rate": args.error_rate, "rate_429": args.rate_429,
+        "concurrency": args.concurrency, "batch_size": max(1, args.batch_size), "batch_drop": args.batch_drop, "malformed": args.malformed, "rpm": args.rpm, "text_layer": args.text_layer,
+        "render_sample": args.render_sample, "repeat": args.repeat, "seed": args.seed,
+        "verbose": args.verbose,
+        "image_opts": image_options(
+            pixel_budget_mp=args.image_budget, color=args.image_color,
+            format=args.image_format, quality=args.image_quality
+        ),
+    }
+
+    print(f"{'benchmark':<44} {'folhas':>5} {'itens':>6} {'tempo':>10} {'débito':>12} {'latência':>30}")
+    results = run_benchmarks(args.only, sorted(args.sizes), args.workdir, options)
+
+    if args.json:
+        with open(args.json, 'w', encoding='utf-8') as f:
+            json.dump({"options": options, "results": results}, f, ensure_ascii=False, indent=2)
+        print(f"Resultados gravados em {args.json}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
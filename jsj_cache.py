@@ -0,0 +1,211 @@
+import hashlib
+import json
+import logging
+import os
+import sqlite3
+import threading
+import time
+from contextlib import contextmanager
+
+from jsj_imageprep import EncodedImage
+
+logger = logging.getLogger(__name__)
+
+# Localização e limite por omissão (configuráveis por variáveis de ambiente)
+DEFAULT_CACHE_PATH = os.environ.get(
+    "JSJ_CACHE_PATH",
+    os.path.join(os.path.expanduser("~"), ".jsj_parser", "gemini_cache.sqlite")
+)
+DEFAULT_CACHE_MAX_MB = float(os.environ.get("JSJ_CACHE_MAX_MB", "200"))
+
+
+def prompt_version(prompt):
+    """Versão do prompt = hash curto do texto (qualquer alteração invalida a cache)."""
+    return hashlib.sha256(prompt.encode("utf-8")).hexdigest()[:12]
+
+
+def image_fingerprint(image):
+    """Hash SHA-256 dos pixels do crop (modo + dimensões + bytes brutos).
+
+    Aceita PIL.Image, EncodedImage ou bytes já codificados (PNG/JPEG).
+    """
+    h = hashlib.sha256()
+    if isinstance(image, EncodedImage):
+        # Mesmo crop com outra codificação (cor/formato) é outro pedido
+        h.update(f"{image.mime_type}:{image.mode}:".encode("ascii"))
+        h.update(image.data)
+    elif isinstance(image, (bytes, bytearray)):
+        h.update(b"bytes:")
+        h.update(image)
+    else:
+        h.update(f"{image.mode}:{image.size[0]}x{image.size[1]}:".encode("ascii"))
+        h.update(image.tobytes())
+    return h.hexdigest()
+
+
+def page_fingerprint(page):
+    """Hash do conteúdo de uma página PDF (content streams + XObjects + geometria).
+
+    Não rasteriza: só lê os streams. A mesma folha reexportada sem
+    alterações tem o mesmo fingerprint (deteção de folhas alteradas).
+    """
+    doc = page.parent
+    h = hashlib.sha256()
+    h.update(f"{page.rect.width:.1f}x{page.rect.height:.1f}:{page.rotation}:".encode("ascii"))
+    h.update(page.read_contents())
+    # Formulários (blocos plotados) e imagens referenciados pela página
+    for xref, *_ in page.get_xobjects():
+        h.update(doc.xref_stream(xref) or b"")
+    for image in page.get_images(full=True):
+        h.update(doc.xref_stream_raw(image[0]) or b"")
+    return h.hexdigest()
+
+
+def data_fingerprint(data):
+    """Hash estável de dados JSON-serializáveis (ex.: atributos de uma legenda)."""
+    payload = json.dumps(data, sort_keys=True, ensure_ascii=False, default=str)
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+
+class ResultCache:
+    """Cache persistente (SQLite) de extrações Gemini, endereçada por conteúdo.
+
+    Chave = hash da imagem recortada + versão do prompt + modelo. Guarda o JSON
+    já parseado e o nº de tokens que o pedido custou. Quando o tamanho total
+    excede `max_bytes`, as entradas menos usadas recentemente (LRU) são
+    removidas. Segura para uso a partir das threads do executor.
+    """
+    def __init__(self, path=DEFAULT_CACHE_PATH, max_mb=DEFAULT_CACHE_MAX_MB):
+        self.path = path
+        self.max_bytes = int(max_mb * 1024 * 1024)
+        self.hits = 0
+        self.misses = 0
+        self.tokens_saved = 0
+        self._lock = threading.Lock()
+
+        directory = os.path.dirname(os.path.abspath(path))
+        os.makedirs(directory, exist_ok=True)
+
+        with self._connect() as conn:
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("""
+                CREATE TABLE IF NOT EXISTS results (
+                    key TEXT PRIMARY KEY,
+                    image_hash TEXT NOT NULL,
+                    prompt_version TEXT NOT NULL,
+                    model TEXT NOT NULL,
+                    data TEXT NOT NULL,
+                    tokens INTEGER NOT NULL,
+                    size INTEGER NOT NULL,
+                    created REAL NOT NULL,
+                    last_access REAL NOT NULL
+                )
+            """)
+            conn.execute("CREATE INDEX IF NOT EXISTS idx_results_last_access ON results(last_access)")
+
+    @contextmanager
+    def _connect(self):
+        """Ligação por operação: uma transação (commit/rollback) e fechada no fim."""
+        conn = sqlite3.connect(self.path, timeout=30)
+        try:
+            with conn:
+                yield conn
+        finally:
+            conn.close()
+
+    @staticmethod
+    def make_key(image_hash, prompt_ver, model):
+        return hashlib.sha256(f"{image_hash}|{prompt_ver}|{model}".encode("utf-8")).hexdigest()
+
+    def get(self, image_hash, prompt_ver, models):
+        """Procura um resultado para a imagem, pela ordem de prioridade dos modelos.
+
+        Returns:
+            tuple: (data: dict, tokens: int, model: str) ou None se não existir
+        """
+        if isinstance(models, str):
+            models = [models]
+        try:
+            with self._connect() as conn:
+                for model in models:
+                    key = self.make_key(image_hash, prompt_ver, model)
+                    row = conn.execute("SELECT data, tokens FROM results WHERE key = ?", (key,)).fetchone()
+                    if row:
+                        conn.execute("UPDATE results SET last_access = ? WHERE key = ?", (time.time(), key))
+                        data = json.loads(row[0])
+                        # Contadores partilhados pelas threads do executor
+                        with self._lock:
+                            self.hits += 1
+                            self.tokens_saved += row[1]
+                        return data, row[1], model
+        except (sqlite3.Error, json.JSONDecodeError) as e:
+            logger.warning(f"Cache indisponível ({self.path}): {e}")
+            return None
+        with self._lock:
+            self.misses += 1
+        return None
+
+    def put(self, image_hash, prompt_ver, model, data, tokens):
+        """Guarda um resultado e aplica a política de evicção LRU."""
+        payload = json.dumps(data, ensure_ascii=False)
+        now = time.time()
+        key = self.make_key(image_hash, prompt_ver, model)
+        try:
+            with self._lock, self._connect() as conn:
+                conn.execute(
+                    "INSERT OR REPLACE INTO results VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                    (key, image_hash, prompt_ver, model, payload, int(tokens), len(payload), now, now)
+                )
+                self._evict(conn)
+        except sqlite3.Error as e:
+            logger.warning(f"Não foi possível gravar na cache ({self.path}): {e}")
+
+    def _evict(self, conn):
+        """Remove as entradas menos usadas até ficar abaixo de 90% do limite."""
+        total = conn.execute("SELECT COALESCE(SUM(size), 0) FROM results").fetchone()[0]
+        if total <= self.max_bytes:
+            return
+        target = int(self.max_bytes * 0.9)
+        removed = 0
+        for key, size in conn.execute("SELECT key, size FROM results ORDER BY last_access ASC").fetchall():
+            if total <= target:
+                break
+            conn.execute("DELETE FROM results WHERE key = ?", (key,))
+            total -= size
+            removed += 1
+        logger.info(f"Cache: {removed} entradas removidas (LRU), {total / 1024 / 1024:.1f} MB em uso")
+
+    def clear(self):
+        with self._lock, self._connect() as conn:
+            conn.execute("DELETE FROM results")
+            self.hits = self.misses = self.tokens_saved = 0
+
+    def stats(self):
+        """Estatísticas de uso: entradas, tamanho e hits/misses desta instância."""
+        with self._connect() as conn:
+            entries, size = conn.execute("SELECT COUNT(*), COALESCE(SUM(size), 0) FROM results").fetchone()
+        with self._lock:
+            return {
+                "entries": entries,
+                "size_mb": size / 1024 / 1024,
+                "hits": self.hits,
+                "misses": self.misses,
+                "tokens_saved": self.tokens_saved,
+            }
+
+
+_default_cache = None
+_default_lock = threading.Lock()
+
+
+def get_result_cache():
+    """Instância partilhada no processo (None se a cache não puder ser criada)."""
+    global _default_cache
+    with _default_lock:
+        if _default_cache is None:
+            try:
+                _default_cache = ResultCache()
+            except (OSError, sqlite3.Error) as e:
+                logger.warning(f"Cache de resultados desativada: {e}")
+                return None
+        return _default_cache
@@ -0,0 +1,324 @@
+"""JSJ Parser em linha de comandos (sem Streamlit).
+
+Processa pastas de projeto (PDF, JSON LISP, DWG/DXF) com o mesmo pipeline da
+aplicação web e grava a Lista Mestra com as 34 colunas normalizadas.
+
+Exemplos:
+    python jsj_cli.py /projetos/2024-015 --proj-num 2024-015 --format xlsx csv
+    python jsj_cli.py /projetos/* --jobs 4 --turbo --output-dir /relatorios
+    python jsj_cli.py /projetos/2024-015 --project 2024-015   # só folhas novas/alteradas
+    python jsj_cli.py --export-projects 2024-015 2024-016 --format xlsx csv   # Lista Mestra conjunta
+"""
+import argparse
+import asyncio
+import logging
+import os
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+import pandas as pd
+
+from jsj_core import (
+    CROP_PRESETS,
+    DWG_SUPPORT,
+    GEMINI_MODELS,
+    cleanup_temp_files,
+    export_csv_bytes,
+    export_file_basename,
+    export_xlsx_bytes,
+    iter_file_tasks,
+    prepare_export_df,
+    process_tasks,
+)
+from jsj_export import export_records
+from jsj_masterlist import sort_by_tipo
+from jsj_imageprep import COLOR_MODES, DEFAULT_PIXEL_BUDGET_MP, IMAGE_FORMATS, image_options
+from jsj_ratelimit import RATE_STANDARD, RATE_TURBO, create_rate_limiter
+from jsj_raster import create_raster_pool
+from jsj_store import get_project_store
+
+logger = logging.getLogger("jsj_cli")
+
+
+def find_project_files(directory, recursive=False):
+    """Ficheiros suportados de uma pasta de projeto, por ordem alfabética."""
+    extensions = {'.pdf', '.json'}
+    if DWG_SUPPORT:
+        extensions |= {'.dwg', '.dxf'}
+
+    found = []
+    if recursive:
+        for root, dirs, files in os.walk(directory):
+            dirs.sort()
+            found.extend(os.path.join(root, f) for f in sorted(files))
+    else:
+        found = [os.path.join(directory, f) for f in sorted(os.listdir(directory))]
+    return [f for f in found if os.path.isfile(f) and os.path.splitext(f)[1].lower() in extensions]
+
+
+def sheet_source(path, root):
+    """Identificador do ficheiro nas chaves de folha: caminho relativo à raiz do projeto.
+
+    Ficheiros com o mesmo nome em subpastas diferentes (a/PLANTA.pdf,
+    b/PLANTA.pdf) ficam com folhas distintas; numa pasta sem subpastas é o
+    nome do ficheiro, como nos uploads da aplicação web.
+    """
+    return os.path.relpath(path, root).replace(os.sep, '/')
+
+
+def process_file(path, options):
+    """Processa um ficheiro (num processo worker ou no processo principal).
+
+    Returns:
+        tuple: (path, records: list, tokens: int, stats: dict, sheets: dict ficheiro -> folhas atuais)
+    """
+    temp_files = []
+    sheet_index = {}
+    tokens = 0
+    raster_pool = create_raster_pool(options["raster_workers"]) if options["jobs"] <= 1 else None
+    # Limite da conta partilhado (token bucket em disco) por todos os workers e pela aplicação web
+    rate_limiter = create_rate_limiter(options["api_key"], turbo=options["turbo"], models=GEMINI_MODELS)
+
+    def on_record(record, record_tokens, task_data, stats):
+        nonlocal tokens
+        tokens += record_tokens
+
+    try:
+        tasks = iter_file_tasks(
+            os.path.basename(path), path, options["tipo"], options["crop_preset"],
+            use_text_layer=options["use_text_layer"], raster_pool=raster_pool,
+            temp_files=temp_files, image_opts=options["image_opts"],
+            known_sheets=options["known_sheets"],
+            sheet_prefix=sheet_source(path, options["project_root"]), sheet_index=sheet_index
+        )
+        records, stats = asyncio.run(process_tasks(
+            tasks, options["api_key"], options["global_fields"], rate_limiter,
+            concurrency=options["concurrency"], use_cache=options["use_cache"],
+            raster_pool=raster_pool, raster_workers=options["raster_workers"],
+            on_record=on_record, batch_size=options["batch_size"]
+        ))
+    finally:
+        if raster_pool is not None:
+            raster_pool.shutdown(wait=False, cancel_futures=True)
+        cleanup_temp_files(temp_files)
+
+    return path, records, tokens, {k: stats[k] for k in ("produced", "completed", "errors", "latency")}, sheet_index
+
+
+def write_exports(records, directory, options, name=None):
+    """Grava XLSX/CSV de uma pasta de projeto; devolve os caminhos criados."""
+    # Por TIPO e nº de desenho em ordem natural (como a Lista Completa)
+    df_export = sort_by_tipo(prepare_export_df(pd.DataFrame(records)))
+
+    dwg_source = options["global_fields"].get('DWG_SOURCE', '')
+    nome_base = export_file_basename(dwg_source) if dwg_source else f"{name or os.path.basename(os.path.normpath(directory))}-LD"
+    output_dir = options["output_dir"] or directory
+    os.makedirs(output_dir, exist_ok=True)
+
+    written = []
+    for fmt in options["formats"]:
+        out_path = os.path.join(output_dir, f"{nome_base}.{fmt}")
+        data = export_xlsx_bytes(df_export) if fmt == "xlsx" else export_csv_bytes(df_export)
+        with open(out_path, 'wb') as f:
+            f.write(data)
+        written.append(out_path)
+    return written
+
+
+def write_store_exports(store, projects, output_dir, name, options):
+    """Grava XLSX/CSV da Lista Mestra de um ou mais projetos em streaming, direto da store."""
+    dwg_source = options["global_fields"].get('DWG_SOURCE', '')
+    nome_base = export_file_basename(dwg_source) if dwg_source else f"{name}-LD"
+    output_dir = options["output_dir"] or output_dir
+    os.makedirs(output_dir, exist_ok=True)
+
+    written = []
+    for fmt in options["formats"]:
+        out_path = os.path.join(output_dir, f"{nome_base}.{fmt}")
+        count = export_records(store, projects, fmt, out_path)
+        logger.info(f"📊 {out_path} ({count} desenhos)")
+        written.append(out_path)
+    return written
+
+
+def run(directories, options):
+    """Processa as pastas indicadas; ficheiros distribuídos por `jobs` processos."""
+    projects = {}
+    for directory in directories:
+        files = find_project_files(directory, options["recursive"])
+        if not files:
+            logger.warning(f"⚠️ {directory}: nenhum ficheiro PDF/JSON/DWG encontrado")
+            continue
+        projects[directory] = files
+        logger.info(f"📁 {directory}: {len(files)} ficheiros")
+
+    all_files = [f for files in projects.values() for f in files]
+    # Raiz do projeto (pasta indicada ou pai comum das pastas): base das chaves de folha
+    options = {**options, "project_root": os.path.commonpath([os.path.abspath(d) for d in projects] or [os.getcwd()])}
+    results = {}
+    total_tokens = 0
+    start = time.perf_counter()
+
+    if options["jobs"] <= 1:
+        for path in all_files:
+            # Um ficheiro com erro não interrompe o lote (como com --jobs N)
+            try:
+                results[path] = process_file(path, options)
+                logger.info(f"✅ {path}: {len(results[path][1])} desenhos")
+            except Exception as e:
+                logger.error(f"❌ Erro ao processar {path}: {e}")
+    else:
+        with ProcessPoolExecutor(max_workers=options["jobs"]) as pool:
+            futures = {path: pool.submit(process_file, path, options) for path in all_files}
+            for path, future in futures.items():
+                try:
+                    results[path] = future.result()
+                    logger.info(f"✅ {path}: {len(results[path][1])} desenhos")
+                except Exception as e:
+                    logger.error(f"❌ Erro ao processar {path}: {e}")
+
+    failed = 0
+    project_records = []
+    project_sheets = {}
+    for directory, files in projects.items():
+        records = []
+        for path in files:
+            if path not in results:
+                failed += 1
+                continue
+            _, file_records, tokens, stats, sheets = results[path]
+            records.extend(file_records)
+            project_sheets.update(sheets)
+            total_tokens += tokens
+            failed += stats["errors"]
+        if options["project"]:
+            project_records.extend(records)
+            continue
+        if not records:
+            logger.warning(f"⚠️ {directory}: nenhum desenho extraído")
+            continue
+        for out_path in write_exports(records, directory, options):
+            logger.info(f"📊 {out_path} ({len(records)} desenhos)")
+
+    if options["project"] and projects:
+        # Projeto persistente: folhas reprocessadas substituem as anteriores; exporta a Lista Mestra completa
+        store = get_project_store()
+        _, replaced = store.merge(options["project"], project_records, project_sheets)
+        logger.info(f"🗂️ Projeto '{options['project']}': {len(project_records)} desenhos novos/alterados ({replaced} substituídos)")
+        if store.count(options["project"]):
+            # Uma pasta: exporta para ela; várias: main() garante --output-dir
+            write_store_exports(store, options["project"], next(iter(projects)), options["project"], options)
+
+    logger.info(f"Concluído em {time.perf_counter() - start:.1f}s | {len(all_files)} ficheiros | tokens: {total_tokens} | erros: {failed}")
+    return 1 if failed else 0
+
+
+def build_parser():
+    parser = argparse.ArgumentParser(
+        description="JSJ Parser (linha de comandos): extrai legendas de PDF/JSON/DWG e gera a Lista Mestra (34 colunas)."
+    )
+    parser.add_argument("directories", nargs="*", help="Pastas de projeto a processar")
+    parser.add_argument("-r", "--recursive", action="store_true", help="Incluir subpastas")
+    parser.add_argument("--api-key", default=None, help="API key do Google Gemini (por omissão GEMINI_API_KEY / GOOGLE_API_KEY)")
+    parser.add_argument("--turbo", action="store_true", help=f"Modo TURBO ({RATE_TURBO} req/min em vez de {RATE_STANDARD})")
+    parser.add_argument("--concurrency", type=int, default=None, help="Pedidos Gemini em voo por worker (por omissão 5, ou 50 em TURBO)")
+    parser.add_argument("--batch-size", type=int, default=1, help="Legendas por pedido Gemini (K > 1: extração em lote, menos pedidos e tokens de prompt)")
+    parser.add_argument("-j", "--jobs", type=int, default=1, help="Ficheiros processados em paralelo (processos)")
+    parser.add_argument("--raster-workers", type=int, default=1, help="Processos de rasterização (apenas com --jobs 1)")
+    parser.add_argument("--crop-preset", choices=CROP_PRESETS, default=CROP_PRESETS[0], help="Área de crop da legenda (PDF); por omissão localizada automaticamente em cada página")
+    parser.add_argument("--tipo", default="", help="Tipo de desenho do lote (ex.: 'Betão Armado - Lajes')")
+    parser.add_argument("--proj-num", default="", help="Número do projeto (PROJ_NUM)")
+    parser.add_argument("--proj-nome", default="", help="Nome do projeto (PROJ_NOME)")
+    parser.add_argument("--fase-pfix", default="", help="Prefixo da fase (FASE_PFIX)")
+    parser.add_argument("--emissao", default="", help="Emissão (EMISSAO)")
+    parser.add_argument("--elemento", default="", help="Elemento (ELEMENTO)")
+    parser.add_argument("--dwg-source", default="", help="Ficheiro DWG de origem (DWG_SOURCE, também define o nome da exportação)")
+    parser.add_argument("--image-budget", type=float, default=None, help=f"Orçamento de píxeis por imagem, MP (por omissão {DEFAULT_PIXEL_BUDGET_MP})")
+    parser.add_argument("--image-color", choices=list(COLOR_MODES), default=None, help="Modo de cor da imagem enviada à IA")
+    parser.add_argument("--image-format", choices=list(IMAGE_FORMATS), default=None, help="Codificação da imagem enviada à IA")
+    parser.add_argument("--image-quality", type=int, default=None, help="Qualidade JPEG/WebP (40-95)")
+    parser.add_argument("--project", default=None, help="Projeto persistente (Lista Mestra partilhada com a aplicação web): só folhas novas/alteradas são processadas e exporta-se a lista completa; páginas/layouts removidos saem da lista. As folhas são identificadas pelo caminho relativo à pasta do projeto (ou ao pai comum das pastas indicadas). Todas as pastas indicadas entram no mesmo projeto; com mais de uma pasta é obrigatório --output-dir")
+    parser.add_argument("--export-projects", nargs="+", default=None, metavar="PROJETO", help="Exportar a Lista Mestra conjunta destes projetos persistentes (streaming a partir da store, memória constante)")
+    parser.add_argument("--all-sheets", action="store_true", help="Com --project, reprocessar todas as folhas (ignorar fingerprints)")
+    parser.add_argument("--no-cache", action="store_true", help="Não reutilizar a cache de resultados Gemini")
+    parser.add_argument("--no-text-layer", action="store_true", help="Não ler a camada de texto dos PDF vetoriais")
+    parser.add_argument("--format", nargs="+", choices=["xlsx", "csv"], default=["xlsx"], dest="formats", help="Formatos de exportação")
+    parser.add_argument("-o", "--output-dir", default=None, help="Pasta de saída (por omissão a própria pasta do projeto)")
+    parser.add_argument("-v", "--verbose", action="store_true", help="Logging detalhado")
+    return parser
+
+
+def main(argv=None):
+    parser = build_parser()
+    args = parser.parse_args(argv)
+    if not args.directories and not args.export_projects:
+        parser.error("indicar pastas de projeto e/ou --export-projects")
+    if args.project and len(args.directories) > 1 and not args.output_dir:
+        # Uma só Lista Mestra para várias pastas: não há uma pasta de saída "natural"
+        parser.error("--project com várias pastas exige --output-dir (a Lista Mestra do projeto é uma só)")
+
+    logging.basicConfig(
+        level=logging.DEBUG if args.verbose else logging.INFO,
+        format='%(asctime)s - %(levelname)s - %(message)s'
+    )
+
+    for directory in args.directories:
+        if not os.path.isdir(directory):
+            logger.error(f"❌ Pasta não encontrada: {directory}")
+            return 2
+
+    api_key = args.api_key or os.environ.get("GEMINI_API_KEY") or os.environ.get("GOOGLE_API_KEY") or ""
+    if not api_key:
+        logger.warning("⚠️ Sem API key: apenas extração nativa (DWG/JSON/camada de texto) terá resultados")
+
+    # Fingerprints da última ingestão do projeto (folhas inalteradas não são reprocessadas)
+    known_sheets = None
+    if args.project and not args.all_sheets:
+        known_sheets = get_project_store().sheet_fingerprints(args.project)
+
+    options = {
+        "api_key": api_key,
+        "turbo": args.turbo,
+        "concurrency": args.concurrency or (50 if args.turbo else 5),
+        "batch_size": max(1, args.batch_size),
+        "jobs": max(1, args.jobs),
+        "raster_workers": max(1, args.raster_workers),
+        "crop_preset": args.crop_preset,
+        "tipo": args.tipo,
+        "use_text_layer": not args.no_text_layer,
+        "use_cache": not args.no_cache,
+        "recursive": args.recursive,
+        "formats": args.formats,
+        "output_dir": args.output_dir,
+        "project": args.project,
+        "known_sheets": known_sheets,
+        "image_opts": image_options(
+            pixel_budget_mp=args.image_budget,
+            color=args.image_color,
+            format=args.image_format,
+            quality=args.image_quality
+        ),
+        "global_fields": {
+            'PROJ_NUM': args.proj_num,
+            'PROJ_NOME': args.proj_nome,
+            'FASE_PFIX': args.fase_pfix,
+            'EMISSAO': args.emissao,
+            'ELEMENTO': args.elemento,
+            'DWG_SOURCE': args.dwg_source
+        },
+    }
+    status = run(args.directories, options) if args.directories else 0
+
+    if args.export_projects:
+        # Lista Mestra conjunta de vários projetos, escrita linha a linha a partir do SQLite
+        store = get_project_store()
+        missing = [p for p in args.export_projects if not store.count(p)]
+        if missing:
+            logger.warning(f"⚠️ Projetos sem desenhos: {', '.join(missing)}")
+        write_store_exports(store, args.export_projects, os.getcwd(), "-".join(args.export_projects), options)
+    return status
+
+
+if __name__ == "__main__":
+    sys.exit(main())
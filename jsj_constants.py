@@ -0,0 +1,4 @@
+"""Constantes da legenda LEGENDA_JSJ partilhadas pelos módulos do JSJ Parser."""
+
+# Linhas da tabela de revisões da legenda (REV_x / DATA_x / DESC_x)
+REV_LETTERS = ['A', 'B', 'C', 'D', 'E']
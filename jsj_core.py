@@ -0,0 +1,1190 @@
+"""Núcleo do JSJ Parser sem dependência de Streamlit.
+
+Partilhado pela aplicação web (jsj_app.py) e pela linha de comandos (jsj_cli.py):
+validação, pipeline híbrido (nativo + Gemini), registos normalizados e exportação.
+"""
+import fitz  # PyMuPDF
+import pandas as pd
+import io
+import json
+import asyncio
+import functools
+import tempfile
+import os
+import logging
+import re
+
+from jsj_dwg import (
+    DWG_SUPPORT,
+    DwgSession,
+    extract_dwg_native_blocks,
+    get_dwg_layouts,
+    native_fields,
+)
+from jsj_pipeline import run_streaming_pipeline
+from jsj_gemini import get_api_executor, get_client_pool
+from jsj_ratelimit import SharedRateLimiter
+from jsj_report import write_pdf_report
+from jsj_response import (
+    BATCH_SCHEMA,
+    EXTRACTION_SCHEMA,
+    generation_config,
+    normalize_extraction,
+    parse_batch_response,
+    parse_json_response,
+)
+from jsj_retry import RetryPolicy
+from jsj_validation import validate_extracted_data
+from jsj_cache import data_fingerprint, get_result_cache, image_fingerprint, page_fingerprint, prompt_version
+from jsj_textlayer import DEFAULT_MIN_CONFIDENCE, extract_from_text_layer
+from jsj_raster import pixmap_to_image, render_dwg_layout, render_pdf_page
+from jsj_imageprep import EncodedImage
+from jsj_locator import locate_title_block
+
+logger = logging.getLogger(__name__)
+
+# Lista de colunas normalizadas (ordem exata para exportação)
+COLUNAS_NORMALIZADAS = [
+    'PROJ_NUM', 'PROJ_NOME', 'CLIENTE', 'OBRA', 'LOCALIZACAO', 'ESPECIALIDADE',
+    'PROJETOU', 'FASE', 'FASE_PFIX', 'EMISSAO', 'DATA', 'PFIX', 'LAYOUT',
+    'DES_NUM', 'TIPO', 'ELEMENTO', 'TITULO', 'REV_A', 'DATA_A', 'DESC_A',
+    'REV_B', 'DATA_B', 'DESC_B', 'REV_C', 'DATA_C', 'DESC_C', 'REV_D',
+    'DATA_D', 'DESC_D', 'REV_E', 'DATA_E', 'DESC_E', 'DWG_SOURCE', 'ID_CAD'
+]
+
+# --- FUNÇÕES DE PROCESSAMENTO (BACKEND) ---
+
+class RateLimiter(SharedRateLimiter):
+    """Rate limiter local (token bucket FIFO só neste processo).
+
+    Mesma interface do SharedRateLimiter; para limites partilhados entre
+    sessões e processos usar jsj_ratelimit.create_rate_limiter().
+    """
+    def __init__(self, max_requests=15, time_window=60):
+        super().__init__(max_requests, time_window, models=GEMINI_MODELS, path=None)
+
+# Presets de crop (o automático localiza a legenda em cada página)
+AUTO_CROP_PRESET = "Automático (deteção da legenda)"
+FALLBACK_CROP_PRESET = "Canto Inf. Direito (50%)"
+CROP_PRESETS = [
+    AUTO_CROP_PRESET,
+    "Canto Inf. Direito (50%)",
+    "Canto Inf. Direito (40%)",
+    "Canto Inf. Direito (30%)",
+    "Canto Inf. Direito (70%)",
+    "Metade Inferior (100% largura)",
+    "Página Inteira"
+]
+
+def get_crop_coordinates(preset, rect):
+    """Calcula as coordenadas de crop baseadas no preset selecionado.
+
+    Args:
+        preset: String com o preset selecionado
+        rect: fitz.Rect da página
+
+    Returns:
+        tuple: (x_start_pct, y_start_pct, x_end_pct, y_end_pct) em percentagens
+    """
+    if preset == "Canto Inf. Direito (50%)":
+        return (0.50, 0.50, 1.0, 1.0)  # Quadrante inferior direito (padrão)
+    elif preset == "Canto Inf. Direito (40%)":
+        return (0.60, 0.60, 1.0, 1.0)  # 40% da área (60% offset)
+    elif preset == "Canto Inf. Direito (30%)":
+        return (0.70, 0.70, 1.0, 1.0)  # Área menor, mais focada
+    elif preset == "Canto Inf. Direito (70%)":
+        return (0.30, 0.30, 1.0, 1.0)  # Área maior
+    elif preset == "Metade Inferior (100% largura)":
+        return (0.0, 0.50, 1.0, 1.0)  # Toda a metade inferior
+    elif preset == "Página Inteira":
+        return (0.0, 0.0, 1.0, 1.0)  # Página completa
+    else:
+        return (0.50, 0.50, 1.0, 1.0)  # Padrão
+
+def get_crop_rect(page, crop_preset=AUTO_CROP_PRESET):
+    """Retângulo de crop (fitz.Rect) de uma página para o preset selecionado.
+
+    Com AUTO_CROP_PRESET o retângulo é a legenda localizada na própria página
+    (âncoras de texto + moldura vetorial); sem legenda detetável (ex.: PDF
+    digitalizado) usa FALLBACK_CROP_PRESET.
+    """
+    rect = page.rect
+
+    if crop_preset == AUTO_CROP_PRESET:
+        title_block = locate_title_block(page)
+        if title_block is not None:
+            return title_block
+        logger.debug(f"Legenda não localizada na página {page.number + 1}, a usar '{FALLBACK_CROP_PRESET}'")
+        crop_preset = FALLBACK_CROP_PRESET
+
+    # Calcular coordenadas do crop
+    x_start, y_start, x_end, y_end = get_crop_coordinates(crop_preset, rect)
+
+    crop_rect = fitz.Rect(
+        rect.width * x_start,
+        rect.height * y_start,
+        rect.width * x_end,
+        rect.height * y_end
+    )
+
+    logger.debug(f"Crop preset '{crop_preset}': ({x_start:.0%}, {y_start:.0%}) -> ({x_end:.0%}, {y_end:.0%})")
+
+    return crop_rect
+
+def crop_rect_to_box(page, crop):
+    """Retângulo de crop (fitz.Rect) -> frações da página (x_start, y_start, x_end, y_end)."""
+    rect = page.rect
+    return (crop.x0 / rect.width, crop.y0 / rect.height, crop.x1 / rect.width, crop.y1 / rect.height)
+
+def get_crop_box(page, crop_preset=AUTO_CROP_PRESET):
+    """Crop da página em frações (x_start, y_start, x_end, y_end), como em get_crop_coordinates."""
+    if crop_preset != AUTO_CROP_PRESET:
+        return get_crop_coordinates(crop_preset, page.rect)
+    return crop_rect_to_box(page, get_crop_rect(page, crop_preset))
+
+def get_image_from_page(doc, page_num, crop_preset=AUTO_CROP_PRESET, image_opts=None):
+    """Extrai a imagem (crop da legenda) de uma página específica do documento.
+
+    Args:
+        doc: Documento PyMuPDF
+        page_num: Número da página
+        crop_preset: Preset de crop selecionado
+        image_opts: Opções de image_options() (zoom adaptativo ao tamanho do crop)
+
+    Returns:
+        PIL.Image: Imagem extraída (antes da conversão de cor/codificação)
+    """
+    page = doc.load_page(page_num)
+    crop_rect = get_crop_rect(page, crop_preset)
+
+    return pixmap_to_image(page, crop_rect, image_opts)
+
+def create_pdf_export(df):
+    """Cria PDF profissional com a lista de desenhos (BytesIO; ver jsj_report)."""
+    buffer = io.BytesIO()
+    write_pdf_report(df, buffer)
+    buffer.seek(0)
+    return buffer
+
+def build_native_record(task_data, gf):
+    """Constrói o registo normalizado (34 colunas) de uma task nativa (DXF/JSON LISP).
+
+    Args:
+        task_data: Task com "native_data" e "batch_type"
+        gf: Campos globais (batch fill)
+    """
+    data = task_data["native_data"]
+
+    record = {
+        # Campos globais (preenchidos pelo utilizador)
+        "PROJ_NUM": gf.get('PROJ_NUM', ''),
+        "PROJ_NOME": gf.get('PROJ_NOME', ''),
+        # Campos extraídos (normalizados)
+        "CLIENTE": data.get("cliente", ""),
+        "OBRA": data.get("obra", ""),
+        "LOCALIZACAO": data.get("localizacao", ""),
+        "ESPECIALIDADE": data.get("especialidade", ""),
+        "PROJETOU": data.get("projetou", ""),
+        "FASE": data.get("fase", ""),
+        # Campos globais (preenchidos pelo utilizador)
+        # (o que o utilizador preencher prevalece; senão o atributo da legenda)
+        "FASE_PFIX": gf.get('FASE_PFIX') or data.get("fase_pfix", ""),
+        "EMISSAO": gf.get('EMISSAO') or data.get("emissao", ""),
+        # Campos extraídos
+        "DATA": data.get("primeira_emissao", "-"),
+        "PFIX": data.get("pfix", ""),
+        # Campos extraídos
+        "LAYOUT": data.get("layout", ""),
+        "DES_NUM": data.get("num_desenho", "N/A"),
+        "TIPO": data.get("tipo", task_data["batch_type"]),
+        # Campos globais
+        "ELEMENTO": gf.get('ELEMENTO') or data.get("elemento", ""),
+        # Campos extraídos
+        "TITULO": data.get("titulo", "N/A"),
+        # Revisões A-E
+        "REV_A": data.get("rev_a", ""),
+        "DATA_A": data.get("data_a", ""),
+        "DESC_A": data.get("desc_a", ""),
+        "REV_B": data.get("rev_b", ""),
+        "DATA_B": data.get("data_b", ""),
+        "DESC_B": data.get("desc_b", ""),
+        "REV_C": data.get("rev_c", ""),
+        "DATA_C": data.get("data_c", ""),
+        "DESC_C": data.get("desc_c", ""),
+        "REV_D": data.get("rev_d", ""),
+        "DATA_D": data.get("data_d", ""),
+        "DESC_D": data.get("desc_d", ""),
+        "REV_E": data.get("rev_e", ""),
+        "DATA_E": data.get("data_e", ""),
+        "DESC_E": data.get("desc_e", ""),
+        # Campos extraídos/globais
+        "DWG_SOURCE": gf.get('DWG_SOURCE') or data.get("dwg_source", ""),
+        "ID_CAD": data.get("id_cad", ""),
+        # Flag interna (não exportada)
+        "_source": "DXF"
+    }
+
+    return record
+
+def build_gemini_record(task_data, data, gf):
+    """Constrói o registo normalizado (34 colunas) a partir da resposta do Gemini.
+
+    Args:
+        task_data: Task com "display_name" e "batch_type"
+        data: Dados extraídos pela IA
+        gf: Campos globais (batch fill)
+    """
+    # Construir número do desenho a partir de PFIX + NUM
+    pfix = data.get("PFIX", "").strip()
+    num = data.get("NUM", "").strip()
+    if pfix and num:
+        num_desenho = f"{pfix}-{num}"
+    elif num:
+        num_desenho = num
+    else:
+        num_desenho = "N/A"
+
+    # Usar TIPO do JSON se disponível, senão batch_type
+    tipo_extraido = data.get("TIPO", "").strip()
+
+    record = {
+        # Campos globais (preenchidos pelo utilizador)
+        "PROJ_NUM": gf.get('PROJ_NUM', ''),
+        "PROJ_NOME": gf.get('PROJ_NOME', ''),
+        # Campos extraídos (normalizados)
+        "CLIENTE": data.get("CLIENTE", ""),
+        "OBRA": data.get("OBRA", ""),
+        "LOCALIZACAO": data.get("LOCALIZACAO", ""),
+        "ESPECIALIDADE": data.get("ESPECIALIDADE", ""),
+        "PROJETOU": data.get("PROJETOU", ""),
+        "FASE": data.get("FASE", ""),
+        # Campos globais (preenchidos pelo utilizador)
+        "FASE_PFIX": gf.get('FASE_PFIX', ''),
+        "EMISSAO": gf.get('EMISSAO', ''),
+        # Campos extraídos
+        "DATA": data.get("DATA", "-"),
+        "PFIX": pfix,
+        # Campos extraídos
+        "LAYOUT": data.get("LAYOUT", ""),
+        "DES_NUM": num_desenho,
+        "TIPO": tipo_extraido or task_data["batch_type"],
+        # Campos globais
+        "ELEMENTO": gf.get('ELEMENTO', ''),
+        # Campos extraídos
+        "TITULO": data.get("TITULO", "N/A"),
+        # Todas as revisões
+        "REV_A": data.get("REV_A", ""),
+        "DATA_A": data.get("DATA_A", ""),
+        "DESC_A": data.get("DESC_A", ""),
+        "REV_B": data.get("REV_B", ""),
+        "DATA_B": data.get("DATA_B", ""),
+        "DESC_B": data.get("DESC_B", ""),
+        "REV_C": data.get("REV_C", ""),
+        "DATA_C": data.get("DATA_C", ""),
+        "DESC_C": data.get("DESC_C", ""),
+        "REV_D": data.get("REV_D", ""),
+        "DATA_D": data.get("DATA_D", ""),
+        "DESC_D": data.get("DESC_D", ""),
+        "REV_E": data.get("REV_E", ""),
+        "DATA_E": data.get("DATA_E", ""),
+        "DESC_E": data.get("DESC_E", ""),
+        # Campos extraídos/globais
+        "DWG_SOURCE": gf.get('DWG_SOURCE', ''),
+        "ID_CAD": data.get("ID_CAD", ""),
+        # Flag interna (não exportada)
+        "_source": "PDF"
+    }
+
+    if "error" in data:
+        record["_obs"] = f"Erro IA: {data['error']}"
+
+    return record
+
+async def ask_gemini_async(image, file_context, rate_limiter, api_key_param, use_cache=True, acquired=False, executor=None):
+    """O Cérebro Assíncrono: Processa requests em paralelo com rate limiting.
+
+    Args:
+        image: Imagem PIL para análise
+        file_context: Nome do ficheiro (para logging)
+        rate_limiter: RateLimiter / SharedRateLimiter (ou None)
+        api_key_param: API key do Google Gemini
+        use_cache: Reutilizar resultados da cache persistente
+        acquired: O chamador (pipeline) já adquiriu a vez do modelo principal;
+            o rate_limiter continua a ser usado para os modelos de fallback
+        executor: Thread pool das chamadas à API (por omissão o pool dedicado, ver get_api_executor)
+
+    Returns:
+        dict: Dados extraídos pela IA
+    """
+    if not api_key_param:
+        logger.error("Tentativa de processar sem API Key")
+        return {"error": "Sem API Key", "num_desenho": "ERRO", "titulo": file_context, "revisao": "?", "data": "??/??/????", "obs": "API Key não fornecida"}, 0
+
+    # Aguarda permissão do rate limiter (quota do modelo principal)
+    if rate_limiter is not None and not acquired:
+        await rate_limiter.acquire()
+
+    # Executa a chamada síncrona da API no thread pool dedicado
+    loop = asyncio.get_event_loop()
+    executor = executor or get_api_executor()
+    return await loop.run_in_executor(executor, _ask_gemini_sync, image, file_context, api_key_param, use_cache, rate_limiter)
+
+# --- CONFIGURAÇÃO GEMINI ---
+
+# LISTA DE MODELOS ATUALIZADA (ordem de prioridade)
+GEMINI_MODELS = [
+    'gemini-2.5-flash',          # PRIORIDADE 1
+    'gemini-2.0-flash',          # PRIORIDADE 2
+    'gemini-1.5-flash',          # Fallback Standard
+    'gemini-1.5-flash-latest',   # Fallback Alias
+    'gemini-pro'                 # Legacy
+]
+
+# Repetições por modelo: 429 e erros transitórios repetem o mesmo modelo com backoff;
+# só erros permanentes (ou tentativas esgotadas) passam ao modelo seguinte
+RETRY_POLICY = RetryPolicy(max_attempts=4, base_delay=2.0, max_delay=30.0)
+
+# Prompt de extração (a versão entra na chave da cache de resultados)
+PROMPT_EXTRACAO = """
+    És um técnico de documentação especializado em extrair metadados de desenhos técnicos. Analisa APENAS o que está visualmente desenhado/escrito nesta imagem.
+
+    ╔═══════════════════════════════════════════════════════════════════╗
+    ║ REGRA DE OURO #1: IGNORA COMPLETAMENTE O NOME DO FICHEIRO        ║
+    ║ REGRA DE OURO #2: EXTRAI TODOS OS CAMPOS VISÍVEIS NA LEGENDA     ║
+    ║ REGRA DE OURO #3: EXTRAI TODAS AS REVISÕES (A, B, C, D, E)       ║
+    ╚═══════════════════════════════════════════════════════════════════╝
+
+    📋 CAMPOS A EXTRAIR DA LEGENDA:
+
+    1️⃣ INFORMAÇÃO DO PROJETO (procura na legenda):
+       - CLIENTE: Nome do cliente/dono de obra
+       - OBRA: Nome/descrição da obra
+       - LOCALIZACAO: Local da obra (cidade, morada, etc)
+       - ESPECIALIDADE: Tipo de especialidade (ex: "ESTRUTURA E FUNDAÇÕES", "ARQUITECTURA")
+       - PROJETOU: Nome de quem projetou/autor
+       - FASE: Fase do projeto (ex: "LIC", "EXE", "PROJ")
+
+    2️⃣ INFORMAÇÃO DO DESENHO:
+       - DATA: Data base/1ª emissão do desenho
+       - TIPO: Tipo de desenho (ex: "Betão Armado", "Dimensionamento", "Pormenor")
+       - TITULO: Título/descrição do desenho
+       - PFIX: Prefixo do número do desenho (ex: "EST", "BA", "DIM")
+       - NUM: Número sequencial do desenho (ex: "001", "15")
+       - R: Revisão atual (letra A-Z ou vazio se 1ª emissão)
+
+    3️⃣ TABELA DE REVISÕES (EXTRAIR TODAS AS LINHAS A até E):
+       Procura a tabela de revisões e extrai CADA linha separadamente:
+       ┌─────────────────────────────────────────────────────┐
+       │ REV │   DATA    │      DESCRIÇÃO           │
+       ├─────┼───────────┼──────────────────────────┤
+       │  A  │ 10/01/2025│ Primeira emissão         │ → REV_A, DATA_A, DESC_A
+       │  B  │ 15/02/2025│ Correcção de medidas     │ → REV_B, DATA_B, DESC_B
+       │  C  │ 20/03/2025│ Ajuste de armaduras      │ → REV_C, DATA_C, DESC_C
+       │  D  │           │                          │ → REV_D, DATA_D, DESC_D (vazios)
+       │  E  │           │                          │ → REV_E, DATA_E, DESC_E (vazios)
+       └─────┴───────────┴──────────────────────────┘
+
+    📤 RETORNA APENAS JSON VÁLIDO (sem comentários):
+    {
+        "CLIENTE": "string - Nome do cliente ou vazio",
+        "OBRA": "string - Nome da obra ou vazio",
+        "LOCALIZACAO": "string - Localização ou vazio",
+        "ESPECIALIDADE": "string - Especialidade ou vazio",
+        "PROJETOU": "string - Quem projetou ou vazio",
+        "FASE": "string - Fase do projeto ou vazio",
+        "DATA": "string - Data base/1ª emissão ou vazio",
+        "TIPO": "string - Tipo de desenho ou vazio",
+        "TITULO": "string - Título do desenho",
+        "PFIX": "string - Prefixo do número ou vazio",
+        "NUM": "string - Número do desenho",
+        "R": "string - Revisão atual (letra) ou vazio",
+        "REV_A": "string - 'A' se preenchida, senão vazio",
+        "DATA_A": "string - Data da revisão A ou vazio",
+        "DESC_A": "string - Descrição da revisão A ou vazio",
+        "REV_B": "string - 'B' se preenchida, senão vazio",
+        "DATA_B": "string - Data da revisão B ou vazio",
+        "DESC_B": "string - Descrição da revisão B ou vazio",
+        "REV_C": "string - 'C' se preenchida, senão vazio",
+        "DATA_C": "string - Data da revisão C ou vazio",
+        "DESC_C": "string - Descrição da revisão C ou vazio",
+        "REV_D": "string - 'D' se preenchida, senão vazio",
+        "DATA_D": "string - Data da revisão D ou vazio",
+        "DESC_D": "string - Descrição da revisão D ou vazio",
+        "REV_E": "string - 'E' se preenchida, senão vazio",
+        "DATA_E": "string - Data da revisão E ou vazio",
+        "DESC_E": "string - Descrição da revisão E ou vazio",
+        "obs": "string - Avisos se ilegível/em falta, senão vazio"
+    }
+
+    ⚠️ NOTAS IMPORTANTES:
+    - Se um campo não for visível ou legível, deixa VAZIO (string vazia "")
+    - Para revisões não preenchidas na tabela, deixa os 3 campos vazios
+    - O campo R deve ter a letra da revisão mais recente (última preenchida)
+    - Datas podem estar em qualquer formato (DD/MM/YYYY, YYYY.MM.DD, texto)
+    """
+PROMPT_VERSION = prompt_version(PROMPT_EXTRACAO)
+
+def _apply_validation(parsed_data, file_context):
+    """Valida os dados extraídos e anota avisos/erros no campo 'obs'."""
+    is_valid, errors, warnings = validate_extracted_data(parsed_data, file_context)
+
+    if not is_valid:
+        # Dados inválidos - reportar mas não falhar completamente
+        logger.error(f"Dados inválidos extraídos de {file_context}: {errors}")
+        parsed_data['obs'] = f"VALIDAÇÃO FALHOU: {'; '.join(errors)}"
+        if warnings:
+            parsed_data['obs'] += f" | Avisos: {'; '.join(warnings)}"
+    elif warnings:
+        # Dados válidos mas com avisos
+        if parsed_data.get('obs'):
+            parsed_data['obs'] += f" | {'; '.join(warnings)}"
+        else:
+            parsed_data['obs'] = '; '.join(warnings)
+
+    return parsed_data
+
+def _response_tokens(response):
+    if hasattr(response, 'usage_metadata'):
+        return response.usage_metadata.total_token_count
+    # Estimativa se não houver metadata: ~500 tokens por request
+    return 500
+
+def _generate_with_fallback(contents, file_context, api_key_param, rate_limiter=None, schema=EXTRACTION_SCHEMA):
+    """Chama os modelos por ordem de prioridade até um responder.
+
+    Cada modelo tem as suas repetições (RETRY_POLICY); os modelos de fallback
+    aguardam a sua própria vez no rate_limiter (o principal já foi adquirido).
+    Os modelos com modo JSON respondem segundo `schema` (jsj_response).
+
+    Returns:
+        tuple: (response, model_name)
+
+    Raises:
+        RuntimeError: Todos os modelos falharam (mensagem com o último erro)
+    """
+    # Clientes reutilizados por API key/modelo (sem genai.configure por pedido)
+    clients = get_client_pool()
+    last_error = ""
+
+    # LOOP DE MODELOS (FALLBACK): cada modelo com as suas repetições (RETRY_POLICY)
+    for attempt, model_name in enumerate(GEMINI_MODELS):
+        try:
+            if attempt > 0 and hasattr(rate_limiter, "acquire_blocking"):
+                rate_limiter.acquire_blocking(model_name)
+            logger.info(f"Tentando modelo {model_name} para {file_context}")
+            model = clients.model(api_key_param, model_name)
+            response = RETRY_POLICY.call(
+                lambda: model.generate_content(contents, generation_config=generation_config(model_name, schema)),
+                model_name, rate_limiter=rate_limiter, context=file_context
+            )
+            return response, model_name
+        except Exception as e:
+            last_error = str(e)
+            logger.warning(f"Modelo {model_name} falhou para {file_context}: {last_error}")
+
+    raise RuntimeError(last_error)
+
+def _failed_result(file_context, error):
+    """Resultado de uma folha em que todos os modelos falharam."""
+    return {
+        "error": f"Falha IA. Último erro: {error}",
+        "num_desenho": "ERRO",
+        "titulo": file_context,
+        "revisao": "?",
+        "data": "??/??/????",
+        "obs": "Todos os modelos falharam"
+    }
+
+def _ask_gemini_sync(image, file_context, api_key_param, use_cache=True, rate_limiter=None):
+    """Wrapper síncrono para chamada ao Gemini (executado em thread pool).
+
+    Args:
+        image: Imagem PIL para análise
+        file_context: Nome do ficheiro (para logging)
+        api_key_param: API key do Google Gemini
+        use_cache: Consultar/gravar a cache de resultados (hash da imagem + prompt + modelo)
+        rate_limiter: Limiter com quotas por modelo; cada modelo de fallback
+            aguarda a sua própria vez (o principal já foi adquirido). Recebe os
+            429 (throttle) e sucessos para adaptar a concorrência.
+
+    Returns:
+        tuple: (dados_extraidos: dict, tokens_usados: int)
+    """
+    # CACHE: a mesma folha (mesmos pixels) não volta a ser paga
+    cache = get_result_cache() if use_cache else None
+    image_hash = image_fingerprint(image) if cache else None
+    if cache:
+        hit = cache.get(image_hash, PROMPT_VERSION, GEMINI_MODELS)
+        if hit:
+            parsed_data, cached_tokens, cached_model = hit
+            logger.info(f"Cache HIT ({cached_model}) para {file_context}: {cached_tokens} tokens poupados")
+            return _apply_validation(parsed_data, file_context), 0
+
+    # Imagem já codificada (JPEG/WebP/PNG) segue como blob inline
+    image_part = image.to_part() if isinstance(image, EncodedImage) else image
+
+    try:
+        response, model_name = _generate_with_fallback([PROMPT_EXTRACAO, image_part], file_context, api_key_param, rate_limiter)
+    except RuntimeError as e:
+        # Se chegou aqui, todos os modelos falharam
+        logger.error(f"TODOS os modelos falharam para {file_context}. Último erro: {e}")
+        return _failed_result(file_context, e), 0
+
+    total = _response_tokens(response)
+
+    # *** VALIDAÇÃO ROBUSTA DO JSON *** (parser tolerante: cercas, texto extra, respostas cortadas)
+    try:
+        parsed_data, truncated = parse_json_response(response.text)
+        if not isinstance(parsed_data, dict):
+            raise json.JSONDecodeError("Resposta não é um objeto JSON", response.text, 0)
+    except json.JSONDecodeError as e:
+        logger.error(f"JSON inválido retornado pela IA para {file_context}: {e}")
+        logger.debug(f"Resposta bruta: {response.text[:200]}...")
+        return {
+            "error": f"IA retornou JSON malformado: {str(e)}",
+            "num_desenho": "ERRO_JSON",
+            "titulo": file_context,
+            "revisao": "?",
+            "data": "??/??/????",
+            "obs": f"Erro de parsing JSON: {str(e)}"
+        }, 0
+
+    normalize_extraction(parsed_data)
+    if truncated:
+        # Resposta cortada: os campos que chegaram ficam, mas o registo é assinalado (e não vai para a cache)
+        parsed_data['obs'] = "; ".join(filter(None, [parsed_data['obs'], "Resposta IA incompleta: verificar campos"]))
+    elif cache:
+        # Guardar o JSON bruto (antes das anotações de validação)
+        cache.put(image_hash, PROMPT_VERSION, model_name, parsed_data, total)
+
+    # *** VALIDAÇÃO DE INTEGRIDADE DOS DADOS ***
+    _apply_validation(parsed_data, file_context)
+
+    logger.info(f"Sucesso com modelo {model_name} para {file_context} ({total} tokens)")
+    return parsed_data, total
+
+# --- EXTRAÇÃO EM LOTE (K legendas por pedido) ---
+
+# Acrescentado ao prompt de extração: o prompt (~1.5 KB) é pago uma vez por lote
+PROMPT_LOTE = """
+    ╔═══════════════════════════════════════════════════════════════════╗
+    ║ MODO LOTE: {n} IMAGENS, CADA UMA É A LEGENDA DE UM DESENHO       ║
+    ╚═══════════════════════════════════════════════════════════════════╝
+
+    - As imagens estão numeradas ("Imagem 1" a "Imagem {n}"); aplica as regras acima a CADA uma
+    - Cada desenho é independente: NUNCA copies valores de uma imagem para outra
+
+    📤 RETORNA APENAS UM ARRAY JSON com exatamente {n} objetos, pela ordem das imagens,
+    cada um com os campos acima e o campo extra "IMAGEM" (número da imagem, 1 a {n}).
+    """
+# Versão do prompt em lote (PROMPT_EXTRACAO + PROMPT_LOTE): resultados em lote
+# ficam na cache separados dos de uma folha e mudar PROMPT_LOTE invalida-os
+PROMPT_BATCH_VERSION = prompt_version(PROMPT_EXTRACAO + PROMPT_LOTE)
+# Campos obrigatórios de cada objeto do array (objetos sem eles são repetidos)
+BATCH_REQUIRED_FIELDS = ("NUM", "TITULO")
+# Divisões ao meio de um lote falhado (K → K/2 → K/4); depois cada folha é pedida
+# sozinha (um lote de K que falha custa no máximo 1 + 2 + 4 + K pedidos, não ~2K)
+MAX_BATCH_SPLITS = 2
+
+def _align_batch_items(parsed, n):
+    """Objetos de uma resposta em lote alinhados às imagens (None onde faltam)."""
+    if isinstance(parsed, dict):
+        # Alguns modelos embrulham o array ({"desenhos": [...]})
+        lists = [v for v in parsed.values() if isinstance(v, list)]
+        parsed = lists[0] if len(lists) == 1 else [parsed]
+    if not isinstance(parsed, list):
+        return [None] * n
+
+    items = [None] * n
+    numbered = all(isinstance(item, dict) and str(item.get("IMAGEM", "")).isdigit() for item in parsed)
+    for position, item in enumerate(parsed):
+        index = int(item["IMAGEM"]) - 1 if numbered else position
+        if 0 <= index < n and items[index] is None:
+            items[index] = item
+    return items
+
+def _valid_batch_item(item):
+    return isinstance(item, dict) and all(field in item for field in BATCH_REQUIRED_FIELDS)
+
+def _ask_gemini_batch_sync(images, contexts, api_key_param, use_cache=True, rate_limiter=None):
+    """Extrai K legendas num só pedido, com split-and-retry por item.
+
+    Folhas em cache (PROMPT_BATCH_VERSION) não entram no pedido. A resposta
+    (array JSON) é alinhada às imagens pelo campo IMAGEM; objetos em falta ou
+    sem os campos obrigatórios são repetidos num lote menor e, se o pedido
+    inteiro falhar (todos os modelos, JSON inválido), o lote é dividido ao
+    meio e cada metade repetida. Ao fim de MAX_BATCH_SPLITS níveis de
+    repetição em lote as folhas que faltam são pedidas uma a uma. Um lote de
+    uma folha segue o caminho normal (_ask_gemini_sync).
+    Os tokens de cada pedido são repartidos pelas suas folhas.
+
+    Args:
+        images: Imagens (PIL ou EncodedImage), uma por folha
+        contexts: Nome de cada folha (logging / registos de erro)
+        api_key_param, use_cache: Como em _ask_gemini_sync
+        rate_limiter: O primeiro pedido já foi adquirido pelo chamador; os
+            pedidos de repetição aguardam a sua vez no modelo principal
+
+    Returns:
+        list: (dados_extraidos, tokens_usados) por folha, pela ordem de `images`
+    """
+    results = [None] * len(images)
+    cache = get_result_cache() if use_cache else None
+    hashes = [image_fingerprint(image) for image in images] if cache else [None] * len(images)
+
+    pending = []
+    for i, image_hash in enumerate(hashes):
+        hit = cache.get(image_hash, PROMPT_BATCH_VERSION, GEMINI_MODELS) if cache else None
+        if hit:
+            logger.info(f"Cache HIT ({hit[2]}) para {contexts[i]}: {hit[1]} tokens poupados")
+            results[i] = (_apply_validation(hit[0], contexts[i]), 0)
+        else:
+            pending.append(i)
+
+    acquired = True
+
+    def extract(indices, depth=0):
+        nonlocal acquired
+        if not acquired and hasattr(rate_limiter, "acquire_blocking"):
+            rate_limiter.acquire_blocking()
+        acquired = False
+
+        if len(indices) == 1:
+            i = indices[0]
+            results[i] = _ask_gemini_sync(images[i], contexts[i], api_key_param, use_cache, rate_limiter)
+            return
+
+        label = f"lote de {len(indices)} ({contexts[indices[0]]} …)"
+        contents = [PROMPT_EXTRACAO + PROMPT_LOTE.format(n=len(indices))]
+        for n, i in enumerate(indices, 1):
+            image = images[i]
+            contents += [f"Imagem {n}:", image.to_part() if isinstance(image, EncodedImage) else image]
+
+        failed = list(indices)
+        try:
+            response, model_name = _generate_with_fallback(contents, label, api_key_param, rate_limiter, BATCH_SCHEMA)
+            items = _align_batch_items(parse_batch_response(response.text), len(indices))
+            total = _response_tokens(response)
+            share = total // len(indices)
+            failed = []
+            for n, (i, item) in enumerate(zip(indices, items)):
+                if not _valid_batch_item(item):
+                    failed.append(i)
+                    continue
+                item.pop("IMAGEM", None)
+                normalize_extraction(item)
+                if cache:
+                    cache.put(hashes[i], PROMPT_BATCH_VERSION, model_name, item, share)
+                # Resto da divisão fica na primeira folha (total exato)
+                results[i] = (_apply_validation(item, contexts[i]), share + (total % len(indices) if n == 0 else 0))
+            logger.info(f"Sucesso com modelo {model_name} para {label}: {len(indices) - len(failed)} folhas ({total} tokens)")
+        except (RuntimeError, json.JSONDecodeError) as e:
+            logger.warning(f"Pedido em lote falhou para {label}: {e}")
+
+        if not failed:
+            return
+        if depth >= MAX_BATCH_SPLITS:
+            # Sem mais lotes: cada folha em falta segue o caminho normal
+            for i in failed:
+                extract([i], depth + 1)
+        elif len(failed) < len(indices):
+            # Só os objetos em falta/inválidos voltam a ser pedidos
+            extract(failed, depth + 1)
+        else:
+            half = len(failed) // 2
+            extract(failed[:half], depth + 1)
+            extract(failed[half:], depth + 1)
+
+    if pending:
+        extract(pending)
+    return results
+
+async def ask_gemini_batch_async(images, contexts, rate_limiter, api_key_param, use_cache=True, acquired=False, executor=None):
+    """Versão em lote de ask_gemini_async: K folhas num pedido (ver _ask_gemini_batch_sync)."""
+    if not api_key_param:
+        logger.error("Tentativa de processar sem API Key")
+        return [await ask_gemini_async(image, context, None, api_key_param) for image, context in zip(images, contexts)]
+
+    if rate_limiter is not None and not acquired:
+        await rate_limiter.acquire()
+
+    loop = asyncio.get_event_loop()
+    executor = executor or get_api_executor()
+    return await loop.run_in_executor(
+        executor, _ask_gemini_batch_sync, images, contexts, api_key_param, use_cache, rate_limiter
+    )
+
+# --- INGESTÃO DE FICHEIROS (PDF / JSON LISP / DWG) ---
+
+def iter_lisp_json_tasks(json_data, file_name, batch_type="", report=None, known_sheets=None,
+                         sheet_prefix=None, seen_sheets=None):
+    """Gera as tasks nativas de um JSON exportado pela LISP EXTRATOR_LEGENDA_JSJ.lsp.
+
+    SUPORTE PARA DOIS FORMATOS DE JSON:
+    Formato 1: {"desenhos": [...], "metadata": {...}} (LISP antiga)
+    Formato 2: [{atributos: {...}}, ...] (LISP nova)
+
+    Cada bloco é uma folha (fingerprint = hash dos atributos); com
+    known_sheets, os blocos inalterados desde a última ingestão são ignorados.
+    As chaves de folha começam por sheet_prefix (por omissão file_name) e
+    são todas registadas em seen_sheets, inalteradas incluídas.
+
+    Returns:
+        bool: False se o formato do JSON não for reconhecido
+    """
+    report = report or _log_report
+    known_sheets = known_sheets or {}
+    sheet_prefix = sheet_prefix or file_name
+    seen_sheets = seen_sheets if seen_sheets is not None else set()
+    json_count = 0
+    skipped = 0
+
+    # Detectar formato
+    if isinstance(json_data, list):
+        # Formato 2: Array direto de desenhos com atributos aninhados
+        items = [(item.get('atributos', {}), item.get('layout_tab', f'Layout {idx+1}'), item.get('id_desenho', idx + 1),
+                  item.get('handle_bloco', ''))
+                 for idx, item in enumerate(json_data)]
+        display_prefix = file_name.replace('.json', '')
+        # A LISP nova grava <desenho>.dwg.jsj.json (ou <desenho>.json)
+        dwg_source = re.sub(r'(\.jsj)?\.json$', '', file_name, flags=re.IGNORECASE)
+        source_name = file_name
+        array_format = True
+    elif isinstance(json_data, dict) and 'desenhos' in json_data:
+        # Formato 1: Estrutura com wrapper {"desenhos": [...]}
+        metadata = json_data.get('metadata', {})
+        items = [(desenho, desenho.get('LAYOUT', 'Layout desconhecido'), desenho.get('BLOCO_NUM', idx + 1),
+                  desenho.get('HANDLE', ''))
+                 for idx, desenho in enumerate(json_data['desenhos'])]
+        source_name = display_prefix = metadata.get('dwg_file', file_name)
+        dwg_source = metadata.get('dwg_file', '')
+        array_format = False
+    else:
+        report('error', f"❌ {file_name}: Formato JSON não reconhecido")
+        return False
+
+    for attrs, layout_info, bloco_num, handle in items:
+        sheet = f"{sheet_prefix}#{layout_info}#{bloco_num}"
+        seen_sheets.add(sheet)
+        fingerprint = data_fingerprint([attrs, handle])
+        if known_sheets.get(sheet) == fingerprint:
+            skipped += 1
+            continue
+
+        # Mesmo mapeamento de atributos que a extração DWG nativa (todas as colunas + ID_CAD)
+        native_data = native_fields(attrs, layout_info, handle)
+
+        # Para JSON, usar tipo do próprio JSON (não precisa de batch_type)
+        tipo_final = native_data['tipo'] or (batch_type.upper() if batch_type else 'N/A')
+
+        native_data.update({
+            'tipo': tipo_final,
+            'num_desenho': native_data['num_desenho'] or 'N/A',
+            'titulo': native_data['titulo'] or 'Sem título',
+            'primeira_emissao': native_data['primeira_emissao'] or 'N/A',
+            'dwg_source': dwg_source,
+            'obs': f'Extração LISP AutoCAD (Layout: {layout_info})'
+        })
+
+        yield {
+            "native_data": native_data,
+            "display_name": f"{display_prefix} (Layout: {layout_info}, Bloco {bloco_num})",
+            "batch_type": tipo_final,
+            "is_native": True,
+            "sheet": sheet,
+            "fingerprint": fingerprint
+        }
+        json_count += 1
+
+    if skipped:
+        report('info', f"♻️ {file_name}: {skipped} blocos inalterados (não reprocessados)")
+    if array_format:
+        report('success', f"✅ {json_count} desenhos extraídos do JSON (formato array)")
+    report('status', f"JSON: {json_count} desenhos processados de {source_name}")
+    logger.info(f"✅ JSON LISP processado: {json_count} desenhos de {file_name}")
+    return True
+
+def _log_report(level, message):
+    """Destino por omissão das mensagens de progresso (sem UI): o logger."""
+    if level == 'error':
+        logger.error(message)
+    elif level == 'warning':
+        logger.warning(message)
+    else:
+        logger.info(message)
+
+def _ensure_path(file_name, source, temp_files):
+    """Caminho em disco para a fonte (bytes → ficheiro temporário registado em temp_files)."""
+    if isinstance(source, str):
+        return source
+    suffix = os.path.splitext(file_name)[1] or '.tmp'
+    with tempfile.NamedTemporaryFile(delete=False, suffix=suffix) as tmp:
+        tmp.write(source)
+    # Removido só no fim do lote (rasterizações podem ainda estar em curso)
+    temp_files.append(tmp.name)
+    return tmp.name
+
+def iter_file_tasks(file_name, source, batch_type="", crop_preset=AUTO_CROP_PRESET,
+                    use_text_layer=True, raster_pool=None, temp_files=None, report=None, image_opts=None,
+                    known_sheets=None, sheet_prefix=None, sheet_index=None):
+    """Gera as tasks de um ficheiro (PDF, JSON LISP ou DWG/DXF), sob demanda.
+
+    A rasterização é adiada via "render" e corre dentro do pipeline; tasks
+    nativas (DXF, JSON, camada de texto) trazem os dados em "native_data".
+    Cada task identifica a sua folha ("sheet": página PDF, layout DWG ou
+    bloco JSON) e o respetivo "fingerprint"; folhas cujo fingerprint é igual
+    ao de known_sheets (ingestão anterior do projeto) não geram tasks.
+    Quando o ficheiro é lido até ao fim, sheet_index[sheet_prefix] recebe
+    todas as folhas atuais (ver jsj_store.ProjectStore.merge, que remove as
+    folhas que deixaram de existir).
+
+    Args:
+        file_name: Nome do ficheiro (extensão determina o tipo)
+        source: Caminho em disco (str) ou conteúdo (bytes)
+        batch_type: Tipo de desenho do lote
+        crop_preset: Preset de crop para PDF
+        use_text_layer: Tentar a camada de texto antes do Gemini (PDF)
+        raster_pool: Process pool de rasterização (None = rasterização na thread do pipeline)
+        temp_files: Lista onde registar ficheiros temporários a remover no fim do lote
+        report: Função report(level, message) para mensagens de progresso
+            (level: 'status', 'info', 'success', 'warning', 'error')
+        image_opts: Opções de image_options() para as imagens enviadas à IA
+        known_sheets: dict folha -> fingerprint da última ingestão (None = processar tudo)
+        sheet_prefix: Identificador do ficheiro nas chaves de folha (por omissão
+            file_name; a CLI usa o caminho relativo à raiz do projeto)
+        sheet_index: dict ficheiro (sheet_prefix) -> folhas atuais, preenchido
+            só se o ficheiro for lido sem erros
+    """
+    report = report or _log_report
+    temp_files = temp_files if temp_files is not None else []
+    known_sheets = known_sheets or {}
+    sheet_prefix = sheet_prefix or file_name
+    seen_sheets = set()
+    file_ext = file_name.lower().split('.')[-1]
+
+    try:
+        if file_ext == 'json':
+            # Processar JSON (ficheiro LISP AutoCAD)
+            report('status', f"A processar JSON LISP: {file_name}...")
+            try:
+                if isinstance(source, str):
+                    with open(source, 'rb') as f:
+                        source = f.read()
+                json_data = json.loads(source.decode('utf-8'))
+            except json.JSONDecodeError as e:
+                report('error', f"❌ Erro ao ler JSON {file_name}: {str(e)}")
+                logger.error(f"JSON decode error: {file_name} - {e}")
+                return
+
+            report('info', f"📋 JSON carregado: {len(json_data) if isinstance(json_data, list) else 'formato dict'} registos")
+            if not (yield from iter_lisp_json_tasks(json_data, file_name, batch_type, report, known_sheets,
+                                                    sheet_prefix, seen_sheets)):
+                return
+
+        elif file_ext == 'pdf':
+            # Processar PDF
+            if isinstance(source, str):
+                doc = fitz.open(source)
+            else:
+                doc = fitz.open(stream=source, filetype="pdf")
+
+            # Process pool: os workers abrem o PDF a partir de um ficheiro em disco
+            if raster_pool is not None:
+                pdf_path = _ensure_path(file_name, source, temp_files)
+            auto_crop = crop_preset == AUTO_CROP_PRESET
+            crop_box = None if auto_crop else get_crop_coordinates(crop_preset, None)
+
+            skipped = 0
+            try:
+                for page_num in range(doc.page_count):
+                    display_name = f"{file_name} (Pág. {page_num + 1})"
+                    sheet = f"{sheet_prefix}#{page_num + 1}"
+                    seen_sheets.add(sheet)
+
+                    # Deteção de alterações: hash dos content streams (sem rasterizar)
+                    page = doc.load_page(page_num)
+                    fingerprint = page_fingerprint(page)
+                    if known_sheets.get(sheet) == fingerprint:
+                        skipped += 1
+                        continue
+
+                    # Crop automático: legenda localizada UMA vez por página (rect para a
+                    # camada de texto, frações para a rasterização)
+                    crop_rect = get_crop_rect(page, crop_preset) if auto_crop or use_text_layer else None
+                    page_box = crop_rect_to_box(page, crop_rect) if auto_crop else crop_box
+
+                    # FAST PATH: PDF vetorial → ler a legenda da camada de texto (zero custo)
+                    if use_text_layer:
+                        text_data, confidence = extract_from_text_layer(page, crop_rect)
+                        if confidence >= DEFAULT_MIN_CONFIDENCE:
+                            yield {
+                                "native_data": text_data,
+                                "display_name": display_name,
+                                "batch_type": batch_type.upper(),
+                                "is_native": True,
+                                "source": "TEXT",
+                                "sheet": sheet,
+                                "fingerprint": fingerprint
+                            }
+                            continue
+                        logger.info(f"Camada de texto insuficiente em {display_name} ({confidence:.0%}), a usar Gemini")
+
+                    # Zoom adaptativo + codificação (no worker do pool ou na thread do pipeline)
+                    render = functools.partial(
+                        render_pdf_page, pdf_path if raster_pool is not None else doc,
+                        page_num, page_box, image_opts
+                    )
+
+                    yield {
+                        "render": render,
+                        "display_name": display_name,
+                        "batch_type": batch_type.upper(),
+                        "is_native": False,
+                        "sheet": sheet,
+                        "fingerprint": fingerprint
+                    }
+            finally:
+                doc.close()
+
+            if skipped:
+                report('info', f"♻️ {file_name}: {skipped} páginas inalteradas (não reprocessadas)")
+
+        elif file_ext in ['dwg', 'dxf'] and DWG_SUPPORT:
+            # Processar DWG/DXF com HYBRID WORKFLOW
+            report('status', f"A processar {file_name}...")
+
+            # ezdxf precisa de ficheiro no disco
+            dwg_path = _ensure_path(file_name, source, temp_files)
+
+            try:
+                # Parse único do DWG: layouts, extração nativa e rendering partilham a sessão
+                report('status', f"A carregar {file_name}...")
+                dwg_session = DwgSession(dwg_path)
+
+                # Obter layouts (apenas Paper Space, Model Space é ignorado)
+                layouts = get_dwg_layouts(dwg_session)
+
+                if not layouts:
+                    report('warning', f"⚠️ **{file_name}**: Apenas contém Model Space. Desenhos devem estar em Paper Space (Layout1, Layout2, etc). Ficheiro ignorado.")
+                    logger.warning(f"DWG ignorado (só Model Space): {file_name}")
+                    return
+
+                report('status', f"Encontrados {len(layouts)} Paper Space layouts em {file_name}")
+
+                skipped = 0
+                for layout_name in layouts:
+                    try:
+                        sheet = f"{sheet_prefix}#{layout_name}"
+                        # Registada antes da extração: um layout com erro não é dado como removido
+                        seen_sheets.add(sheet)
+
+                        # TENTATIVA 1: Extração Nativa (zero custo, instant)
+                        report('status', f"Tentando extração nativa de {file_name} (Layout: {layout_name})...")
+                        native_blocks = extract_dwg_native_blocks(dwg_session, layout_name)
+
+                        # Fingerprint do layout = hash dos atributos LEGENDA; sem legenda, hash
+                        # das entidades do layout (só volta ao Gemini se o desenho mudar)
+                        if native_blocks:
+                            fingerprint = data_fingerprint(native_blocks)
+                        else:
+                            fingerprint = dwg_session.layout_fingerprint(layout_name)
+                        if known_sheets.get(sheet) == fingerprint:
+                            skipped += 1
+                            continue
+
+                        if native_blocks:
+                            # Sucesso! Adicionar todos os blocos encontrados
+                            for block_idx, block_data in enumerate(native_blocks):
+                                block_data['dwg_source'] = file_name
+                                yield {
+                                    "native_data": block_data,  # Dados já extraídos!
+                                    "display_name": f"{file_name} (Layout: {layout_name}, Bloco {block_idx+1})",
+                                    "batch_type": batch_type.upper(),
+                                    "is_native": True,
+                                    "sheet": sheet,
+                                    "fingerprint": fingerprint
+                                }
+
+                            logger.info(f"✅ Extração nativa: {len(native_blocks)} blocos em {layout_name}")
+                        else:
+                            # FALLBACK: Rendering + Gemini (custo API)
+                            logger.warning(f"Sem blocos LEGENDA em {layout_name}, usando rendering + Gemini")
+                            display_name = f"{file_name} (Layout: {layout_name})"
+                            report('status', f"A renderizar {display_name} (fallback)...")
+
+                            render = functools.partial(
+                                render_dwg_layout, dwg_path if raster_pool is not None else dwg_session,
+                                layout_name, image_opts
+                            )
+
+                            yield {
+                                "render": render,
+                                "display_name": display_name,
+                                "batch_type": batch_type.upper(),
+                                "is_native": False,
+                                "sheet": sheet,
+                                "fingerprint": fingerprint
+                            }
+
+                    except Exception as layout_error:
+                        report('warning', f"⚠️ Erro no layout '{layout_name}' de {file_name}: {str(layout_error)}")
+                        continue
+
+                if skipped:
+                    report('info', f"♻️ {file_name}: {skipped} layouts inalterados (não reprocessados)")
+
+            except Exception as dwg_error:
+                report('error', f"❌ Erro ao processar {file_name}: {str(dwg_error)}")
+                return
+
+        else:
+            return
+
+        if sheet_index is not None:
+            sheet_index[sheet_prefix] = seen_sheets
+
+    except Exception as e:
+        report('error', f"Erro ao ler {file_name}: {e}")
+
+def cleanup_temp_files(temp_files):
+    """Remove os ficheiros temporários de um lote."""
+    for tmp_path in temp_files:
+        try:
+            if os.path.exists(tmp_path):
+                os.unlink(tmp_path)
+        except (FileNotFoundError, PermissionError, OSError) as e:
+            logger.warning(f"Não foi possível eliminar ficheiro temporário {tmp_path}: {e}")
+
+# --- PROCESSAMENTO (PIPELINE) ---
+
+def build_record(task_data, result, gf):
+    """Converte o resultado de uma task no registo normalizado (34 colunas).
+
+    A folha de origem ("_sheet", "_fingerprint") segue no registo para a
+    ingestão incremental (ver jsj_store.ProjectStore.merge).
+
+    Returns:
+        tuple: (record: dict, tokens: int)
+    """
+    record, tokens = _build_record(task_data, result, gf)
+    if task_data.get("sheet"):
+        record["_sheet"] = task_data["sheet"]
+        record["_fingerprint"] = task_data.get("fingerprint")
+    return record, tokens
+
+def _build_record(task_data, result, gf):
+    if task_data.get("source") == "TEXT":
+        # Camada de texto do PDF (mesmo formato da resposta Gemini)
+        data = _apply_validation(task_data["native_data"], task_data["display_name"])
+        return build_gemini_record(task_data, data, gf), 0
+
+    if task_data.get("is_native", False):
+        # Task nativa (instantânea, sem API calls)
+        return build_native_record(task_data, gf), 0
+
+    # Desempacotar resultado Gemini (data, tokens)
+    tokens = 0
+    if isinstance(result, Exception):
+        data = {"error": str(result), "NUM": "ERRO", "TITULO": task_data["display_name"]}
+    elif isinstance(result, tuple):
+        data, tokens = result
+    else:
+        data = result
+    return build_gemini_record(task_data, data, gf), tokens
+
+async def process_tasks(task_source, api_key_param, gf, rate_limiter, concurrency=5,
+                        use_cache=True, raster_pool=None, raster_workers=1, on_record=None, batch_size=1,
+                        source_executor=None):
+    """Corre o pipeline híbrido (nativo + Gemini) sobre um iterável de tasks.
+
+    Args:
+        task_source: Iterável de tasks (ver iter_file_tasks)
+        api_key_param: API key do Google Gemini
+        gf: Campos globais (batch fill)
+        rate_limiter: RateLimiter / SharedRateLimiter (quotas por modelo)
+        concurrency: Nº de pedidos Gemini em voo
+        use_cache: Reutilizar a cache de resultados
+        raster_pool: Process pool de rasterização (ou None)
+        raster_workers: Nº de processos do pool (rasterizações em curso)
+        on_record: Função on_record(record, tokens, task, stats) chamada por registo
+        batch_size: Legendas por pedido Gemini (K > 1: extração em lote)
+        source_executor: Executor de uma thread para o gerador de tasks (ver run_streaming_pipeline)
+
+    Returns:
+        tuple: (records: list, stats: dict do pipeline)
+    """
+    records = []
+    # Pool dedicado às chamadas à API (o executor por omissão do asyncio tem poucas threads)
+    executor = get_api_executor()
+
+    async def ask_task(task_data):
+        # O pipeline já adquiriu a vez no rate limiter (latência sem espera)
+        return await ask_gemini_async(
+            task_data["image"], task_data["display_name"], rate_limiter, api_key_param, use_cache,
+            acquired=True, executor=executor
+        )
+
+    async def ask_batch(tasks):
+        return await ask_gemini_batch_async(
+            [task_data["image"] for task_data in tasks], [task_data["display_name"] for task_data in tasks],
+            rate_limiter, api_key_param, use_cache, acquired=True, executor=executor
+        )
+
+    def on_result(task_data, result, stats):
+        record, tokens = build_record(task_data, result, gf)
+        records.append(record)
+        if on_record:
+            on_record(record, tokens, task_data, stats)
+
+    stats = await run_streaming_pipeline(
+        task_source, ask_task, on_result,
+        concurrency=int(concurrency), rate_limiter=rate_limiter,
+        render_executor=raster_pool,
+        render_ahead=int(raster_workers) if raster_pool is not None else 1,
+        ask_batch_fn=ask_batch, batch_size=int(batch_size),
+        source_executor=source_executor
+    )
+    return records, stats
+
+# --- EXPORTAÇÃO (XLSX / CSV) ---
+
+def export_file_basename(dwg_source):
+    """Nome base dos ficheiros exportados a partir de DWG_SOURCE."""
+    dwg_source = (dwg_source or '').strip()
+    if dwg_source:
+        # Remover extensão se existir
+        nome_base = dwg_source.rsplit('.', 1)[0] if '.' in dwg_source else dwg_source
+        return f"{nome_base}-LD"
+    return "lista_desenhos_jsj"
+
+def prepare_export_df(df):
+    """DataFrame com as 34 COLUNAS_NORMALIZADAS na ordem exata (sem colunas internas)."""
+    df_export = df.drop(columns=[c for c in df.columns if str(c).startswith('_')]).copy()
+
+    # Garantir que todas as colunas existem (preencher com vazio se não)
+    for col in COLUNAS_NORMALIZADAS:
+        if col not in df_export.columns:
+            df_export[col] = ''
+
+    # Reordenar para a ordem exata
+    return df_export[COLUNAS_NORMALIZADAS]
+
+def export_xlsx_bytes(df_export):
+    """Excel com as colunas normalizadas e larguras ajustadas."""
+    buffer_xlsx = io.BytesIO()
+    with pd.ExcelWriter(buffer_xlsx, engine='xlsxwriter') as writer:
+        df_export.to_excel(writer, index=False, sheet_name='Lista Mestra JSJ')
+        worksheet = writer.sheets['Lista Mestra JSJ']
+        # Ajustar larguras de colunas
+        for idx, col in enumerate(COLUNAS_NORMALIZADAS):
+            max_len = max(df_export[col].astype(str).map(len).max(), len(col)) + 2
+            worksheet.set_column(idx, idx, min(max_len, 40))
+    return buffer_xlsx.getvalue()
+
+def export_csv_bytes(df_export):
+    """CSV (;) com encoding UTF-8 com BOM para Excel reconhecer caracteres especiais."""
+    csv_buffer = io.BytesIO()
+    csv_content = df_export.to_csv(index=False, sep=';')
+    csv_buffer.write(b'\xef\xbb\xbf')  # UTF-8 BOM
+    csv_buffer.write(csv_content.encode('utf-8'))
+    return csv_buffer.getvalue()
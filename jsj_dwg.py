@@ -0,0 +1,359 @@
+import hashlib
+import io
+import logging
+import unicodedata
+from collections import defaultdict
+
+from PIL import Image
+
+from jsj_constants import REV_LETTERS
+
+try:
+    import ezdxf
+    from ezdxf.addons.drawing import RenderContext, Frontend
+    from ezdxf.addons.drawing.matplotlib import MatplotlibBackend
+    from ezdxf.lldxf.tagwriter import TagCollector
+    import matplotlib
+    matplotlib.use('Agg')  # Backend sem GUI
+    import matplotlib.pyplot as plt
+    DWG_SUPPORT = True
+except ImportError:
+    DWG_SUPPORT = False
+
+logger = logging.getLogger(__name__)
+
+
+# --- SESSÃO DWG/DXF (UM PARSE POR FICHEIRO) ---
+class DwgSession:
+    """Documento DWG/DXF carregado UMA vez por ficheiro carregado.
+
+    O `ezdxf.readfile` é a operação mais cara do workflow híbrido. A sessão
+    faz o parse uma única vez e pré-indexa os INSERTs por layout (código
+    DXF 410 / owner) e por nome de bloco, servindo a enumeração de layouts,
+    a extração nativa e o rendering a partir do mesmo documento em memória.
+    """
+    def __init__(self, dwg_path):
+        if not DWG_SUPPORT:
+            raise ImportError("ezdxf não está instalado. Instala com: pip install ezdxf matplotlib")
+
+        self.path = dwg_path
+        self.doc = ezdxf.readfile(dwg_path)
+        self._layouts = {layout.name: layout for layout in self.doc.layouts}
+        self._inserts_by_layout = defaultdict(list)
+        self._inserts_by_block = defaultdict(list)
+        self._render_ctx = None
+        self._index_inserts()
+
+    def _index_inserts(self):
+        """Percorre a base de entidades uma só vez e indexa os INSERTs."""
+        # O owner de uma entidade de layout é o BLOCK_RECORD do próprio layout
+        owner_to_layout = {layout.layout_key: name for name, layout in self._layouts.items()}
+
+        for entity in self.doc.entitydb.values():
+            if entity.dxftype() != 'INSERT' or not entity.is_alive:
+                continue
+            layout_name = owner_to_layout.get(entity.dxf.owner)
+            if layout_name is None:
+                continue  # INSERT dentro de uma definição de bloco
+            self._inserts_by_layout[layout_name].append(entity)
+            self._inserts_by_block[entity.dxf.name.upper()].append(entity)
+
+        logger.info(
+            f"DWG carregado: {self.path} ({len(self._layouts)} layouts, "
+            f"{sum(len(v) for v in self._inserts_by_layout.values())} INSERTs)"
+        )
+
+    def paperspace_layouts(self):
+        """Nomes dos layouts Paper Space (Model Space é ignorado), ordenados."""
+        return sorted(name for name in self._layouts if name != 'Model')
+
+    def get_layout(self, layout_name):
+        """Devolve o layout pelo nome (Model ou Paper Space)."""
+        if layout_name == 'Model':
+            return self.doc.modelspace()
+        if layout_name not in self._layouts:
+            raise KeyError(f"Layout '{layout_name}' não existe em {self.path}")
+        return self._layouts[layout_name]
+
+    def inserts(self, layout_name):
+        """Todos os INSERTs de um layout (a partir do índice)."""
+        return list(self._inserts_by_layout.get(layout_name, []))
+
+    def inserts_by_block(self, block_name):
+        """Todos os INSERTs de um bloco, em qualquer layout."""
+        return list(self._inserts_by_block.get(block_name.upper(), []))
+
+    def legenda_inserts(self, layout_name):
+        """INSERTs de blocos com "LEGENDA" no nome num layout."""
+        return [i for i in self._inserts_by_layout.get(layout_name, []) if "LEGENDA" in i.dxf.name.upper()]
+
+    def layout_fingerprint(self, layout_name):
+        """Hash do conteúdo de um layout: tags DXF de cada entidade (geometria, texto,
+        ATTRIBs) e das definições de bloco inseridas, incluindo blocos aninhados.
+
+        Identifica folhas sem LEGENDA na ingestão incremental: muda quando algo
+        desenhado no layout muda, não quando o ficheiro é apenas gravado de novo.
+        """
+        digest = hashlib.sha256()
+        pending, seen = [], set()
+
+        def feed(entities):
+            for entity in entities:
+                collector = TagCollector(dxfversion=self.doc.dxfversion)
+                entity.export_dxf(collector)
+                for tag in collector.tags:
+                    digest.update(f"{tag.code}:{tag.value}\n".encode("utf-8"))
+                if entity.dxftype() == 'INSERT' and entity.dxf.name not in seen:
+                    seen.add(entity.dxf.name)
+                    pending.append(entity.dxf.name)
+
+        feed(self.get_layout(layout_name))
+        while pending:
+            block = self.doc.blocks.get(pending.pop())
+            if block is not None:
+                feed(block)
+        return digest.hexdigest()
+
+    def render_context(self):
+        """RenderContext partilhado entre todos os layouts do documento."""
+        if self._render_ctx is None:
+            self._render_ctx = RenderContext(self.doc)
+        return self._render_ctx
+
+
+def _as_session(dwg_source):
+    """Aceita um caminho ou uma DwgSession já carregada."""
+    if isinstance(dwg_source, DwgSession):
+        return dwg_source
+    return DwgSession(dwg_source)
+
+
+# --- MAPEAMENTO DOS ATRIBUTOS DA LEGENDA (LEGENDA_JSJ_V1) ---
+
+# Campo nativo -> tags aceites (normalizadas: maiúsculas, sem acentos), por prioridade
+NATIVE_TAG_ALIASES = {
+    'cliente': ['CLIENTE', 'DONO_OBRA'],
+    'obra': ['OBRA'],
+    'localizacao': ['LOCALIZACAO', 'LOCAL'],
+    'especialidade': ['ESPECIALIDADE'],
+    'projetou': ['PROJETOU', 'PROJECTOU', 'AUTOR'],
+    'fase': ['FASE'],
+    'fase_pfix': ['FASE_PFIX'],
+    'emissao': ['EMISSAO'],
+    'primeira_emissao': ['DATA', 'DATA_EMISSAO', '1_EMISSAO'],
+    'pfix': ['PFIX', 'DES_PFIX'],
+    'num_desenho': ['DES_NUM', 'NUM_DESENHO', 'N_DESENHO'],
+    'tipo': ['TIPO'],
+    'elemento': ['ELEMENTO'],
+    'titulo': ['TITULO'],
+    'id_cad': ['ID_CAD'],
+}
+
+
+def _normalize_tag(tag):
+    """TÍTULO / Localização -> TITULO / LOCALIZACAO."""
+    tag = unicodedata.normalize('NFKD', tag)
+    return ''.join(c for c in tag if not unicodedata.combining(c)).strip().upper()
+
+
+def normalize_date(value):
+    """Converte YYYY.MM.DD (formato da LISP) em DD/MM/YYYY; restantes ficam iguais."""
+    if '.' in value and len(value.split('.')) == 3:
+        partes = value.split('.')
+        if len(partes[0]) == 4:  # Formato YYYY.MM.DD
+            return f"{partes[2]}/{partes[1]}/{partes[0]}"
+    return value
+
+
+def native_fields(attribs, layout='', handle=''):
+    """Mapeia os atributos de uma legenda (tag -> texto) em TODOS os campos nativos.
+
+    Partilhado pela extração DWG/DXF e pelo JSON da LISP: cada campo de
+    COLUNAS_NORMALIZADAS que vem da legenda tem a sua chave (minúsculas),
+    mais o resumo da última revisão (revisao / data_revisao / desc_revisao).
+
+    Args:
+        attribs: dict tag -> texto (uma passagem pelos ATTRIBs do INSERT)
+        layout: Nome do layout (coluna LAYOUT)
+        handle: Handle da entidade INSERT (coluna ID_CAD)
+    """
+    tags = {_normalize_tag(tag): (text or '').strip() for tag, text in attribs.items()}
+
+    data = {}
+    for field, aliases in NATIVE_TAG_ALIASES.items():
+        data[field] = next((tags[alias] for alias in aliases if tags.get(alias)), '')
+    data['primeira_emissao'] = normalize_date(data['primeira_emissao'])
+
+    # HISTÓRICO DE REVISÕES: todas as letras A→E; a ÚLTIMA preenchida é a revisão atual
+    revisao_letra = ''
+    for rev in REV_LETTERS:
+        data[f'rev_{rev.lower()}'] = tags.get(f'REV_{rev}', '')
+        data[f'data_{rev.lower()}'] = normalize_date(tags.get(f'DATA_{rev}', ''))
+        data[f'desc_{rev.lower()}'] = tags.get(f'DESC_{rev}', '')
+        if data[f'rev_{rev.lower()}']:
+            revisao_letra = rev
+
+    # Tag R (revisão atual) prevalece se existir
+    revisao_letra = tags.get('R', '') or revisao_letra
+    data['revisao'] = revisao_letra
+    data['data_revisao'] = data.get(f'data_{revisao_letra.lower()}', '') if revisao_letra in REV_LETTERS else ''
+    data['desc_revisao'] = data.get(f'desc_{revisao_letra.lower()}', '') if revisao_letra in REV_LETTERS else ''
+
+    data['layout'] = layout
+    data['id_cad'] = data['id_cad'] or handle
+    return data
+
+
+def extract_dwg_native_blocks(dwg_source, layout_name):
+    """Extrai dados nativos de TODOS os blocos LEGENDA_JSJ_V1 num layout.
+
+    Uma passagem pelos ATTRIBs de cada INSERT preenche todos os campos da
+    legenda (ver native_fields), incluindo o handle da entidade (ID_CAD).
+
+    Args:
+        dwg_source: DwgSession (recomendado) ou caminho do ficheiro
+        layout_name: Nome do layout
+
+    Retorna: list[dict] com dados extraídos de cada bloco encontrado.
+             Lista vazia se não houver blocos LEGENDA ou se falhar.
+    """
+    if not DWG_SUPPORT:
+        return []
+
+    try:
+        session = _as_session(dwg_source)
+
+        # Procurar TODOS os INSERTs de blocos com "LEGENDA" no nome (índice pré-calculado)
+        inserts = session.legenda_inserts(layout_name)
+
+        if not inserts:
+            logger.info(f"Nenhum bloco LEGENDA encontrado em {layout_name}")
+            return []
+
+        logger.info(f"Encontrados {len(inserts)} blocos LEGENDA em {layout_name}")
+
+        extracted_blocks = []
+
+        for insert_idx, insert in enumerate(inserts):
+            try:
+                # Uma única passagem pelos atributos do INSERT
+                attribs_dict = {a.dxf.tag: a.dxf.text for a in insert.attribs}
+                block_data = native_fields(attribs_dict, layout_name, insert.dxf.handle)
+
+                # Validar se tem dados mínimos (blocos JSJ são sempre aceites: o Gemini não teria mais informação)
+                is_jsj = insert.dxf.name.upper().startswith('LEGENDA_JSJ')
+                if not block_data['num_desenho'] and not block_data['titulo'] and not is_jsj:
+                    logger.warning(f"Bloco {insert_idx+1} em {layout_name}: campos vazios, ignorado")
+                    continue
+
+                block_data.update({
+                    'tipo': block_data['tipo'] or 'N/A',
+                    'num_desenho': block_data['num_desenho'] or 'N/A',
+                    'titulo': block_data['titulo'] or 'Sem título',
+                    'primeira_emissao': block_data['primeira_emissao'] or 'N/A',
+                    'obs': 'Extração nativa (zero custo)'
+                })
+                extracted_blocks.append(block_data)
+
+                logger.info(f"Bloco {insert_idx+1}: {block_data['num_desenho']} - Rev {block_data['revisao'] or '(1ª Emissão)'} [{block_data['id_cad']}]")
+
+            except Exception as e:
+                logger.error(f"Erro ao extrair bloco {insert_idx+1} em {layout_name}: {e}")
+                continue
+
+        return extracted_blocks
+
+    except Exception as e:
+        logger.error(f"Erro na extração nativa de {layout_name}: {e}")
+        return []
+
+
+def get_image_from_dwg_layout(dwg_source, layout_name):
+    """Extrai imagem de um layout específico de um ficheiro DWG.
+
+    Args:
+        dwg_source: DwgSession (recomendado) ou caminho do ficheiro
+        layout_name: Nome do layout
+    """
+    if not DWG_SUPPORT:
+        raise ImportError("ezdxf não está instalado. Instala com: pip install ezdxf matplotlib")
+
+    try:
+        session = _as_session(dwg_source)
+        layout = session.get_layout(layout_name)
+
+        # Configurar figura com fundo branco
+        fig = plt.figure(figsize=(16, 12), dpi=200, facecolor='white')
+        ax = fig.add_axes([0, 0, 1, 1])
+        ax.set_facecolor('white')
+
+        # Contexto de renderização partilhado pela sessão
+        ctx = session.render_context()
+        out = MatplotlibBackend(ax)
+
+        # Renderizar o layout
+        Frontend(ctx, out).draw_layout(layout, finalize=True)
+
+        # Ajustar limites do gráfico
+        ax.autoscale()
+        ax.margins(0.05)
+
+        # Converter para bytes
+        buf = io.BytesIO()
+        fig.savefig(buf, format='png', bbox_inches='tight', dpi=200, facecolor='white')
+        buf.seek(0)
+        plt.close(fig)
+
+        # Carregar imagem completa
+        img = Image.open(buf)
+        width, height = img.size
+
+        # CROP: Quadrante inferior direito (50% x 50%)
+        crop_box = (
+            width // 2,      # left (50% da largura)
+            height // 2,     # top (50% da altura)
+            width,           # right (100%)
+            height           # bottom (100%)
+        )
+
+        cropped = img.crop(crop_box)
+
+        # Garantir que a imagem está em RGB
+        if cropped.mode != 'RGB':
+            cropped = cropped.convert('RGB')
+
+        return cropped
+
+    except Exception as e:
+        raise Exception(f"Erro ao processar DWG layout '{layout_name}': {str(e)}")
+
+
+def get_dwg_layouts(dwg_source):
+    """Retorna lista de nomes de layouts Paper Space num ficheiro DWG.
+
+    Model Space é ignorado conforme Regra de Ouro #4 (Multi-Layout).
+    Retorna lista vazia se só existir Model Space.
+
+    Args:
+        dwg_source: DwgSession (recomendado) ou caminho do ficheiro
+    """
+    if not DWG_SUPPORT:
+        return []
+
+    try:
+        session = _as_session(dwg_source)
+
+        # Obter APENAS paperspace layouts (ignora Model Space)
+        paperspace_layouts = session.paperspace_layouts()
+
+        # Se não houver paperspace layouts, retorna VAZIO (não processar Model)
+        # O código chamador deve avisar o utilizador
+        if not paperspace_layouts:
+            logger.warning(f"DWG sem Paper Space layouts: {session.path}")
+            return []
+
+        return paperspace_layouts
+
+    except Exception as e:
+        logger.error(f"Erro ao ler layouts DWG {getattr(dwg_source, 'path', dwg_source)}: {e}")
+        return []
@@ -0,0 +1,197 @@
+import csv
+import io
+import itertools
+import logging
+import threading
+from collections import OrderedDict
+
+import xlsxwriter
+
+from jsj_core import COLUNAS_NORMALIZADAS, export_csv_bytes, export_xlsx_bytes, prepare_export_df
+from jsj_report import pdf_report_bytes
+
+logger = logging.getLogger(__name__)
+
+# Formatos de exportação: nome -> função (DataFrame de 34 colunas -> bytes)
+EXPORT_BUILDERS = {
+    "xlsx": export_xlsx_bytes,
+    "csv": export_csv_bytes,
+    "pdf": pdf_report_bytes,
+}
+XLSX_SHEET = 'Lista Mestra JSJ'
+MAX_COLUMN_WIDTH = 40
+CSV_CHUNK_ROWS = 5000
+
+
+# --- EXPORTAÇÃO EM STREAMING (memória constante) ---
+
+def _export_row(record):
+    """Valores de um registo nas 34 COLUNAS_NORMALIZADAS ('' quando faltam)."""
+    return ['' if record.get(col) is None else record.get(col) for col in COLUNAS_NORMALIZADAS]
+
+
+def write_xlsx_stream(records, output):
+    """Escreve o XLSX linha a linha (xlsxwriter constant_memory); devolve o nº de registos.
+
+    As larguras das colunas são o máximo incremental do texto de cada coluna
+    (como export_xlsx_bytes) e só são aplicadas no fim — em constant_memory
+    as linhas vão para disco à medida que são escritas.
+
+    Args:
+        records: Iterável de registos (dict), ex.: ProjectStore.iter_records()
+        output: Caminho do ficheiro ou stream binário
+    """
+    workbook = xlsxwriter.Workbook(output, {'constant_memory': True})
+    worksheet = workbook.add_worksheet(XLSX_SHEET)
+    header_format = workbook.add_format({'bold': True, 'border': 1, 'align': 'center', 'valign': 'top'})
+    worksheet.write_row(0, 0, COLUNAS_NORMALIZADAS, header_format)
+
+    widths = [len(col) for col in COLUNAS_NORMALIZADAS]
+    count = 0
+    for count, record in enumerate(records, start=1):
+        values = _export_row(record)
+        worksheet.write_row(count, 0, values)
+        for idx, value in enumerate(values):
+            length = len(str(value))
+            if length > widths[idx]:
+                widths[idx] = length
+
+    for idx, width in enumerate(widths):
+        worksheet.set_column(idx, idx, min(width + 2, MAX_COLUMN_WIDTH))
+    workbook.close()
+    return count
+
+
+def write_csv_stream(records, output, chunk_rows=CSV_CHUNK_ROWS):
+    """Escreve o CSV (;, UTF-8 com BOM) aos blocos de chunk_rows linhas; devolve o nº de registos.
+
+    Args:
+        records: Iterável de registos (dict)
+        output: Caminho do ficheiro ou stream binário
+    """
+    if isinstance(output, str):
+        with open(output, 'wb') as f:
+            return write_csv_stream(records, f, chunk_rows)
+
+    text = io.TextIOWrapper(output, encoding='utf-8-sig', newline='', write_through=True)
+    try:
+        writer = csv.writer(text, delimiter=';', lineterminator='\n')
+        writer.writerow(COLUNAS_NORMALIZADAS)
+        count = 0
+        records = iter(records)
+        while True:
+            chunk = [_export_row(record) for record in itertools.islice(records, chunk_rows)]
+            if not chunk:
+                break
+            writer.writerows(chunk)
+            count += len(chunk)
+        text.flush()
+    finally:
+        # Não fechar o stream do chamador
+        text.detach()
+    return count
+
+
+STREAM_WRITERS = {
+    "xlsx": write_xlsx_stream,
+    "csv": write_csv_stream,
+}
+
+
+def export_records(store, projects, fmt, output, tipo_order=()):
+    """Exporta a Lista Mestra de um ou mais projetos diretamente da store (sem DataFrame).
+
+    Args:
+        store: ProjectStore
+        projects: Projeto ou lista de projetos (Lista Mestra conjunta)
+        fmt: "xlsx" ou "csv"
+        output: Caminho do ficheiro ou stream binário
+        tipo_order: TIPOs a exportar primeiro (ordem da Lista Completa)
+
+    Returns:
+        int: Registos exportados
+    """
+    count = STREAM_WRITERS[fmt](store.iter_records(projects, tipo_order), output)
+    logger.info(f"Exportação {fmt} em streaming: {count} desenhos")
+    return count
+
+
+class ExportCache:
+    """Ficheiros exportados da Lista Mestra, gerados a pedido e memorizados por versão.
+
+    A chave é (projeto, revisão dos dados, ordem das linhas, formato): a
+    revisão vem de ProjectStore.revision() e muda a cada append/merge/clear,
+    por isso os bytes são reutilizados entre reruns (e entre sessões) até os
+    dados ou a ordem mudarem. Nada é gerado antes de ser pedido: lazy()
+    devolve uma função para o st.download_button chamar só no clique.
+    """
+    def __init__(self, max_entries=8):
+        self.max_entries = max_entries
+        self._lock = threading.Lock()
+        self._entries = OrderedDict()  # chave -> bytes (LRU)
+        self._building = {}            # chave -> Lock (um só build por chave)
+        self.builds = 0                # ficheiros gerados (para benchmarks)
+
+    @staticmethod
+    def _key(project, revision, order, fmt):
+        return project, tuple(revision), tuple(order or ()), fmt
+
+    def get(self, fmt, df, project, revision, order=(), store=None, builder=None):
+        """Bytes do ficheiro `fmt` para o DataFrame dado (gerado só se a versão mudou).
+
+        Args:
+            fmt: Formato (EXPORT_BUILDERS, ou o nome de um formato próprio com `builder`)
+            df: Lista Mestra já ordenada como deve ser exportada
+            project: Projeto na store
+            revision: ProjectStore.revision(project)
+            order: Ordem dos TIPOs aplicada a `df` (faz parte da chave)
+            store: ProjectStore opcional: XLSX/CSV são escritos em streaming a
+                partir da store (sem cópias do DataFrame)
+            builder: Função df -> bytes de um formato próprio (ex.: colunas do
+                TURBO); recebe `df` tal como está
+        """
+        key = self._key(project, revision, order, fmt)
+        with self._lock:
+            data = self._entries.get(key)
+            if data is not None:
+                self._entries.move_to_end(key)
+                return data
+            building = self._building.setdefault(key, threading.Lock())
+
+        with building:
+            with self._lock:
+                data = self._entries.get(key)
+            if data is None:
+                if builder is not None:
+                    data = builder(df)
+                elif store is not None and fmt in STREAM_WRITERS:
+                    buffer = io.BytesIO()
+                    export_records(store, project, fmt, buffer, order)
+                    data = buffer.getvalue()
+                else:
+                    data = EXPORT_BUILDERS[fmt](prepare_export_df(df))
+                with self._lock:
+                    self._entries[key] = data
+                    self._entries.move_to_end(key)
+                    while len(self._entries) > self.max_entries:
+                        self._entries.popitem(last=False)
+                    self._building.pop(key, None)
+                    self.builds += 1
+                logger.debug(f"Exportação {fmt} de '{project}' gerada ({len(df)} desenhos, {len(data)} bytes)")
+        return data
+
+    def lazy(self, fmt, df, project, revision, order=(), store=None, builder=None):
+        """Função sem argumentos que devolve os bytes (para st.download_button)."""
+        return lambda: self.get(fmt, df, project, revision, order, store, builder)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+
+_export_cache = ExportCache()
+
+
+def get_export_cache():
+    """Cache de exportações partilhada no processo."""
+    return _export_cache
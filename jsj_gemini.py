@@ -0,0 +1,117 @@
+import hashlib
+import logging
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+import google.generativeai as genai
+from google.ai import generativelanguage as glm
+from google.api_core import gapic_v1
+from google.generativeai import client as genai_client
+
+logger = logging.getLogger(__name__)
+
+
+class GeminiClientPool:
+    """Clientes Gemini reutilizados entre pedidos, por API key e modelo.
+
+    genai.configure() descarta os clientes criados e o GenerativeModel
+    seguinte abre um canal gRPC novo (ligação + TLS) — chamado em cada página,
+    isso repete-se em cada pedido. Aqui cada API key tem um único
+    GenerativeServiceClient (canal persistente, thread-safe) e cada
+    (API key, modelo) um único GenerativeModel que o usa; nada é global, por
+    isso sessões com API keys diferentes não interferem.
+
+    O SDK 0.8.x não aceita um cliente (nem client_options) por modelo: o
+    cliente é injetado no atributo privado GenerativeModel._client, que o
+    SDK preenche sob demanda. tests/test_gemini.py verifica no SDK instalado
+    que os pedidos passam pelo cliente injetado.
+    """
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._clients = {}  # hash da API key -> GenerativeServiceClient
+        self._models = {}   # (hash da API key, modelo) -> GenerativeModel
+        self.created = 0    # modelos construídos (para benchmarks)
+        self.injected = True  # False se o SDK instalado não tiver GenerativeModel._client
+
+    @staticmethod
+    def _key(api_key):
+        return hashlib.sha256((api_key or "").encode("utf-8")).hexdigest()[:16]
+
+    def _client(self, api_key):
+        key = self._key(api_key)
+        client = self._clients.get(key)
+        if client is None:
+            client = glm.GenerativeServiceClient(
+                client_options={"api_key": api_key},
+                client_info=gapic_v1.client_info.ClientInfo(
+                    user_agent=f"{getattr(genai_client, 'USER_AGENT', 'genai-py')}/{genai.__version__}"
+                ),
+            )
+            self._clients[key] = client
+        return client
+
+    def model(self, api_key, model_name):
+        """GenerativeModel do modelo pedido, ligado ao cliente da API key (criado uma vez)."""
+        key = (self._key(api_key), model_name)
+        model = self._models.get(key)
+        if model is not None:
+            return model
+        with self._lock:
+            model = self._models.get(key)
+            if model is None:
+                model = genai.GenerativeModel(model_name)
+                # O SDK cria o atributo a None e preenche-o no primeiro pedido
+                if "_client" in vars(model) and model._client is None:
+                    # Injeta o cliente partilhado (o SDK criaria um por configure())
+                    model._client = self._client(api_key)
+                else:
+                    # Versão do SDK sem o atributo privado: configuração global do SDK
+                    # (correto com uma só API key por processo)
+                    if self.injected:
+                        logger.error(
+                            f"google-generativeai {genai.__version__}: GenerativeModel._client não existe; "
+                            f"clientes Gemini NÃO são reutilizados e genai.configure() é global "
+                            f"(uma só API key por processo). Verificar a versão pinada em requirements.txt"
+                        )
+                    self.injected = False
+                    genai.configure(api_key=api_key)
+                self._models[key] = model
+                self.created += 1
+                logger.debug(f"Cliente Gemini criado: {model_name}")
+        return model
+
+    def clear(self):
+        """Descarta todos os clientes (ex.: depois de trocar genai.GenerativeModel nos benchmarks)."""
+        with self._lock:
+            self._clients.clear()
+            self._models.clear()
+
+
+# Threads do pool da API: o máximo de pedidos em voo da interface (N ≤ 200). As threads
+# só são criadas quando são precisas, por isso um máximo alto não custa nada em repouso.
+MAX_API_WORKERS = 200
+
+_client_pool = GeminiClientPool()
+_executor = None
+_executor_lock = threading.Lock()
+
+
+def get_client_pool():
+    """Pool de clientes partilhado no processo."""
+    return _client_pool
+
+
+def get_api_executor():
+    """Thread pool dedicado às chamadas à API, único no processo (MAX_API_WORKERS threads).
+
+    O executor por omissão do asyncio tem min(32, CPUs + 4) threads e é
+    partilhado com tudo o resto; com N pedidos em voo o pipeline precisa de N
+    threads só para a API. O pool nunca é recriado nem desligado: pipelines
+    de várias sessões (cada uma com o seu N) usam-no ao mesmo tempo, e o
+    número de pedidos em voo é limitado por cada pipeline, não pelo pool.
+    """
+    global _executor
+    with _executor_lock:
+        if _executor is None:
+            _executor = ThreadPoolExecutor(max_workers=MAX_API_WORKERS, thread_name_prefix="jsj-gemini")
+        return _executor
@@ -0,0 +1,163 @@
+import io
+import logging
+import math
+
+from PIL import Image
+
+logger = logging.getLogger(__name__)
+
+# Orçamento de píxeis por imagem enviada à IA (megapíxeis)
+DEFAULT_PIXEL_BUDGET_MP = 1.5
+# Resolução mínima legível (texto de 6-7 pt da legenda ainda nítido) e máxima (zoom 2x histórico)
+DEFAULT_MIN_DPI = 110
+DEFAULT_MAX_DPI = 144
+PDF_DPI = 72  # 1 pt = 1/72 polegada (zoom 1 = 72 dpi)
+
+COLOR_MODES = {
+    "rgb": "Cor (RGB)",
+    "gray": "Tons de cinzento",
+    "1bit": "Preto e branco (1-bit)",
+}
+IMAGE_FORMATS = {
+    "png": "image/png",
+    "jpeg": "image/jpeg",
+    "webp": "image/webp",
+}
+
+DEFAULT_IMAGE_OPTIONS = {
+    "pixel_budget_mp": DEFAULT_PIXEL_BUDGET_MP,
+    "min_dpi": DEFAULT_MIN_DPI,
+    "max_dpi": DEFAULT_MAX_DPI,
+    "color": "rgb",
+    "format": "png",
+    "quality": 85,
+}
+
+
+def image_options(**overrides):
+    """Opções de preparação de imagem (DEFAULT_IMAGE_OPTIONS + alterações não nulas)."""
+    options = dict(DEFAULT_IMAGE_OPTIONS)
+    options.update({k: v for k, v in overrides.items() if v is not None})
+    if options["color"] not in COLOR_MODES:
+        raise ValueError(f"Modo de cor desconhecido: {options['color']}")
+    if options["format"] not in IMAGE_FORMATS:
+        raise ValueError(f"Formato de imagem desconhecido: {options['format']}")
+    return options
+
+
+def estimate_image_tokens(width, height):
+    """Tokens de entrada de uma imagem no Gemini: 258 até 384px, senão 258 por tile de 768×768."""
+    if width <= 384 and height <= 384:
+        return 258
+    return 258 * math.ceil(width / 768) * math.ceil(height / 768)
+
+
+def choose_zoom(width_pt, height_pt, options=None):
+    """Zoom da rasterização a partir do tamanho físico do crop e do orçamento de píxeis.
+
+    Usa o maior zoom que cabe no orçamento, limitado a [min_dpi, max_dpi]:
+    crops pequenos (legenda) mantêm a nitidez máxima, crops grandes
+    ("Página Inteira", "Metade Inferior") descem até ao mínimo legível.
+
+    Args:
+        width_pt, height_pt: Dimensões do crop em pontos PDF
+        options: Opções de image_options()
+
+    Returns:
+        float: Fator de zoom (1.0 = 72 dpi)
+    """
+    options = options or DEFAULT_IMAGE_OPTIONS
+    area = max(width_pt * height_pt, 1.0)
+    budget_zoom = math.sqrt(options["pixel_budget_mp"] * 1_000_000 / area)
+    min_zoom = options["min_dpi"] / PDF_DPI
+    max_zoom = options["max_dpi"] / PDF_DPI
+    zoom = max(min_zoom, min(budget_zoom, max_zoom))
+    logger.debug(f"Crop {width_pt:.0f}x{height_pt:.0f} pt → zoom {zoom:.2f} ({zoom * PDF_DPI:.0f} dpi)")
+    return zoom
+
+
+class EncodedImage:
+    """Imagem já codificada para envio à IA (bytes + MIME + dimensões).
+
+    Picklable (pode vir de um processo worker) e aceite pelo SDK Gemini
+    como blob inline via to_part().
+    """
+    def __init__(self, data, mime_type, size, mode):
+        self.data = data
+        self.mime_type = mime_type
+        self.size = size
+        self.mode = mode
+
+    @property
+    def tokens(self):
+        return estimate_image_tokens(*self.size)
+
+    def to_part(self):
+        """Parte inline para model.generate_content([...])."""
+        return {"mime_type": self.mime_type, "data": self.data}
+
+    def to_pil(self):
+        return Image.open(io.BytesIO(self.data))
+
+    def __len__(self):
+        return len(self.data)
+
+
+def prepare_pixmap(pix, options=None):
+    """Codifica um fitz.Pixmap já rasterizado ao zoom adaptativo.
+
+    PNG em cor/cinzento é codificado diretamente pelo PyMuPDF (mais rápido e
+    mais pequeno que via PIL); 1-bit, JPEG e WebP passam por prepare_image().
+
+    Returns:
+        EncodedImage
+    """
+    options = options or DEFAULT_IMAGE_OPTIONS
+    mode = "L" if pix.n == 1 else "RGB"
+    if options["format"] == "png" and options["color"] != "1bit":
+        return EncodedImage(pix.tobytes("png"), IMAGE_FORMATS["png"], (pix.width, pix.height), mode)
+
+    # O zoom já respeitou o orçamento (e o mínimo legível): não voltar a reduzir
+    img = Image.frombytes(mode, (pix.width, pix.height), pix.samples)
+    return prepare_image(img, options, fit_budget=False)
+
+
+def prepare_image(img, options=None, fit_budget=True):
+    """Reduz ao orçamento de píxeis, converte o modo de cor e codifica a imagem.
+
+    Args:
+        img: PIL.Image (crop já rasterizado)
+        options: Opções de image_options()
+        fit_budget: Reduzir ao orçamento de píxeis (rasters sem controlo de zoom)
+
+    Returns:
+        EncodedImage
+    """
+    options = options or DEFAULT_IMAGE_OPTIONS
+
+    # Rasters sem controlo de zoom (ex.: DWG via matplotlib): reduzir ao orçamento
+    budget = options["pixel_budget_mp"] * 1_000_000
+    width, height = img.size
+    if fit_budget and width * height > budget:
+        scale = math.sqrt(budget / (width * height))
+        img = img.resize((max(1, int(width * scale)), max(1, int(height * scale))), Image.LANCZOS)
+
+    color = options["color"]
+    fmt = options["format"]
+    if color == "gray" or (color == "1bit" and fmt == "jpeg"):
+        # JPEG não suporta 1-bit: usa cinzento
+        img = img.convert("L")
+    elif color == "1bit":
+        img = img.convert("L").point(lambda v: 255 if v > 160 else 0, mode="1")
+    elif img.mode != "RGB":
+        img = img.convert("RGB")
+
+    buf = io.BytesIO()
+    if fmt == "png":
+        img.save(buf, format="PNG")
+    elif fmt == "jpeg":
+        img.save(buf, format="JPEG", quality=int(options["quality"]), optimize=True)
+    else:
+        img.save(buf, format="WEBP", quality=int(options["quality"]), method=4)
+
+    return EncodedImage(buf.getvalue(), IMAGE_FORMATS[fmt], img.size, img.mode)
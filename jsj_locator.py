@@ -0,0 +1,198 @@
+import logging
+import threading
+from collections import OrderedDict
+
+import fitz  # PyMuPDF
+
+logger = logging.getLogger(__name__)
+
+# Âncoras de texto da legenda LEGENDA_JSJ (a primeira encontrada identifica o template)
+NUMBER_ANCHORS = ["Nº DESENHO", "N.º DESENHO", "Nº DES", "DESENHO Nº", "NÚMERO DE DESENHO", "N DESENHO"]
+REV_ANCHORS = ["REV", "REVISÃO", "REVISÕES"]
+# Palavras que podem partilhar a linha do cabeçalho REV (tabela de revisões); noutra
+# companhia ("REVISÃO GERAL DAS NOTAS") a palavra não é o cabeçalho da legenda
+REV_HEADER_WORDS = {
+    "REV", "REVISÃO", "REVISÕES", "DATA", "DESCRIÇÃO", "DESCRICAO", "DESIGNAÇÃO", "DESIGNACAO",
+    "ALTERAÇÃO", "ALTERAÇÕES", "MODIFICAÇÃO", "DES", "DESENHOU", "VERIF", "VERIFICOU", "APROV", "APROVOU",
+}
+
+# Moldura candidata: no máximo esta fração da página (evita apanhar a moldura da folha)
+MAX_FRAME_FRACTION = 0.45
+# Margem à volta da legenda (fração do tamanho da legenda, mínimo em pontos)
+MARGIN_FRACTION = 0.03
+MIN_MARGIN_PT = 6
+# Cache do localizador: tamanhos de folha memorizados (LRU) e legendas por tamanho
+MAX_SHEET_SIZES = 32
+MAX_TEMPLATES_PER_SHEET = 4
+
+
+def _token(text):
+    """Palavra normalizada para comparar com as âncoras (maiúsculas, sem pontuação final: "Rev." -> "REV")."""
+    return text.upper().rstrip('.:;,')
+
+
+def _page_words(page, clip=None):
+    """(fitz.Rect, palavra normalizada, linha) de cada palavra da camada de texto (pela ordem de leitura)."""
+    return [(fitz.Rect(w[:4]), _token(w[4]), (w[5], w[6])) for w in page.get_text("words", clip=clip)]
+
+
+def _anchor_hits(words, anchor, line_words=None):
+    """Retângulos das ocorrências de uma âncora como palavras inteiras consecutivas.
+
+    Ao contrário de page.search_for (substring), "REV" não apanha
+    "REVESTIMENTO" nas notas do desenho. Com line_words, as restantes
+    palavras da linha têm de pertencer a esse conjunto (ex.: "REVISÃO" em
+    "REVISÃO GERAL" não conta como cabeçalho).
+    """
+    tokens = [_token(part) for part in anchor.split()]
+    lines = {}
+    if line_words is not None:
+        for _, token, line in words:
+            lines.setdefault(line, []).append(token)
+    hits = []
+    for i in range(len(words) - len(tokens) + 1):
+        if not all(words[i + j][1] == token for j, token in enumerate(tokens)):
+            continue
+        if line_words is not None and not all(token in line_words for token in lines[words[i][2]]):
+            continue
+        rect = fitz.Rect(words[i][0])
+        for j in range(1, len(tokens)):
+            rect |= words[i + j][0]
+        hits.append(rect)
+    return hits
+
+
+def _best_anchor(words, anchors, line_words=None):
+    """Ocorrência mais abaixo/à direita da primeira âncora encontrada: (âncora, fitz.Rect) ou (None, None)."""
+    for anchor in anchors:
+        hits = _anchor_hits(words, anchor, line_words)
+        if hits:
+            return anchor, max(hits, key=lambda r: r.x1 + r.y1)
+    return None, None
+
+
+def _nearest(words, anchors, target, max_distance, line_words=None):
+    """Ocorrência de uma âncora mais próxima de `target` (dentro de max_distance)."""
+    best, best_distance = None, max_distance
+    centre = fitz.Point((target.x0 + target.x1) / 2, (target.y0 + target.y1) / 2)
+    for anchor in anchors:
+        for hit in _anchor_hits(words, anchor, line_words):
+            distance = abs(fitz.Point((hit.x0 + hit.x1) / 2, (hit.y0 + hit.y1) / 2) - centre)
+            if distance < best_distance:
+                best, best_distance = hit, distance
+    return best
+
+
+def _pad(rect, page_rect):
+    margin = max(MIN_MARGIN_PT, MARGIN_FRACTION * max(rect.width, rect.height))
+    padded = fitz.Rect(rect.x0 - margin, rect.y0 - margin, rect.x1 + margin, rect.y1 + margin)
+    return padded & page_rect
+
+
+def find_title_block(page):
+    """Localiza a legenda numa página a partir das âncoras de texto e da moldura vetorial.
+
+    1. Âncora "Nº DESENHO" (a mais abaixo/à direita) e o cabeçalho REV mais próximo,
+       comparados como palavras inteiras (o REV numa linha só de cabeçalhos).
+    2. A moldura desenhada (page.get_drawings) mais pequena que contém as duas âncoras.
+    3. Sem moldura: das âncoras até ao canto inferior direito da folha.
+
+    Returns:
+        tuple: (fitz.Rect ou None, template: str ou None)
+    """
+    page_rect = page.rect
+    words = _page_words(page)
+    anchor, number_hit = _best_anchor(words, NUMBER_ANCHORS)
+    if number_hit is None:
+        return None, None
+
+    diagonal = abs(page_rect.br - page_rect.tl)
+    rev_hit = _nearest(words, REV_ANCHORS, number_hit, diagonal * 0.4, REV_HEADER_WORDS)
+    seed = fitz.Rect(number_hit)
+    if rev_hit is not None:
+        seed |= rev_hit
+
+    max_area = page_rect.width * page_rect.height * MAX_FRAME_FRACTION
+    frame = None
+    for path in page.get_drawings():
+        rect = path["rect"]
+        if rect.width < seed.width or rect.height < seed.height:
+            continue
+        if rect.contains(seed) and rect.get_area() <= max_area and (frame is None or rect.get_area() < frame.get_area()):
+            frame = fitz.Rect(rect)
+
+    if frame is None:
+        # Sem moldura vetorial: legendas JSJ ficam no canto inferior direito
+        margin = max(number_hit.height, 8) * 6
+        frame = fitz.Rect(seed.x0 - margin, seed.y0 - margin, page_rect.x1, page_rect.y1)
+
+    template = f"{anchor}|{'REV' if rev_hit is not None else '-'}"
+    return _pad(frame, page_rect), template
+
+
+class TitleBlockLocator:
+    """Localizador de legendas com cache por tamanho de folha e template.
+
+    Numa folha já vista (mesmas dimensões/rotação) reutiliza a posição da
+    legenda se as âncoras do template ainda estiverem lá dentro (palavras do
+    retângulo, get_text("words", clip)); só folhas novas pagam get_drawings().
+    A cache é limitada (MAX_SHEET_SIZES tamanhos, MAX_TEMPLATES_PER_SHEET
+    legendas por tamanho) e partilhada entre threads.
+    """
+    def __init__(self, max_sheet_sizes=MAX_SHEET_SIZES, max_templates=MAX_TEMPLATES_PER_SHEET):
+        self.max_sheet_sizes = max_sheet_sizes
+        self.max_templates = max_templates
+        self._known = OrderedDict()  # (largura, altura, rotação) -> [(template, anchor, has_rev, rect)] (LRU)
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    @staticmethod
+    def sheet_key(page):
+        return (round(page.rect.width), round(page.rect.height), page.rotation)
+
+    def locate(self, page):
+        """fitz.Rect da legenda na página, ou None se não houver âncoras (ex.: PDF digitalizado)."""
+        key = self.sheet_key(page)
+        with self._lock:
+            candidates = list(self._known.get(key, []))
+            if candidates:
+                self._known.move_to_end(key)
+
+        for template, anchor, has_rev, rect in candidates:
+            words = _page_words(page, clip=rect)
+            if _anchor_hits(words, anchor) and (not has_rev or _best_anchor(words, REV_ANCHORS, REV_HEADER_WORDS)[1]):
+                with self._lock:
+                    self.hits += 1
+                return fitz.Rect(rect)
+
+        with self._lock:
+            self.misses += 1
+        rect, template = find_title_block(page)
+        if rect is None:
+            return None
+
+        anchor, has_rev = template.split("|")[0], template.endswith("REV")
+        with self._lock:
+            known = self._known.setdefault(key, [])
+            known.append((template, anchor, has_rev, fitz.Rect(rect)))
+            # Só as max_templates legendas mais recentes deste tamanho de folha
+            del known[:-self.max_templates]
+            self._known.move_to_end(key)
+            while len(self._known) > self.max_sheet_sizes:
+                self._known.popitem(last=False)
+        logger.info(f"Legenda localizada ({template}) em folha {key[0]}x{key[1]} pt: {rect}")
+        return rect
+
+    def clear(self):
+        with self._lock:
+            self._known.clear()
+            self.hits = self.misses = 0
+
+
+_default_locator = TitleBlockLocator()
+
+
+def locate_title_block(page, locator=None):
+    """Retângulo da legenda LEGENDA_JSJ na página (None se não encontrada)."""
+    return (locator or _default_locator).locate(page)
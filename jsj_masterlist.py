@@ -0,0 +1,265 @@
+import logging
+import re
+import threading
+from collections import OrderedDict
+
+import numpy as np
+import pandas as pd
+from pandas.api.types import union_categoricals
+
+from jsj_constants import REV_LETTERS
+
+logger = logging.getLogger(__name__)
+
+# Colunas equivalentes: 34 colunas normalizadas (jsj_app.py) <-> formato do TURBO (jsjturbo.py)
+LEGACY_COLUMNS = {"DES_NUM": "Num. Desenho", "TITULO": "Titulo", "DATA": "Data"}
+
+# Colunas com poucos valores distintos (globais do projeto, legenda, revisões):
+# guardadas como category (códigos inteiros + valores únicos) em vez de uma string por linha
+CATEGORICAL_COLUMNS = [
+    'PROJ_NUM', 'PROJ_NOME', 'CLIENTE', 'OBRA', 'LOCALIZACAO', 'ESPECIALIDADE',
+    'PROJETOU', 'FASE', 'FASE_PFIX', 'EMISSAO', 'DATA', 'PFIX', 'TIPO', 'ELEMENTO',
+    *(f'{prefix}_{rev}' for rev in REV_LETTERS for prefix in ('REV', 'DATA', 'DESC')),
+    'DWG_SOURCE', '_source', 'Data', 'Revisão',
+]
+
+
+_DIGITS = re.compile(r'(\d+)')
+# Ordens de visualização memorizadas por MasterList (uma por ordem de TIPOs pedida)
+MAX_CACHED_VIEWS = 8
+
+
+def natural_key(value):
+    """Chave de ordenação natural: 'EST-2' < 'EST-10' (números comparados como inteiros)."""
+    parts = _DIGITS.split(str(value).strip().lower())
+    return tuple(int(part) if i % 2 else part for i, part in enumerate(parts))
+
+
+def natural_compare(a, b):
+    """Comparação natural (-1/0/1), para a collation NATSORT do SQLite."""
+    key_a, key_b = natural_key(a), natural_key(b)
+    return (key_a > key_b) - (key_a < key_b)
+
+
+def natural_rank(values):
+    """Posição de cada valor na ordem natural (inteiros; valores iguais têm a mesma posição).
+
+    A chave natural só é calculada uma vez por valor distinto.
+    """
+    codes, uniques = pd.factorize(pd.Series(values).astype(str), use_na_sentinel=False)
+    order = sorted(range(len(uniques)), key=lambda i: natural_key(uniques[i]))
+    rank = np.empty(len(uniques), dtype=np.int64)
+    rank[order] = np.arange(len(uniques))
+    return rank[codes]
+
+
+def tipo_rank(tipos, tipo_order=()):
+    """Posição de cada TIPO: primeiro os de tipo_order, depois os restantes por ordem alfabética."""
+    tipos = pd.Series(tipos).astype(str)
+    tipos_unicos = sorted(tipos.unique().tolist())
+    ordem = list(tipo_order) + [t for t in tipos_unicos if t not in tipo_order]
+    return pd.Categorical(tipos, categories=ordem).codes
+
+
+def sort_positions(df, tipo_order=(), des_num_column='DES_NUM', des_rank=None):
+    """Posições (iloc) de df ordenado por TIPO e nº de desenho (natural); estável."""
+    keys = []
+    if des_num_column in df.columns:
+        keys.append(des_rank if des_rank is not None else natural_rank(df[des_num_column]))
+    if 'TIPO' in df.columns:
+        keys.append(tipo_rank(df['TIPO'], tipo_order))
+    if not keys:
+        return np.arange(len(df))
+    # lexsort: a última chave é a principal; empates mantêm a ordem de inserção
+    return np.lexsort(keys)
+
+
+def latest_revision(df):
+    """Última revisão preenchida de cada desenho (REV_E … REV_A; '' sem revisões)."""
+    latest = np.full(len(df), '', dtype=object)
+    for rev in REV_LETTERS:
+        column = f'REV_{rev}'
+        if column in df.columns:
+            values = df[column].astype(str).str.strip().to_numpy(dtype=object)
+            latest = np.where(values != '', values, latest)
+    return pd.Series(latest, index=df.index)
+
+
+def _harmonize(df):
+    """Preenche as colunas equivalentes dos dois formatos e troca NaN por ''."""
+    for column, legacy in LEGACY_COLUMNS.items():
+        if column in df.columns and legacy in df.columns:
+            df[column] = df[column].fillna(df[legacy])
+            df[legacy] = df[legacy].fillna(df[column])
+        elif legacy in df.columns:
+            df[column] = df[legacy]
+        elif column in df.columns:
+            df[legacy] = df[column]
+    return df.fillna("")
+
+
+def _categorize(df):
+    for column in CATEGORICAL_COLUMNS:
+        if column in df.columns:
+            df[column] = df[column].astype(str).astype("category")
+    return df
+
+
+def _empty_column(column, n):
+    values = pd.Series([""] * n)
+    return values.astype("category") if column in CATEGORICAL_COLUMNS else values
+
+
+def _concat(frames):
+    """Junta blocos com as mesmas colunas categóricas (categorias unidas e ordenadas)."""
+    frames = [frame for frame in frames if len(frame.columns)]
+    if len(frames) <= 1:
+        return frames[0] if frames else pd.DataFrame()
+
+    columns = list(dict.fromkeys(column for frame in frames for column in frame.columns))
+    data = {}
+    for column in columns:
+        parts = [
+            frame[column].reset_index(drop=True) if column in frame.columns else _empty_column(column, len(frame))
+            for frame in frames
+        ]
+        if column in CATEGORICAL_COLUMNS:
+            data[column] = union_categoricals(parts, sort_categories=True)
+        else:
+            data[column] = pd.concat(parts, ignore_index=True)
+    index = np.concatenate([frame.index.to_numpy() for frame in frames])
+    return pd.DataFrame(data, columns=columns).set_axis(index)
+
+
+class MasterList:
+    """Lista Mestra em memória, em colunas (DataFrame com colunas categóricas).
+
+    Cada registo é um dict de ~35 strings, quase todas vazias ou iguais em
+    todo o projeto (campos globais, cliente, obra, revisões): em colunas
+    category cada valor distinto é guardado uma vez e cada linha só tem um
+    código inteiro. A lista cresce por blocos (append) e perde linhas por id
+    (keep) — não é reconstruída a cada rerun. O índice é o id do desenho na
+    store.
+    """
+    def __init__(self, df=None):
+        self.df = pd.DataFrame() if df is None else df
+        self._lock = threading.Lock()
+        self._des_rank = {}            # coluna -> posição natural de cada linha
+        self._views = OrderedDict()    # (ordem dos TIPOs, coluna) -> posições ordenadas
+        self._memo = {}                # resultados derivados da versão atual (ver memo())
+
+    def _invalidate(self):
+        with self._lock:
+            self._des_rank.clear()
+            self._views.clear()
+            self._memo.clear()
+
+    def __len__(self):
+        return len(self.df)
+
+    @property
+    def last_id(self):
+        return int(self.df.index.max()) if len(self.df) else 0
+
+    def append(self, ids, records):
+        """Acrescenta um bloco de registos (dicts) com os respetivos ids."""
+        if not records:
+            return
+        chunk = _categorize(_harmonize(pd.DataFrame(records, index=pd.Index(ids, dtype=np.int64))))
+        self.df = _concat([self.df, chunk]) if len(self.df) else chunk
+        self._invalidate()
+
+    def keep(self, ids):
+        """Mantém só as linhas com estes ids (desenhos apagados/substituídos na store)."""
+        mask = self.df.index.isin(list(ids))
+        if not mask.all():
+            self.df = self.df[mask]
+            self._drop_unused_categories()
+            self._invalidate()
+
+    def _drop_unused_categories(self):
+        for column in self.df.columns:
+            if isinstance(self.df[column].dtype, pd.CategoricalDtype):
+                self.df[column] = self.df[column].cat.remove_unused_categories()
+
+    def frame(self):
+        """Cópia rasa do DataFrame (o chamador pode acrescentar/ordenar colunas)."""
+        return self.df.copy(deep=False)
+
+    def tipos(self):
+        """TIPOs presentes, por ordem alfabética."""
+        if 'TIPO' not in self.df.columns:
+            return []
+        return sorted(str(tipo) for tipo in self.df['TIPO'].unique())
+
+    def order(self, tipo_order=(), des_num_column='DES_NUM'):
+        """Posições das linhas na ordem da Lista Completa (memorizadas por ordem de TIPOs).
+
+        A posição natural de cada DES_NUM é calculada uma vez por versão da
+        lista; mudar a ordem dos TIPOs só refaz um lexsort de inteiros, e
+        voltar a uma ordem já vista não custa nada.
+        """
+        key = (tuple(tipo_order), des_num_column)
+        with self._lock:
+            positions = self._views.get(key)
+            if positions is not None:
+                self._views.move_to_end(key)
+                return positions
+            des_rank = self._des_rank.get(des_num_column)
+        if des_rank is None and des_num_column in self.df.columns:
+            des_rank = natural_rank(self.df[des_num_column])
+        positions = sort_positions(self.df, tipo_order, des_num_column, des_rank)
+        with self._lock:
+            if des_rank is not None:
+                self._des_rank[des_num_column] = des_rank
+            self._views[key] = positions
+            while len(self._views) > MAX_CACHED_VIEWS:
+                self._views.popitem(last=False)
+        return positions
+
+    def sorted_frame(self, tipo_order=(), des_num_column='DES_NUM'):
+        """DataFrame na ordem da Lista Completa (ver order())."""
+        return self.df.iloc[self.order(tipo_order, des_num_column)]
+
+    def filtered_order(self, tipo_order=(), mask=None, des_num_column='DES_NUM'):
+        """Posições ordenadas (ver order()) só das linhas com mask True (array pela ordem de df)."""
+        positions = self.order(tipo_order, des_num_column)
+        if mask is None:
+            return positions
+        return positions[np.asarray(mask, dtype=bool)[positions]]
+
+    def window(self, positions, page, page_size):
+        """Linhas de uma página (page a partir de 0) das posições dadas: só estas vão para a UI."""
+        start = page * page_size
+        return self.df.iloc[positions[start:start + page_size]]
+
+    def memo(self, key, compute):
+        """Resultado de compute(df) memorizado até a lista mudar (ex.: matriz de validação)."""
+        with self._lock:
+            if key in self._memo:
+                return self._memo[key]
+        value = compute(self.df)
+        with self._lock:
+            self._memo[key] = value
+        return value
+
+    def tipo_counts(self):
+        """Nº de desenhos por TIPO (dict ordenado por TIPO)."""
+        if 'TIPO' not in self.df.columns:
+            return {}
+        counts = self.df['TIPO'].value_counts(sort=False)
+        return {str(tipo): int(count) for tipo, count in sorted(counts.items()) if count}
+
+    def memory_usage(self):
+        """Bytes ocupados pelo DataFrame (deep)."""
+        return int(self.df.memory_usage(deep=True).sum())
+
+
+def sort_by_tipo(df, tipo_order=(), des_num_column='DES_NUM'):
+    """Ordena a lista por TIPO (primeiro os de tipo_order, depois alfabética) e nº de desenho.
+
+    O nº de desenho é ordenado de forma natural (EST-2 antes de EST-10).
+    Funciona com TIPO categórico: a ordem vem de um código inteiro por TIPO,
+    não da ordem das categorias.
+    """
+    return df.iloc[sort_positions(df, tipo_order, des_num_column)]
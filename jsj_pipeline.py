@@ -0,0 +1,266 @@
+import asyncio
+import io
+import logging
+import time
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+
+from PIL import Image
+
+logger = logging.getLogger(__name__)
+
+# Marcador de fim de fila (produtor terminou)
+_FIM = object()
+
+
+def summarize_latencies(latencies):
+    """Resumo das latências por pedido (segundos): n, média, p50, p95 e máximo."""
+    if not latencies:
+        return {"n": 0, "mean": 0.0, "p50": 0.0, "p95": 0.0, "max": 0.0}
+    ordered = sorted(latencies)
+
+    def percentile(p):
+        idx = min(len(ordered) - 1, max(0, int(round(p * (len(ordered) - 1)))))
+        return ordered[idx]
+
+    return {
+        "n": len(ordered),
+        "mean": sum(ordered) / len(ordered),
+        "p50": percentile(0.50),
+        "p95": percentile(0.95),
+        "max": ordered[-1],
+    }
+
+
+def _as_image(rendered):
+    """Workers de processo devolvem PNG (bytes); o resto do pipeline usa PIL."""
+    if isinstance(rendered, (bytes, bytearray)):
+        return Image.open(io.BytesIO(rendered))
+    return rendered
+
+
+async def run_streaming_pipeline(task_source, ask_fn, on_result, concurrency=5, queue_size=None, render_executor=None, rate_limiter=None, render_ahead=1,
+                                 ask_batch_fn=None, batch_size=1, batch_linger=0.5, source_executor=None):
+    """Pipeline em streaming: rasterização → API → registos, com filas limitadas.
+
+    As três fases correm em simultâneo. O produtor só rasteriza a página
+    seguinte quando há espaço na fila, por isso o nº de imagens residentes
+    fica limitado a `queue_size` + `concurrency` × `batch_size` + `render_ahead`, seja qual for o lote, e os
+    primeiros resultados chegam segundos após o arranque.
+
+    A fase da API é um worker pool (janela deslizante): há sempre até
+    `concurrency` pedidos em voo e um pedido lento ou em retry só ocupa o
+    seu próprio worker, em vez de bloquear um batch inteiro.
+
+    O gerador de tasks também avança fora do event loop (abrir um PDF,
+    fazer o parse de um DWG ou extrair a camada de texto bloqueiam), para
+    os workers da API e o consumidor nunca ficarem parados à espera dele.
+
+    Args:
+        task_source: Iterável (tipicamente um gerador) de tasks (dict). Tasks com
+            "render" (callable sem argumentos) são rasterizadas no executor antes
+            de entrar na fila; tasks com "is_native" não passam pela API.
+        ask_fn: Corrotina ask_fn(task) -> (data, tokens) para tasks de imagem.
+        on_result: Função on_result(task, result, stats) chamada por ordem de chegada
+            (constrói o registo e atualiza a UI). `result` pode ser uma Exception.
+            A latência do pedido fica em task["latency"].
+        concurrency: Nº de pedidos à API em voo em simultâneo (N).
+        queue_size: Capacidade das filas (por omissão 2 × concurrency).
+        render_executor: Executor para a rasterização (por omissão uma thread dedicada).
+            Com um process pool, "render" tem de ser picklable e pode devolver PNG (bytes).
+        render_ahead: Nº de rasterizações em curso em simultâneo (1 = sequencial;
+            usar o nº de processos do pool). A ordem das tasks é preservada.
+        rate_limiter: RateLimiter opcional; se indicado, cada worker aguarda
+            `acquire()` antes do pedido e a espera NÃO conta para a latência.
+            Se tiver concurrency(N), os pedidos em voo seguem a janela adaptativa
+            (reduzida após 429, recuperada com pedidos bem-sucedidos).
+        ask_batch_fn: Corrotina ask_batch_fn(tasks) -> [(data, tokens), ...] para
+            lotes de tasks de imagem (um pedido à API por lote).
+        batch_size: Tasks de imagem por pedido (K); com K > 1 as tasks
+            rasterizadas são agrupadas por ordem, esperando no máximo
+            `batch_linger` segundos pelas restantes de um lote. Um lote conta
+            uma vez para o rate limiter e para a janela de pedidos em voo.
+        source_executor: Executor de UMA thread onde o gerador de tasks avança
+            (por omissão uma thread dedicada); útil para dar à thread o contexto
+            da UI quando o gerador escreve mensagens.
+
+    Returns:
+        dict: Estatísticas {"produced", "completed", "errors", "requests", "latencies", "latency"}
+    """
+    loop = asyncio.get_running_loop()
+    queue_size = queue_size or 2 * concurrency
+    work_queue = asyncio.Queue(maxsize=queue_size)
+    result_queue = asyncio.Queue(maxsize=queue_size)
+    # Um lote pronto de cada vez (formado enquanto os workers estão ocupados)
+    batch_queue = asyncio.Queue(maxsize=1)
+    stats = {"produced": 0, "completed": 0, "errors": 0, "requests": 0, "latencies": []}
+    batch_size = max(1, int(batch_size)) if ask_batch_fn is not None else 1
+    adaptive = rate_limiter is not None and hasattr(rate_limiter, "concurrency")
+    in_flight = 0
+    slot_freed = asyncio.Condition()
+
+    own_executor = render_executor is None
+    if own_executor:
+        render_executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="jsj-render")
+    own_source_executor = source_executor is None
+    if own_source_executor:
+        source_executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="jsj-tasks")
+    tasks = iter(task_source)
+
+    async def emit(task, future):
+        if future is not None:
+            try:
+                task["image"] = _as_image(await future)
+            except Exception as e:
+                logger.error(f"Erro ao rasterizar {task.get('display_name', '?')}: {e}")
+                task["render_error"] = e
+        stats["produced"] += 1
+        await work_queue.put(task)
+
+    async def producer():
+        """FASE 1: Enumera tasks e rasteriza sob demanda (backpressure pela fila)."""
+        pending = deque()
+        try:
+            while True:
+                # next() corre no executor: o gerador pode bloquear sem parar o event loop
+                task = await loop.run_in_executor(source_executor, next, tasks, _FIM)
+                if task is _FIM:
+                    break
+                render = task.pop("render", None)
+                future = loop.run_in_executor(render_executor, render) if render is not None else None
+                pending.append((task, future))
+                # Até `render_ahead` rasterizações em curso; emitir por ordem
+                while len(pending) >= max(1, render_ahead):
+                    await emit(*pending.popleft())
+            while pending:
+                await emit(*pending.popleft())
+        finally:
+            for _, future in pending:
+                if future is not None:
+                    future.cancel()
+            await work_queue.put(_FIM)
+
+    def direct_result(task):
+        """Resultado de tasks que não passam pela API (nativas ou falha de rasterização), ou None."""
+        if task.get("is_native", False):
+            # Nativas: zero custo, seguem diretamente para a fase de registos
+            return (task["native_data"], 0)
+        if "render_error" in task:
+            return task.pop("render_error")
+        return None
+
+    async def deliver(task, result):
+        # Libertar a imagem assim que o pedido termina
+        task.pop("image", None)
+        await result_queue.put((task, result))
+
+    async def batcher():
+        """Agrupa as tasks de imagem em lotes de até batch_size (espera no máximo batch_linger)."""
+        batch, deadline = [], None
+        while True:
+            if batch and (len(batch) >= batch_size or loop.time() >= deadline):
+                await batch_queue.put(batch)
+                batch = []
+                continue
+            if batch:
+                try:
+                    task = work_queue.get_nowait()
+                except asyncio.QueueEmpty:
+                    await asyncio.sleep(0.02)
+                    continue
+            else:
+                task = await work_queue.get()
+
+            if task is _FIM:
+                if batch:
+                    await batch_queue.put(batch)
+                await batch_queue.put(_FIM)
+                return
+            result = direct_result(task)
+            if result is not None:
+                await deliver(task, result)
+                continue
+            if not batch:
+                deadline = loop.time() + batch_linger
+            batch.append(task)
+
+    async def api_worker():
+        """FASE 2: Cada worker mantém um pedido em voo e vai buscar o seguinte logo que termina."""
+        nonlocal in_flight
+        while True:
+            batch = await batch_queue.get()
+            if batch is _FIM:
+                # Repor o marcador para os restantes workers
+                await batch_queue.put(_FIM)
+                return
+
+            counted, start = False, None
+            try:
+                if adaptive:
+                    # Janela AIMD: após 429 há menos workers com pedidos em voo
+                    async with slot_freed:
+                        await slot_freed.wait_for(lambda: in_flight < rate_limiter.concurrency(concurrency))
+                        in_flight += 1
+                        counted = True
+                if rate_limiter is not None:
+                    await rate_limiter.acquire()
+                start = time.perf_counter()
+                if len(batch) == 1:
+                    results = [await ask_fn(batch[0])]
+                else:
+                    results = list(await ask_batch_fn(batch))
+            except Exception as e:
+                # Falha do rate limiter ou do pedido: o erro vai para todas as tasks do lote
+                results = [e] * len(batch)
+            finally:
+                if counted:
+                    async with slot_freed:
+                        in_flight -= 1
+                        slot_freed.notify_all()
+            latency = time.perf_counter() - start if start is not None else 0.0
+            if start is not None:
+                stats["requests"] += 1
+            if len(results) != len(batch):
+                # Um resultado por task: as que ficaram sem resultado recebem um erro
+                logger.error(f"Lote de {len(batch)} tasks devolveu {len(results)} resultados")
+                missing = RuntimeError(f"Sem resultado para esta folha (lote de {len(batch)} devolveu {len(results)})")
+                results = results[:len(batch)] + [missing] * (len(batch) - len(results))
+            for task, result in zip(batch, results):
+                task["latency"] = latency
+                stats["latencies"].append(latency)
+                await deliver(task, result)
+
+    async def dispatcher():
+        await asyncio.gather(batcher(), *(api_worker() for _ in range(max(1, concurrency))))
+        await result_queue.put(_FIM)
+
+    async def consumer():
+        """FASE 3: Constrói registos por ordem de chegada."""
+        while True:
+            item = await result_queue.get()
+            if item is _FIM:
+                break
+            task, result = item
+            stats["completed"] += 1
+            if isinstance(result, Exception):
+                stats["errors"] += 1
+            on_result(task, result, stats)
+
+    try:
+        await asyncio.gather(producer(), dispatcher(), consumer())
+    finally:
+        if own_executor:
+            render_executor.shutdown(wait=False)
+        # Fechar o gerador (finally: documentos, temporários) na mesma thread, depois do último next()
+        if hasattr(tasks, "close"):
+            source_executor.submit(tasks.close)
+        if own_source_executor:
+            source_executor.shutdown(wait=False)
+
+    stats["latency"] = summarize_latencies(stats["latencies"])
+    lat = stats["latency"]
+    logger.info(
+        f"Pipeline concluído: {stats['completed']}/{stats['produced']} tasks, {stats['errors']} erros | "
+        f"N={concurrency} K={batch_size} {stats['requests']} pedidos, latência p50={lat['p50']:.2f}s p95={lat['p95']:.2f}s max={lat['max']:.2f}s ({lat['n']} folhas)"
+    )
+    return stats
@@ -0,0 +1,113 @@
+import logging
+import os
+from collections import OrderedDict
+from concurrent.futures import ProcessPoolExecutor
+
+import fitz  # PyMuPDF
+from PIL import Image
+
+from jsj_dwg import DwgSession, get_image_from_dwg_layout
+from jsj_imageprep import DEFAULT_IMAGE_OPTIONS, choose_zoom, prepare_image, prepare_pixmap
+
+logger = logging.getLogger(__name__)
+
+# Nº de processos por omissão: 1 = rasterização na thread do pipeline, sem process pool.
+# Um pool por execução cria processos a partir do servidor Streamlit (fork de um
+# processo com threads e sockets abertos); mais processos só a pedido do utilizador.
+DEFAULT_RASTER_WORKERS = 1
+MAX_RASTER_WORKERS = os.cpu_count() or 1
+
+# Documentos abertos em cada processo worker (evita reabrir o ficheiro por página/layout)
+_MAX_OPEN_DOCS = 4
+_worker_pdfs = OrderedDict()
+_worker_dwgs = OrderedDict()
+
+
+def _cached(cache, key, opener):
+    """LRU pequeno de documentos abertos por processo."""
+    if key in cache:
+        cache.move_to_end(key)
+        return cache[key]
+    value = opener()
+    cache[key] = value
+    while len(cache) > _MAX_OPEN_DOCS:
+        _, old = cache.popitem(last=False)
+        close = getattr(old, "close", None)
+        if close:
+            close()
+    return value
+
+
+def render_pdf_page(pdf_source, page_num, crop_box=(0.50, 0.50, 1.0, 1.0), image_opts=None):
+    """Rasteriza e codifica o crop de uma página PDF (num processo worker ou na thread do pipeline).
+
+    O zoom é escolhido pelo tamanho físico do crop (ver choose_zoom) e a imagem
+    é codificada segundo as opções de cor/formato.
+
+    Args:
+        pdf_source: Caminho do PDF (recomendado, o documento fica em cache no worker),
+            bytes ou documento PyMuPDF já aberto
+        page_num: Número da página
+        crop_box: (x_start, y_start, x_end, y_end) em frações da página
+        image_opts: Opções de image_options() (None = omissão)
+
+    Returns:
+        EncodedImage: Imagem pronta a enviar à IA
+    """
+    own_doc = False
+    if isinstance(pdf_source, fitz.Document):
+        doc = pdf_source
+    elif isinstance(pdf_source, (bytes, bytearray)):
+        doc = fitz.open(stream=pdf_source, filetype="pdf")
+        own_doc = True
+    else:
+        doc = _cached(_worker_pdfs, pdf_source, lambda: fitz.open(pdf_source))
+
+    try:
+        page = doc.load_page(page_num)
+        rect = page.rect
+        x_start, y_start, x_end, y_end = crop_box
+        clip = fitz.Rect(rect.width * x_start, rect.height * y_start, rect.width * x_end, rect.height * y_end)
+        zoom = choose_zoom(clip.width, clip.height, image_opts)
+        # Cinzento/1-bit: rasterizar já num só canal (1/3 dos bytes)
+        gray = (image_opts or DEFAULT_IMAGE_OPTIONS)["color"] in ("gray", "1bit")
+        pix = page.get_pixmap(
+            clip=clip, matrix=fitz.Matrix(zoom, zoom), alpha=False,
+            colorspace=fitz.csGRAY if gray else fitz.csRGB
+        )
+        return prepare_pixmap(pix, image_opts)
+    finally:
+        if own_doc:
+            doc.close()
+
+
+def pixmap_to_image(page, clip, image_opts=None):
+    """Rasteriza o crop ao zoom adaptativo e devolve um PIL.Image (sem passar por PNG)."""
+    zoom = choose_zoom(clip.width, clip.height, image_opts)
+    pix = page.get_pixmap(clip=clip, matrix=fitz.Matrix(zoom, zoom), alpha=False)
+    return Image.frombytes("RGB", (pix.width, pix.height), pix.samples)
+
+
+def render_dwg_layout(dwg_source, layout_name, image_opts=None):
+    """Renderiza (matplotlib) e codifica o crop de um layout DWG/DXF.
+
+    Com um caminho, o parse do DWG é feito uma vez por worker e reutilizado
+    nos layouts seguintes; aceita também uma DwgSession já aberta.
+
+    Returns:
+        EncodedImage: Imagem pronta a enviar à IA
+    """
+    if isinstance(dwg_source, DwgSession):
+        session = dwg_source
+    else:
+        session = _cached(_worker_dwgs, dwg_source, lambda: DwgSession(dwg_source))
+    img = get_image_from_dwg_layout(session, layout_name)
+    return prepare_image(img, image_opts)
+
+
+def create_raster_pool(workers=DEFAULT_RASTER_WORKERS):
+    """Process pool para rasterização paralela (None se workers <= 1)."""
+    if workers is None or workers <= 1:
+        return None
+    logger.info(f"Rasterização paralela: {workers} processos")
+    return ProcessPoolExecutor(max_workers=workers)
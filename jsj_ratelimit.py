@@ -0,0 +1,256 @@
+import asyncio
+import hashlib
+import logging
+import os
+import sqlite3
+import threading
+import time
+from contextlib import closing
+
+logger = logging.getLogger(__name__)
+
+# Estado partilhado entre sessões e processos (configurável por variável de ambiente)
+DEFAULT_RATELIMIT_PATH = os.environ.get(
+    "JSJ_RATELIMIT_PATH",
+    os.path.join(os.path.expanduser("~"), ".jsj_parser", "ratelimit.sqlite")
+)
+
+# Pedidos/minuto por modelo em cada modo (modelos não listados usam o limite do modo).
+# Limites publicados da Gemini API: Standard = nível gratuito, TURBO = nível pago 1.
+# Cada modelo tem quota própria, por isso o fallback não consome a do modelo principal.
+RATE_STANDARD = 15
+RATE_TURBO = 1000
+MODEL_QUOTAS = {
+    "standard": {
+        "gemini-2.5-flash": 10,
+        "gemini-2.0-flash": 15,
+        "gemini-1.5-flash": 15,
+        "gemini-1.5-flash-latest": 15,
+        "gemini-pro": 15,
+    },
+    "turbo": {
+        "gemini-2.5-flash": 1000,
+        "gemini-2.0-flash": 2000,
+        "gemini-1.5-flash": 2000,
+        "gemini-1.5-flash-latest": 2000,
+        "gemini-pro": 360,
+    },
+}
+
+
+class SharedRateLimiter:
+    """Token bucket por modelo, partilhado por todas as sessões e processos.
+
+    O estado de cada bucket (tokens + instante da última atualização) vive
+    num ficheiro SQLite; cada pedido reserva um token numa transação
+    BEGIN IMMEDIATE (lock de escrita entre processos). Se não houver tokens,
+    o bucket fica negativo e o chamador dorme até à sua vez: as reservas são
+    servidas pela ordem de chegada (FIFO), sem re-tentativas em ciclo.
+
+    Buckets separados por API key (hash) e modelo: duas sessões com a mesma
+    conta partilham a quota; contas diferentes não interferem. Capacidade e
+    débito garantem que nunca há mais de `rpm` pedidos em 60 s.
+
+    Retroação de 429: throttle() esvazia o bucket partilhado (todos os
+    processos abrandam durante o retry-after) e reduz para metade a janela de
+    pedidos em voo deste processo; success() volta a alargá-la aos poucos
+    (AIMD). O pipeline consulta a janela com concurrency().
+    """
+    def __init__(self, max_requests=RATE_STANDARD, time_window=60, api_key="", models=None,
+                 quotas=None, path=DEFAULT_RATELIMIT_PATH, burst=None):
+        """
+        Args:
+            max_requests, time_window: Limite por omissão (pedidos por janela), como no RateLimiter
+            api_key: API key (só o hash é guardado; define o âmbito da quota)
+            models: Modelos por ordem de prioridade (o primeiro é o do acquire() sem modelo)
+            quotas: dict modelo -> pedidos/minuto (sobrepõe o limite por omissão)
+            path: Ficheiro SQLite partilhado (None = apenas neste processo)
+            burst: Tamanho do bucket (por omissão 10% do limite, mínimo 1)
+        """
+        self.rpm = max_requests * 60.0 / time_window
+        self.quotas = dict(quotas or {})
+        self.models = list(models or [])
+        self.burst = burst
+        self.scope = hashlib.sha256((api_key or "").encode("utf-8")).hexdigest()[:12]
+        self.path = path
+        self.waits = 0
+        self.wait_time = 0.0
+        self.throttles = 0
+        self.window = None  # pedidos em voo permitidos (AIMD); None até o pipeline indicar o máximo
+        self._max_window = None
+        self._last_decrease = 0.0
+        self._lock = threading.Lock()
+        self._local = {}  # chave -> (tokens, instante) quando não há SQLite
+
+        if path:
+            try:
+                os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+                with closing(self._connect()) as conn:
+                    conn.execute("PRAGMA journal_mode=WAL")
+                    conn.execute("""
+                        CREATE TABLE IF NOT EXISTS buckets (
+                            key TEXT PRIMARY KEY,
+                            tokens REAL NOT NULL,
+                            updated REAL NOT NULL
+                        )
+                    """)
+            except (OSError, sqlite3.Error) as e:
+                logger.warning(f"Rate limiter partilhado indisponível ({path}): {e}; limite apenas neste processo")
+                self.path = None
+
+    def _connect(self):
+        # isolation_level=None: as transações são abertas explicitamente (BEGIN IMMEDIATE)
+        return sqlite3.connect(self.path, timeout=30, isolation_level=None)
+
+    def quota(self, model):
+        """(débito em tokens/s, capacidade) do bucket de um modelo."""
+        rpm = float(self.quotas.get(model, self.rpm))
+        capacity = float(self.burst if self.burst is not None else max(1, int(rpm // 10)))
+        capacity = min(capacity, rpm)
+        # capacidade + débito × 60 s ≤ rpm: nenhuma janela de 60 s excede o limite
+        rate = max(rpm - capacity, 1.0) / 60.0
+        return rate, capacity
+
+    @staticmethod
+    def _take(tokens, updated, now, rate, capacity):
+        """Reabastece o bucket, reserva 1 token e devolve (tokens, espera em s)."""
+        tokens = min(capacity, tokens + (now - updated) * rate) - 1.0
+        return tokens, (-tokens / rate if tokens < 0 else 0.0)
+
+    def reserve(self, model=None):
+        """Reserva a vez de um pedido; devolve quantos segundos esperar até ele poder sair."""
+        model = model or (self.models[0] if self.models else "default")
+        key = self._key(model)
+        rate, capacity = self.quota(model)
+        now = time.time()
+
+        with self._lock:
+            if self.path:
+                try:
+                    return self._reserve_shared(key, now, rate, capacity)
+                except sqlite3.Error as e:
+                    logger.warning(f"Rate limiter partilhado falhou ({e}); a usar limite local")
+            tokens, updated = self._local.get(key, (capacity, now))
+            tokens, wait = self._take(tokens, updated, now, rate, capacity)
+            self._local[key] = (tokens, now)
+            return wait
+
+    def _key(self, model):
+        return f"{self.scope}:{model or (self.models[0] if self.models else 'default')}"
+
+    def _reserve_shared(self, key, now, rate, capacity):
+        conn = self._connect()
+        try:
+            conn.execute("BEGIN IMMEDIATE")
+            row = conn.execute("SELECT tokens, updated FROM buckets WHERE key = ?", (key,)).fetchone()
+            tokens, updated = row if row else (capacity, now)
+            tokens, wait = self._take(tokens, min(updated, now), now, rate, capacity)
+            conn.execute("INSERT OR REPLACE INTO buckets (key, tokens, updated) VALUES (?, ?, ?)", (key, tokens, now))
+            conn.execute("COMMIT")
+            return wait
+        except sqlite3.Error:
+            if conn.in_transaction:
+                conn.execute("ROLLBACK")
+            raise
+        finally:
+            conn.close()
+
+    def _record_wait(self, wait, model):
+        if wait > 0:
+            self.waits += 1
+            self.wait_time += wait
+            logger.debug(f"Rate limit ({model or 'principal'}): a aguardar {wait:.2f}s")
+
+    async def acquire(self, model=None):
+        """Aguarda a vez de um pedido ao modelo (por omissão o primeiro da lista)."""
+        # reserve() pode esperar pelo lock do SQLite (BEGIN IMMEDIATE): fora do event loop
+        wait = await asyncio.to_thread(self.reserve, model)
+        self._record_wait(wait, model)
+        if wait > 0:
+            await asyncio.sleep(wait)
+
+    def acquire_blocking(self, model=None):
+        """Versão síncrona de acquire() (threads do executor, ex.: modelos de fallback)."""
+        wait = self.reserve(model)
+        self._record_wait(wait, model)
+        if wait > 0:
+            time.sleep(wait)
+
+    def concurrency(self, limit):
+        """Pedidos em voo permitidos agora (entre 1 e `limit`), segundo a janela AIMD."""
+        with self._lock:
+            if self._max_window != limit:
+                self._max_window = limit
+                self.window = float(limit) if self.window is None else min(self.window, float(limit))
+            return max(1, min(limit, int(self.window)))
+
+    def throttle(self, model=None, retry_after=None):
+        """Regista um 429 do servidor: abranda todos os processos e reduz a janela local.
+
+        O bucket partilhado do modelo fica negativo o suficiente para que o
+        próximo pedido (de qualquer sessão) só saia após `retry_after`
+        segundos; sem sugestão do servidor, perde apenas o burst acumulado.
+        """
+        model = model or (self.models[0] if self.models else "default")
+        key = self._key(model)
+        rate, capacity = self.quota(model)
+        floor = -rate * retry_after if retry_after else 0.0
+        now = time.time()
+
+        with self._lock:
+            self.throttles += 1
+            # Multiplicative decrease, no máximo uma vez por segundo (uma rajada de 429 conta uma vez)
+            if self.window is not None and now - self._last_decrease >= 1.0:
+                self.window = max(1.0, self.window / 2)
+                self._last_decrease = now
+                logger.info(f"429 em {model}: janela de pedidos em voo reduzida para {int(self.window)}")
+            if self.path:
+                try:
+                    self._throttle_shared(key, now, rate, capacity, floor)
+                    return
+                except sqlite3.Error as e:
+                    logger.warning(f"Rate limiter partilhado falhou ({e}); a usar limite local")
+            tokens, updated = self._local.get(key, (capacity, now))
+            tokens = min(capacity, tokens + (now - updated) * rate)
+            self._local[key] = (min(tokens, floor), now)
+
+    def _throttle_shared(self, key, now, rate, capacity, floor):
+        conn = self._connect()
+        try:
+            conn.execute("BEGIN IMMEDIATE")
+            row = conn.execute("SELECT tokens, updated FROM buckets WHERE key = ?", (key,)).fetchone()
+            tokens, updated = row if row else (capacity, now)
+            tokens = min(capacity, tokens + max(0.0, now - updated) * rate)
+            conn.execute(
+                "INSERT OR REPLACE INTO buckets (key, tokens, updated) VALUES (?, ?, ?)", (key, min(tokens, floor), now)
+            )
+            conn.execute("COMMIT")
+        except sqlite3.Error:
+            if conn.in_transaction:
+                conn.execute("ROLLBACK")
+            raise
+        finally:
+            conn.close()
+
+    def success(self, model=None):
+        """Regista um pedido bem-sucedido: additive increase da janela (+1 por janela completa)."""
+        with self._lock:
+            if self.window is not None and self._max_window:
+                self.window = min(float(self._max_window), self.window + 1.0 / self.window)
+
+    def reset(self):
+        """Repõe todos os buckets deste âmbito (API key) na capacidade máxima."""
+        with self._lock:
+            self._local.clear()
+            if self.path:
+                with closing(self._connect()) as conn:
+                    conn.execute("DELETE FROM buckets WHERE key LIKE ?", (f"{self.scope}:%",))
+
+
+def create_rate_limiter(api_key, turbo=False, models=None, path=DEFAULT_RATELIMIT_PATH):
+    """Rate limiter partilhado do modo Standard (15 req/min) ou TURBO (1000 req/min)."""
+    tier = "turbo" if turbo else "standard"
+    return SharedRateLimiter(
+        max_requests=RATE_TURBO if turbo else RATE_STANDARD, time_window=60,
+        api_key=api_key, models=models, quotas=MODEL_QUOTAS[tier], path=path
+    )
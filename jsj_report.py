@@ -0,0 +1,195 @@
+import io
+import logging
+from datetime import datetime
+
+import numpy as np
+from reportlab.lib import colors
+from reportlab.lib.enums import TA_CENTER
+from reportlab.lib.pagesizes import A4, landscape
+from reportlab.lib.styles import ParagraphStyle, getSampleStyleSheet
+from reportlab.lib.units import cm
+from reportlab.platypus import PageBreak, Paragraph, SimpleDocTemplate, Spacer, Table, TableStyle
+
+logger = logging.getLogger(__name__)
+
+# Colunas do relatório: (cabeçalho, coluna, nº máximo de caracteres ou None, largura)
+PDF_COLUMNS = [
+    ('Nº Desenho', 'DES_NUM', None, 3.5 * cm),
+    ('Título', 'TITULO', 50, 6 * cm),
+    ('Rev', 'REV_A', None, 1.5 * cm),
+    ('Data', 'DATA', None, 2 * cm),
+    ('Cliente', 'CLIENTE', 25, 4 * cm),
+    ('Obra', 'OBRA', 25, 4 * cm),
+]
+# Linhas por tabela: uma tabela por página A4 horizontal (linhas de ~22 pt, cabeçalho
+# e espaçamentos em ~470 pt úteis). Tabelas pequenas mantêm o layout do reportlab
+# linear; se uma tabela começar a meio de uma página, o resto passa à seguinte
+# com o cabeçalho repetido.
+ROWS_PER_TABLE = 18
+
+TABLE_STYLE = TableStyle([
+    # Cabeçalho
+    ('BACKGROUND', (0, 0), (-1, 0), colors.HexColor('#1f4788')),
+    ('TEXTCOLOR', (0, 0), (-1, 0), colors.whitesmoke),
+    ('ALIGN', (0, 0), (-1, 0), 'CENTER'),
+    ('FONTNAME', (0, 0), (-1, 0), 'Helvetica-Bold'),
+    ('FONTSIZE', (0, 0), (-1, 0), 10),
+    ('BOTTOMPADDING', (0, 0), (-1, 0), 12),
+
+    # Dados
+    ('BACKGROUND', (0, 1), (-1, -1), colors.white),
+    ('TEXTCOLOR', (0, 1), (-1, -1), colors.black),
+    ('ALIGN', (0, 1), (-1, -1), 'LEFT'),
+    ('ALIGN', (2, 1), (3, -1), 'CENTER'),  # Rev e Data centralizadas
+    ('FONTNAME', (0, 1), (-1, -1), 'Helvetica'),
+    ('FONTSIZE', (0, 1), (-1, -1), 8),
+    ('TOPPADDING', (0, 1), (-1, -1), 6),
+    ('BOTTOMPADDING', (0, 1), (-1, -1), 6),
+
+    # Linhas alternadas
+    ('ROWBACKGROUNDS', (0, 1), (-1, -1), [colors.white, colors.HexColor('#f0f4f8')]),
+
+    # Bordas
+    ('GRID', (0, 0), (-1, -1), 0.5, colors.HexColor('#cccccc')),
+    ('BOX', (0, 0), (-1, -1), 1, colors.HexColor('#1f4788')),
+
+    # Alinhamento vertical
+    ('VALIGN', (0, 0), (-1, -1), 'MIDDLE'),
+])
+
+
+def _styles():
+    styles = getSampleStyleSheet()
+    title_style = ParagraphStyle(
+        'CustomTitle',
+        parent=styles['Heading1'],
+        fontSize=18,
+        textColor=colors.HexColor('#1f4788'),
+        spaceAfter=20,
+        alignment=TA_CENTER,
+        fontName='Helvetica-Bold'
+    )
+    subtitle_style = ParagraphStyle(
+        'CustomSubtitle',
+        parent=styles['Heading2'],
+        fontSize=14,
+        textColor=colors.HexColor('#2c5aa0'),
+        spaceAfter=12,
+        spaceBefore=12,
+        fontName='Helvetica-Bold'
+    )
+    return styles, title_style, subtitle_style
+
+
+def _format_cells(df, columns=PDF_COLUMNS):
+    """Células do relatório (array n x colunas de str), formatadas por coluna inteira."""
+    cells = []
+    for _, column, max_len, _ in columns:
+        if column not in df.columns:
+            cells.append(np.full(len(df), '', dtype=object))
+            continue
+        values = df[column].fillna('').astype(str)
+        if max_len is not None:
+            values = values.where(values.str.len() <= max_len, values.str[:max_len] + '...')
+        cells.append(values.to_numpy(dtype=object))
+    if not cells or not len(df):
+        return np.empty((len(df), len(columns)), dtype=object)
+    return np.column_stack(cells)
+
+
+def _report_flowables(df, rows_per_table, columns=PDF_COLUMNS):
+    """Flowables do relatório, gerados um a um, com cada TIPO dividido em tabelas de rows_per_table linhas."""
+    styles, title_style, subtitle_style = _styles()
+    header = [title for title, _, _, _ in columns]
+    widths = [width for _, _, _, width in columns]
+
+    yield Paragraph("LISTA DE DESENHOS JSJ", title_style)
+    yield Paragraph(f"Gerado em {datetime.now().strftime('%d/%m/%Y às %H:%M')}", styles['Normal'])
+    yield Spacer(1, 0.5 * cm)
+
+    cells = _format_cells(df, columns)
+    tipos = df['TIPO'].fillna('').astype(str) if 'TIPO' in df.columns else None
+    # Posições de cada TIPO pela ordem em que aparecem (a lista já vem ordenada)
+    groups = tipos.groupby(tipos, sort=False).indices if tipos is not None else {'': np.arange(len(df))}
+
+    for n, (tipo, positions) in enumerate(groups.items()):
+        yield Paragraph(f"TIPO: {tipo}", subtitle_style)
+        yield Spacer(1, 0.3 * cm)
+        for start in range(0, len(positions), rows_per_table):
+            # Cada tabela só é construída quando o reportlab chega a ela
+            chunk = cells[positions[start:start + rows_per_table]].tolist()
+            table = Table([header] + chunk, colWidths=widths, repeatRows=1)
+            table.setStyle(TABLE_STYLE)
+            yield table
+        yield Spacer(1, 0.8 * cm)
+
+        # Page break entre tipos (exceto último)
+        if n < len(groups) - 1:
+            yield PageBreak()
+
+    # Rodapé
+    yield Spacer(1, 1 * cm)
+    footer_text = f"Total de desenhos: {len(df)} | Tipos: {', '.join(groups)}"
+    yield Paragraph(footer_text, styles['Italic'])
+
+
+class _LazyFlowables(list):
+    """Lista de flowables alimentada por um gerador, para doc.build().
+
+    O ciclo de build do reportlab consome a lista pela frente (len, [0],
+    del [0], e insere as partes de tabelas divididas no início); aqui só
+    existem os próximos `ahead` flowables, por isso a memória do relatório
+    não cresce com o nº de desenhos. Depende de o build chamar len() antes
+    de cada flowable (reportlab pinado em requirements.txt; coberto por
+    tests/test_report.py).
+    """
+    def __init__(self, source, ahead=8):
+        super().__init__()
+        self._source = iter(source)
+        self._ahead = ahead
+
+    def _fill(self):
+        while self._source is not None and list.__len__(self) < self._ahead:
+            try:
+                self.append(next(self._source))
+            except StopIteration:
+                self._source = None
+
+    def __len__(self):
+        # O build chama len() antes de cada flowable: momento de ir buscar os seguintes
+        self._fill()
+        return list.__len__(self)
+
+
+def write_pdf_report(df, output, rows_per_table=ROWS_PER_TABLE, columns=PDF_COLUMNS):
+    """Escreve o relatório PDF da lista de desenhos (A4 horizontal, uma secção por TIPO).
+
+    As células são formatadas por coluna (sem iterrows) e cada TIPO é
+    partido em tabelas do tamanho de uma página com o cabeçalho repetido,
+    em vez de uma única tabela por TIPO — o custo de layout do reportlab
+    cresce muito com o tamanho de cada tabela. As tabelas são geradas à
+    medida que o documento é paginado, não todas antes do build.
+
+    Args:
+        df: Lista Mestra (colunas normalizadas), já ordenada
+        output: Caminho do ficheiro ou stream binário (ex.: BytesIO, resposta HTTP)
+        rows_per_table: Linhas de dados por tabela
+        columns: Colunas do relatório, como PDF_COLUMNS (ex.: colunas do TURBO)
+    """
+    doc = SimpleDocTemplate(
+        output,
+        pagesize=landscape(A4),
+        rightMargin=1.5 * cm,
+        leftMargin=1.5 * cm,
+        topMargin=2 * cm,
+        bottomMargin=2 * cm
+    )
+    doc.build(_LazyFlowables(_report_flowables(df, rows_per_table, columns)))
+    logger.debug(f"Relatório PDF gerado: {len(df)} desenhos, {doc.page} páginas")
+
+
+def pdf_report_bytes(df):
+    """Relatório PDF em memória (bytes)."""
+    buffer = io.BytesIO()
+    write_pdf_report(df, buffer)
+    return buffer.getvalue()
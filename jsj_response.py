@@ -0,0 +1,238 @@
+import dataclasses
+import functools
+import json
+import logging
+import re
+
+from jsj_textlayer import OUTPUT_FIELDS
+
+logger = logging.getLogger(__name__)
+
+# --- RESPOSTAS ESTRUTURADAS (JSON com schema) ---
+
+# Schema das 28 colunas do prompt de extração (todas string, todas obrigatórias)
+EXTRACTION_SCHEMA = {
+    "type": "object",
+    "properties": {field: {"type": "string"} for field in OUTPUT_FIELDS},
+    "required": list(OUTPUT_FIELDS),
+}
+# Lote: array com um objeto por imagem, numerado pelo campo IMAGEM
+BATCH_SCHEMA = {
+    "type": "array",
+    "items": {
+        "type": "object",
+        "properties": {"IMAGEM": {"type": "integer"}, **EXTRACTION_SCHEMA["properties"]},
+        "required": ["IMAGEM", *OUTPUT_FIELDS],
+    },
+}
+# Modelos sem modo JSON (a resposta é texto livre, lido pelo parser tolerante)
+JSON_MODE_UNSUPPORTED = {"gemini-pro"}
+
+
+@functools.lru_cache(maxsize=1)
+def supported_config_fields():
+    """Campos de GenerationConfig do SDK instalado (None se o SDK não estiver instalado).
+
+    response_mime_type e response_schema só existem em versões recentes do
+    google-generativeai; num SDK antigo o pedido com esses campos falha com
+    um erro permanente em todos os modelos.
+    """
+    try:
+        from google.generativeai.types import GenerationConfig
+    except ImportError:
+        return None
+    fields = frozenset(field.name for field in dataclasses.fields(GenerationConfig))
+    missing = {"response_mime_type", "response_schema"} - fields
+    if missing:
+        logger.warning(f"SDK Gemini sem {', '.join(sorted(missing))}: respostas lidas pelo parser tolerante")
+    return fields
+
+
+def generation_config(model_name, schema=None):
+    """generation_config de um pedido: JSON obrigatório (e schema, se indicado), ou None.
+
+    Campos que o SDK instalado não conhece são omitidos (ver supported_config_fields).
+    """
+    fields = supported_config_fields()
+    if model_name in JSON_MODE_UNSUPPORTED or (fields is not None and "response_mime_type" not in fields):
+        return None
+    config = {"response_mime_type": "application/json"}
+    if schema is not None and (fields is None or "response_schema" in fields):
+        config["response_schema"] = schema
+    return config
+
+
+def normalize_extraction(data):
+    """Garante as 28 colunas do prompt como string ('' quando faltam ou são null)."""
+    for field in OUTPUT_FIELDS:
+        value = data.get(field)
+        data[field] = "" if value is None else str(value).strip()
+    return data
+
+
+# --- PARSER TOLERANTE ---
+
+_TRAILING_COMMA = re.compile(r",(\s*[}\]])")
+_DANGLING_KEY = re.compile(r'[{,]\s*"(?:[^"\\]|\\.)*"\s*$')
+
+
+class TolerantJsonParser:
+    """Parser JSON incremental que recupera respostas truncadas ou mal formatadas.
+
+    Recebe o texto por pedaços (feed) e ignora o que não é JSON (cercas
+    ```json, texto antes/depois). Quando a raiz é um array, cada objeto fica
+    disponível em `items` logo que fecha, por isso um lote cortado a meio
+    mantém as folhas completas. finish() devolve o valor inteiro; se o texto
+    acabar a meio (string, chave sem valor, objetos por fechar) ou tiver
+    vírgulas finais, é reparado e `recovered` fica True.
+    """
+    def __init__(self):
+        self.items = []
+        self.recovered = False
+        self._text = ""
+        self._pos = 0
+        self._root = None       # índice do primeiro '{' ou '['
+        self._end = None        # índice do fecho da raiz
+        self._stack = []
+        self._in_string = False
+        self._escape = False
+        self._item_start = None
+
+    def feed(self, chunk):
+        """Acrescenta texto; devolve os objetos completos do array raiz até agora."""
+        self._text += chunk
+        text = self._text
+        if self._root is None:
+            match = re.search(r"[{\[]", text[self._pos:])
+            if not match:
+                self._pos = len(text)
+                return self.items
+            self._root = self._pos + match.start()
+            self._pos = self._root
+
+        i = self._pos
+        while i < len(text) and self._end is None:
+            c = text[i]
+            if self._in_string:
+                if self._escape:
+                    self._escape = False
+                elif c == "\\":
+                    self._escape = True
+                elif c == '"':
+                    self._in_string = False
+            elif c == '"':
+                self._in_string = True
+            elif c in "{[":
+                self._stack.append(c)
+                if len(self._stack) == 2 and self._stack[0] == "[":
+                    self._item_start = i
+            elif c in "}]" and self._stack:
+                self._stack.pop()
+                if len(self._stack) == 1 and self._stack[0] == "[" and self._item_start is not None:
+                    self.items.append(self._loads_fragment(text[self._item_start:i + 1]))
+                    self._item_start = None
+                elif not self._stack:
+                    self._end = i
+            i += 1
+        self._pos = i
+        return self.items
+
+    @property
+    def truncated(self):
+        """True se o texto acabou antes de a raiz fechar."""
+        return self._root is not None and self._end is None
+
+    def _loads_fragment(self, fragment):
+        try:
+            return json.loads(fragment)
+        except json.JSONDecodeError:
+            try:
+                value = json.loads(_TRAILING_COMMA.sub(r"\1", fragment))
+                self.recovered = True
+                return value
+            except json.JSONDecodeError:
+                return None
+
+    def _close(self):
+        """Fecha um texto truncado: string aberta, chave sem valor, vírgula final, contentores."""
+        text = self._text[self._root:]
+        if self._in_string:
+            text += '"'
+        text = text.rstrip()
+        if text.endswith(","):
+            text = text[:-1]
+        elif text.endswith(":"):
+            text += '""'
+        elif self._stack and self._stack[-1] == "{" and _DANGLING_KEY.search(text):
+            text += ': ""'
+        closers = {"{": "}", "[": "]"}
+        return text + "".join(closers[c] for c in reversed(self._stack))
+
+    def finish(self):
+        """Valor JSON completo (reparado se necessário).
+
+        Raises:
+            json.JSONDecodeError: Nenhum JSON recuperável na resposta
+        """
+        if self._root is None:
+            raise json.JSONDecodeError("Nenhum objeto JSON na resposta", self._text, 0)
+
+        if self._end is not None:
+            fragment = self._text[self._root:self._end + 1]
+            try:
+                return json.loads(fragment)
+            except json.JSONDecodeError:
+                candidates = [_TRAILING_COMMA.sub(r"\1", fragment)]
+        else:
+            closed = self._close()
+            candidates = [closed, _TRAILING_COMMA.sub(r"\1", closed)]
+
+        self.recovered = True
+        for candidate in candidates:
+            try:
+                return json.loads(candidate)
+            except json.JSONDecodeError:
+                continue
+        if self._stack and self._stack[0] == "[" and any(item is not None for item in self.items):
+            # Array irrecuperável no fim: ficam os objetos que chegaram completos
+            return [item for item in self.items if item is not None]
+        raise json.JSONDecodeError("JSON irrecuperável na resposta", self._text, 0)
+
+
+def parse_json_response(text):
+    """Lê a resposta da IA com o parser tolerante.
+
+    Returns:
+        tuple: (valor JSON, truncated: bool — True se a resposta vinha cortada
+        e foi fechada pelo parser; podem faltar campos)
+
+    Raises:
+        json.JSONDecodeError: Nenhum JSON recuperável na resposta
+    """
+    parser = TolerantJsonParser()
+    parser.feed(text)
+    value = parser.finish()
+    if parser.recovered:
+        logger.warning(f"Resposta JSON da IA reparada ({len(text)} caracteres)")
+    return value, parser.truncated
+
+
+def parse_batch_response(text):
+    """Lê a resposta de um pedido em lote (valor JSON, tipicamente um array).
+
+    Se a resposta vier truncada, só os objetos que chegaram completos são
+    devolvidos: o último, cortado a meio, é repetido em vez de aceite com
+    colunas em falta.
+
+    Raises:
+        json.JSONDecodeError: Nenhum JSON recuperável na resposta
+    """
+    parser = TolerantJsonParser()
+    parser.feed(text)
+    value = parser.finish()
+    if parser.truncated and isinstance(value, list):
+        logger.warning(f"Resposta em lote truncada: {len(parser.items)} objetos completos")
+        return [item for item in parser.items if item is not None]
+    if parser.recovered:
+        logger.warning(f"Resposta JSON da IA reparada ({len(text)} caracteres)")
+    return value
@@ -0,0 +1,148 @@
+import logging
+import random
+import re
+import socket
+import time
+
+try:
+    from google.api_core import exceptions as api_exceptions
+except ImportError:  # SDK sem google-api-core: classificação só pela mensagem
+    api_exceptions = None
+
+logger = logging.getLogger(__name__)
+
+# Categorias de erro
+QUOTA = "quota"          # 429: esperar e repetir no mesmo modelo (e abrandar o rate limiter)
+TRANSIENT = "transient"  # timeouts, 500/503: repetir no mesmo modelo
+PERMANENT = "permanent"  # 400/403/404, modelo inexistente: passar ao modelo seguinte
+
+if api_exceptions is not None:
+    _QUOTA_TYPES = (api_exceptions.ResourceExhausted, api_exceptions.TooManyRequests)
+    _TRANSIENT_TYPES = (
+        api_exceptions.ServiceUnavailable, api_exceptions.InternalServerError,
+        api_exceptions.DeadlineExceeded, api_exceptions.GatewayTimeout,
+        api_exceptions.Aborted, api_exceptions.Unknown,
+    )
+    _PERMANENT_TYPES = (
+        api_exceptions.InvalidArgument, api_exceptions.NotFound, api_exceptions.PermissionDenied,
+        api_exceptions.Unauthenticated, api_exceptions.FailedPrecondition,
+    )
+else:
+    _QUOTA_TYPES = _TRANSIENT_TYPES = _PERMANENT_TYPES = ()
+
+_QUOTA_PATTERN = re.compile(r"\b429\b|resource.{0,3}exhausted|quota|rate.?limit|too many requests", re.IGNORECASE)
+_TRANSIENT_PATTERN = re.compile(
+    r"\b50[0234]\b|timed? ?out|timeout|deadline|unavailable|connection (reset|aborted|refused)|temporar",
+    re.IGNORECASE
+)
+# "Please retry in 12.5s" / "retry_delay { seconds: 12 }" / "Retry-After: 12"
+_RETRY_AFTER_PATTERNS = [
+    re.compile(r"retry in\s+([\d.]+)\s*(ms|s)\b", re.IGNORECASE),
+    re.compile(r"retry_delay\s*\{\s*seconds:\s*(\d+)", re.IGNORECASE),
+    re.compile(r"retry-after:?\s*([\d.]+)", re.IGNORECASE),
+]
+
+
+def retry_after_hint(error):
+    """Segundos sugeridos pelo servidor para repetir (RetryInfo, Retry-After ou mensagem), ou None."""
+    for detail in getattr(error, "details", None) or []:
+        delay = getattr(detail, "retry_delay", None)
+        if delay is not None and hasattr(delay, "seconds"):
+            return delay.seconds + getattr(delay, "nanos", 0) / 1e9
+
+    response = getattr(error, "response", None)
+    headers = getattr(response, "headers", None) or {}
+    if headers.get("Retry-After"):
+        try:
+            return float(headers["Retry-After"])
+        except ValueError:
+            pass
+
+    message = str(error)
+    for pattern in _RETRY_AFTER_PATTERNS:
+        match = pattern.search(message)
+        if match:
+            value = float(match.group(1))
+            unit = match.group(2) if pattern.groups > 1 else "s"
+            return value / 1000 if unit and unit.lower() == "ms" else value
+    return None
+
+
+def classify_error(error):
+    """Categoria de um erro da API: (QUOTA | TRANSIENT | PERMANENT, retry_after em s ou None)."""
+    if isinstance(error, _QUOTA_TYPES):
+        return QUOTA, retry_after_hint(error)
+    if isinstance(error, _TRANSIENT_TYPES) or isinstance(error, (TimeoutError, socket.timeout, ConnectionError)):
+        return TRANSIENT, retry_after_hint(error)
+    if isinstance(error, _PERMANENT_TYPES):
+        return PERMANENT, None
+
+    # Exceções sem tipo conhecido (transporte, SDK): classificar pela mensagem
+    message = str(error)
+    if _QUOTA_PATTERN.search(message):
+        return QUOTA, retry_after_hint(error)
+    if _TRANSIENT_PATTERN.search(message):
+        return TRANSIENT, retry_after_hint(error)
+    return PERMANENT, None
+
+
+class RetryPolicy:
+    """Backoff exponencial com jitter por modelo, respeitando as sugestões do servidor.
+
+    Erros de quota e transitórios repetem o MESMO modelo até max_attempts;
+    só erros permanentes, tentativas esgotadas ou esperas sugeridas maiores
+    que max_retry_after fazem passar ao modelo seguinte.
+    """
+    def __init__(self, max_attempts=4, base_delay=1.0, max_delay=30.0, jitter=0.5, max_retry_after=60.0):
+        self.max_attempts = max_attempts
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+        self.jitter = jitter
+        self.max_retry_after = max_retry_after
+
+    def delay(self, attempt, retry_after=None):
+        """Espera antes da tentativa `attempt + 1` (attempt começa em 0)."""
+        if retry_after is not None:
+            # Sugestão do servidor + um pouco de jitter (evita que todos voltem no mesmo instante)
+            return retry_after + random.uniform(0, self.jitter * min(retry_after, self.base_delay))
+        backoff = min(self.max_delay, self.base_delay * (2 ** attempt))
+        return backoff * random.uniform(1 - self.jitter, 1 + self.jitter)
+
+    def call(self, fn, model, rate_limiter=None, context=""):
+        """Executa fn() com repetições; levanta o último erro se o modelo deve ser abandonado.
+
+        Args:
+            fn: Chamada à API (sem argumentos)
+            model: Nome do modelo (quota no rate limiter)
+            rate_limiter: SharedRateLimiter opcional: recebe throttle()/success()
+                e cada repetição aguarda uma nova vez na quota do modelo
+            context: Nome da folha (para logging)
+        """
+        for attempt in range(self.max_attempts):
+            try:
+                result = fn()
+            except Exception as error:
+                kind, retry_after = classify_error(error)
+                if kind == QUOTA and rate_limiter is not None and hasattr(rate_limiter, "throttle"):
+                    rate_limiter.throttle(model, retry_after)
+
+                last_attempt = attempt + 1 >= self.max_attempts
+                if kind == PERMANENT or last_attempt or (retry_after or 0) > self.max_retry_after:
+                    raise
+
+                wait = self.delay(attempt, retry_after)
+                logger.warning(
+                    f"{model} ({context}): erro {kind} na tentativa {attempt + 1}/{self.max_attempts}, "
+                    f"nova tentativa em {wait:.1f}s: {error}"
+                )
+                time.sleep(wait)
+                if rate_limiter is not None and hasattr(rate_limiter, "acquire_blocking"):
+                    rate_limiter.acquire_blocking(model)
+                continue
+
+            if rate_limiter is not None and hasattr(rate_limiter, "success"):
+                rate_limiter.success(model)
+            return result
+
+
+DEFAULT_RETRY_POLICY = RetryPolicy()
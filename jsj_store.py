@@ -0,0 +1,319 @@
+import json
+import logging
+import os
+import sqlite3
+import tempfile
+import threading
+import time
+from contextlib import contextmanager
+
+from jsj_masterlist import LEGACY_COLUMNS, MasterList, natural_compare
+
+logger = logging.getLogger(__name__)
+
+# Localização por omissão (configurável por variável de ambiente)
+DEFAULT_STORE_PATH = os.environ.get(
+    "JSJ_STORE_PATH",
+    os.path.join(os.path.expanduser("~"), ".jsj_parser", "projects.sqlite")
+)
+DEFAULT_PROJECT = "Geral"
+# Registos lidos de cada vez ao carregar a Lista Mestra
+MASTER_LIST_CHUNK = 5000
+
+def _record_key(record):
+    """(DES_NUM, ID_CAD, TIPO) de um registo (34 colunas ou formato antigo do TURBO)."""
+    des_num = record.get("DES_NUM", record.get("Num. Desenho", ""))
+    return str(des_num or ""), str(record.get("ID_CAD", "") or ""), str(record.get("TIPO", "") or "")
+
+
+def _harmonize_record(record):
+    """Versão por registo de _harmonize (leitura em streaming)."""
+    for column, legacy in LEGACY_COLUMNS.items():
+        if record.get(column) in (None, "") and legacy in record:
+            record[column] = record[legacy]
+    return record
+
+
+class ProjectStore:
+    """Lista Mestra persistente (SQLite), partilhada pelas aplicações.
+
+    Cada desenho é uma linha append-only (projeto, DES_NUM, ID_CAD, TIPO +
+    registo completo em JSON), com índices por projeto/TIPO e
+    projeto/DES_NUM/ID_CAD. Sobrevive a reloads e reinícios do servidor;
+    a Lista Mestra de cada projeto fica em memória em colunas (MasterList)
+    e é atualizada só com os desenhos que mudaram.
+
+    Ingestão incremental: cada registo pode trazer a folha de origem
+    ("_sheet": página PDF, layout DWG, bloco JSON) e o seu fingerprint; merge()
+    substitui os desenhos dessas folhas e guarda os fingerprints na tabela
+    `sheets`, consultada na ingestão seguinte (sheet_fingerprints).
+    Segura para uso a partir das threads das sessões Streamlit.
+    """
+    def __init__(self, path=DEFAULT_STORE_PATH):
+        self.path = path
+        self._lock = threading.Lock()
+        self._frames = {}  # projeto -> (revisão, MasterList)
+        self._refresh_lock = threading.Lock()
+
+        directory = os.path.dirname(os.path.abspath(path))
+        os.makedirs(directory, exist_ok=True)
+
+        with self._connect() as conn:
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("""
+                CREATE TABLE IF NOT EXISTS drawings (
+                    id INTEGER PRIMARY KEY AUTOINCREMENT,
+                    project TEXT NOT NULL,
+                    des_num TEXT NOT NULL,
+                    id_cad TEXT NOT NULL,
+                    tipo TEXT NOT NULL,
+                    data TEXT NOT NULL,
+                    created REAL NOT NULL
+                )
+            """)
+            # Bases criadas antes da ingestão incremental não têm a coluna sheet
+            columns = {row[1] for row in conn.execute("PRAGMA table_info(drawings)")}
+            if "sheet" not in columns:
+                conn.execute("ALTER TABLE drawings ADD COLUMN sheet TEXT NOT NULL DEFAULT ''")
+            conn.execute("""
+                CREATE TABLE IF NOT EXISTS sheets (
+                    project TEXT NOT NULL,
+                    sheet TEXT NOT NULL,
+                    fingerprint TEXT NOT NULL,
+                    updated REAL NOT NULL,
+                    PRIMARY KEY (project, sheet)
+                )
+            """)
+            conn.execute("CREATE INDEX IF NOT EXISTS idx_drawings_key ON drawings(project, des_num, id_cad)")
+            conn.execute("CREATE INDEX IF NOT EXISTS idx_drawings_tipo ON drawings(project, tipo)")
+            conn.execute("CREATE INDEX IF NOT EXISTS idx_drawings_sheet ON drawings(project, sheet)")
+
+    @contextmanager
+    def _connect(self):
+        """Ligação por operação: uma transação (commit/rollback) e fechada no fim."""
+        conn = sqlite3.connect(self.path, timeout=30)
+        try:
+            # Nº de desenho por ordem natural (EST-2 antes de EST-10), como na Lista Completa
+            conn.create_collation("NATSORT", natural_compare)
+            with conn:
+                yield conn
+        finally:
+            conn.close()
+
+    @staticmethod
+    def _insert(conn, project, records, now):
+        rows = [
+            (project, *_record_key(record), str(record.get("_sheet") or ""),
+             json.dumps(record, ensure_ascii=False, default=str), now)
+            for record in records
+        ]
+        conn.executemany(
+            "INSERT INTO drawings (project, des_num, id_cad, tipo, sheet, data, created) VALUES (?, ?, ?, ?, ?, ?, ?)",
+            rows
+        )
+        return len(rows)
+
+    def append(self, project, records):
+        """Acrescenta um lote de registos numa única transação; devolve quantos foram gravados."""
+        if not records:
+            return 0
+        with self._lock, self._connect() as conn:
+            count = self._insert(conn, project, records, time.time())
+        logger.info(f"Projeto '{project}': {count} desenhos gravados")
+        return count
+
+    def merge(self, project, records, sources=None):
+        """Junta um lote à Lista Mestra, substituindo as folhas reprocessadas.
+
+        Os desenhos anteriores das folhas presentes no lote são apagados e
+        os novos inseridos (uma transação). O fingerprint de cada folha só é
+        guardado se nenhum dos seus registos tiver erro da IA, para que
+        folhas falhadas voltem a ser processadas na ingestão seguinte.
+
+        Com sources (ficheiro -> folhas atuais, o sheet_index de
+        jsj_core.iter_file_tasks), as folhas desses ficheiros que deixaram de
+        existir (páginas/layouts/blocos removidos) são apagadas. As chaves de
+        folha de um ficheiro começam por "<ficheiro>#".
+
+        Returns:
+            tuple: (desenhos gravados, desenhos substituídos ou removidos)
+        """
+        sources = sources or {}
+        if not records and not sources:
+            return 0, 0
+        now = time.time()
+        sheets, fingerprints, failed = set(), {}, set()
+        for record in records:
+            sheet = record.get("_sheet")
+            if not sheet:
+                continue
+            sheets.add(sheet)
+            if record.get("_fingerprint"):
+                fingerprints[sheet] = record["_fingerprint"]
+            if str(record.get("_obs", "")).startswith("Erro"):
+                failed.add(sheet)
+
+        with self._lock, self._connect() as conn:
+            stale = self._stale_sheets(conn, project, sources) - sheets
+            if stale:
+                logger.info(f"Projeto '{project}': {len(stale)} folhas removidas dos ficheiros de origem")
+            replaced = 0
+            for sheet in sheets | stale:
+                replaced += conn.execute(
+                    "DELETE FROM drawings WHERE project = ? AND sheet = ?", (project, sheet)
+                ).rowcount
+            conn.executemany(
+                "DELETE FROM sheets WHERE project = ? AND sheet = ?", [(project, sheet) for sheet in sheets | stale]
+            )
+            conn.executemany(
+                "INSERT INTO sheets (project, sheet, fingerprint, updated) VALUES (?, ?, ?, ?)",
+                [(project, sheet, fp, now) for sheet, fp in fingerprints.items() if sheet not in failed]
+            )
+            count = self._insert(conn, project, records, now)
+        logger.info(f"Projeto '{project}': {count} desenhos gravados ({replaced} substituídos, {len(sheets)} folhas)")
+        return count, replaced
+
+    @staticmethod
+    def _stale_sheets(conn, project, sources):
+        """Folhas guardadas dos ficheiros em sources que já não constam das folhas atuais."""
+        if not sources:
+            return set()
+        stored = {row[0] for row in conn.execute(
+            "SELECT sheet FROM sheets WHERE project = ? UNION SELECT DISTINCT sheet FROM drawings WHERE project = ?",
+            (project, project)
+        )}
+        stale = set()
+        for source, current in sources.items():
+            prefix = f"{source}#"
+            stale.update(sheet for sheet in stored if sheet.startswith(prefix) and sheet not in current)
+        return stale
+
+    def sheet_fingerprints(self, project):
+        """dict folha -> fingerprint da última ingestão do projeto."""
+        with self._connect() as conn:
+            return dict(conn.execute("SELECT sheet, fingerprint FROM sheets WHERE project = ?", (project,)))
+
+    def revision(self, project):
+        """Versão dos dados de um projeto (muda a cada append/clear)."""
+        with self._connect() as conn:
+            return conn.execute(
+                "SELECT COUNT(*), COALESCE(MAX(id), 0) FROM drawings WHERE project = ?", (project,)
+            ).fetchone()
+
+    def count(self, project):
+        return self.revision(project)[0]
+
+    def load(self, project):
+        """Registos do projeto (list[dict]) pela ordem de inserção."""
+        with self._connect() as conn:
+            rows = conn.execute("SELECT data FROM drawings WHERE project = ? ORDER BY id", (project,)).fetchall()
+        return [json.loads(row[0]) for row in rows]
+
+    def iter_records(self, projects, tipo_order=(), chunk_size=1000):
+        """Registos de um ou mais projetos, lidos do SQLite aos blocos (memória constante).
+
+        Ordenados por TIPO (primeiro os de `tipo_order`, pela ordem dada;
+        depois os restantes por ordem alfabética) e DES_NUM em ordem natural
+        — a mesma ordem da Lista Completa na aplicação (MasterList.order).
+
+        Args:
+            projects: Nome de um projeto ou lista de projetos (Lista Mestra conjunta)
+            tipo_order: TIPOs a mostrar primeiro
+            chunk_size: Linhas lidas de cada vez (fetchmany)
+        """
+        projects = [projects] if isinstance(projects, str) else list(projects)
+        tipo_order = list(tipo_order or ())
+        rank = " ".join("WHEN ? THEN ?" for _ in tipo_order)
+        rank_sql = f"CASE tipo {rank} ELSE {len(tipo_order)} END, " if tipo_order else ""
+        params = [value for i, tipo in enumerate(tipo_order) for value in (tipo, i)]
+        query = (
+            f"SELECT data FROM drawings WHERE project IN ({', '.join('?' for _ in projects)}) "
+            f"ORDER BY {rank_sql}tipo, des_num COLLATE NATSORT, id"
+        )
+        with self._connect() as conn:
+            cursor = conn.execute(query, projects + params)
+            while True:
+                rows = cursor.fetchmany(chunk_size)
+                if not rows:
+                    break
+                for row in rows:
+                    yield _harmonize_record(json.loads(row[0]))
+
+    def master_list(self, project):
+        """Lista Mestra do projeto em memória (MasterList), atualizada só com o que mudou.
+
+        Na primeira leitura os registos são carregados aos blocos; depois só
+        são lidos os desenhos com id acima do último conhecido e, se a
+        contagem não bater certo (merge/clear apagaram linhas), removidos os
+        ids que já não existem.
+        """
+        revision = self.revision(project)
+        with self._lock:
+            cached = self._frames.get(project)
+        if cached is not None and cached[0] == revision:
+            return cached[1]
+
+        with self._refresh_lock:
+            with self._lock:
+                cached = self._frames.get(project)
+            if cached is not None and cached[0] == revision:
+                return cached[1]
+            master = MasterList(cached[1].df if cached is not None else None)
+            with self._connect() as conn:
+                cursor = conn.execute(
+                    "SELECT id, data FROM drawings WHERE project = ? AND id > ? ORDER BY id", (project, master.last_id)
+                )
+                while True:
+                    rows = cursor.fetchmany(MASTER_LIST_CHUNK)
+                    if not rows:
+                        break
+                    master.append([row[0] for row in rows], [json.loads(row[1]) for row in rows])
+                if len(master) != revision[0]:
+                    master.keep(row[0] for row in conn.execute("SELECT id FROM drawings WHERE project = ?", (project,)))
+            with self._lock:
+                self._frames[project] = (revision, master)
+        return master
+
+    def load_df(self, project):
+        """DataFrame do projeto (colunas categóricas; índice = id do desenho).
+
+        Projetos com registos dos dois formatos têm as colunas equivalentes
+        (LEGACY_COLUMNS) preenchidas em ambos. Devolve uma cópia rasa: o
+        chamador pode acrescentar/ordenar colunas sem alterar a versão memorizada.
+        """
+        return self.master_list(project).frame()
+
+    def tipo_counts(self, project):
+        """Nº de desenhos por TIPO (dict ordenado por TIPO), a partir da Lista Mestra em memória."""
+        return self.master_list(project).tipo_counts()
+
+    def projects(self):
+        """Projetos existentes (ordem alfabética)."""
+        with self._connect() as conn:
+            return [row[0] for row in conn.execute("SELECT DISTINCT project FROM drawings ORDER BY project")]
+
+    def clear(self, project):
+        """Apaga todos os desenhos de um projeto."""
+        with self._lock, self._connect() as conn:
+            conn.execute("DELETE FROM drawings WHERE project = ?", (project,))
+            conn.execute("DELETE FROM sheets WHERE project = ?", (project,))
+            self._frames.pop(project, None)
+        logger.info(f"Projeto '{project}' limpo")
+
+
+_default_store = None
+_default_lock = threading.Lock()
+
+
+def get_project_store():
+    """Instância partilhada no processo (ficheiro temporário se o caminho por omissão falhar)."""
+    global _default_store
+    with _default_lock:
+        if _default_store is None:
+            try:
+                _default_store = ProjectStore()
+            except (OSError, sqlite3.Error) as e:
+                fallback = os.path.join(tempfile.gettempdir(), "jsj_projects.sqlite")
+                logger.warning(f"Lista Mestra em {DEFAULT_STORE_PATH} indisponível ({e}); a usar {fallback}")
+                _default_store = ProjectStore(fallback)
+        return _default_store
@@ -0,0 +1,213 @@
+import logging
+import re
+import unicodedata
+
+from jsj_constants import REV_LETTERS
+
+logger = logging.getLogger(__name__)
+
+# Confiança mínima para aceitar a camada de texto sem recorrer ao Gemini
+DEFAULT_MIN_CONFIDENCE = 0.7
+
+# Etiquetas da legenda LEGENDA_JSJ (normalizadas: sem acentos, maiúsculas, sem pontuação)
+FIELD_LABELS = {
+    'DES_NUM': ['N DESENHO', 'NO DESENHO', 'DESENHO N', 'DESENHO NO', 'N DES', 'DES NUM', 'NUMERO DESENHO', 'NUMERO'],
+    'TITULO': ['TITULO', 'DESIGNACAO'],
+    'CLIENTE': ['CLIENTE', 'DONO DE OBRA', 'DONO OBRA'],
+    'OBRA': ['OBRA'],
+    'LOCALIZACAO': ['LOCALIZACAO', 'LOCAL'],
+    'ESPECIALIDADE': ['ESPECIALIDADE'],
+    'PROJETOU': ['PROJETOU', 'PROJECTOU', 'AUTOR'],
+    'FASE': ['FASE'],
+    'DATA': ['DATA'],
+    'TIPO': ['TIPO'],
+}
+REV_HEADER_LABELS = {'REV', 'REVISAO', 'REVISOES', 'R'}
+
+DATE_RE = re.compile(r'^\d{1,2}[/\-.]\d{1,2}[/\-.]\d{2,4}$|^\d{4}[/\-.]\d{1,2}[/\-.]\d{1,2}$')
+DES_NUM_RE = re.compile(r'^([A-Z]{1,6})[-_ ]+(\w[\w.\-]*)$')
+
+# Campos devolvidos (mesmo formato da resposta JSON do Gemini)
+OUTPUT_FIELDS = [
+    'CLIENTE', 'OBRA', 'LOCALIZACAO', 'ESPECIALIDADE', 'PROJETOU', 'FASE',
+    'DATA', 'TIPO', 'TITULO', 'PFIX', 'NUM', 'R',
+] + [f'{prefix}_{rev}' for rev in REV_LETTERS for prefix in ('REV', 'DATA', 'DESC')] + ['obs']
+
+
+def _normalize(text):
+    """Maiúsculas, sem acentos e sem pontuação (para comparar etiquetas)."""
+    text = unicodedata.normalize('NFKD', text)
+    text = ''.join(c for c in text if not unicodedata.combining(c))
+    text = text.replace('º', ' ').replace('°', ' ')
+    text = re.sub(r'[^A-Za-z0-9 ]+', ' ', text).upper()
+    return ' '.join(text.split())
+
+
+def _collect_spans(page, clip):
+    """Spans de texto dentro do crop: lista de dicts {text, norm, x0, y0, x1, y1}."""
+    spans = []
+    text_dict = page.get_text("dict", clip=clip)
+    for block in text_dict.get("blocks", []):
+        for line in block.get("lines", []):
+            for span in line.get("spans", []):
+                text = span.get("text", "").strip()
+                if not text:
+                    continue
+                x0, y0, x1, y1 = span["bbox"]
+                spans.append({"text": text, "norm": _normalize(text), "x0": x0, "y0": y0, "x1": x1, "y1": y1})
+    return spans
+
+
+def _same_row(a, b):
+    """Dois spans na mesma linha (centros verticais próximos)."""
+    height = max(a["y1"] - a["y0"], b["y1"] - b["y0"], 1.0)
+    return abs((a["y0"] + a["y1"]) / 2 - (b["y0"] + b["y1"]) / 2) < height * 0.6
+
+
+def _value_near(label, spans, used):
+    """Valor associado a uma etiqueta: span à direita na mesma linha, senão logo abaixo."""
+    height = max(label["y1"] - label["y0"], 1.0)
+
+    right = [s for s in spans if id(s) not in used and s["x0"] >= label["x1"] - 1 and _same_row(label, s)]
+    if right:
+        return min(right, key=lambda s: s["x0"] - label["x1"])
+
+    below = [
+        s for s in spans
+        if id(s) not in used
+        and s["y0"] >= label["y1"] - 1
+        and s["y0"] - label["y1"] < height * 3
+        and s["x0"] < label["x1"] + height * 4
+        and s["x1"] > label["x0"] - height
+    ]
+    if below:
+        return min(below, key=lambda s: (s["y0"] - label["y1"], abs(s["x0"] - label["x0"])))
+    return None
+
+
+def _split_label(span, labels):
+    """Etiqueta e valor no mesmo span (ex.: "CLIENTE: arcaya") → valor, senão None."""
+    for label in labels:
+        if span["norm"].startswith(label + ' ') and ':' in span["text"]:
+            return span["text"].split(':', 1)[1].strip()
+    return None
+
+
+def _parse_revision_table(spans, used):
+    """Lê a tabela de revisões a partir do cabeçalho REV | DATA | DESCRIÇÃO.
+
+    Returns:
+        tuple: (header_found: bool, revs: dict letra -> (data, descricao))
+    """
+    headers = [
+        s for s in spans
+        if s["norm"] in REV_HEADER_LABELS
+        and any(o["norm"] == 'DATA' and _same_row(s, o) and o["x0"] > s["x1"] for o in spans)
+    ]
+    if not headers:
+        return False, {}
+
+    header = headers[0]
+    used.add(id(header))
+    header_row = [s for s in spans if _same_row(header, s)]
+    for s in header_row:
+        used.add(id(s))
+
+    col_width = max(header["x1"] - header["x0"], 6.0)
+    col_center = (header["x0"] + header["x1"]) / 2
+    row_height = max(header["y1"] - header["y0"], 1.0)
+
+    revs = {}
+    for s in spans:
+        if s["text"] not in REV_LETTERS or id(s) in used:
+            continue
+        # Coluna REV e até ~12 linhas acima ou abaixo do cabeçalho
+        if abs((s["x0"] + s["x1"]) / 2 - col_center) > col_width * 1.5:
+            continue
+        if abs(s["y0"] - header["y0"]) > row_height * 12:
+            continue
+
+        row = sorted((o for o in spans if o is not s and _same_row(s, o) and o["x0"] > s["x0"]), key=lambda o: o["x0"])
+        date = next((o["text"] for o in row if DATE_RE.match(o["text"])), '')
+        desc = ' '.join(o["text"] for o in row if o["text"] != date)
+        revs[s["text"]] = (date, desc)
+        used.add(id(s))
+        for o in row:
+            used.add(id(o))
+
+    return True, revs
+
+
+def extract_from_text_layer(page, clip):
+    """Extrai os campos da legenda a partir da camada de texto (PDF vetorial).
+
+    Args:
+        page: Página PyMuPDF
+        clip: fitz.Rect da área da legenda (o mesmo crop enviado ao Gemini)
+
+    Returns:
+        tuple: (data: dict no formato da resposta do Gemini, confidence: float 0..1)
+    """
+    spans = _collect_spans(page, clip)
+    data = {field: '' for field in OUTPUT_FIELDS}
+    if not spans:
+        return data, 0.0
+
+    used = set()
+    header_found, revs = _parse_revision_table(spans, used)
+
+    for letter in REV_LETTERS:
+        if letter in revs:
+            data[f'REV_{letter}'] = letter
+            data[f'DATA_{letter}'], data[f'DESC_{letter}'] = revs[letter]
+    if revs:
+        data['R'] = max(revs)
+
+    # Campos simples: etiqueta → valor mais próximo (DES_NUM primeiro, é o mais específico)
+    found = {}
+    for field, labels in FIELD_LABELS.items():
+        for span in spans:
+            if id(span) in used:
+                continue
+            inline_value = _split_label(span, labels)
+            if inline_value:
+                found[field] = inline_value
+                used.add(id(span))
+                break
+            if span["norm"] in labels:
+                value = _value_near(span, spans, used | {id(span)})
+                if value is not None and _normalize(value["text"]) not in {l for ls in FIELD_LABELS.values() for l in ls}:
+                    found[field] = value["text"]
+                    used.add(id(span))
+                    used.add(id(value))
+                    break
+
+    for field, value in found.items():
+        if field == 'DES_NUM':
+            match = DES_NUM_RE.match(value.upper())
+            if match:
+                data['PFIX'], data['NUM'] = match.group(1), value[len(match.group(1)):].lstrip('-_ ')
+            else:
+                data['NUM'] = value
+        else:
+            data[field] = value
+
+    # CONFIANÇA: Nº de desenho é obrigatório; restantes campos somam
+    confidence = 0.0
+    if data['NUM']:
+        confidence += 0.4
+        if data['TITULO']:
+            confidence += 0.2
+        if header_found:
+            confidence += 0.2
+            # Revisões sem data indicam leitura incompleta da tabela
+            confidence -= 0.1 * sum(1 for date, _ in revs.values() if not date)
+        if data['DATA']:
+            confidence += 0.1
+        if sum(1 for f in ('CLIENTE', 'OBRA', 'LOCALIZACAO', 'ESPECIALIDADE', 'PROJETOU', 'FASE') if data[f]) >= 2:
+            confidence += 0.1
+    confidence = max(0.0, min(confidence, 1.0))
+
+    data['obs'] = f"Extração camada de texto (confiança {confidence:.0%})"
+    logger.debug(f"Camada de texto: NUM={data['NUM']} R={data['R']} confiança={confidence:.2f}")
+    return data, confidence
@@ -0,0 +1,281 @@
+import logging
+import re
+
+import numpy as np
+import pandas as pd
+
+from jsj_constants import REV_LETTERS
+
+logger = logging.getLogger(__name__)
+
+# Severidade de cada célula da matriz de erros
+OK, AVISO, ERRO = 0, 1, 2
+
+# Padrões compilados uma vez (não por registo)
+# DD/MM/YYYY, D/MM/YYYY ou DD/M/YYYY (separador / - .); D/M/YYYY não é aceite
+DATE_PATTERN = re.compile(r'^(?!\d[/\-.]\d[/\-.])(\d{1,2})[/\-.](\d{1,2})[/\-.](\d{4})$')
+REV_PATTERN = re.compile(r'[A-Z0]')
+REV_LOWER_PATTERN = re.compile(r'[a-z]')
+DATE_PLACEHOLDERS = ['n/d', 'n/a', '?', '??/??/????', 'ilegível']
+DES_NUM_PLACEHOLDERS = ['', 'N/A', 'ERRO', 'ERRO_JSON']
+TITULO_PLACEHOLDERS = ['', 'N/A', 'Sem título']
+YEAR_RANGE = (2000, 2100)
+
+DATE_COLUMNS = [f'DATA_{rev}' for rev in REV_LETTERS]
+REV_COLUMNS = [f'REV_{rev}' for rev in REV_LETTERS]
+
+# Colunas da matriz de erros (uma regra por coluna)
+RULES = ['DES_NUM', 'DES_NUM_DUP', 'TITULO', 'DATA', *DATE_COLUMNS, *REV_COLUMNS, 'REV_ORDEM']
+
+# Mensagens por (regra, severidade); {value} = valor da célula de origem
+MESSAGES = {
+    ('DES_NUM', ERRO): "Número de desenho vazio ou inválido",
+    ('DES_NUM', AVISO): "Número de desenho muito curto: '{value}'",
+    ('DES_NUM_DUP', ERRO): "Número de desenho repetido na lista: '{value}'",
+    ('TITULO', AVISO): "Título vazio ou muito curto: '{value}'",
+    ('DATA', ERRO): "Formato de data inválido: '{value}' (esperado DD/MM/YYYY)",
+    ('DATA', AVISO): "Data vazia, ilegível ou fora do intervalo: '{value}'",
+    ('REV', ERRO): "Revisão inválida: '{value}' (esperado letra A-Z ou '0')",
+    ('REV', AVISO): "Revisão em minúscula: '{value}'",
+    ('REV_ORDEM', ERRO): "Datas das revisões fora de ordem",
+    ('REV_ORDEM', AVISO): "Tabela de revisões com linhas em falta",
+}
+
+
+def _factorize(values):
+    """(códigos, valores únicos como texto limpo) de uma coluna; faltas = ''."""
+    codes, uniques = pd.factorize(values, use_na_sentinel=True)
+    uniques = [str(u).strip() for u in uniques] + ['']
+    # Código -1 (NaN/None) aponta para o '' acrescentado no fim
+    return np.where(codes < 0, len(uniques) - 1, codes), uniques
+
+
+def _apply(column, rule):
+    """Aplica uma regra escalar a cada valor distinto e espalha o resultado pela coluna."""
+    codes, uniques = column
+    return np.array([rule(value) for value in uniques])[codes]
+
+
+def _date_rule(value, required=False):
+    """(severidade, data ordinal AAAAMMDD ou NaN) de uma data."""
+    if not value:
+        return (AVISO if required else OK), np.nan
+    if value.lower() in DATE_PLACEHOLDERS:
+        return AVISO, np.nan
+    match = DATE_PATTERN.match(value)
+    if not match:
+        return ERRO, np.nan
+    day, month, year = (int(part) for part in match.groups())
+    if not (1 <= day <= 31 and 1 <= month <= 12):
+        return ERRO, np.nan
+    severity = OK if YEAR_RANGE[0] <= year <= YEAR_RANGE[1] else AVISO
+    return severity, float(year * 10000 + month * 100 + day)
+
+
+def _rev_rule(value):
+    """Severidade de uma revisão: vazio ou letra A-Z / '0'."""
+    if not value or REV_PATTERN.fullmatch(value):
+        return OK
+    return AVISO if REV_LOWER_PATTERN.fullmatch(value) else ERRO
+
+
+def _des_num_rule(value):
+    if value.upper() in DES_NUM_PLACEHOLDERS:
+        return ERRO
+    return AVISO if len(value) < 3 else OK
+
+
+def _titulo_rule(value):
+    return AVISO if value in TITULO_PLACEHOLDERS or len(value) < 3 else OK
+
+
+def _evaluate(columns, n):
+    """Matriz de erros a partir de colunas fatorizadas (ver _factorize)."""
+    empty = (np.zeros(n, dtype=np.intp), [''])
+
+    def column(name):
+        return columns.get(name, empty)
+
+    matrix = {}
+    des_num = column('DES_NUM')
+    matrix['DES_NUM'] = _apply(des_num, _des_num_rule).astype(np.int8)
+    # Repetidos (sem distinguir maiúsculas), ignorando placeholders
+    codes, uniques = des_num
+    upper_codes, _ = pd.factorize(np.array([u.upper() for u in uniques], dtype=object)[codes])
+    duplicated = np.bincount(upper_codes, minlength=1)[upper_codes] > 1
+    matrix['DES_NUM_DUP'] = np.where(duplicated & (matrix['DES_NUM'] != ERRO), ERRO, OK).astype(np.int8)
+
+    matrix['TITULO'] = _apply(column('TITULO'), _titulo_rule).astype(np.int8)
+
+    base = _apply(column('DATA'), lambda value: _date_rule(value, required=True))
+    matrix['DATA'] = base[:, 0].astype(np.int8)
+    ordinals, filled = [base[:, 1]], []
+    for date_column, rev_column in zip(DATE_COLUMNS, REV_COLUMNS):
+        dates = _apply(column(date_column), _date_rule)
+        matrix[date_column] = dates[:, 0].astype(np.int8)
+        matrix[rev_column] = _apply(column(rev_column), _rev_rule).astype(np.int8)
+        ordinals.append(dates[:, 1])
+        filled.append(_apply(column(rev_column), bool))
+
+    # Datas das revisões (e a data base) não podem recuar
+    dates = np.column_stack(ordinals)
+    previous = np.fmax.accumulate(np.where(np.isnan(dates), -np.inf, dates), axis=1)[:, :-1]
+    backwards = (dates[:, 1:] < previous).any(axis=1)
+    # Revisão preenchida depois de uma vazia (ex.: C sem B)
+    filled = np.column_stack(filled)
+    gaps = (filled & ~np.logical_and.accumulate(filled, axis=1)).any(axis=1)
+    order = np.where(gaps, AVISO, OK).astype(np.int8)
+    order[backwards] = ERRO
+    matrix['REV_ORDEM'] = order
+    return matrix
+
+
+def validate_records(df):
+    """Valida uma Lista Mestra inteira (colunas normalizadas) de uma só vez.
+
+    Cada coluna é fatorizada e as regras (padrões compilados) correm uma vez
+    por valor distinto — datas e revisões repetem-se muito numa lista —,
+    sendo o resultado espalhado com numpy. Inclui verificações entre
+    registos: DES_NUM repetidos e tabelas de revisões fora de ordem (datas a
+    recuar ou linhas em falta).
+
+    Returns:
+        pd.DataFrame: Matriz de erros (int8: OK/AVISO/ERRO), uma coluna por
+        regra (RULES), com o índice de `df`
+    """
+    needed = ['DES_NUM', 'TITULO', 'DATA', *DATE_COLUMNS, *REV_COLUMNS]
+    columns = {name: _factorize(df[name]) for name in needed if name in df.columns}
+    matrix = _evaluate(columns, len(df))
+    return pd.DataFrame(matrix, index=df.index, columns=RULES)
+
+
+def validation_status(matrix):
+    """Severidade máxima por registo (OK/AVISO/ERRO)."""
+    return matrix.max(axis=1) if len(matrix.columns) else pd.Series(OK, index=matrix.index, dtype=np.int8)
+
+
+def _message(rule, severity, value):
+    key = 'REV' if rule in REV_COLUMNS else 'DATA' if rule in DATE_COLUMNS else rule
+    message = MESSAGES[(key, severity)].format(value=value)
+    # Colunas de revisão: indicar qual (ex.: "DATA_B: ...")
+    return f"{rule}: {message}" if rule != key else message
+
+
+def _source(rule):
+    """Coluna cujo valor aparece na mensagem de uma regra."""
+    return 'DES_NUM' if rule == 'DES_NUM_DUP' else rule
+
+
+def describe_issues(df, matrix):
+    """Mensagens por registo, só para as células com problemas.
+
+    Returns:
+        dict: índice -> (erros: list, avisos: list)
+    """
+    issues = {}
+    severities = matrix.to_numpy()
+    values = {
+        rule: df[_source(rule)].to_numpy() if _source(rule) in df.columns else None
+        for rule in matrix.columns
+    }
+    rows, cols = np.nonzero(severities)
+    for row, col in zip(rows, cols):
+        rule = matrix.columns[col]
+        severity = int(severities[row, col])
+        value = values[rule][row] if values[rule] is not None else ''
+        errors, warnings = issues.setdefault(matrix.index[row], ([], []))
+        (errors if severity == ERRO else warnings).append(_message(rule, severity, value))
+    return issues
+
+
+def extracted_to_row(data):
+    """Resposta da IA (campos do prompt ou formato antigo em minúsculas) -> colunas normalizadas."""
+    pfix = str(data.get('PFIX', '') or '').strip()
+    num = str(data.get('NUM', '') or '').strip()
+    des_num = f"{pfix}-{num}" if pfix and num else num or str(data.get('num_desenho', '') or '')
+    row = {
+        'DES_NUM': des_num,
+        'TITULO': data.get('TITULO', data.get('titulo', '')),
+        'DATA': data.get('DATA', data.get('data', '')),
+    }
+    for column in (*DATE_COLUMNS, *REV_COLUMNS):
+        row[column] = data.get(column, '')
+    return row
+
+
+def validate_extracted_data(data, filename=""):
+    """Valida dados extraídos pela IA para garantir integridade.
+
+    Aceita as chaves do prompt (PFIX/NUM, TITULO, DATA, R) e o formato
+    antigo (num_desenho, titulo, data, revisao). Regras e mensagens de uma
+    folha; as verificações entre registos (repetidos, tabela de revisões)
+    ficam para validate_records.
+
+    Retorna: (is_valid: bool, errors: list, warnings: list)
+    """
+    errors = []
+    warnings = []
+    row = extracted_to_row(data)
+
+    # 1. Validar número de desenho (obrigatório e não vazio)
+    num_desenho = str(row['DES_NUM'] or '').strip()
+    if not num_desenho or num_desenho == 'ERRO':
+        errors.append("Número de desenho vazio ou inválido")
+    elif len(num_desenho) < 3:
+        warnings.append(f"Número de desenho muito curto: '{num_desenho}'")
+
+    # 2. Validar data (formato DD/MM/YYYY ou variações comuns)
+    data_str = str(row['DATA'] or '').strip()
+    if data_str:
+        match = DATE_PATTERN.match(data_str)
+        if not match:
+            # Verificar se não é placeholder comum
+            if data_str.lower() in DATE_PLACEHOLDERS:
+                warnings.append(f"Data ilegível ou não disponível: '{data_str}'")
+            else:
+                errors.append(f"Formato de data inválido: '{data_str}' (esperado DD/MM/YYYY)")
+        else:
+            # Validar valores numéricos
+            dia, mes, ano = (int(part) for part in match.groups())
+            if not (1 <= dia <= 31):
+                errors.append(f"Dia inválido: {dia}")
+            if not (1 <= mes <= 12):
+                errors.append(f"Mês inválido: {mes}")
+            if not (YEAR_RANGE[0] <= ano <= YEAR_RANGE[1]):
+                warnings.append(f"Ano fora do range esperado: {ano}")
+    else:
+        warnings.append("Data vazia")
+
+    # 3. Validar revisão (letra A-Z maiúscula ou '0' para primeira emissão)
+    revisao = str(data.get('R', data.get('revisao', '')) or '').strip()
+    if revisao:
+        if not REV_PATTERN.fullmatch(revisao):
+            if REV_LOWER_PATTERN.fullmatch(revisao):
+                warnings.append(f"Revisão em minúscula: '{revisao}' (esperado maiúscula)")
+            else:
+                errors.append(MESSAGES[('REV', ERRO)].format(value=revisao))
+    else:
+        warnings.append("Revisão vazia")
+
+    # 4. Validar título (opcional mas recomendado)
+    titulo = str(row['TITULO'] or '').strip()
+    if not titulo:
+        warnings.append("Título vazio")
+    elif len(titulo) < 3:
+        warnings.append(f"Título muito curto: '{titulo}'")
+
+    # 5. Verificar se há erro reportado pela própria IA
+    if 'error' in data:
+        errors.append(f"IA reportou erro: {data['error']}")
+
+    is_valid = len(errors) == 0
+
+    # Log de validação
+    if errors:
+        logger.error(f"Validação FALHOU para {filename}: {errors}")
+    if warnings:
+        logger.warning(f"Validação com avisos para {filename}: {warnings}")
+    if is_valid and not warnings:
+        logger.info(f"Validação OK para {filename}: Rev={revisao}, Data={data_str}")
+
+    return is_valid, errors, warnings
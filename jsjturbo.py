@@ -1,36 +1,34 @@
 import streamlit as st
 import fitz  # PyMuPDF
 import pandas as pd
-import google.generativeai as genai
 from PIL import Image
 import io
-import json
+import logging
 import time
 import asyncio
-from collections import deque
+import functools
 import tempfile
 import os
-from datetime import datetime
+from concurrent.futures import ThreadPoolExecutor
+from streamlit.runtime.media_file_manager import MediaFileManager
+from streamlit.runtime.scriptrunner import add_script_run_ctx, get_script_run_ctx
 
 # Imports para Relatórios PDF
-from reportlab.lib import colors
-from reportlab.lib.pagesizes import A4, landscape
-from reportlab.platypus import SimpleDocTemplate, Table, TableStyle, Paragraph, Spacer, PageBreak
-from reportlab.lib.styles import getSampleStyleSheet, ParagraphStyle
 from reportlab.lib.units import cm
-from reportlab.lib.enums import TA_CENTER
-
-# Imports Opcionais para DWG
-try:
-    import ezdxf
-    from ezdxf.addons.drawing import RenderContext, Frontend
-    from ezdxf.addons.drawing.matplotlib import MatplotlibBackend
-    import matplotlib
-    matplotlib.use('Agg')  # Backend sem GUI
-    import matplotlib.pyplot as plt
-    DWG_SUPPORT = True
-except ImportError:
-    DWG_SUPPORT = False
+
+from jsj_dwg import DWG_SUPPORT, DwgSession, get_image_from_dwg_layout
+from jsj_export import get_export_cache
+from jsj_pipeline import run_streaming_pipeline
+from jsj_cache import get_result_cache, image_fingerprint, prompt_version
+from jsj_gemini import get_api_executor, get_client_pool
+from jsj_ratelimit import create_rate_limiter
+from jsj_report import write_pdf_report
+from jsj_response import generation_config, parse_json_response
+from jsj_retry import RetryPolicy
+from jsj_masterlist import sort_by_tipo
+from jsj_store import DEFAULT_PROJECT, get_project_store
+
+logger = logging.getLogger(__name__)
 
 # --- CONFIGURAÇÃO DA PÁGINA ---
 st.set_page_config(
@@ -39,9 +37,16 @@ st.set_page_config(
     layout="wide"
 )
 
+# --- LISTA MESTRA PERSISTENTE (SQLite, partilhada com jsj_app.py) ---
+store = get_project_store()
+# Exportações memorizadas por versão dos dados (partilhadas com o jsj_app.py)
+exports = get_export_cache()
+# Streamlit com downloads diferidos (data=função chamada só no clique)
+LAZY_DOWNLOADS = hasattr(MediaFileManager, "add_deferred")
+
 # --- INICIALIZAÇÃO DO ESTADO (MEMÓRIA TEMPORÁRIA) ---
-if 'master_data' not in st.session_state:
-    st.session_state.master_data = []
+if 'project' not in st.session_state:
+    st.session_state.project = (store.projects() or [DEFAULT_PROJECT])[0]
 if 'total_tokens' not in st.session_state:
     st.session_state.total_tokens = 0
 if 'ordem_customizada' not in st.session_state:
@@ -54,22 +59,34 @@ with st.sidebar:
 
     st.divider()
 
-    # PAINEL DE LOTES CARREGADOS
-    st.subheader("📦 Lotes em Memória")
-    if len(st.session_state.master_data) > 0:
-        # Agrupar por TIPO e contar
-        df_temp = pd.DataFrame(st.session_state.master_data)
-        summary = df_temp.groupby('TIPO').size().sort_index()
+    # PROJETO ATIVO (Lista Mestra gravada em disco)
+    projetos = store.projects()
+    if st.session_state.project not in projetos:
+        projetos.append(st.session_state.project)
+    st.session_state.project = st.selectbox("📁 Projeto", projetos, index=projetos.index(st.session_state.project))
+
+    def criar_projeto():
+        """Ativa o novo projeto (só passa a existir em disco com o primeiro lote)."""
+        if st.session_state.novo_projeto.strip():
+            st.session_state.project = st.session_state.novo_projeto.strip()
+        st.session_state.novo_projeto = ""
 
+    st.text_input("➕ Novo projeto", key="novo_projeto", placeholder="Ex: 2024-001", on_change=criar_projeto)
+
+    # PAINEL DE LOTES CARREGADOS
+    st.subheader("📦 Lotes do Projeto")
+    summary = store.tipo_counts(st.session_state.project)
+    if summary:
         for tipo, count in summary.items():
             st.metric(label=tipo, value=f"{count} desenhos")
 
-        st.caption(f"**Total:** {len(st.session_state.master_data)} desenhos")
+        st.caption(f"**Total:** {sum(summary.values())} desenhos")
     else:
         st.info("Nenhum lote carregado ainda.")
 
     st.divider()
-    st.success("⚡ MODO TURBO ATIVO\nRate Limit: 1000 req/min\nBatch Size: 50")
+    concurrency = st.number_input("🔀 Pedidos em simultâneo (N)", min_value=1, max_value=200, value=50, step=1, help="Afina com as latências p50/p95 reportadas no fim de cada lote.")
+    st.success(f"⚡ MODO TURBO ATIVO\nRate Limit: 1000 req/min\nEm simultâneo: {concurrency}")
     
     # CONTADOR DE TOKENS E CUSTO
     if st.session_state.total_tokens > 0:
@@ -86,33 +103,14 @@ with st.sidebar:
 
     st.divider()
 
-    if st.button("🗑️ Limpar Toda a Memória", type="primary"):
-        st.session_state.master_data = []
+    if st.button("🗑️ Limpar Projeto", type="primary"):
+        store.clear(st.session_state.project)
         st.session_state.total_tokens = 0
         st.session_state.ordem_customizada = []
         st.rerun()
 
 # --- FUNÇÕES DE PROCESSAMENTO (BACKEND) ---
 
-class RateLimiter:
-    """Rate limiter ajustado para MODO TURBO (Paid Tier)."""
-    def __init__(self, max_requests=1000, time_window=60): # TURBO: 1000 req/min
-        self.max_requests = max_requests
-        self.time_window = time_window
-        self.requests = deque()
-
-    async def acquire(self):
-        now = time.time()
-        while self.requests and self.requests[0] < now - self.time_window:
-            self.requests.popleft()
-
-        if len(self.requests) >= self.max_requests:
-            sleep_time = self.requests[0] + self.time_window - now + 0.1
-            await asyncio.sleep(sleep_time)
-            return await self.acquire()
-
-        self.requests.append(now)
-
 def get_image_from_page(doc, page_num):
     """Extrai a imagem (crop da legenda) de uma página específica."""
     page = doc.load_page(page_num)
@@ -131,117 +129,62 @@ def get_image_from_page(doc, page_num):
 
     return Image.open(io.BytesIO(img_data))
 
-def get_image_from_dwg_layout(dwg_path, layout_name):
-    """Extrai imagem de um layout DWG."""
-    if not DWG_SUPPORT:
-        raise ImportError("ezdxf não está instalado.")
-    
-    try:
-        doc = ezdxf.readfile(dwg_path)
-        if layout_name == 'Model':
-            layout = doc.modelspace()
-        else:
-            layout = doc.paperspace(layout_name)
-        
-        fig = plt.figure(figsize=(16, 12), dpi=200, facecolor='white')
-        ax = fig.add_axes([0, 0, 1, 1])
-        ax.set_facecolor('white')
-        
-        ctx = RenderContext(doc)
-        out = MatplotlibBackend(ax)
-        Frontend(ctx, out).draw_layout(layout, finalize=True)
-        
-        ax.autoscale()
-        ax.margins(0.05)
-        
-        buf = io.BytesIO()
-        fig.savefig(buf, format='png', bbox_inches='tight', dpi=200, facecolor='white')
-        buf.seek(0)
-        plt.close(fig)
-        
-        img = Image.open(buf)
-        width, height = img.size
-        crop_box = (width // 2, height // 2, width, height)
-        cropped = img.crop(crop_box)
-        
-        if cropped.mode != 'RGB':
-            cropped = cropped.convert('RGB')
-        
-        return cropped
-    except Exception as e:
-        raise Exception(f"Erro DWG '{layout_name}': {str(e)}")
-
-def get_dwg_layouts(dwg_path):
-    """Retorna lista de layouts DWG."""
-    if not DWG_SUPPORT: return []
-    try:
-        doc = ezdxf.readfile(dwg_path)
-        layouts = [l.name for l in doc.layouts if l.name != 'Model']
-        return sorted(layouts) if layouts else ['Model']
-    except:
-        return []
+def get_dwg_layouts(session):
+    """Retorna lista de layouts DWG (Model se não houver Paper Space)."""
+    return session.paperspace_layouts() or ['Model']
+
+# Colunas do relatório PDF do TURBO (cabeçalho, coluna, nº máximo de caracteres, largura)
+TURBO_PDF_COLUMNS = [
+    ('Nº Desenho', 'Num. Desenho', None, 3.5 * cm),
+    ('Título', 'Titulo', 50, 6 * cm),
+    ('Rev', 'Revisão', None, 1.5 * cm),
+    ('Data', 'Data', None, 2 * cm),
+    ('Ficheiro', 'Ficheiro', 30, 5 * cm),
+    ('Obs', 'Obs', 30, 4 * cm),
+]
 
 def create_pdf_export(df):
-    """Cria PDF profissional."""
+    """Cria PDF profissional (BytesIO; relatório em streaming de jsj_report)."""
     buffer = io.BytesIO()
-    doc = SimpleDocTemplate(buffer, pagesize=landscape(A4), rightMargin=1.5*cm, leftMargin=1.5*cm, topMargin=2*cm, bottomMargin=2*cm)
-    styles = getSampleStyleSheet()
-    title_style = ParagraphStyle('CustomTitle', parent=styles['Heading1'], fontSize=18, textColor=colors.HexColor('#1f4788'), spaceAfter=20, alignment=TA_CENTER, fontName='Helvetica-Bold')
-    subtitle_style = ParagraphStyle('CustomSubtitle', parent=styles['Heading2'], fontSize=14, textColor=colors.HexColor('#2c5aa0'), spaceAfter=12, spaceBefore=12, fontName='Helvetica-Bold')
-    
-    elements = []
-    elements.append(Paragraph("LISTA DE DESENHOS JSJ", title_style))
-    elements.append(Paragraph(f"Gerado em {datetime.now().strftime('%d/%m/%Y às %H:%M')}", styles['Normal']))
-    elements.append(Spacer(1, 0.5*cm))
-    
-    for tipo in df['TIPO'].unique():
-        df_tipo = df[df['TIPO'] == tipo]
-        elements.append(Paragraph(f"TIPO: {tipo}", subtitle_style))
-        elements.append(Spacer(1, 0.3*cm))
-        
-        table_data = [['Nº Desenho', 'Título', 'Rev', 'Data', 'Ficheiro', 'Obs']]
-        for _, row in df_tipo.iterrows():
-            table_data.append([
-                str(row['Num. Desenho']),
-                str(row['Titulo'])[:50] + '...' if len(str(row['Titulo'])) > 50 else str(row['Titulo']),
-                str(row['Revisão']),
-                str(row['Data']),
-                str(row['Ficheiro'])[:30] + '...' if len(str(row['Ficheiro'])) > 30 else str(row['Ficheiro']),
-                str(row['Obs'])[:30] + '...' if len(str(row['Obs'])) > 30 else str(row['Obs'])
-            ])
-        
-        table = Table(table_data, colWidths=[3.5*cm, 6*cm, 1.5*cm, 2*cm, 5*cm, 4*cm])
-        table.setStyle(TableStyle([
-            ('BACKGROUND', (0, 0), (-1, 0), colors.HexColor('#1f4788')),
-            ('TEXTCOLOR', (0, 0), (-1, 0), colors.whitesmoke),
-            ('ALIGN', (0, 0), (-1, 0), 'CENTER'),
-            ('FONTNAME', (0, 0), (-1, 0), 'Helvetica-Bold'),
-            ('FONTSIZE', (0, 0), (-1, 0), 10),
-            ('ROWBACKGROUNDS', (0, 1), (-1, -1), [colors.white, colors.HexColor('#f0f4f8')]),
-            ('GRID', (0, 0), (-1, -1), 0.5, colors.HexColor('#cccccc')),
-            ('VALIGN', (0, 0), (-1, -1), 'MIDDLE'),
-        ]))
-        elements.append(table)
-        elements.append(Spacer(1, 0.8*cm))
-        if tipo != df['TIPO'].unique()[-1]: elements.append(PageBreak())
-    
-    doc.build(elements)
+    write_pdf_report(df, buffer, columns=TURBO_PDF_COLUMNS)
     buffer.seek(0)
     return buffer
 
-async def ask_gemini_async(image, file_context, rate_limiter):
-    """Wrapper Assíncrono."""
+def excel_export_bytes(df):
+    """Excel com as colunas do TURBO."""
+    bx = io.BytesIO()
+    with pd.ExcelWriter(bx, engine='xlsxwriter') as w:
+        df.to_excel(w, index=False, sheet_name='JSJ')
+        w.sheets['JSJ'].set_column(0, 6, 20)
+    return bx.getvalue()
+
+def markdown_export_bytes(df):
+    """Tabela Markdown (separador |) com as colunas do TURBO."""
+    return df.to_csv(sep='|', index=False).encode('utf-8')
+
+def pdf_export_bytes(df):
+    return create_pdf_export(df).getvalue()
+
+# Formatos do TURBO na cache de exportações (colunas próprias, não as 34 normalizadas)
+TURBO_EXPORTS = {
+    "turbo_xlsx": excel_export_bytes,
+    "turbo_md": markdown_export_bytes,
+    "turbo_pdf": pdf_export_bytes,
+}
+
+async def ask_gemini_async(image, file_context, rate_limiter=None, acquired=False, executor=None):
+    """Wrapper Assíncrono (acquired=True se o pipeline já adquiriu a vez do modelo principal)."""
     if not api_key: return {"error": "Sem API Key"}
-    await rate_limiter.acquire()
+    if rate_limiter is not None and not acquired:
+        await rate_limiter.acquire()
     loop = asyncio.get_event_loop()
-    return await loop.run_in_executor(None, _ask_gemini_sync, image, file_context)
+    return await loop.run_in_executor(executor or get_api_executor(), _ask_gemini_sync, image, file_context, rate_limiter)
 
-def _ask_gemini_sync(image, file_context):
-    """Chamada Síncrona ao Gemini."""
-    genai.configure(api_key=api_key)
-    models_to_try = ['gemini-2.5-flash', 'gemini-2.0-flash', 'gemini-1.5-flash', 'gemini-1.5-flash-latest', 'gemini-pro']
+MODELS_TURBO = ['gemini-2.5-flash', 'gemini-2.0-flash', 'gemini-1.5-flash', 'gemini-1.5-flash-latest', 'gemini-pro']
+# 429/erros transitórios: backoff no mesmo modelo antes de passar ao seguinte
+RETRY_TURBO = RetryPolicy(max_attempts=3, base_delay=1.0, max_delay=15.0)
 
-    prompt = """
+PROMPT_TURBO = """
     Age como um técnico de documentação. Analisa a LEGENDA VISUAL no canto inferior direito desta imagem.
     
     REGRAS ESTRITAS (FONTE DE VERDADE):
@@ -265,20 +208,46 @@ def _ask_gemini_sync(image, file_context):
         "obs": "string"
     }
     """
+PROMPT_TURBO_VERSION = prompt_version(PROMPT_TURBO)
+
+def _ask_gemini_sync(image, file_context, rate_limiter=None):
+    """Chamada Síncrona ao Gemini (com cache de resultados por conteúdo e quota por modelo)."""
+    models_to_try = MODELS_TURBO
+    prompt = PROMPT_TURBO
+
+    cache = get_result_cache()
+    image_hash = image_fingerprint(image) if cache else None
+    if cache:
+        hit = cache.get(image_hash, PROMPT_TURBO_VERSION, models_to_try)
+        if hit:
+            return hit[0], 0
+
+    clients = get_client_pool()
 
     last_error = ""
-    for model_name in models_to_try:
+    for attempt, model_name in enumerate(models_to_try):
         try:
-            model = genai.GenerativeModel(model_name)
-            response = model.generate_content([prompt, image])
-            clean_text = response.text.replace("```json", "").replace("```", "").strip()
+            if attempt > 0 and rate_limiter is not None:
+                rate_limiter.acquire_blocking(model_name)
+            model = clients.model(api_key, model_name)
+            response = RETRY_TURBO.call(
+                lambda: model.generate_content([prompt, image], generation_config=generation_config(model_name)),
+                model_name, rate_limiter, file_context
+            )
             
             total = 500
             if hasattr(response, 'usage_metadata'):
                 total = response.usage_metadata.total_token_count
             
-            return json.loads(clean_text), total
+            # Parser tolerante: uma resposta mal formatada não custa um segundo pedido
+            parsed, truncated = parse_json_response(response.text)
+            if truncated:
+                parsed["obs"] = "Resposta IA incompleta: verificar campos"
+            elif cache:
+                cache.put(image_hash, PROMPT_TURBO_VERSION, model_name, parsed, total)
+            return parsed, total
         except Exception as e:
+            logger.warning(f"{model_name} falhou para {file_context}: {e}")
             last_error = str(e)
             continue
 
@@ -308,96 +277,100 @@ with col_input:
             progress_bar = st.progress(0)
             status_text = st.empty()
             
-            all_tasks = []
-            total_operations = 0
+            # 1. Preparação em streaming (rasterização adiada via "render")
+            def iter_all_tasks():
+                for file in uploaded_files:
+                    file_ext = file.name.lower().split('.')[-1]
+                    try:
+                        if file_ext == 'pdf':
+                            bytes_data = file.read()
+                            doc = fitz.open(stream=bytes_data, filetype="pdf")
+                            try:
+                                for page_num in range(doc.page_count):
+                                    display_name = f"{file.name} (Pág. {page_num + 1})"
+                                    yield {"render": functools.partial(get_image_from_page, doc, page_num), "display_name": display_name, "batch_type": batch_type.upper()}
+                            finally:
+                                doc.close()
+                        elif file_ext in ['dwg', 'dxf'] and DWG_SUPPORT:
+                            with tempfile.NamedTemporaryFile(delete=False, suffix=f'.{file_ext}') as tmp:
+                                tmp.write(file.read())
+                                tmp_path = tmp.name
+                            try:
+                                # Um único parse por ficheiro: layouts e renders saem da mesma sessão
+                                session = DwgSession(tmp_path)
+                                for layout_name in get_dwg_layouts(session):
+                                    display_name = f"{file.name} (Layout: {layout_name})"
+                                    yield {"render": functools.partial(get_image_from_dwg_layout, session, layout_name), "display_name": display_name, "batch_type": batch_type.upper()}
+                            finally:
+                                try:
+                                    os.unlink(tmp_path)
+                                except Exception as e:
+                                    logger.warning(f"Não foi possível eliminar ficheiro temporário {tmp_path}: {e}")
+                    except Exception as e:
+                        st.error(f"Erro ao ler {file.name}: {e}")
             
-            # 1. Preparação (Rápida)
-            for file in uploaded_files:
-                file_ext = file.name.lower().split('.')[-1]
-                try:
-                    if file_ext == 'pdf':
-                        bytes_data = file.read()
-                        doc = fitz.open(stream=bytes_data, filetype="pdf")
-                        for page_num in range(doc.page_count):
-                            display_name = f"{file.name} (Pág. {page_num + 1})"
-                            img = get_image_from_page(doc, page_num)
-                            all_tasks.append({"image": img, "display_name": display_name, "batch_type": batch_type.upper()})
-                            total_operations += 1
-                        doc.close()
-                    elif file_ext in ['dwg', 'dxf'] and DWG_SUPPORT:
-                        with tempfile.NamedTemporaryFile(delete=False, suffix=f'.{file_ext}') as tmp:
-                            tmp.write(file.read())
-                            tmp_path = tmp.name
-                        layouts = get_dwg_layouts(tmp_path)
-                        for layout_name in layouts:
-                            display_name = f"{file.name} (Layout: {layout_name})"
-                            img = get_image_from_dwg_layout(tmp_path, layout_name)
-                            all_tasks.append({"image": img, "display_name": display_name, "batch_type": batch_type.upper()})
-                            total_operations += 1
-                        try: os.unlink(tmp_path)
-                        except: pass
-                except Exception as e:
-                    st.error(f"Erro ao ler {file.name}: {e}")
-            
-            # 2. Processamento Assíncrono (TURBO)
+            # O gerador corre fora do event loop, numa thread com o contexto desta sessão (st.error)
+            task_thread = ThreadPoolExecutor(
+                max_workers=1, thread_name_prefix="jsj-tasks",
+                initializer=add_script_run_ctx, initargs=(None, get_script_run_ctx())
+            )
+
+            # 2. Processamento Assíncrono (TURBO) em pipeline
             async def process_all_pages():
-                # TURBO SETTINGS: 1000 req/min
-                rate_limiter = RateLimiter(max_requests=1000, time_window=60)
+                # TURBO SETTINGS: 1000 req/min, partilhados com as outras sessões/processos (mesma API key)
+                rate_limiter = create_rate_limiter(api_key, turbo=True, models=MODELS_TURBO)
                 new_records = []
+                # Pool da API partilhado pelo processo, obtido uma vez por execução
+                executor = get_api_executor()
                 
-                async_tasks = []
-                for task_data in all_tasks:
-                    async_tasks.append(ask_gemini_async(task_data["image"], task_data["display_name"], rate_limiter))
+                async def ask_task(task_data):
+                    return await ask_gemini_async(task_data["image"], task_data["display_name"], rate_limiter, acquired=True, executor=executor)
                 
-                # TURBO BATCH: 50 de cada vez
-                batch_size = 50
-                completed = 0
+                def on_result(task_info, result, stats):
+                    if isinstance(result, tuple):
+                        data, tokens = result
+                        st.session_state.total_tokens += tokens
+                    else:
+                        data, tokens = {"error": str(result)}, 0
+
+                    record = {
+                        "TIPO": task_info["batch_type"],
+                        "Num. Desenho": data.get("num_desenho", "N/A"),
+                        "Titulo": data.get("titulo", "N/A"),
+                        "Revisão": data.get("revisao", "-"),
+                        "Data": data.get("data", "-"),
+                        "Ficheiro": task_info["display_name"],
+                        "Obs": data.get("obs", "")
+                    }
+                    if "error" in data: record["Obs"] = f"Erro: {data['error']}"
+                    new_records.append(record)
+                    status_text.text(f"🔥 {stats['completed']}/{stats['produced']} desenhos ({task_info['display_name']})")
+                    progress_bar.progress(min(stats["completed"] / max(stats["produced"], 1), 1.0))
                 
-                for i in range(0, len(async_tasks), batch_size):
-                    batch = async_tasks[i:i + batch_size]
-                    status_text.text(f"🔥 A processar batch {i//batch_size + 1} ({len(batch)} desenhos em paralelo)...")
-                    
-                    results = await asyncio.gather(*batch, return_exceptions=True)
-                    
-                    for idx, result in enumerate(results):
-                        task_info = all_tasks[i + idx]
-                        if isinstance(result, tuple):
-                            data, tokens = result
-                            st.session_state.total_tokens += tokens
-                        else:
-                            data, tokens = {"error": str(result)}, 0
-
-                        record = {
-                            "TIPO": task_info["batch_type"],
-                            "Num. Desenho": data.get("num_desenho", "N/A"),
-                            "Titulo": data.get("titulo", "N/A"),
-                            "Revisão": data.get("revisao", "-"),
-                            "Data": data.get("data", "-"),
-                            "Ficheiro": task_info["display_name"],
-                            "Obs": data.get("obs", "")
-                        }
-                        if "error" in data: record["Obs"] = f"Erro: {data['error']}"
-                        new_records.append(record)
-                        completed += 1
-                        progress_bar.progress(completed / total_operations)
-                return new_records
+                # TURBO: janela deslizante de N pedidos em voo
+                stats = await run_streaming_pipeline(iter_all_tasks(), ask_task, on_result, concurrency=int(concurrency), rate_limiter=rate_limiter, source_executor=task_thread)
+                return new_records, stats["latency"]
             
             try:
-                new_records = asyncio.run(process_all_pages())
-                st.session_state.master_data.extend(new_records)
-                status_text.success(f"✅ Concluído! ({len(new_records)} desenhos)")
+                new_records, latency = asyncio.run(process_all_pages())
+                store.append(st.session_state.project, new_records)
+                status_text.success(f"✅ Concluído! ({len(new_records)} desenhos) | ⏱️ p50 {latency['p50']:.1f}s · p95 {latency['p95']:.1f}s (N={concurrency})")
                 time.sleep(1)
                 st.rerun()
             except Exception as e:
                 st.error(f"Erro: {e}")
+            finally:
+                task_thread.shutdown(wait=False)
 
 with col_view:
     st.subheader("2. Lista Completa")
-    if len(st.session_state.master_data) > 0:
-        df = pd.DataFrame(st.session_state.master_data)
+    df = store.load_df(st.session_state.project)
+    if not df.empty:
+        # Colunas do TURBO (registos gravados pelo jsj_app.py também são mostrados)
+        df = df.reindex(columns=["TIPO", "Num. Desenho", "Titulo", "Revisão", "Data", "Ficheiro", "Obs"], fill_value="")
         
         st.markdown("### 🔄 Reordenar")
-        tipos_unicos = sorted(df['TIPO'].unique().tolist())
+        tipos_unicos = sorted(df['TIPO'].astype(str).unique().tolist())
         col_pills, col_btn = st.columns([4, 1])
         
         with col_pills:
@@ -414,28 +387,28 @@ with col_view:
                 st.session_state.ordem_customizada = []
                 st.rerun()
         
-        if st.session_state.ordem_customizada:
-            ordem_completa = st.session_state.ordem_customizada + [t for t in tipos_unicos if t not in st.session_state.ordem_customizada]
-            ordem_map = {tipo: idx for idx, tipo in enumerate(ordem_completa)}
-            df['_ordem'] = df['TIPO'].map(ordem_map)
-            df = df.sort_values(by=['_ordem', 'Num. Desenho']).drop('_ordem', axis=1)
-        else:
-            df = df.sort_values(by=["TIPO", "Num. Desenho"])
+        df = sort_by_tipo(df, st.session_state.ordem_customizada, 'Num. Desenho')
         
         st.dataframe(df, use_container_width=True, hide_index=True)
         
         st.markdown("### 📥 Exportar")
         c1, c2, c3 = st.columns(3)
         
+        # Ficheiros gerados só no clique e memorizados pela revisão dos dados e ordem
+        # (como no jsj_app.py): reruns não reconstroem Excel/PDF
+        revisao = store.revision(st.session_state.project)
+        ordem = tuple(st.session_state.ordem_customizada)
+
+        def export_data(fmt):
+            if LAZY_DOWNLOADS:
+                return exports.lazy(fmt, df, st.session_state.project, revisao, ordem, builder=TURBO_EXPORTS[fmt])
+            return exports.get(fmt, df, st.session_state.project, revisao, ordem, builder=TURBO_EXPORTS[fmt])
+        
         with c1:
-            bx = io.BytesIO()
-            with pd.ExcelWriter(bx, engine='xlsxwriter') as w:
-                df.to_excel(w, index=False, sheet_name='JSJ')
-                w.sheets['JSJ'].set_column(0, 6, 20)
-            st.download_button("📊 Excel", data=bx.getvalue(), file_name="lista_jsj.xlsx", mime="application/vnd.openxmlformats-officedocument.spreadsheetml.sheet")
+            st.download_button("📊 Excel", data=export_data("turbo_xlsx"), file_name="lista_jsj.xlsx", mime="application/vnd.openxmlformats-officedocument.spreadsheetml.sheet")
             
         with c2:
-            st.download_button("📝 Markdown", data=df.to_csv(sep='|', index=False), file_name="lista_jsj.md", mime="text/markdown")
+            st.download_button("📝 Markdown", data=export_data("turbo_md"), file_name="lista_jsj.md", mime="text/markdown")
             
         with c3:
-            st.download_button("📄 PDF", data=create_pdf_export(df).getvalue(), file_name="lista_jsj.pdf", mime="application/pdf")
\ No newline at end of file
+            st.download_button("📄 PDF", data=export_data("turbo_pdf"), file_name="lista_jsj.pdf", mime="application/pdf")
\ No newline at end of file
@@ -0,0 +1,207 @@
+import asyncio
+import json
+import warnings
+from types import SimpleNamespace
+
+import pytest
+from PIL import Image
+
+from jsj_cache import ResultCache, image_fingerprint
+from jsj_pipeline import run_streaming_pipeline
+
+with warnings.catch_warnings():
+    # google-generativeai avisa que está descontinuado ao ser importado
+    warnings.simplefilter("ignore", FutureWarning)
+    import jsj_core
+    from jsj_core import _align_batch_items, _ask_gemini_batch_sync
+
+
+# --- Alinhamento da resposta às imagens ---
+
+def test_align_by_image_number():
+    parsed = [{"IMAGEM": 3, "NUM": "c"}, {"IMAGEM": "1", "NUM": "a"}]
+    assert _align_batch_items(parsed, 3) == [{"IMAGEM": "1", "NUM": "a"}, None, {"IMAGEM": 3, "NUM": "c"}]
+
+
+def test_align_by_position_without_numbers():
+    parsed = [{"NUM": "a"}, {"NUM": "b"}, {"NUM": "extra"}]
+    assert _align_batch_items(parsed, 2) == [{"NUM": "a"}, {"NUM": "b"}]
+
+
+def test_align_ignores_duplicates_and_out_of_range():
+    parsed = [{"IMAGEM": 1, "NUM": "a"}, {"IMAGEM": 1, "NUM": "dup"}, {"IMAGEM": 9, "NUM": "x"}]
+    assert _align_batch_items(parsed, 2) == [{"IMAGEM": 1, "NUM": "a"}, None]
+
+
+def test_align_wrapped_array_and_garbage():
+    assert _align_batch_items({"desenhos": [{"NUM": "a"}]}, 1) == [{"NUM": "a"}]
+    assert _align_batch_items({"NUM": "a"}, 2) == [{"NUM": "a"}, None]
+    assert _align_batch_items("texto", 2) == [None, None]
+
+
+# --- Lote com split-and-retry ---
+
+class FakeGemini:
+    """Substitui _generate_with_fallback/_ask_gemini_sync; `answer(n)` decide a resposta a um lote de n."""
+
+    def __init__(self, monkeypatch, answer):
+        self.batches = []
+        self.singles = []
+        self.answer = answer
+        monkeypatch.setattr(jsj_core, "_generate_with_fallback", self.generate)
+        monkeypatch.setattr(jsj_core, "_ask_gemini_sync", self.single)
+
+    def generate(self, contents, label, api_key, rate_limiter=None, schema=None):
+        names = [c for c in contents if isinstance(c, str) and c.startswith("Imagem ")]
+        self.batches.append(len(names))
+        text = self.answer(len(names))
+        if isinstance(text, Exception):
+            raise text
+        return SimpleNamespace(text=text, usage_metadata=SimpleNamespace(total_token_count=101)), "gemini-test"
+
+    def single(self, image, context, api_key, use_cache=True, rate_limiter=None):
+        self.singles.append(context)
+        return {"NUM": context, "TITULO": "sozinha"}, 10
+
+
+def _items(n, skip=()):
+    return json.dumps([{"IMAGEM": i + 1, "NUM": f"N{i}", "TITULO": f"T{i}"} for i in range(n) if i not in skip])
+
+
+def _run(n):
+    images = [Image.new("L", (4, 4)) for _ in range(n)]
+    contexts = [f"folha{i}" for i in range(n)]
+    return _ask_gemini_batch_sync(images, contexts, "key", use_cache=False)
+
+
+def test_complete_batch_is_one_request(monkeypatch):
+    fake = FakeGemini(monkeypatch, _items)
+    results = _run(4)
+
+    assert fake.batches == [4] and fake.singles == []
+    assert [data["NUM"] for data, _ in results] == ["N0", "N1", "N2", "N3"]
+    # Tokens repartidos; o resto da divisão fica na primeira folha
+    assert [tokens for _, tokens in results] == [26, 25, 25, 25]
+
+
+def test_missing_items_are_asked_again(monkeypatch):
+    fake = FakeGemini(monkeypatch, lambda n: _items(n, skip={1, 2}) if n == 4 else _items(n))
+    results = _run(4)
+
+    assert fake.batches == [4, 2]
+    assert all(data["TITULO"].startswith("T") for data, _ in results)
+
+
+def test_failed_batch_is_halved_then_goes_single(monkeypatch):
+    fake = FakeGemini(monkeypatch, lambda n: RuntimeError("todos os modelos falharam"))
+    results = _run(8)
+
+    # 1 lote + 2 metades + 4 quartos; depois cada folha sozinha (não ~2K pedidos)
+    assert sorted(fake.batches, reverse=True) == [8, 4, 4, 2, 2, 2, 2]
+    assert len(fake.singles) == 8
+    assert [data["NUM"] for data, _ in results] == [f"folha{i}" for i in range(8)]
+
+
+def test_half_that_succeeds_is_not_split_again(monkeypatch):
+    fake = FakeGemini(monkeypatch, lambda n: RuntimeError("falhou") if n == 8 else _items(n))
+    _run(8)
+    assert fake.batches == [8, 4, 4] and fake.singles == []
+
+
+def test_batch_results_are_cached_under_the_batch_prompt(monkeypatch, tmp_path):
+    cache = ResultCache(str(tmp_path / "cache.sqlite"))
+    monkeypatch.setattr(jsj_core, "get_result_cache", lambda: cache)
+    monkeypatch.setattr(jsj_core, "GEMINI_MODELS", ["gemini-test"])
+    fake = FakeGemini(monkeypatch, _items)
+    images = [Image.new("L", (4, 4), color) for color in (0, 255)]
+
+    _ask_gemini_batch_sync(images, ["a", "b"], "key")
+    image_hash = image_fingerprint(images[0])
+    assert cache.get(image_hash, jsj_core.PROMPT_BATCH_VERSION, ["gemini-test"])[0]["NUM"] == "N0"
+    assert cache.get(image_hash, jsj_core.PROMPT_VERSION, ["gemini-test"]) is None
+    assert jsj_core.PROMPT_BATCH_VERSION != jsj_core.PROMPT_VERSION
+
+    # Segunda vez: tudo da cache, nenhum pedido
+    _ask_gemini_batch_sync(images, ["a", "b"], "key")
+    assert fake.batches == [2]
+
+
+def test_invalid_json_counts_as_failed_batch(monkeypatch):
+    fake = FakeGemini(monkeypatch, lambda n: "não é JSON")
+    results = _run(2)
+    assert fake.batches == [2]
+    assert fake.singles == ["folha0", "folha1"]
+    assert all(result is not None for result in results)
+
+
+def test_single_image_uses_the_normal_path(monkeypatch):
+    fake = FakeGemini(monkeypatch, _items)
+    _run(1)
+    assert fake.batches == [] and fake.singles == ["folha0"]
+
+
+# --- Lotes no pipeline ---
+
+def _pipeline(tasks, ask_batch_fn, batch_size):
+    delivered = []
+
+    async def ask_fn(task):
+        return ({"NUM": task["display_name"]}, 1)
+
+    stats = asyncio.run(run_streaming_pipeline(
+        tasks, ask_fn, lambda task, result, stats: delivered.append((task["display_name"], result)),
+        concurrency=2, ask_batch_fn=ask_batch_fn, batch_size=batch_size, batch_linger=0.05
+    ))
+    return stats, dict(delivered)
+
+
+def _image_tasks(n):
+    return [{"display_name": f"f{i}", "image": Image.new("L", (4, 4))} for i in range(n)]
+
+
+def test_pipeline_groups_image_tasks():
+    sizes = []
+
+    async def ask_batch_fn(batch):
+        sizes.append(len(batch))
+        return [({"NUM": task["display_name"]}, 1) for task in batch]
+
+    tasks = _image_tasks(5) + [{"display_name": "nativa", "is_native": True, "native_data": {"NUM": "x"}}]
+    stats, delivered = _pipeline(tasks, ask_batch_fn, batch_size=2)
+
+    # A sobra de um lote (1 task) segue pelo pedido normal (ask_fn)
+    assert sizes == [2, 2]
+    assert stats["requests"] == 3
+    assert stats["completed"] == 6 and stats["errors"] == 0
+    assert delivered["nativa"] == ({"NUM": "x"}, 0)
+
+
+def test_pipeline_pads_short_batch_results():
+    async def ask_batch_fn(batch):
+        return [({"NUM": batch[0]["display_name"]}, 1)]
+
+    stats, delivered = _pipeline(_image_tasks(3), ask_batch_fn, batch_size=3)
+
+    assert stats["completed"] == 3 and stats["errors"] == 2
+    assert delivered["f0"] == ({"NUM": "f0"}, 1)
+    assert isinstance(delivered["f1"], RuntimeError)
+    assert isinstance(delivered["f2"], RuntimeError)
+
+
+def test_pipeline_delivers_batch_exception_to_every_task():
+    async def ask_batch_fn(batch):
+        raise ValueError("falhou")
+
+    stats, delivered = _pipeline(_image_tasks(2), ask_batch_fn, batch_size=2)
+    assert stats["errors"] == 2
+    assert all(isinstance(result, ValueError) for result in delivered.values())
+
+
+@pytest.mark.parametrize("batch_size", [1, 4])
+def test_pipeline_without_batch_fn_asks_one_by_one(batch_size):
+    async def never(batch):
+        raise AssertionError("não devia ser chamado")
+
+    stats, delivered = _pipeline(_image_tasks(3), never if batch_size == 1 else None, batch_size)
+    assert stats["requests"] == 3
+    assert delivered["f2"] == ({"NUM": "f2"}, 1)
@@ -0,0 +1,73 @@
+import pytest
+from PIL import Image
+
+from jsj_cache import ResultCache, data_fingerprint, image_fingerprint, prompt_version
+from jsj_imageprep import EncodedImage
+
+
+@pytest.fixture
+def cache(tmp_path):
+    return ResultCache(str(tmp_path / "cache.sqlite"))
+
+
+def test_miss_then_hit(cache):
+    assert cache.get("img", "v1", ["m1"]) is None
+    cache.put("img", "v1", "m1", {"NUM": "001"}, 120)
+    assert cache.get("img", "v1", ["m1"]) == ({"NUM": "001"}, 120, "m1")
+
+    stats = cache.stats()
+    assert (stats["entries"], stats["hits"], stats["misses"], stats["tokens_saved"]) == (1, 1, 1, 120)
+
+
+def test_models_are_tried_in_priority_order(cache):
+    cache.put("img", "v1", "fallback", {"NUM": "fb"}, 1)
+    cache.put("img", "v1", "primary", {"NUM": "p"}, 2)
+    assert cache.get("img", "v1", ["primary", "fallback"])[2] == "primary"
+    assert cache.get("img", "v1", "fallback")[2] == "fallback"
+    assert cache.get("img", "v1", ["other"]) is None
+
+
+def test_prompt_version_is_part_of_the_key(cache):
+    cache.put("img", prompt_version("prompt A"), "m", {"NUM": "1"}, 1)
+    assert cache.get("img", prompt_version("prompt B"), ["m"]) is None
+    assert prompt_version("prompt A") == prompt_version("prompt A")
+
+
+def test_least_recently_used_entries_are_evicted(tmp_path):
+    cache = ResultCache(str(tmp_path / "cache.sqlite"), max_mb=250 / 1024 / 1024)
+    payload = {"TITULO": "x" * 80}
+    for key in ("a", "b"):
+        cache.put(key, "v", "m", payload, 1)
+    cache.get("a", "v", ["m"])
+    cache.put("c", "v", "m", payload, 1)
+
+    assert cache.get("b", "v", ["m"]) is None
+    assert cache.get("a", "v", ["m"]) is not None
+    assert cache.get("c", "v", ["m"]) is not None
+
+
+def test_clear_and_persistence(tmp_path):
+    path = str(tmp_path / "cache.sqlite")
+    ResultCache(path).put("img", "v", "m", {"NUM": "1"}, 5)
+    cache = ResultCache(path)
+    assert cache.get("img", "v", ["m"]) is not None
+
+    cache.clear()
+    assert cache.stats()["entries"] == 0 and cache.stats()["hits"] == 0
+
+
+def test_image_fingerprint_follows_pixels_and_encoding():
+    white = Image.new("L", (8, 8), 255)
+    assert image_fingerprint(white) == image_fingerprint(Image.new("L", (8, 8), 255))
+    assert image_fingerprint(white) != image_fingerprint(Image.new("L", (8, 8), 0))
+    assert image_fingerprint(white) != image_fingerprint(Image.new("RGB", (8, 8), "white"))
+
+    png = EncodedImage(b"data", "image/png", (8, 8), "L")
+    jpeg = EncodedImage(b"data", "image/jpeg", (8, 8), "L")
+    assert image_fingerprint(png) != image_fingerprint(jpeg)
+    assert image_fingerprint(b"data") != image_fingerprint(png)
+
+
+def test_data_fingerprint_ignores_key_order():
+    assert data_fingerprint({"a": 1, "b": [1, 2]}) == data_fingerprint({"b": [1, 2], "a": 1})
+    assert data_fingerprint({"a": 1}) != data_fingerprint({"a": 2})
@@ -0,0 +1,138 @@
+import functools
+import json
+import warnings
+
+import pytest
+
+from jsj_ratelimit import create_rate_limiter
+from jsj_store import ProjectStore
+
+with warnings.catch_warnings():
+    # google-generativeai avisa que está descontinuado ao ser importado
+    warnings.simplefilter("ignore", FutureWarning)
+    import jsj_cli
+    from jsj_core import COLUNAS_NORMALIZADAS
+
+
+def _lisp_json(folder, name, drawings):
+    data = [
+        {"atributos": {"DES_NUM": num, "TITULO": title, "TIPO": "PLANTA"}, "layout_tab": f"L{i}", "handle_bloco": f"{i:X}"}
+        for i, (num, title) in enumerate(drawings, 1)
+    ]
+    (folder / name).write_text(json.dumps(data), encoding="utf-8")
+
+
+@pytest.fixture
+def env(tmp_path, monkeypatch):
+    """Sem API key, store e rate limiter temporários (nada escrito em ~/.jsj_parser)."""
+    store = ProjectStore(str(tmp_path / "projects.sqlite"))
+    monkeypatch.setattr(jsj_cli, "get_project_store", lambda: store)
+    monkeypatch.setattr(jsj_cli, "create_rate_limiter", functools.partial(create_rate_limiter, path=None))
+    monkeypatch.delenv("GEMINI_API_KEY", raising=False)
+    monkeypatch.delenv("GOOGLE_API_KEY", raising=False)
+    return store
+
+
+def _csv_des_nums(path):
+    header, *rows = path.read_text(encoding="utf-8-sig").splitlines()
+    column = header.split(";").index("DES_NUM")
+    assert header.split(";") == COLUNAS_NORMALIZADAS
+    return [row.split(";")[column] for row in rows]
+
+
+def test_find_project_files(tmp_path):
+    (tmp_path / "sub").mkdir()
+    for name in ("b.pdf", "a.JSON", "notas.txt", "sub/c.pdf"):
+        (tmp_path / name).write_bytes(b"")
+    assert [p.split("/")[-1] for p in jsj_cli.find_project_files(str(tmp_path))] == ["a.JSON", "b.pdf"]
+    assert [p.split("/")[-1] for p in jsj_cli.find_project_files(str(tmp_path), recursive=True)] == ["a.JSON", "b.pdf", "c.pdf"]
+
+
+def test_folder_to_csv(tmp_path, env):
+    project = tmp_path / "2024-015"
+    project.mkdir()
+    _lisp_json(project, "a.dwg.jsj.json", [("EST-10", "Corte"), ("EST-2", "Planta")])
+    out = tmp_path / "out"
+
+    status = jsj_cli.main([str(project), "--no-cache", "--format", "csv", "-o", str(out), "--proj-num", "2024-015"])
+    assert status == 0
+    assert _csv_des_nums(out / "2024-015-LD.csv") == ["EST-2", "EST-10"]
+    assert "2024-015" in (out / "2024-015-LD.csv").read_text(encoding="utf-8-sig")
+
+
+def test_project_reprocesses_only_changed_sheets(tmp_path, env, monkeypatch):
+    project = tmp_path / "obra"
+    project.mkdir()
+    _lisp_json(project, "a.dwg.jsj.json", [("EST-1", "Planta"), ("EST-2", "Corte")])
+    args = [str(project), "--no-cache", "--format", "csv", "--project", "P1"]
+
+    assert jsj_cli.main(args) == 0
+    assert env.count("P1") == 2
+
+    processed = []
+    process_file = jsj_cli.process_file
+
+    def tracking(path, options):
+        result = process_file(path, options)
+        processed.append(len(result[1]))
+        return result
+
+    monkeypatch.setattr(jsj_cli, "process_file", tracking)
+    _lisp_json(project, "a.dwg.jsj.json", [("EST-1", "Planta"), ("EST-2", "Corte AA")])
+    assert jsj_cli.main(args) == 0
+    assert processed == [1]
+    assert env.count("P1") == 2
+    assert sorted(r["TITULO"] for r in env.load("P1")) == ["Corte AA", "Planta"]
+    assert sorted(_csv_des_nums(project / "P1-LD.csv")) == ["EST-1", "EST-2"]
+
+
+def test_project_keys_sheets_by_relative_path(tmp_path, env):
+    project = tmp_path / "obra"
+    for sub, num in (("a", "EST-1"), ("b", "EST-2")):
+        (project / sub).mkdir(parents=True)
+        _lisp_json(project / sub, "PLANTA.dwg.jsj.json", [(num, "Planta")])
+    args = [str(project), "-r", "--no-cache", "--format", "csv", "--project", "P1"]
+
+    assert jsj_cli.main(args) == 0
+    assert sorted(r["DES_NUM"] for r in env.load("P1")) == ["EST-1", "EST-2"]
+    assert sorted(env.sheet_fingerprints("P1")) == ["a/PLANTA.dwg.jsj.json#L1#1", "b/PLANTA.dwg.jsj.json#L1#1"]
+
+    # Bloco removido de b/: sai da Lista Mestra; a/ fica intacto
+    (project / "b" / "PLANTA.dwg.jsj.json").write_text("[]", encoding="utf-8")
+    assert jsj_cli.main(args) == 0
+    assert [r["DES_NUM"] for r in env.load("P1")] == ["EST-1"]
+
+
+def test_failing_file_does_not_abort_the_run(tmp_path, env, monkeypatch):
+    project = tmp_path / "obra"
+    project.mkdir()
+    _lisp_json(project, "a.dwg.jsj.json", [("EST-1", "Planta")])
+    _lisp_json(project, "b.dwg.jsj.json", [("EST-2", "Corte")])
+    process_file = jsj_cli.process_file
+
+    def failing(path, options):
+        if path.endswith("a.dwg.jsj.json"):
+            raise RuntimeError("ficheiro corrompido")
+        return process_file(path, options)
+
+    monkeypatch.setattr(jsj_cli, "process_file", failing)
+    status = jsj_cli.main([str(project), "--no-cache", "--format", "csv", "-o", str(tmp_path / "out")])
+    # O ficheiro falhado conta como erro; o resto é exportado
+    assert status == 1
+    assert _csv_des_nums(tmp_path / "out" / "obra-LD.csv") == ["EST-2"]
+
+
+def test_export_projects(tmp_path, env, monkeypatch):
+    env.append("A", [{"DES_NUM": "EST-2", "TIPO": "PLANTA"}])
+    env.append("B", [{"DES_NUM": "EST-1", "TIPO": "PLANTA"}])
+    monkeypatch.chdir(tmp_path)
+    assert jsj_cli.main(["--export-projects", "A", "B", "--format", "csv"]) == 0
+    assert _csv_des_nums(tmp_path / "A-B-LD.csv") == ["EST-1", "EST-2"]
+
+
+def test_argument_errors(tmp_path, env):
+    with pytest.raises(SystemExit):
+        jsj_cli.main([])
+    with pytest.raises(SystemExit):
+        jsj_cli.main([str(tmp_path), str(tmp_path), "--project", "P1"])
+    assert jsj_cli.main([str(tmp_path / "nao-existe")]) == 2
@@ -0,0 +1,126 @@
+import pytest
+
+import jsj_dwg
+from jsj_dwg import DWG_SUPPORT, DwgSession, extract_dwg_native_blocks, get_dwg_layouts, native_fields, normalize_date
+
+ezdxf = pytest.importorskip("ezdxf")
+
+
+# --- Mapeamento dos atributos ---
+
+def test_every_field_from_one_attribute_dict():
+    data = native_fields({
+        "Título": "Planta piso 1", "DES_NUM": " 001 ", "PFIX": "EST", "Dono_Obra": "arcaya",
+        "LOCAL": "Lisboa", "AUTOR": "JSJ", "DATA": "2025.01.10", "TIPO": "PLANTA",
+        "REV_A": "A", "DATA_A": "2025.02.11", "DESC_A": "Emissão",
+        "REV_B": "B", "DATA_B": "12/03/2025", "DESC_B": "Revisão geral",
+    }, layout="Layout1", handle="2F")
+
+    assert (data["titulo"], data["num_desenho"], data["pfix"]) == ("Planta piso 1", "001", "EST")
+    assert (data["cliente"], data["localizacao"], data["projetou"]) == ("arcaya", "Lisboa", "JSJ")
+    assert data["primeira_emissao"] == "10/01/2025"
+    assert (data["rev_a"], data["data_a"], data["desc_a"]) == ("A", "11/02/2025", "Emissão")
+    assert (data["revisao"], data["data_revisao"], data["desc_revisao"]) == ("B", "12/03/2025", "Revisão geral")
+    assert (data["layout"], data["id_cad"]) == ("Layout1", "2F")
+    assert data["rev_e"] == "" and data["fase"] == ""
+
+
+def test_alias_priority_and_empty_values():
+    data = native_fields({"CLIENTE": "", "DONO_OBRA": "arcaya", "ID_CAD": "99"}, handle="2F")
+    assert data["cliente"] == "arcaya"
+    assert data["id_cad"] == "99"
+
+
+def test_r_tag_overrides_the_last_revision():
+    data = native_fields({"REV_A": "A", "DATA_A": "01/01/2025", "REV_B": "B", "R": "A"})
+    assert (data["revisao"], data["data_revisao"]) == ("A", "01/01/2025")
+    assert native_fields({"R": "0"})["data_revisao"] == ""
+
+
+@pytest.mark.parametrize("value, expected", [
+    ("2025.01.10", "10/01/2025"),
+    ("10.01.2025", "10.01.2025"),
+    ("10/01/2025", "10/01/2025"),
+    ("", ""),
+])
+def test_normalize_date(value, expected):
+    assert normalize_date(value) == expected
+
+
+# --- Extração nativa de um DXF ---
+
+@pytest.fixture
+def dxf_path(tmp_path):
+    doc = ezdxf.new()
+    for name in ("LEGENDA_JSJ_V1", "LEGENDA_OUTRA", "CARIMBO"):
+        block = doc.blocks.new(name)
+        block.add_attdef("DES_NUM", (0, 0))
+        block.add_attdef("TITULO", (0, 10))
+
+    layout = doc.layouts.get("Layout1")
+    jsj = layout.add_blockref("LEGENDA_JSJ_V1", (0, 0))
+    jsj.add_attrib("DES_NUM", "001", (0, 0))
+    jsj.add_attrib("TITULO", "Planta", (0, 10))
+    # Bloco JSJ vazio: aceite (o Gemini não teria mais informação)
+    layout.add_blockref("LEGENDA_JSJ_V1", (500, 0))
+    # Outro bloco LEGENDA vazio: ignorado
+    layout.add_blockref("LEGENDA_OUTRA", (900, 0))
+    # Bloco sem LEGENDA no nome: não é uma legenda
+    other = layout.add_blockref("CARIMBO", (0, 500))
+    other.add_attrib("DES_NUM", "999", (0, 500))
+
+    path = tmp_path / "a.dxf"
+    doc.saveas(path)
+    return str(path)
+
+
+@pytest.mark.skipif(not DWG_SUPPORT, reason="ezdxf/matplotlib não instalados")
+def test_extract_native_blocks(dxf_path):
+    blocks = extract_dwg_native_blocks(dxf_path, "Layout1")
+    assert [block["num_desenho"] for block in blocks] == ["001", "N/A"]
+    assert blocks[0]["titulo"] == "Planta"
+    assert blocks[1]["titulo"] == "Sem título"
+    assert all(block["layout"] == "Layout1" and block["id_cad"] for block in blocks)
+    assert blocks[0]["obs"] == "Extração nativa (zero custo)"
+
+
+@pytest.mark.skipif(not DWG_SUPPORT, reason="ezdxf/matplotlib não instalados")
+def test_layout_without_legenda(dxf_path):
+    assert extract_dwg_native_blocks(dxf_path, "Model") == []
+    assert extract_dwg_native_blocks(dxf_path, "Inexistente") == []
+
+
+# --- Sessão DWG (um parse por ficheiro) ---
+
+@pytest.mark.skipif(not DWG_SUPPORT, reason="ezdxf/matplotlib não instalados")
+def test_session_indexes_inserts_per_layout(dxf_path):
+    session = DwgSession(dxf_path)
+    assert session.paperspace_layouts() == ["Layout1"]
+    assert len(session.inserts("Layout1")) == 4
+    assert len(session.legenda_inserts("Layout1")) == 3
+    assert len(session.inserts_by_block("legenda_jsj_v1")) == 2
+    assert session.inserts("Model") == []
+    assert session.get_layout("Model") is session.doc.modelspace()
+    with pytest.raises(KeyError):
+        session.get_layout("Inexistente")
+
+
+@pytest.mark.skipif(not DWG_SUPPORT, reason="ezdxf/matplotlib não instalados")
+def test_file_is_parsed_once_per_session(dxf_path, monkeypatch):
+    calls = []
+    readfile = ezdxf.readfile
+
+    def counting_readfile(path, *args, **kwargs):
+        calls.append(path)
+        return readfile(path, *args, **kwargs)
+
+    monkeypatch.setattr(jsj_dwg.ezdxf, "readfile", counting_readfile)
+    session = DwgSession(dxf_path)
+    for layout in get_dwg_layouts(session):
+        extract_dwg_native_blocks(session, layout)
+        session.layout_fingerprint(layout)
+    assert calls == [dxf_path]
+
+    # Um caminho em vez da sessão continua a funcionar (um parse por chamada)
+    assert get_dwg_layouts(dxf_path) == ["Layout1"]
+    assert len(calls) == 2
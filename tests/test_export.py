@@ -0,0 +1,159 @@
+import io
+import threading
+import time
+import warnings
+import zipfile
+
+import pandas as pd
+import pytest
+
+from jsj_store import ProjectStore
+
+with warnings.catch_warnings():
+    # google-generativeai avisa que está descontinuado ao ser importado
+    warnings.simplefilter("ignore", FutureWarning)
+    from jsj_core import COLUNAS_NORMALIZADAS
+    from jsj_export import ExportCache, export_records, write_csv_stream, write_xlsx_stream
+
+
+@pytest.fixture
+def df():
+    return pd.DataFrame({"DES_NUM": ["EST-1", "EST-2"], "TIPO": ["PLANTA", "CORTE"], "_sheet": ["a", "b"]})
+
+
+class CountingBuilder:
+    def __init__(self, delay=0.0):
+        self.calls = 0
+        self.delay = delay
+
+    def __call__(self, df):
+        self.calls += 1
+        time.sleep(self.delay)
+        return f"{len(df)}:{self.calls}".encode()
+
+
+def test_same_revision_is_built_once(df):
+    cache, builder = ExportCache(), CountingBuilder()
+    first = cache.get("own", df, "P1", (2, 7), builder=builder)
+    assert cache.get("own", df, "P1", (2, 7), builder=builder) is first
+    assert builder.calls == 1 and cache.builds == 1
+
+
+def test_revision_order_and_format_are_part_of_the_key(df):
+    cache, builder = ExportCache(), CountingBuilder()
+    cache.get("own", df, "P1", (2, 7), builder=builder)
+    cache.get("own", df, "P1", (3, 8), builder=builder)
+    cache.get("own", df, "P1", (3, 8), order=["CORTE"], builder=builder)
+    cache.get("other", df, "P1", (3, 8), order=["CORTE"], builder=builder)
+    cache.get("own", df, "P2", (2, 7), builder=builder)
+    assert builder.calls == 5
+
+
+def test_lazy_builds_only_when_called(df):
+    cache, builder = ExportCache(), CountingBuilder()
+    download = cache.lazy("own", df, "P1", (2, 7), builder=builder)
+    assert builder.calls == 0
+    assert download() == b"2:1"
+    assert download() == b"2:1"
+    assert builder.calls == 1
+
+
+def test_entries_are_bounded(df):
+    cache, builder = ExportCache(max_entries=2), CountingBuilder()
+    for revision in range(3):
+        cache.get("own", df, "P1", (revision, revision), builder=builder)
+    cache.get("own", df, "P1", (0, 0), builder=builder)
+    assert builder.calls == 4
+
+    cache.clear()
+    cache.get("own", df, "P1", (2, 2), builder=builder)
+    assert builder.calls == 5
+
+
+def test_concurrent_requests_share_one_build(df):
+    cache, builder = ExportCache(), CountingBuilder(delay=0.05)
+    results = []
+    threads = [
+        threading.Thread(target=lambda: results.append(cache.get("own", df, "P1", (2, 7), builder=builder)))
+        for _ in range(4)
+    ]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert builder.calls == 1
+    assert len(set(results)) == 1
+
+
+def test_csv_from_dataframe_has_the_normalized_columns(df):
+    data = ExportCache().get("csv", df, "P1", (2, 7))
+    assert data.startswith(b"\xef\xbb\xbf")
+    header, *rows = data.decode("utf-8-sig").splitlines()
+    assert header.split(";")[:3] == ["PROJ_NUM", "PROJ_NOME", "CLIENTE"]
+    assert "_sheet" not in header
+    assert len(rows) == 2
+
+
+def test_csv_from_store_follows_the_requested_order(tmp_path, df):
+    store = ProjectStore(str(tmp_path / "projects.sqlite"))
+    store.append("P1", df.drop(columns="_sheet").to_dict("records"))
+    cache = ExportCache()
+
+    data = cache.get("csv", df, "P1", store.revision("P1"), order=["PLANTA"], store=store)
+    header, *rows = data.decode("utf-8-sig").splitlines()
+    column = header.split(";").index("DES_NUM")
+    assert [row.split(";")[column] for row in rows] == ["EST-1", "EST-2"]
+    assert cache.get("csv", df, "P1", store.revision("P1"), order=["PLANTA"], store=store) is data
+
+
+# --- Exportação em streaming ---
+
+def _records(n):
+    return ({"DES_NUM": f"EST-{i}", "TITULO": f"Desenho {i}", "TIPO": "PLANTA", "_sheet": "x"} for i in range(n))
+
+
+def test_csv_stream_in_chunks_keeps_the_caller_stream_open():
+    output = io.BytesIO()
+    assert write_csv_stream(_records(7), output, chunk_rows=3) == 7
+    assert not output.closed
+
+    header, *rows = output.getvalue().decode("utf-8-sig").splitlines()
+    assert header.split(";") == COLUNAS_NORMALIZADAS
+    assert len(rows) == 7
+    assert rows[6].split(";")[COLUNAS_NORMALIZADAS.index("DES_NUM")] == "EST-6"
+
+
+def test_csv_stream_to_path(tmp_path):
+    path = tmp_path / "lista.csv"
+    assert write_csv_stream(_records(2), str(path)) == 2
+    assert path.read_bytes().startswith(b"\xef\xbb\xbf")
+
+
+def test_xlsx_stream():
+    output = io.BytesIO()
+    assert write_xlsx_stream(_records(5), output) == 5
+    with zipfile.ZipFile(io.BytesIO(output.getvalue())) as xlsx:
+        sheet = xlsx.read("xl/worksheets/sheet1.xml").decode("utf-8")
+        workbook = xlsx.read("xl/workbook.xml").decode("utf-8")
+    assert "Lista Mestra JSJ" in workbook
+    assert "EST-4" in sheet and "_sheet" not in sheet
+    assert sheet.count("<row ") == 6
+
+
+def test_empty_export():
+    output = io.BytesIO()
+    assert write_csv_stream(iter(()), output) == 0
+    assert output.getvalue().decode("utf-8-sig").splitlines() == [";".join(COLUNAS_NORMALIZADAS)]
+    assert write_xlsx_stream(iter(()), io.BytesIO()) == 0
+
+
+def test_export_records_of_several_projects(tmp_path):
+    store = ProjectStore(str(tmp_path / "projects.sqlite"))
+    store.append("A", [{"DES_NUM": "EST-10", "TIPO": "PLANTA"}, {"DES_NUM": "EST-1", "TIPO": "CORTE"}])
+    store.append("B", [{"DES_NUM": "EST-2", "TIPO": "PLANTA"}])
+
+    output = io.BytesIO()
+    assert export_records(store, ["A", "B"], "csv", output, tipo_order=["PLANTA"]) == 3
+    column = COLUNAS_NORMALIZADAS.index("DES_NUM")
+    rows = output.getvalue().decode("utf-8-sig").splitlines()[1:]
+    assert [row.split(";")[column] for row in rows] == ["EST-2", "EST-10", "EST-1"]
@@ -0,0 +1,97 @@
+import threading
+import warnings
+
+import pytest
+
+with warnings.catch_warnings():
+    # google-generativeai avisa que está descontinuado ao ser importado
+    warnings.simplefilter("ignore", FutureWarning)
+    genai = pytest.importorskip("google.generativeai")
+    import jsj_gemini
+    from jsj_gemini import GeminiClientPool, get_api_executor, get_client_pool
+
+
+def test_one_model_per_api_key_and_model():
+    pool = GeminiClientPool()
+    model = pool.model("key-1", "gemini-2.5-flash")
+    assert pool.model("key-1", "gemini-2.5-flash") is model
+    assert pool.model("key-1", "gemini-2.0-flash") is not model
+    assert pool.model("key-2", "gemini-2.5-flash") is not model
+    assert pool.created == 3
+
+
+def test_models_of_one_api_key_share_the_client():
+    pool = GeminiClientPool()
+    a = pool.model("key-1", "gemini-2.5-flash")
+    b = pool.model("key-1", "gemini-2.0-flash")
+    c = pool.model("key-2", "gemini-2.5-flash")
+    assert a._client is b._client
+    assert a._client is not c._client
+
+
+def test_concurrent_first_use_creates_one_model():
+    pool = GeminiClientPool()
+    models = []
+    threads = [threading.Thread(target=lambda: models.append(pool.model("key", "gemini-2.5-flash"))) for _ in range(8)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert pool.created == 1
+    assert all(model is models[0] for model in models)
+
+
+def test_installed_sdk_sends_requests_through_the_injected_client():
+    # Falha se uma atualização do SDK deixar de ler GenerativeModel._client
+    glm = pytest.importorskip("google.ai.generativelanguage")
+    requests = []
+
+    class Client:
+        def generate_content(self, request, **kwargs):
+            requests.append(request)
+            return glm.GenerateContentResponse(candidates=[
+                {"content": {"parts": [{"text": "ok"}], "role": "model"}, "finish_reason": 1}
+            ])
+
+    pool = GeminiClientPool()
+    model = pool.model("key", "gemini-2.5-flash")
+    assert pool.injected, f"google-generativeai {genai.__version__} sem GenerativeModel._client"
+    model._client = Client()
+
+    assert model.generate_content("olá").text == "ok"
+    assert len(requests) == 1
+    assert requests[0].model == "models/gemini-2.5-flash"
+
+
+def test_sdk_without_private_client_falls_back_to_configure(monkeypatch, caplog):
+    configured = []
+
+    class Model:
+        def __init__(self, name):
+            self.name = name
+
+    monkeypatch.setattr(jsj_gemini.genai, "GenerativeModel", Model)
+    monkeypatch.setattr(jsj_gemini.genai, "configure", lambda api_key: configured.append(api_key))
+    pool = GeminiClientPool()
+    model = pool.model("key", "gemini-2.5-flash")
+    pool.model("key", "gemini-2.0-flash")
+    assert not hasattr(model, "_client")
+    assert configured == ["key", "key"]
+    assert not pool.injected
+    # Um só erro por pool, bem visível
+    assert [r.levelname for r in caplog.records if "_client" in r.getMessage()] == ["ERROR"]
+
+
+def test_clear():
+    pool = GeminiClientPool()
+    model = pool.model("key", "gemini-2.5-flash")
+    pool.clear()
+    assert pool.model("key", "gemini-2.5-flash") is not model
+
+
+def test_process_wide_pool_and_executor():
+    assert get_client_pool() is get_client_pool()
+    executor = get_api_executor()
+    assert get_api_executor() is executor
+    assert executor._max_workers == jsj_gemini.MAX_API_WORKERS
+    assert executor.submit(lambda: threading.current_thread().name).result().startswith("jsj-gemini")
@@ -0,0 +1,79 @@
+import pickle
+
+import fitz
+import pytest
+from PIL import Image
+
+from jsj_imageprep import (
+    DEFAULT_MAX_DPI, DEFAULT_MIN_DPI, PDF_DPI, EncodedImage, choose_zoom, estimate_image_tokens, image_options,
+    prepare_image, prepare_pixmap,
+)
+
+
+def test_image_options():
+    options = image_options(color="gray", quality=None)
+    assert options["color"] == "gray" and options["quality"] == 85
+    with pytest.raises(ValueError):
+        image_options(color="sepia")
+    with pytest.raises(ValueError):
+        image_options(format="tiff")
+
+
+def test_estimate_image_tokens():
+    assert estimate_image_tokens(384, 384) == 258
+    assert estimate_image_tokens(768, 385) == 258
+    assert estimate_image_tokens(1536, 769) == 258 * 4
+
+
+def test_small_crop_keeps_max_resolution():
+    # Legenda de ~18 x 8 cm
+    assert choose_zoom(500, 230) == pytest.approx(DEFAULT_MAX_DPI / PDF_DPI)
+
+
+def test_large_crop_fits_budget_down_to_min_resolution():
+    options = image_options(pixel_budget_mp=1.5)
+    zoom = choose_zoom(1190, 421, options)
+    assert DEFAULT_MIN_DPI / PDF_DPI <= zoom < DEFAULT_MAX_DPI / PDF_DPI
+    assert 1190 * zoom * 421 * zoom == pytest.approx(1.5e6, rel=0.01)
+    # Página A0 inteira: nunca abaixo do mínimo legível
+    assert choose_zoom(3370, 2384, options) == pytest.approx(DEFAULT_MIN_DPI / PDF_DPI)
+
+
+@pytest.mark.parametrize("color, fmt, mode, mime", [
+    ("rgb", "png", "RGB", "image/png"),
+    ("gray", "png", "L", "image/png"),
+    ("1bit", "png", "1", "image/png"),
+    ("1bit", "jpeg", "L", "image/jpeg"),
+    ("rgb", "webp", "RGB", "image/webp"),
+])
+def test_prepare_image_modes_and_formats(color, fmt, mode, mime):
+    encoded = prepare_image(Image.new("RGB", (64, 32), "white"), image_options(color=color, format=fmt))
+    assert (encoded.mode, encoded.mime_type, encoded.size) == (mode, mime, (64, 32))
+    assert encoded.to_pil().size == (64, 32)
+    assert encoded.to_part() == {"mime_type": mime, "data": encoded.data}
+
+
+def test_prepare_image_fits_pixel_budget():
+    options = image_options(pixel_budget_mp=0.01)
+    encoded = prepare_image(Image.new("RGB", (400, 100)), options)
+    width, height = encoded.size
+    assert width * height <= 10_000 and width / height == pytest.approx(4, rel=0.05)
+    assert prepare_image(Image.new("RGB", (400, 100)), options, fit_budget=False).size == (400, 100)
+
+
+def test_prepare_pixmap():
+    doc = fitz.open()
+    page = doc.new_page(width=100, height=50)
+    pix = page.get_pixmap(colorspace=fitz.csGRAY)
+    encoded = prepare_pixmap(pix, image_options(color="gray"))
+    assert (encoded.mime_type, encoded.mode, encoded.size) == ("image/png", "L", (100, 50))
+
+    encoded = prepare_pixmap(page.get_pixmap(), image_options(format="jpeg"))
+    assert encoded.mime_type == "image/jpeg" and encoded.size == (100, 50)
+    doc.close()
+
+
+def test_encoded_image_is_picklable():
+    encoded = EncodedImage(b"abc", "image/png", (800, 400), "L")
+    copy = pickle.loads(pickle.dumps(encoded))
+    assert (copy.data, copy.size, len(copy), copy.tokens) == (b"abc", (800, 400), 3, 258 * 2)
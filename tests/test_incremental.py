@@ -0,0 +1,183 @@
+import warnings
+
+import ezdxf
+import fitz
+import pytest
+
+from jsj_store import ProjectStore
+
+with warnings.catch_warnings():
+    # google-generativeai avisa que está descontinuado ao ser importado
+    warnings.simplefilter("ignore", FutureWarning)
+    from jsj_core import build_record, iter_file_tasks, iter_lisp_json_tasks
+    from jsj_dwg import DwgSession
+
+
+@pytest.fixture
+def store(tmp_path):
+    return ProjectStore(str(tmp_path / "projects.sqlite"))
+
+
+def _record(des_num, sheet, fingerprint, **extra):
+    return {"DES_NUM": des_num, "TIPO": "PLANTA", "_sheet": sheet, "_fingerprint": fingerprint, **extra}
+
+
+def _known(tasks):
+    return {task["sheet"]: task["fingerprint"] for task in tasks}
+
+
+# --- ProjectStore.merge ---
+
+def test_merge_replaces_the_drawings_of_reprocessed_sheets(store):
+    store.merge("P1", [_record("EST-1", "a.pdf#1", "f1"), _record("EST-2", "a.pdf#2", "f2")])
+    count, replaced = store.merge("P1", [_record("EST-1", "a.pdf#1", "f1b")])
+
+    assert (count, replaced) == (1, 1)
+    assert sorted(r["DES_NUM"] for r in store.load("P1")) == ["EST-1", "EST-2"]
+    assert store.sheet_fingerprints("P1") == {"a.pdf#1": "f1b", "a.pdf#2": "f2"}
+
+
+def test_merge_does_not_remember_failed_sheets(store):
+    store.merge("P1", [_record("EST-1", "a.pdf#1", "f1", _obs="Erro: quota excedida")])
+    assert store.sheet_fingerprints("P1") == {}
+    assert store.count("P1") == 1
+
+
+def test_merge_without_sheets_only_appends(store):
+    store.append("P1", [{"DES_NUM": "EST-1"}])
+    assert store.merge("P1", [{"DES_NUM": "EST-2"}]) == (1, 0)
+    assert store.count("P1") == 2
+    assert store.merge("P1", []) == (0, 0)
+
+
+def test_merge_drops_sheets_removed_from_their_source(store):
+    store.merge("P1", [_record("EST-1", "a.pdf#1", "f1"), _record("EST-2", "a.pdf#2", "f2"),
+                       _record("EST-9", "b.pdf#1", "f9")])
+    # a.pdf relido só com a página 1 (inalterada): a página 2 sai; b.pdf não foi lido
+    count, removed = store.merge("P1", [], {"a.pdf": {"a.pdf#1"}})
+
+    assert (count, removed) == (0, 1)
+    assert sorted(r["DES_NUM"] for r in store.load("P1")) == ["EST-1", "EST-9"]
+    assert store.sheet_fingerprints("P1") == {"a.pdf#1": "f1", "b.pdf#1": "f9"}
+
+
+def test_merge_keeps_failed_sheets_of_a_source(store):
+    store.merge("P1", [_record("EST-1", "a.pdf#1", "f1", _obs="Erro: quota excedida")])
+    store.merge("P1", [_record("EST-1", "a.pdf#1", "f1", _obs="Erro: quota excedida")], {"a.pdf": {"a.pdf#1"}})
+    assert store.count("P1") == 1
+
+
+def test_clear_forgets_fingerprints(store):
+    store.merge("P1", [_record("EST-1", "a.pdf#1", "f1")])
+    store.clear("P1")
+    assert store.sheet_fingerprints("P1") == {}
+
+
+def test_build_record_carries_the_sheet():
+    task = {"native_data": {"num_desenho": "EST-1"}, "is_native": True, "display_name": "a.dxf",
+            "batch_type": "", "sheet": "a.dxf#Layout1", "fingerprint": "abc"}
+    record, _ = build_record(task, None, {})
+    assert (record["_sheet"], record["_fingerprint"]) == ("a.dxf#Layout1", "abc")
+
+
+# --- PDF ---
+
+def _pdf(texts):
+    doc = fitz.open()
+    for text in texts:
+        page = doc.new_page(width=1190, height=842)
+        page.insert_text((100, 100), text)
+    data = doc.tobytes()
+    doc.close()
+    return data
+
+
+def test_unchanged_pdf_pages_are_skipped():
+    first = list(iter_file_tasks("a.pdf", _pdf(["um", "dois"]), use_text_layer=False))
+    assert [task["sheet"] for task in first] == ["a.pdf#1", "a.pdf#2"]
+
+    known = _known(first)
+    assert list(iter_file_tasks("a.pdf", _pdf(["um", "dois"]), use_text_layer=False, known_sheets=known)) == []
+
+    changed = list(iter_file_tasks("a.pdf", _pdf(["um", "DOIS"]), use_text_layer=False, known_sheets=known))
+    assert [task["sheet"] for task in changed] == ["a.pdf#2"]
+
+
+def test_sheet_index_lists_every_current_page():
+    index = {}
+    known = _known(iter_file_tasks("a.pdf", _pdf(["um", "dois"]), use_text_layer=False, sheet_prefix="obra/a.pdf"))
+    tasks = list(iter_file_tasks("a.pdf", _pdf(["um"]), use_text_layer=False, known_sheets=known,
+                                 sheet_prefix="obra/a.pdf", sheet_index=index))
+    assert tasks == []
+    assert index == {"obra/a.pdf": {"obra/a.pdf#1"}}
+
+
+def test_unreadable_file_is_not_indexed():
+    index = {}
+    assert list(iter_file_tasks("a.pdf", b"nao e um pdf", sheet_index=index)) == []
+    assert list(iter_file_tasks("a.json", b'{"outro": 1}', sheet_index=index)) == []
+    assert index == {}
+
+
+# --- DWG/DXF ---
+
+def _dxf(path, legenda_title="Planta", extra_line=False):
+    doc = ezdxf.new()
+    block = doc.blocks.new("LEGENDA_JSJ_V1")
+    block.add_attdef("DES_NUM", (0, 0))
+    block.add_attdef("TITULO", (0, 10))
+    block.add_line((0, 0), (100, 0))
+
+    with_legenda = doc.layouts.get("Layout1")
+    insert = with_legenda.add_blockref("LEGENDA_JSJ_V1", (10, 10))
+    insert.add_attrib("DES_NUM", "EST-001", (10, 10))
+    insert.add_attrib("TITULO", legenda_title, (10, 20))
+
+    without_legenda = doc.layouts.new("Layout2")
+    without_legenda.add_line((0, 0), (50, 50))
+    if extra_line:
+        without_legenda.add_line((50, 50), (80, 10))
+    doc.saveas(path)
+    return str(path)
+
+
+def test_unchanged_dwg_layouts_are_skipped(tmp_path):
+    path = _dxf(tmp_path / "a.dxf")
+    first = list(iter_file_tasks("a.dxf", path))
+    assert {task["sheet"] for task in first} == {"a.dxf#Layout1", "a.dxf#Layout2"}
+    assert [task["is_native"] for task in first] == [True, False]
+
+    # Mesmo desenho gravado de novo: nada a reprocessar
+    again = _dxf(tmp_path / "b.dxf")
+    assert list(iter_file_tasks("a.dxf", again, known_sheets=_known(first))) == []
+
+    retitled = _dxf(tmp_path / "c.dxf", legenda_title="Corte")
+    assert [task["sheet"] for task in iter_file_tasks("a.dxf", retitled, known_sheets=_known(first))] == ["a.dxf#Layout1"]
+
+    redrawn = _dxf(tmp_path / "d.dxf", extra_line=True)
+    assert [task["sheet"] for task in iter_file_tasks("a.dxf", redrawn, known_sheets=_known(first))] == ["a.dxf#Layout2"]
+
+
+def test_layout_fingerprint_follows_block_definitions(tmp_path):
+    a = DwgSession(_dxf(tmp_path / "a.dxf"))
+    b = DwgSession(_dxf(tmp_path / "b.dxf"))
+    assert a.layout_fingerprint("Layout1") == b.layout_fingerprint("Layout1")
+    assert a.layout_fingerprint("Layout1") != a.layout_fingerprint("Layout2")
+
+    b.doc.blocks.get("LEGENDA_JSJ_V1").add_circle((0, 0), 5)
+    assert a.layout_fingerprint("Layout1") != b.layout_fingerprint("Layout1")
+
+
+# --- JSON da LISP ---
+
+def test_unchanged_lisp_blocks_are_skipped():
+    data = [
+        {"atributos": {"DES_NUM": "EST-001", "TITULO": "Planta"}, "layout_tab": "L1", "handle_bloco": "1A"},
+        {"atributos": {"DES_NUM": "EST-002", "TITULO": "Corte"}, "layout_tab": "L2", "handle_bloco": "1B"},
+    ]
+    first = list(iter_lisp_json_tasks(data, "a.dwg.jsj.json"))
+    assert len(first) == 2
+
+    data[1]["atributos"]["TITULO"] = "Corte AA"
+    changed = list(iter_lisp_json_tasks(data, "a.dwg.jsj.json", known_sheets=_known(first)))
+    assert [task["native_data"]["num_desenho"] for task in changed] == ["EST-002"]
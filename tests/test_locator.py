@@ -0,0 +1,110 @@
+import fitz
+import pytest
+
+from jsj_locator import REV_ANCHORS, REV_HEADER_WORDS, TitleBlockLocator, _anchor_hits, _page_words, find_title_block
+
+FRAME = fitz.Rect(800, 540, 1170, 822)
+
+
+def _page(doc, frame=True, anchors=True, size=(1190, 842), offset=0):
+    page = doc.new_page(width=size[0], height=size[1])
+    # Moldura da folha (maior que MAX_FRAME_FRACTION: nunca é a legenda)
+    page.draw_rect(fitz.Rect(20, 20, size[0] - 20, size[1] - 20))
+    box = FRAME + (offset, 0, offset, 0)
+    if frame:
+        page.draw_rect(box)
+    if anchors:
+        page.insert_text((box.x0 + 20, box.y0 + 30), "REV", fontsize=7)
+        page.insert_text((box.x0 + 20, box.y1 - 30), "Nº DESENHO", fontsize=7)
+        page.insert_text((box.x0 + 120, box.y1 - 30), "EST-001", fontsize=9)
+    return page
+
+
+def test_frame_around_the_anchors_is_found():
+    doc = fitz.open()
+    rect, template = find_title_block(_page(doc))
+    assert template == "Nº DESENHO|REV"
+    assert rect.contains(FRAME)
+    # Só a margem à volta da moldura, não a folha inteira
+    assert rect.width < FRAME.width * 1.1 and rect.height < FRAME.height * 1.1
+
+
+def test_notes_near_the_number_are_not_rev_headers():
+    doc = fitz.open()
+    page = _page(doc)
+    # Notas do desenho mais perto do "Nº DESENHO" do que o verdadeiro cabeçalho REV
+    page.insert_text((FRAME.x0 - 120, FRAME.y1 - 30), "REVESTIMENTO CERÂMICO", fontsize=7)
+    page.insert_text((FRAME.x0 - 120, FRAME.y1 - 50), "REVISÃO GERAL", fontsize=7)
+    rect, template = find_title_block(page)
+    assert template == "Nº DESENHO|REV"
+    assert rect.contains(FRAME) and rect.width < FRAME.width * 1.1
+
+
+def test_rev_anchor_matches_whole_header_words_only():
+    doc = fitz.open()
+    page = doc.new_page(width=600, height=400)
+    for y, text in enumerate(["REVESTIMENTO", "REVISÃO GERAL", "Rev.", "REV. DATA DESCRIÇÃO", "PREV"]):
+        page.insert_text((50, 50 + 40 * y), text, fontsize=10)
+    words = _page_words(page)
+    hits = [hit for anchor in REV_ANCHORS for hit in _anchor_hits(words, anchor, REV_HEADER_WORDS)]
+    # Só "Rev." (linha 2) e a linha de cabeçalhos da tabela (linha 3)
+    assert sorted(int((hit.y1 - 50) // 40) for hit in hits) == [2, 3]
+
+
+def test_without_frame_goes_to_the_bottom_right_corner():
+    doc = fitz.open()
+    page = _page(doc, frame=False)
+    rect, _ = find_title_block(page)
+    assert rect.x1 == page.rect.x1 and rect.y1 == page.rect.y1
+    assert rect.get_area() < page.rect.get_area() * 0.5
+
+
+def test_no_anchors():
+    doc = fitz.open()
+    assert find_title_block(_page(doc, anchors=False)) == (None, None)
+    assert TitleBlockLocator().locate(_page(doc, anchors=False)) is None
+
+
+def test_same_sheet_size_reuses_the_position():
+    doc = fitz.open()
+    locator = TitleBlockLocator()
+    rects = [locator.locate(_page(doc)) for _ in range(5)]
+    assert (locator.misses, locator.hits) == (1, 4)
+    assert all(rect == rects[0] for rect in rects)
+
+
+def test_moved_title_block_is_located_again():
+    doc = fitz.open()
+    locator = TitleBlockLocator()
+    first = locator.locate(_page(doc))
+    moved = locator.locate(_page(doc, offset=-600))
+    assert locator.misses == 2
+    assert moved != first and moved.contains(FRAME + (-600, 0, -600, 0))
+    # As duas posições ficam memorizadas para este tamanho de folha
+    locator.locate(_page(doc))
+    locator.locate(_page(doc, offset=-600))
+    assert locator.hits == 2
+
+
+def test_cache_is_bounded():
+    doc = fitz.open()
+    locator = TitleBlockLocator(max_sheet_sizes=2, max_templates=1)
+    for width in (1190, 1200, 1210):
+        locator.locate(_page(doc, size=(width, 842)))
+    assert len(locator._known) == 2
+    locator.locate(_page(doc, size=(1190, 842)))
+    assert locator.misses == 4
+
+    locator.locate(_page(doc, size=(1210, 842), offset=-600))
+    assert len(locator._known[(1210, 842, 0)]) == 1
+
+    locator.clear()
+    assert (locator.hits, locator.misses, len(locator._known)) == (0, 0, 0)
+
+
+@pytest.mark.parametrize("rotation", [0, 90])
+def test_rotation_is_part_of_the_sheet_key(rotation):
+    doc = fitz.open()
+    page = _page(doc)
+    page.set_rotation(rotation)
+    assert TitleBlockLocator.sheet_key(page)[2] == rotation
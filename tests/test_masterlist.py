@@ -0,0 +1,134 @@
+import pandas as pd
+import pytest
+
+from jsj_masterlist import MasterList, latest_revision
+from jsj_store import ProjectStore
+
+
+def _records(*des_nums, tipo="PLANTA"):
+    return [{"DES_NUM": d, "TIPO": tipo, "CLIENTE": "arcaya", "TITULO": f"Desenho {d}"} for d in des_nums]
+
+
+def test_append_uses_ids_and_categorical_columns():
+    master = MasterList()
+    master.append([1, 2], _records("EST-1", "EST-2"))
+    master.append([5], _records("EST-3", tipo="CORTE"))
+
+    assert len(master) == 3 and master.last_id == 5
+    assert list(master.df.index) == [1, 2, 5]
+    assert isinstance(master.df["TIPO"].dtype, pd.CategoricalDtype)
+    assert isinstance(master.df["CLIENTE"].dtype, pd.CategoricalDtype)
+    assert master.df["TITULO"].dtype != "category"
+    assert list(master.df["TIPO"].cat.categories) == ["CORTE", "PLANTA"]
+    assert master.tipos() == ["CORTE", "PLANTA"]
+
+
+def test_append_chunks_with_different_columns():
+    master = MasterList()
+    master.append([1], [{"DES_NUM": "EST-1", "TIPO": "PLANTA"}])
+    master.append([2], [{"DES_NUM": "EST-2", "TIPO": "CORTE", "FASE": "PE"}])
+    assert master.df["FASE"].tolist() == ["", "PE"]
+    assert isinstance(master.df["FASE"].dtype, pd.CategoricalDtype)
+
+
+def test_legacy_columns_are_harmonized():
+    master = MasterList()
+    master.append([1], [{"Num. Desenho": "EST-1", "Titulo": "Planta", "Data": "10/01/2025"}])
+    master.append([2], _records("EST-2"))
+    assert master.df["DES_NUM"].tolist() == ["EST-1", "EST-2"]
+    assert master.df["Num. Desenho"].tolist() == ["EST-1", "EST-2"]
+    assert master.df["TITULO"].tolist() == ["Planta", "Desenho EST-2"]
+
+
+def test_keep_drops_rows_and_unused_categories():
+    master = MasterList()
+    master.append([1, 2, 3], _records("EST-1", "EST-2") + _records("EST-3", tipo="CORTE"))
+    master.keep([1, 2])
+    assert list(master.df.index) == [1, 2]
+    assert list(master.df["TIPO"].cat.categories) == ["PLANTA"]
+    assert master.tipo_counts() == {"PLANTA": 2}
+
+
+def test_memo_is_invalidated_by_changes():
+    master = MasterList()
+    master.append([1], _records("EST-1"))
+    calls = []
+
+    def compute(df):
+        calls.append(len(df))
+        return len(df)
+
+    assert master.memo("n", compute) == 1
+    assert master.memo("n", compute) == 1
+    master.append([2], _records("EST-2"))
+    assert master.memo("n", compute) == 2
+    master.keep([2])
+    assert master.memo("n", compute) == 1
+    assert calls == [1, 2, 1]
+
+
+def test_frame_is_a_shallow_copy():
+    master = MasterList()
+    master.append([1], _records("EST-1"))
+    frame = master.frame()
+    frame["EXTRA"] = "x"
+    assert "EXTRA" not in master.df.columns
+
+
+def test_empty_master_list():
+    master = MasterList()
+    assert len(master) == 0 and master.last_id == 0
+    assert master.tipos() == [] and master.tipo_counts() == {}
+    master.append([], [])
+    assert len(master) == 0
+
+
+def test_latest_revision():
+    df = pd.DataFrame({"REV_A": ["A", "A", ""], "REV_B": ["", "B", ""], "REV_C": ["", "", ""]})
+    assert latest_revision(df).tolist() == ["A", "B", ""]
+
+
+# --- Atualização incremental a partir da store ---
+
+@pytest.fixture
+def store(tmp_path):
+    return ProjectStore(str(tmp_path / "projects.sqlite"))
+
+
+def test_store_master_list_is_reused_until_data_changes(store):
+    store.append("P1", _records("EST-1", "EST-2"))
+    first = store.master_list("P1")
+    assert store.master_list("P1") is first
+    assert len(first) == 2
+
+
+def test_store_master_list_appends_only_new_rows(store, monkeypatch):
+    store.append("P1", _records("EST-1", "EST-2"))
+    store.master_list("P1")
+
+    appended = []
+    original = MasterList.append
+
+    def tracking_append(self, ids, records):
+        appended.append(list(ids))
+        return original(self, ids, records)
+
+    monkeypatch.setattr(MasterList, "append", tracking_append)
+    store.append("P1", _records("EST-3", tipo="CORTE"))
+    master = store.master_list("P1")
+
+    assert len(appended) == 1 and len(appended[0]) == 1
+    assert master.df["DES_NUM"].tolist() == ["EST-1", "EST-2", "EST-3"]
+    assert master.tipo_counts() == {"CORTE": 1, "PLANTA": 2}
+
+
+def test_store_master_list_follows_merge_and_clear(store):
+    store.merge("P1", [dict(r, _sheet="a.pdf#1") for r in _records("EST-1")]
+                + [dict(r, _sheet="a.pdf#2") for r in _records("EST-2")])
+    assert len(store.master_list("P1")) == 2
+
+    store.merge("P1", [dict(r, _sheet="a.pdf#1") for r in _records("EST-1B")])
+    assert sorted(store.master_list("P1").df["DES_NUM"]) == ["EST-1B", "EST-2"]
+
+    store.clear("P1")
+    assert len(store.master_list("P1")) == 0
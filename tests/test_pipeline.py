@@ -0,0 +1,236 @@
+import asyncio
+import io
+import threading
+import time
+
+import pytest
+from PIL import Image
+
+from jsj_pipeline import run_streaming_pipeline, summarize_latencies
+
+
+def _run(tasks, ask_fn=None, **kwargs):
+    delivered = []
+
+    async def echo(task):
+        await asyncio.sleep(0.001)
+        return ({"NUM": task["display_name"]}, 1)
+
+    stats = asyncio.run(run_streaming_pipeline(
+        tasks, ask_fn or echo, lambda task, result, stats: delivered.append((task, result)), **kwargs
+    ))
+    return stats, delivered
+
+
+def _render(name, events=None):
+    def render():
+        if events is not None:
+            events.append(("render", name))
+        return Image.new("L", (4, 4))
+    return render
+
+
+def test_native_and_image_tasks():
+    tasks = [
+        {"display_name": "nativa", "is_native": True, "native_data": {"NUM": "1"}},
+        {"display_name": "img", "render": _render("img")},
+    ]
+    stats, delivered = _run(tasks)
+    results = {task["display_name"]: result for task, result in delivered}
+
+    assert results == {"nativa": ({"NUM": "1"}, 0), "img": ({"NUM": "img"}, 1)}
+    assert (stats["produced"], stats["completed"], stats["errors"], stats["requests"]) == (2, 2, 0, 1)
+    # A imagem é libertada assim que o pedido termina
+    assert all("image" not in task for task, _ in delivered)
+    assert "latency" in delivered[1][0]
+
+
+def test_results_stream_before_rendering_ends():
+    events = []
+
+    def tasks():
+        for i in range(20):
+            yield {"display_name": f"f{i}", "render": _render(f"f{i}", events)}
+
+    def on_result(task, result, stats):
+        events.append(("result", task["display_name"]))
+
+    async def ask_fn(task):
+        return ({}, 0)
+
+    asyncio.run(run_streaming_pipeline(tasks(), ask_fn, on_result, concurrency=2, queue_size=2))
+    first_result = events.index(("result", "f0"))
+    renders_before = sum(1 for kind, _ in events[:first_result] if kind == "render")
+    # Filas limitadas: só algumas folhas rasterizadas antes do primeiro registo
+    assert renders_before < 10
+
+
+def test_resident_images_are_bounded():
+    live, peak = [0], [0]
+    lock = threading.Lock()
+
+    def render():
+        with lock:
+            live[0] += 1
+            peak[0] = max(peak[0], live[0])
+        return Image.new("L", (4, 4))
+
+    async def slow_ask(task):
+        await asyncio.sleep(0.005)
+        return ({}, 0)
+
+    def on_result(task, result, stats):
+        with lock:
+            live[0] -= 1
+
+    tasks = ({"display_name": str(i), "render": render} for i in range(40))
+    asyncio.run(run_streaming_pipeline(tasks, slow_ask, on_result, concurrency=2, queue_size=2))
+    # queue_size + concurrency + render_ahead (+ 1 entre filas)
+    assert peak[0] <= 2 + 2 + 1 + 2
+
+
+def test_render_error_is_delivered_as_result():
+    def broken():
+        raise ValueError("página corrompida")
+
+    stats, delivered = _run([{"display_name": "x", "render": broken}])
+    assert isinstance(delivered[0][1], ValueError)
+    assert stats["errors"] == 1 and stats["requests"] == 0
+
+
+def test_api_error_is_delivered_as_result():
+    async def failing(task):
+        raise RuntimeError("falhou")
+
+    stats, delivered = _run([{"display_name": "x", "image": Image.new("L", (4, 4))}], failing)
+    assert isinstance(delivered[0][1], RuntimeError)
+    assert stats["errors"] == 1
+
+
+def test_png_bytes_from_process_workers_become_images():
+    def render_png():
+        buf = io.BytesIO()
+        Image.new("L", (4, 4)).save(buf, format="PNG")
+        return buf.getvalue()
+
+    seen = []
+
+    async def ask_fn(task):
+        seen.append(type(task["image"]))
+        return ({}, 0)
+
+    _run([{"display_name": "x", "render": render_png}], ask_fn)
+    assert seen and issubclass(seen[0], Image.Image)
+
+
+def test_order_is_kept_with_render_ahead():
+    tasks = [{"display_name": str(i), "render": _render(str(i))} for i in range(10)]
+    _, delivered = _run(tasks, concurrency=1, render_ahead=3)
+    assert [task["display_name"] for task, _ in delivered] == [str(i) for i in range(10)]
+
+
+def test_blocking_generator_runs_off_the_event_loop():
+    generator_threads = []
+    closed = []
+
+    def tasks():
+        try:
+            for i in range(3):
+                generator_threads.append(threading.current_thread().name)
+                time.sleep(0.05)
+                yield {"display_name": str(i), "is_native": True, "native_data": {}}
+        finally:
+            closed.append(threading.current_thread().name)
+
+    loop_thread = threading.current_thread().name
+    _run(tasks())
+    assert generator_threads and loop_thread not in generator_threads
+    time.sleep(0.05)
+    assert closed == [generator_threads[0]]
+
+
+def test_summarize_latencies():
+    assert summarize_latencies([])["n"] == 0
+    summary = summarize_latencies([0.1 * i for i in range(1, 21)])
+    assert summary["n"] == 20
+    assert summary["max"] == pytest.approx(2.0)
+    assert summary["p50"] == pytest.approx(1.1)
+    assert summary["p95"] == pytest.approx(1.9)
+    assert summary["mean"] == pytest.approx(1.05)
+
+
+# --- Janela deslizante de pedidos em voo ---
+
+class InFlight:
+    """ask_fn que mede o nº máximo de pedidos em simultâneo."""
+
+    def __init__(self, durations=None):
+        self.now = 0
+        self.peak = 0
+        self.durations = durations or {}
+
+    async def __call__(self, task):
+        self.now += 1
+        self.peak = max(self.peak, self.now)
+        await asyncio.sleep(self.durations.get(task["display_name"], 0.01))
+        self.now -= 1
+        return ({}, 0)
+
+
+def _images(n):
+    return [{"display_name": str(i), "image": Image.new("L", (4, 4))} for i in range(n)]
+
+
+def test_concurrency_is_the_number_of_requests_in_flight():
+    ask = InFlight()
+    stats, _ = _run(_images(20), ask, concurrency=4)
+    assert ask.peak == 4
+    assert stats["requests"] == 20
+
+
+def test_slow_request_does_not_block_the_others():
+    ask = InFlight(durations={"0": 0.3})
+    delivered_at = {}
+
+    def on_result(task, result, stats):
+        delivered_at[task["display_name"]] = time.perf_counter()
+
+    start = time.perf_counter()
+    asyncio.run(run_streaming_pipeline(_images(12), ask, on_result, concurrency=3))
+    # Sem batches fixos: as outras folhas terminam enquanto "0" ainda está em voo
+    assert max(t for name, t in delivered_at.items() if name != "0") - start < 0.25
+    assert list(delivered_at)[-1] == "0"
+
+
+class WindowLimiter:
+    """Rate limiter sem espera com janela fixa (ver SharedRateLimiter.concurrency)."""
+
+    def __init__(self, window, fail=False):
+        self.window = window
+        self.fail = fail
+        self.acquired = 0
+
+    async def acquire(self, model=None):
+        if self.fail:
+            raise RuntimeError("rate limiter indisponível")
+        self.acquired += 1
+
+    def concurrency(self, limit):
+        return max(1, min(limit, self.window))
+
+
+def test_adaptive_window_limits_requests_in_flight():
+    ask, limiter = InFlight(), WindowLimiter(window=2)
+    stats, _ = _run(_images(12), ask, concurrency=6, rate_limiter=limiter)
+    assert ask.peak == 2
+    assert limiter.acquired == 12 and stats["requests"] == 12
+
+
+def test_acquire_failure_is_delivered_and_frees_the_slot():
+    ask, limiter = InFlight(), WindowLimiter(window=1, fail=True)
+    stats, delivered = _run(_images(3), ask, concurrency=2, rate_limiter=limiter)
+    assert all(isinstance(result, RuntimeError) for _, result in delivered)
+    assert stats["errors"] == 3
+    # Pedidos que nunca saíram não contam como pedidos nem têm latência
+    assert stats["requests"] == 0 and ask.peak == 0
+    assert all(task["latency"] == 0.0 for task, _ in delivered)
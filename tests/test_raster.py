@@ -0,0 +1,76 @@
+from pathlib import Path
+
+import fitz
+import pytest
+
+import jsj_raster
+from jsj_imageprep import DEFAULT_MAX_DPI, PDF_DPI, image_options
+from jsj_raster import create_raster_pool, render_pdf_page
+
+
+@pytest.fixture
+def pdf_path(tmp_path):
+    doc = fitz.open()
+    for i in range(3):
+        page = doc.new_page(width=1190, height=842)
+        page.insert_text((900, 800), f"EST-00{i}")
+    path = tmp_path / "a.pdf"
+    doc.save(path)
+    doc.close()
+    return str(path)
+
+
+def test_crop_is_rendered_at_the_adaptive_zoom(pdf_path):
+    image = render_pdf_page(pdf_path, 0, (0.75, 0.75, 1.0, 1.0))
+    zoom = DEFAULT_MAX_DPI / PDF_DPI
+    assert image.size == (round(1190 * 0.25 * zoom), round(842 * 0.25 * zoom))
+    assert image.mime_type == "image/png"
+
+
+def test_gray_rendering(pdf_path):
+    image = render_pdf_page(pdf_path, 1, image_opts=image_options(color="gray"))
+    assert image.mode == "L"
+
+
+def test_sources_give_the_same_image(pdf_path):
+    data = Path(pdf_path).read_bytes()
+    from_path = render_pdf_page(pdf_path, 2)
+    from_bytes = render_pdf_page(data, 2)
+    with fitz.open(pdf_path) as doc:
+        from_doc = render_pdf_page(doc, 2)
+        assert not doc.is_closed
+    assert from_path.data == from_bytes.data == from_doc.data
+
+
+def test_worker_keeps_a_few_documents_open(tmp_path, pdf_path, monkeypatch):
+    monkeypatch.setattr(jsj_raster, "_worker_pdfs", type(jsj_raster._worker_pdfs)())
+    opened = []
+    real_open = fitz.open
+
+    def counting_open(*args, **kwargs):
+        opened.append(args)
+        return real_open(*args, **kwargs)
+
+    monkeypatch.setattr(fitz, "open", counting_open)
+    for page in range(3):
+        render_pdf_page(pdf_path, page)
+    assert len(opened) == 1
+
+    for i in range(jsj_raster._MAX_OPEN_DOCS + 1):
+        copy = tmp_path / f"c{i}.pdf"
+        copy.write_bytes(Path(pdf_path).read_bytes())
+        render_pdf_page(str(copy), 0)
+    assert len(jsj_raster._worker_pdfs) == jsj_raster._MAX_OPEN_DOCS
+
+
+def test_process_pool_only_when_asked(pdf_path):
+    assert create_raster_pool() is None
+    assert create_raster_pool(1) is None
+    assert create_raster_pool(None) is None
+
+    pool = create_raster_pool(2)
+    try:
+        image = pool.submit(render_pdf_page, pdf_path, 0).result(timeout=60)
+    finally:
+        pool.shutdown()
+    assert image.data == render_pdf_page(pdf_path, 0).data
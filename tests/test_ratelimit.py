@@ -0,0 +1,163 @@
+import asyncio
+import time
+
+import pytest
+
+from jsj_ratelimit import MODEL_QUOTAS, RATE_STANDARD, SharedRateLimiter, create_rate_limiter
+
+
+class Clock:
+    def __init__(self):
+        self.now = 1_000_000.0
+
+    def __call__(self):
+        return self.now
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    clock = Clock()
+    monkeypatch.setattr(time, "time", clock)
+    return clock
+
+
+@pytest.fixture(params=["local", "sqlite"])
+def path(request, tmp_path):
+    return None if request.param == "local" else str(tmp_path / "ratelimit.sqlite")
+
+
+def test_quota_never_exceeds_rpm_in_a_minute():
+    limiter = SharedRateLimiter(max_requests=60, path=None)
+    rate, capacity = limiter.quota("any")
+    assert capacity == 6
+    assert capacity + rate * 60 == pytest.approx(60)
+
+    rate, capacity = SharedRateLimiter(max_requests=60, burst=100, path=None).quota("any")
+    assert capacity == 60 and rate == pytest.approx(1 / 60)
+
+
+def test_quota_per_model():
+    limiter = SharedRateLimiter(max_requests=60, quotas={"fast": 600}, path=None)
+    assert limiter.quota("fast")[1] == 60
+    assert limiter.quota("other")[1] == 6
+
+
+def test_burst_then_fifo_waits(clock, path):
+    limiter = SharedRateLimiter(max_requests=60, burst=2, path=path, models=["m"])
+    rate, _ = limiter.quota("m")
+    waits = [limiter.reserve() for _ in range(5)]
+    assert waits[:2] == [0.0, 0.0]
+    # Cada reserva seguinte espera mais um intervalo: pela ordem de chegada
+    assert waits[2:] == pytest.approx([1 / rate, 2 / rate, 3 / rate])
+
+
+def test_bucket_refills_over_time(clock, path):
+    limiter = SharedRateLimiter(max_requests=60, burst=1, path=path)
+    rate, _ = limiter.quota("m")
+    assert limiter.reserve("m") == 0.0
+    clock.now += 1 / rate
+    assert limiter.reserve("m") == pytest.approx(0.0)
+    # Tempo parado não dá mais do que a capacidade
+    clock.now += 3600
+    assert [limiter.reserve("m") for _ in range(2)] == pytest.approx([0.0, 1 / rate])
+
+
+def test_models_have_separate_buckets(clock, path):
+    limiter = SharedRateLimiter(max_requests=60, burst=1, path=path)
+    assert limiter.reserve("a") == 0.0
+    assert limiter.reserve("b") == 0.0
+    assert limiter.reserve("a") > 0
+
+
+def test_bucket_is_shared_by_api_key(clock, tmp_path):
+    path = str(tmp_path / "ratelimit.sqlite")
+    first = SharedRateLimiter(max_requests=60, burst=1, api_key="k1", path=path)
+    same_key = SharedRateLimiter(max_requests=60, burst=1, api_key="k1", path=path)
+    other_key = SharedRateLimiter(max_requests=60, burst=1, api_key="k2", path=path)
+
+    assert first.reserve("m") == 0.0
+    assert same_key.reserve("m") > 0
+    assert other_key.reserve("m") == 0.0
+
+    first.reset()
+    assert same_key.reserve("m") == 0.0
+
+
+def test_throttle_delays_next_request_by_retry_after(clock, path):
+    limiter = SharedRateLimiter(max_requests=60, burst=5, path=path)
+    rate, _ = limiter.quota("m")
+    limiter.throttle("m", retry_after=10)
+    assert limiter.reserve("m") == pytest.approx(10 + 1 / rate)
+    assert limiter.throttles == 1
+
+
+def test_throttle_without_retry_after_drops_the_burst(clock, path):
+    limiter = SharedRateLimiter(max_requests=60, burst=5, path=path)
+    rate, _ = limiter.quota("m")
+    limiter.throttle("m")
+    assert limiter.reserve("m") == pytest.approx(1 / rate)
+
+
+def test_aimd_window(clock):
+    limiter = SharedRateLimiter(path=None)
+    assert limiter.concurrency(8) == 8
+
+    limiter.throttle()
+    assert limiter.concurrency(8) == 4
+    # Rajada de 429 no mesmo segundo: uma só redução
+    limiter.throttle()
+    assert limiter.concurrency(8) == 4
+
+    for _ in range(3):
+        clock.now += 1
+        limiter.throttle()
+    assert limiter.concurrency(8) == 1
+
+    for _ in range(100):
+        limiter.success()
+    assert limiter.concurrency(8) == 8
+    assert limiter.concurrency(3) == 3
+
+
+def test_success_before_the_pipeline_sets_a_window():
+    limiter = SharedRateLimiter(path=None)
+    limiter.success()
+    assert limiter.window is None
+
+
+def test_acquire_waits_its_turn():
+    limiter = SharedRateLimiter(max_requests=6000, burst=1, path=None)
+
+    async def run():
+        await asyncio.gather(*(limiter.acquire("m") for _ in range(3)))
+
+    started = time.monotonic()
+    asyncio.run(run())
+    assert limiter.waits == 2
+    assert time.monotonic() - started >= 2 * 60 / 6000 * 0.9
+
+
+def test_acquire_blocking():
+    limiter = SharedRateLimiter(max_requests=6000, burst=1, path=None)
+    limiter.acquire_blocking("m")
+    limiter.acquire_blocking("m")
+    assert limiter.waits == 1 and limiter.wait_time > 0
+
+
+def test_create_rate_limiter_uses_model_quotas(tmp_path):
+    limiter = create_rate_limiter("key", models=["gemini-2.5-flash"], path=str(tmp_path / "r.sqlite"))
+    assert limiter.rpm == RATE_STANDARD
+    assert limiter.quota("gemini-2.5-flash")[1] == 1
+    assert limiter.quota("gemini-2.0-flash") == limiter.quota("unknown")
+
+    turbo = create_rate_limiter("key", turbo=True, path=None)
+    rate, capacity = turbo.quota("gemini-2.0-flash")
+    assert capacity + rate * 60 == pytest.approx(MODEL_QUOTAS["turbo"]["gemini-2.0-flash"])
+
+
+def test_unusable_path_falls_back_to_local(tmp_path):
+    blocker = tmp_path / "file"
+    blocker.write_text("")
+    limiter = SharedRateLimiter(path=str(blocker / "ratelimit.sqlite"))
+    assert limiter.path is None
+    assert limiter.reserve("m") == 0.0
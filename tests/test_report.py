@@ -0,0 +1,119 @@
+import io
+
+import fitz
+import pandas as pd
+from reportlab.lib.pagesizes import A4, landscape
+from reportlab.platypus import SimpleDocTemplate
+
+from jsj_report import (
+    PDF_COLUMNS, ROWS_PER_TABLE, _format_cells, _LazyFlowables, _report_flowables, pdf_report_bytes, write_pdf_report,
+)
+
+
+def _df(counts):
+    rows = [
+        {"DES_NUM": f"{tipo[:3]}-{i}", "TITULO": f"Desenho {i} " + "x" * 60, "TIPO": tipo, "REV_A": "A"}
+        for tipo, n in counts.items() for i in range(n)
+    ]
+    return pd.DataFrame(rows)
+
+
+def _pages(data):
+    with fitz.open(stream=data, filetype="pdf") as doc:
+        return [page.get_text() for page in doc]
+
+
+def test_format_cells_truncates_and_fills_missing_columns():
+    df = pd.DataFrame({"DES_NUM": ["EST-1", None], "TITULO": ["t" * 60, "curto"]})
+    cells = _format_cells(df)
+    assert cells.shape == (2, len(PDF_COLUMNS))
+    assert cells[0, 1] == "t" * 50 + "..."
+    assert cells[1, 1] == "curto"
+    assert cells[1, 0] == ""
+    assert cells[0, 4] == ""
+
+
+def test_format_cells_of_empty_frame():
+    assert _format_cells(pd.DataFrame()).shape == (0, len(PDF_COLUMNS))
+
+
+def test_one_section_per_tipo_with_every_drawing():
+    df = _df({"PLANTA": 3, "CORTE": 2})
+    pages = _pages(pdf_report_bytes(df))
+    text = "\n".join(pages)
+
+    assert "LISTA DE DESENHOS JSJ" in pages[0]
+    # Quebra de página entre TIPOs, pela ordem da lista
+    assert "TIPO: PLANTA" in pages[0] and "TIPO: CORTE" in pages[1]
+    assert all(des_num in text for des_num in df["DES_NUM"])
+    assert "Total de desenhos: 5 | Tipos: PLANTA, CORTE" in text
+
+
+def test_large_tipo_is_split_in_page_sized_tables():
+    n = ROWS_PER_TABLE * 5 + 3
+    pages = _pages(pdf_report_bytes(_df({"PLANTA": n})))
+    assert len(pages) >= 5
+    # Cabeçalho repetido em cada página de dados
+    assert all("Nº Desenho" in page for page in pages[:-1])
+    text = "\n".join(pages)
+    assert f"PLA-{n - 1}\n" in text
+
+
+def test_custom_columns_and_file_output(tmp_path):
+    columns = [("Num.", "Num. Desenho", None, 100), ("Titulo", "Titulo", 10, 200)]
+    df = pd.DataFrame({"Num. Desenho": ["EST-1"], "Titulo": ["Planta do piso 1"], "TIPO": ["PLANTA"]})
+    path = tmp_path / "lista.pdf"
+    write_pdf_report(df, str(path), columns=columns)
+
+    text = "\n".join(_pages(path.read_bytes()))
+    assert "Num." in text and "Planta do ..." in text
+    assert "Cliente" not in text
+
+
+def test_report_without_tipo_column():
+    buffer = io.BytesIO()
+    write_pdf_report(pd.DataFrame({"DES_NUM": ["EST-1"]}), buffer)
+    assert "EST-1" in "\n".join(_pages(buffer.getvalue()))
+
+
+def test_lazy_flowables_only_hold_the_next_items():
+    produced = []
+
+    def source():
+        for i in range(100):
+            produced.append(i)
+            yield i
+
+    flowables = _LazyFlowables(source(), ahead=4)
+    consumed = []
+    while len(flowables):
+        consumed.append(flowables[0])
+        del flowables[0]
+        assert len(produced) - len(consumed) <= 4
+    assert consumed == list(range(100))
+
+
+def test_build_splits_tables_and_pulls_flowables_page_by_page():
+    # Tabelas de 70 linhas não cabem numa página: o reportlab divide-as e volta a
+    # inserir o resto no início da lista. Se o build deixar de consultar len()
+    # antes de cada flowable, o gerador é esgotado na primeira página e isto falha.
+    n = 70 * 6
+    df = _df({"PLANTA": n // 2, "CORTE": n // 2})
+    buffer = io.BytesIO()
+    doc = SimpleDocTemplate(buffer, pagesize=landscape(A4))
+    pages_when_produced = []
+
+    def source():
+        for flowable in _report_flowables(df, 70):
+            pages_when_produced.append(getattr(doc, "page", 0))
+            yield flowable
+
+    doc.build(_LazyFlowables(source(), ahead=4))
+    pages = _pages(buffer.getvalue())
+
+    assert len(pages) > 6
+    assert pages_when_produced[-1] > pages_when_produced[0] + 4
+    # Cada desenho aparece uma vez, com o cabeçalho repetido nas partes divididas
+    text = "\n".join(pages)
+    assert all(text.count(f"{des_num}\n") == 1 for des_num in df["DES_NUM"])
+    assert all("Nº Desenho" in page for page in pages[:-1])
@@ -0,0 +1,123 @@
+import json
+
+import pytest
+
+import jsj_response
+from jsj_response import (
+    BATCH_SCHEMA, EXTRACTION_SCHEMA, TolerantJsonParser, generation_config, normalize_extraction,
+    parse_batch_response, parse_json_response,
+)
+from jsj_textlayer import OUTPUT_FIELDS
+
+
+# --- Parser tolerante ---
+
+def test_plain_json():
+    assert parse_json_response('{"NUM": "001"}') == ({"NUM": "001"}, False)
+
+
+def test_fences_and_surrounding_text():
+    text = 'Aqui está:\n```json\n{"NUM": "001", "R": "A"}\n```\nMais alguma coisa?'
+    assert parse_json_response(text) == ({"NUM": "001", "R": "A"}, False)
+
+
+def test_trailing_commas_are_repaired():
+    value, truncated = parse_json_response('{"NUM": "001", "LISTA": [1, 2,],}')
+    assert value == {"NUM": "001", "LISTA": [1, 2]}
+    assert not truncated
+
+
+@pytest.mark.parametrize("text, expected", [
+    ('{"NUM": "001", "TITULO": "Planta pi', {"NUM": "001", "TITULO": "Planta pi"}),
+    ('{"NUM": "001", "TITULO":', {"NUM": "001", "TITULO": ""}),
+    ('{"NUM": "001", "TITULO"', {"NUM": "001", "TITULO": ""}),
+    ('{"NUM": "001",', {"NUM": "001"}),
+    ('{"NUM": "001", "REVS": [{"R": "A"}', {"NUM": "001", "REVS": [{"R": "A"}]}),
+])
+def test_truncated_responses_are_closed(text, expected):
+    assert parse_json_response(text) == (expected, True)
+
+
+def test_escaped_quotes_inside_strings():
+    value, _ = parse_json_response(r'{"TITULO": "Corte \"A\" {piso}"}')
+    assert value == {"TITULO": 'Corte "A" {piso}'}
+
+
+@pytest.mark.parametrize("text", ["", "sem JSON nenhum", "```json\n```"])
+def test_no_json_raises(text):
+    with pytest.raises(json.JSONDecodeError):
+        parse_json_response(text)
+
+
+def test_incremental_feed_yields_completed_items():
+    parser = TolerantJsonParser()
+    assert parser.feed('[{"NUM": "1"}, {"NU') == [{"NUM": "1"}]
+    assert parser.truncated
+    parser.feed('M": "2"}]')
+    assert parser.finish() == [{"NUM": "1"}, {"NUM": "2"}]
+    assert not parser.truncated and not parser.recovered
+
+
+# --- Respostas em lote ---
+
+def test_batch_response():
+    text = '```json\n[{"IMAGEM": 1, "NUM": "1"}, {"IMAGEM": 2, "NUM": "2"}]\n```'
+    assert parse_batch_response(text) == [{"IMAGEM": 1, "NUM": "1"}, {"IMAGEM": 2, "NUM": "2"}]
+
+
+def test_truncated_batch_keeps_only_complete_items():
+    text = '[{"IMAGEM": 1, "NUM": "1"}, {"IMAGEM": 2, "NUM": "2"}, {"IMAGEM": 3, "NU'
+    assert parse_batch_response(text) == [{"IMAGEM": 1, "NUM": "1"}, {"IMAGEM": 2, "NUM": "2"}]
+
+
+def test_batch_with_broken_item_keeps_the_others():
+    text = '[{"IMAGEM": 1, "NUM": "1",}, {"IMAGEM": 2 "NUM": "2"}, {"IMAGEM": 3, "NUM": "3"}'
+    assert parse_batch_response(text) == [{"IMAGEM": 1, "NUM": "1"}, {"IMAGEM": 3, "NUM": "3"}]
+
+
+# --- Normalização ---
+
+def test_normalize_extraction_fills_every_field():
+    data = normalize_extraction({"NUM": " 001 ", "R": None, "TITULO": 12})
+    assert set(OUTPUT_FIELDS) <= set(data)
+    assert (data["NUM"], data["R"], data["TITULO"]) == ("001", "", "12")
+
+
+# --- generation_config ---
+
+@pytest.fixture
+def sdk_fields(monkeypatch):
+    """Simula os campos de GenerationConfig de um SDK (None = SDK não instalado)."""
+    def use(fields):
+        monkeypatch.setattr(jsj_response, "supported_config_fields", lambda: fields)
+    return use
+
+
+def test_json_mode_with_schema(sdk_fields):
+    sdk_fields(frozenset({"temperature", "response_mime_type", "response_schema"}))
+    assert generation_config("gemini-2.5-flash", EXTRACTION_SCHEMA) == {
+        "response_mime_type": "application/json", "response_schema": EXTRACTION_SCHEMA,
+    }
+    assert generation_config("gemini-2.5-flash") == {"response_mime_type": "application/json"}
+
+
+def test_models_without_json_mode(sdk_fields):
+    sdk_fields(frozenset({"response_mime_type", "response_schema"}))
+    assert generation_config("gemini-pro", EXTRACTION_SCHEMA) is None
+
+
+def test_old_sdk_without_schema(sdk_fields):
+    sdk_fields(frozenset({"temperature", "response_mime_type"}))
+    assert generation_config("gemini-2.5-flash", BATCH_SCHEMA) == {"response_mime_type": "application/json"}
+
+
+def test_old_sdk_without_json_mode(sdk_fields):
+    sdk_fields(frozenset({"temperature"}))
+    assert generation_config("gemini-2.5-flash", BATCH_SCHEMA) is None
+
+
+def test_supported_config_fields_of_installed_sdk():
+    pytest.importorskip("google.generativeai")
+    jsj_response.supported_config_fields.cache_clear()
+    fields = jsj_response.supported_config_fields()
+    assert {"response_mime_type", "response_schema"} <= fields
@@ -0,0 +1,139 @@
+import socket
+import time
+from types import SimpleNamespace
+
+import pytest
+
+from jsj_retry import PERMANENT, QUOTA, TRANSIENT, RetryPolicy, classify_error, retry_after_hint
+
+api_exceptions = pytest.importorskip("google.api_core.exceptions")
+
+
+@pytest.mark.parametrize("error, kind", [
+    (api_exceptions.ResourceExhausted("quota"), QUOTA),
+    (api_exceptions.TooManyRequests("slow down"), QUOTA),
+    (api_exceptions.ServiceUnavailable("overloaded"), TRANSIENT),
+    (api_exceptions.InternalServerError("oops"), TRANSIENT),
+    (api_exceptions.DeadlineExceeded("late"), TRANSIENT),
+    (TimeoutError(), TRANSIENT),
+    (socket.timeout(), TRANSIENT),
+    (ConnectionResetError(), TRANSIENT),
+    (api_exceptions.InvalidArgument("bad image"), PERMANENT),
+    (api_exceptions.NotFound("models/gemini-x is not found"), PERMANENT),
+    (api_exceptions.PermissionDenied("API key"), PERMANENT),
+])
+def test_classify_by_type(error, kind):
+    assert classify_error(error)[0] == kind
+
+
+@pytest.mark.parametrize("message, kind", [
+    ("429 Resource has been exhausted (e.g. check quota).", QUOTA),
+    ("Too Many Requests", QUOTA),
+    ("503 The model is overloaded", TRANSIENT),
+    ("Read timed out", TRANSIENT),
+    ("Connection reset by peer", TRANSIENT),
+    ("Invalid JSON payload", PERMANENT),
+])
+def test_classify_by_message(message, kind):
+    assert classify_error(RuntimeError(message))[0] == kind
+
+
+def test_permanent_errors_have_no_retry_after():
+    assert classify_error(api_exceptions.InvalidArgument("retry in 5s")) == (PERMANENT, None)
+
+
+@pytest.mark.parametrize("message, seconds", [
+    ("429 quota exceeded. Please retry in 12.5s.", 12.5),
+    ("429 quota exceeded. Please retry in 800ms", 0.8),
+    ("429 ... retry_delay {\n  seconds: 17\n}", 17),
+    ("429 Retry-After: 3", 3),
+    ("429 quota exceeded", None),
+])
+def test_retry_after_from_message(message, seconds):
+    assert retry_after_hint(RuntimeError(message)) == seconds
+
+
+def test_retry_after_from_details_and_headers():
+    error = RuntimeError("429")
+    error.details = [SimpleNamespace(retry_delay=SimpleNamespace(seconds=4, nanos=500_000_000))]
+    assert retry_after_hint(error) == pytest.approx(4.5)
+
+    error = RuntimeError("429")
+    error.response = SimpleNamespace(headers={"Retry-After": "7"})
+    assert retry_after_hint(error) == 7.0
+
+
+class FakeLimiter:
+    def __init__(self):
+        self.calls = []
+
+    def throttle(self, model, retry_after=None):
+        self.calls.append(("throttle", model, retry_after))
+
+    def acquire_blocking(self, model=None):
+        self.calls.append(("acquire", model))
+
+    def success(self, model=None):
+        self.calls.append(("success", model))
+
+
+@pytest.fixture
+def sleeps(monkeypatch):
+    sleeps = []
+    monkeypatch.setattr(time, "sleep", sleeps.append)
+    return sleeps
+
+
+def _failing(*errors, result="ok"):
+    errors = list(errors)
+
+    def fn():
+        if errors:
+            raise errors.pop(0)
+        return result
+    return fn
+
+
+def test_quota_error_is_retried_on_the_same_model(sleeps):
+    limiter = FakeLimiter()
+    fn = _failing(RuntimeError("429 quota. Please retry in 2s"))
+    assert RetryPolicy().call(fn, "m", limiter) == "ok"
+
+    assert len(sleeps) == 1 and 2 <= sleeps[0] <= 2.5
+    assert limiter.calls == [("throttle", "m", 2.0), ("acquire", "m"), ("success", "m")]
+
+
+def test_transient_errors_back_off_exponentially(sleeps):
+    policy = RetryPolicy(max_attempts=4, base_delay=1.0, jitter=0.0)
+    fn = _failing(TimeoutError(), TimeoutError(), TimeoutError())
+    assert policy.call(fn, "m") == "ok"
+    assert sleeps == [1.0, 2.0, 4.0]
+
+
+def test_permanent_error_is_raised_at_once(sleeps):
+    limiter = FakeLimiter()
+    with pytest.raises(api_exceptions.NotFound):
+        RetryPolicy().call(_failing(api_exceptions.NotFound("no model")), "m", limiter)
+    assert sleeps == [] and limiter.calls == []
+
+
+def test_attempts_are_limited(sleeps):
+    fn = _failing(*[TimeoutError()] * 5)
+    with pytest.raises(TimeoutError):
+        RetryPolicy(max_attempts=3).call(fn, "m")
+    assert len(sleeps) == 2
+
+
+def test_long_retry_after_moves_to_the_next_model(sleeps):
+    limiter = FakeLimiter()
+    with pytest.raises(RuntimeError):
+        RetryPolicy(max_retry_after=60).call(_failing(RuntimeError("429 retry in 120s")), "m", limiter)
+    assert sleeps == []
+    # O 429 abranda o rate limiter mesmo quando o modelo é abandonado
+    assert limiter.calls == [("throttle", "m", 120.0)]
+
+
+def test_delay_is_capped():
+    policy = RetryPolicy(base_delay=1.0, max_delay=5.0, jitter=0.0)
+    assert [policy.delay(attempt) for attempt in range(5)] == [1.0, 2.0, 4.0, 5.0, 5.0]
+    assert policy.delay(0, retry_after=3) == 3.0
@@ -0,0 +1,113 @@
+import numpy as np
+import pandas as pd
+
+import jsj_masterlist
+from jsj_masterlist import (
+    MAX_CACHED_VIEWS, MasterList, natural_compare, natural_key, natural_rank, sort_by_tipo, sort_positions,
+    tipo_rank,
+)
+
+
+def test_natural_key_orders_numbers_as_integers():
+    values = ["EST-10", "est-2", "EST-1", "ARQ-100", "EST-2A", " EST-3"]
+    assert sorted(values, key=natural_key) == ["ARQ-100", "EST-1", "est-2", "EST-2A", " EST-3", "EST-10"]
+
+
+def test_natural_compare():
+    assert natural_compare("EST-2", "EST-10") == -1
+    assert natural_compare("EST-10", "EST-2") == 1
+    assert natural_compare("est-2", "EST-2") == 0
+
+
+def test_natural_rank_ties_and_types():
+    rank = natural_rank(["EST-10", "EST-2", "EST-10", 7, ""])
+    assert rank.tolist() == [3, 2, 3, 1, 0]
+
+
+def test_tipo_rank_puts_requested_order_first():
+    assert tipo_rank(["PLANTA", "ALCADO", "CORTE", "PLANTA"], ["PLANTA"]).tolist() == [0, 1, 2, 0]
+    assert tipo_rank(["PLANTA", "ALCADO"]).tolist() == [1, 0]
+
+
+def _df():
+    return pd.DataFrame({
+        "DES_NUM": ["EST-10", "EST-2", "EST-1", "EST-3", "EST-2"],
+        "TIPO": ["PLANTA", "PLANTA", "CORTE", "ALCADO", "CORTE"],
+    }, index=[10, 11, 12, 13, 14])
+
+
+def test_sort_by_tipo_and_natural_number():
+    df = _df()
+    assert sort_by_tipo(df)["DES_NUM"].tolist() == ["EST-3", "EST-1", "EST-2", "EST-2", "EST-10"]
+    assert sort_by_tipo(df, ["PLANTA"]).index.tolist() == [11, 10, 13, 12, 14]
+
+
+def test_sort_with_categorical_tipo_ignores_category_order():
+    df = _df()
+    df["TIPO"] = pd.Categorical(df["TIPO"], categories=["PLANTA", "CORTE", "ALCADO"])
+    assert sort_by_tipo(df).index.tolist() == sort_by_tipo(_df()).index.tolist()
+
+
+def test_sort_is_stable_and_handles_missing_columns():
+    df = pd.DataFrame({"DES_NUM": ["B", "A", "A"]}, index=[1, 2, 3])
+    assert sort_by_tipo(df).index.tolist() == [2, 3, 1]
+    assert sort_positions(pd.DataFrame({"X": [3, 1]})).tolist() == [0, 1]
+
+
+def _master():
+    master = MasterList()
+    df = _df()
+    master.append(df.index.tolist(), df.to_dict("records"))
+    return master
+
+
+def test_order_is_cached_per_tipo_order(monkeypatch):
+    master = _master()
+    calls = []
+    original = jsj_masterlist.natural_rank
+
+    def counting_rank(values):
+        calls.append(len(values))
+        return original(values)
+
+    monkeypatch.setattr(jsj_masterlist, "natural_rank", counting_rank)
+    first = master.order()
+    assert master.order() is first
+    planta = master.order(["PLANTA"])
+    assert master.df.iloc[planta].index.tolist() == [11, 10, 13, 12, 14]
+    # A posição natural dos nºs de desenho é calculada uma vez por versão da lista
+    assert calls == [5]
+
+    master.append([20], [{"DES_NUM": "EST-0", "TIPO": "PLANTA"}])
+    assert master.sorted_frame(["PLANTA"]).index.tolist() == [20, 11, 10, 13, 12, 14]
+    assert calls == [5, 6]
+
+
+def test_cached_views_are_bounded():
+    master = _master()
+    for i in range(MAX_CACHED_VIEWS + 3):
+        master.order([f"T{i}"])
+    assert len(master._views) == MAX_CACHED_VIEWS
+
+
+def test_filtered_order_and_window():
+    master = _master()
+    mask = (master.df["TIPO"] != "CORTE").to_numpy()
+    positions = master.filtered_order(["PLANTA"], mask)
+    assert master.df.iloc[positions].index.tolist() == [11, 10, 13]
+    assert master.filtered_order(["PLANTA"]) is master.order(["PLANTA"])
+
+    assert master.window(positions, 0, 2).index.tolist() == [11, 10]
+    assert master.window(positions, 1, 2).index.tolist() == [13]
+    assert master.window(positions, 5, 2).empty
+
+
+def test_order_matches_store_export_order(tmp_path):
+    from jsj_store import ProjectStore
+
+    store = ProjectStore(str(tmp_path / "projects.sqlite"))
+    store.append("P1", _df().to_dict("records"))
+    exported = [r["DES_NUM"] for r in store.iter_records("P1", ["PLANTA"])]
+    master = store.master_list("P1")
+    assert master.sorted_frame(["PLANTA"])["DES_NUM"].tolist() == exported
+    assert isinstance(master.order(["PLANTA"]), np.ndarray)
@@ -0,0 +1,101 @@
+import sqlite3
+
+import pytest
+
+from jsj_store import ProjectStore
+
+
+@pytest.fixture
+def store(tmp_path):
+    return ProjectStore(str(tmp_path / "projects.sqlite"))
+
+
+def _record(des_num, tipo="PLANTA", **extra):
+    return {"DES_NUM": des_num, "TIPO": tipo, "TITULO": f"Desenho {des_num}", **extra}
+
+
+def test_append_and_load_keep_insertion_order(store):
+    assert store.append("P1", [_record("EST-2"), _record("EST-1")]) == 2
+    assert store.append("P1", []) == 0
+    assert [r["DES_NUM"] for r in store.load("P1")] == ["EST-2", "EST-1"]
+    assert store.count("P1") == 2
+    assert store.load("P2") == []
+
+
+def test_projects_are_isolated(store):
+    store.append("B", [_record("EST-1")])
+    store.append("A", [_record("EST-1"), _record("EST-2")])
+    assert store.projects() == ["A", "B"]
+    assert store.count("A") == 2 and store.count("B") == 1
+
+    store.clear("A")
+    assert store.projects() == ["B"]
+    assert store.count("A") == 0
+
+
+def test_revision_changes_on_every_write(store):
+    empty = store.revision("P1")
+    store.append("P1", [_record("EST-1")])
+    first = store.revision("P1")
+    store.append("P1", [_record("EST-2")])
+    second = store.revision("P1")
+    assert len({tuple(empty), tuple(first), tuple(second)}) == 3
+
+
+def test_iter_records_uses_tipo_order_and_natural_des_num(store):
+    store.append("P1", [
+        _record("EST-10", "PLANTA"),
+        _record("EST-2", "PLANTA"),
+        _record("EST-1", "CORTE"),
+        _record("EST-3", "ALCADO"),
+    ])
+    order = [r["DES_NUM"] for r in store.iter_records("P1")]
+    assert order == ["EST-3", "EST-1", "EST-2", "EST-10"]
+
+    order = [r["DES_NUM"] for r in store.iter_records("P1", tipo_order=["PLANTA"], chunk_size=1)]
+    assert order == ["EST-2", "EST-10", "EST-3", "EST-1"]
+
+
+def test_iter_records_over_several_projects(store):
+    store.append("A", [_record("EST-2")])
+    store.append("B", [_record("EST-1")])
+    assert [r["DES_NUM"] for r in store.iter_records(["A", "B"])] == ["EST-1", "EST-2"]
+
+
+def test_legacy_turbo_records_are_harmonized(store):
+    store.append("P1", [{"Num. Desenho": "EST-1", "Titulo": "Planta", "TIPO": "PLANTA"}])
+    record = next(store.iter_records("P1"))
+    assert record["DES_NUM"] == "EST-1"
+    assert record["TITULO"] == "Planta"
+
+    df = store.load_df("P1")
+    assert df["DES_NUM"].tolist() == ["EST-1"]
+    assert df["Num. Desenho"].tolist() == ["EST-1"]
+
+
+def test_data_survives_a_new_instance(tmp_path):
+    path = str(tmp_path / "projects.sqlite")
+    ProjectStore(path).append("P1", [_record("EST-1")])
+    assert [r["DES_NUM"] for r in ProjectStore(path).load("P1")] == ["EST-1"]
+
+
+def test_connections_are_closed(store, monkeypatch):
+    opened = []
+    connect = sqlite3.connect
+
+    def tracking_connect(*args, **kwargs):
+        conn = connect(*args, **kwargs)
+        opened.append(conn)
+        return conn
+
+    monkeypatch.setattr(sqlite3, "connect", tracking_connect)
+    store.append("P1", [_record("EST-1")])
+    store.load("P1")
+    list(store.iter_records("P1"))
+    store.projects()
+
+    assert opened
+    for conn in opened:
+        with pytest.raises(sqlite3.ProgrammingError):
+            conn.execute("SELECT 1")
+
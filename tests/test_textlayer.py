@@ -0,0 +1,103 @@
+import fitz
+import pytest
+
+from jsj_textlayer import DEFAULT_MIN_CONFIDENCE, extract_from_text_layer
+
+LEGENDA = fitz.Rect(780, 520, 1190, 842)
+
+
+def _page(rows, revs=(), inline=()):
+    """Página A3 com uma legenda LEGENDA_JSJ em texto (etiqueta à esquerda, valor à direita)."""
+    doc = fitz.open()
+    page = doc.new_page(width=1190, height=842)
+    x, y = 820, 560
+    if revs is not None:
+        page.insert_text((x, y + 10), "REV", fontsize=7)
+        page.insert_text((x + 30, y + 10), "DATA", fontsize=7)
+        page.insert_text((x + 100, y + 10), "DESCRIÇÃO", fontsize=7)
+        for k, (letter, date) in enumerate(revs):
+            yy = y + 22 + k * 12
+            page.insert_text((x + 2, yy), letter, fontsize=7)
+            if date:
+                page.insert_text((x + 30, yy), date, fontsize=7)
+            page.insert_text((x + 100, yy), f"Revisão {letter}", fontsize=7)
+    for j, (label, value) in enumerate(rows):
+        yy = 660 + j * 16
+        page.insert_text((x, yy), label, fontsize=7)
+        page.insert_text((x + 90, yy), value, fontsize=9)
+    for j, text in enumerate(inline):
+        page.insert_text((x, 810 + j * 12), text, fontsize=7)
+    return doc, page
+
+
+FULL_ROWS = [
+    ("CLIENTE", "arcaya"),
+    ("OBRA", "Edifício Altis"),
+    ("ESPECIALIDADE", "ESTRUTURA"),
+    ("DATA", "10/01/2025"),
+    ("TÍTULO", "Planta piso 1"),
+    ("Nº DESENHO", "EST-001"),
+]
+
+
+def test_full_title_block_is_read_with_high_confidence():
+    doc, page = _page(FULL_ROWS, revs=[("A", "10/02/2025"), ("B", "11/03/2025")])
+    data, confidence = extract_from_text_layer(page, LEGENDA)
+
+    assert data["PFIX"] == "EST"
+    assert data["NUM"] == "001"
+    assert data["TITULO"] == "Planta piso 1"
+    assert data["CLIENTE"] == "arcaya"
+    assert data["DATA"] == "10/01/2025"
+    assert (data["REV_A"], data["DATA_A"]) == ("A", "10/02/2025")
+    assert (data["REV_B"], data["DATA_B"]) == ("B", "11/03/2025")
+    assert data["R"] == "B"
+    assert confidence == pytest.approx(1.0)
+    assert confidence >= DEFAULT_MIN_CONFIDENCE
+    doc.close()
+
+
+def test_no_text_layer_has_zero_confidence():
+    doc = fitz.open()
+    page = doc.new_page(width=1190, height=842)
+    data, confidence = extract_from_text_layer(page, LEGENDA)
+    assert confidence == 0.0
+    assert data["NUM"] == ""
+    doc.close()
+
+
+def test_drawing_number_is_mandatory():
+    rows = [row for row in FULL_ROWS if row[0] != "Nº DESENHO"]
+    doc, page = _page(rows, revs=[("A", "10/02/2025")])
+    _, confidence = extract_from_text_layer(page, LEGENDA)
+    assert confidence == 0.0
+    doc.close()
+
+
+def test_revision_without_date_lowers_confidence():
+    doc, page = _page(FULL_ROWS, revs=[("A", "10/02/2025")])
+    _, complete = extract_from_text_layer(page, LEGENDA)
+    doc.close()
+
+    doc, page = _page(FULL_ROWS, revs=[("A", "10/02/2025"), ("B", "")])
+    data, incomplete = extract_from_text_layer(page, LEGENDA)
+    doc.close()
+
+    assert data["REV_B"] == "B" and data["DATA_B"] == ""
+    assert incomplete == pytest.approx(complete - 0.1)
+
+
+def test_number_only_is_below_threshold():
+    doc, page = _page([("Nº DESENHO", "EST-007")], revs=None)
+    data, confidence = extract_from_text_layer(page, LEGENDA)
+    assert data["NUM"] == "007"
+    assert confidence == pytest.approx(0.4)
+    assert confidence < DEFAULT_MIN_CONFIDENCE
+    doc.close()
+
+
+def test_inline_label_and_value():
+    doc, page = _page([("Nº DESENHO", "EST-002")], revs=None, inline=["CLIENTE: arcaya"])
+    data, _ = extract_from_text_layer(page, LEGENDA)
+    assert data["CLIENTE"] == "arcaya"
+    doc.close()
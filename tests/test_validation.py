@@ -0,0 +1,159 @@
+import numpy as np
+import pandas as pd
+import pytest
+
+from jsj_validation import (
+    AVISO, ERRO, OK, RULES, describe_issues, extracted_to_row, validate_extracted_data, validate_records,
+    validation_status,
+)
+
+
+def _df(*rows):
+    base = {"DES_NUM": "EST-001", "TITULO": "Planta piso 1", "DATA": "10/01/2025"}
+    return pd.DataFrame([{**base, **row} for row in rows], index=range(10, 10 + len(rows)))
+
+
+def test_clean_list_has_no_issues():
+    df = _df({"DES_NUM": "EST-001", "REV_A": "A", "DATA_A": "11/01/2025"}, {"DES_NUM": "EST-002"})
+    matrix = validate_records(df)
+
+    assert list(matrix.columns) == RULES
+    assert list(matrix.index) == [10, 11]
+    assert matrix.dtypes.eq(np.int8).all()
+    assert (validation_status(matrix) == OK).all()
+    assert describe_issues(df, matrix) == {}
+
+
+@pytest.mark.parametrize("row, rule, severity", [
+    ({"DES_NUM": ""}, "DES_NUM", ERRO),
+    ({"DES_NUM": "erro_json"}, "DES_NUM", ERRO),
+    ({"DES_NUM": "E1"}, "DES_NUM", AVISO),
+    ({"TITULO": "Sem título"}, "TITULO", AVISO),
+    ({"TITULO": "ab"}, "TITULO", AVISO),
+    ({"DATA": "2025-01-10"}, "DATA", ERRO),
+    ({"DATA": "32/01/2025"}, "DATA", ERRO),
+    ({"DATA": "ilegível"}, "DATA", AVISO),
+    ({"DATA": ""}, "DATA", AVISO),
+    ({"DATA": "10/01/1999"}, "DATA", AVISO),
+    ({"DATA_B": "01.2.2025", "REV_A": "A", "REV_B": "B"}, "DATA_B", OK),
+    ({"DATA_B": "1/2/2025", "REV_A": "A", "REV_B": "B"}, "DATA_B", ERRO),
+    ({"DATA_B": "fev 2025"}, "DATA_B", ERRO),
+    ({"REV_A": "a"}, "REV_A", AVISO),
+    ({"REV_A": "AB"}, "REV_A", ERRO),
+    ({"REV_A": "0"}, "REV_A", OK),
+])
+def test_single_rules(row, rule, severity):
+    matrix = validate_records(_df(row))
+    assert matrix.at[10, rule] == severity
+
+
+def test_missing_values_are_empty():
+    df = pd.DataFrame({"DES_NUM": ["EST-001", None], "TITULO": ["Planta", np.nan]})
+    matrix = validate_records(df)
+    assert matrix["DES_NUM"].tolist() == [OK, ERRO]
+    assert matrix["TITULO"].tolist() == [OK, AVISO]
+    # Sem coluna DATA: data em falta em todos os registos
+    assert matrix["DATA"].tolist() == [AVISO, AVISO]
+
+
+def test_duplicates_ignore_case_and_placeholders():
+    df = _df({"DES_NUM": "EST-001"}, {"DES_NUM": "est-001"}, {"DES_NUM": "EST-002"}, {"DES_NUM": ""}, {"DES_NUM": ""})
+    matrix = validate_records(df)
+    assert matrix["DES_NUM_DUP"].tolist() == [ERRO, ERRO, OK, OK, OK]
+    assert matrix["DES_NUM"].tolist() == [OK, OK, OK, ERRO, ERRO]
+
+
+def test_revision_dates_going_backwards():
+    df = _df(
+        {"REV_A": "A", "DATA_A": "10/02/2025", "REV_B": "B", "DATA_B": "10/03/2025"},
+        {"REV_A": "A", "DATA_A": "10/03/2025", "REV_B": "B", "DATA_B": "10/02/2025"},
+        {"DATA": "10/05/2025", "REV_A": "A", "DATA_A": "10/02/2025"},
+    )
+    assert validate_records(df)["REV_ORDEM"].tolist() == [OK, ERRO, ERRO]
+
+
+def test_revision_gaps():
+    df = _df({"REV_A": "A", "REV_C": "C"}, {"REV_B": "B"}, {"REV_A": "A", "REV_B": "B"})
+    assert validate_records(df)["REV_ORDEM"].tolist() == [AVISO, AVISO, OK]
+
+
+def test_status_and_messages():
+    df = _df({}, {"DES_NUM": "E1", "DATA": "x", "REV_B": "b"})
+    matrix = validate_records(df)
+    assert validation_status(matrix).tolist() == [OK, ERRO]
+
+    errors, warnings = describe_issues(df, matrix)[11]
+    assert errors == ["Formato de data inválido: 'x' (esperado DD/MM/YYYY)"]
+    assert "Número de desenho muito curto: 'E1'" in warnings
+    assert "REV_B: Revisão em minúscula: 'b'" in warnings
+    assert "Tabela de revisões com linhas em falta" in warnings
+
+
+def test_validation_status_of_empty_matrix():
+    assert validation_status(pd.DataFrame(index=[1, 2])).tolist() == [OK, OK]
+
+
+# --- Uma folha (resposta da IA) ---
+
+def test_prompt_keys_are_validated():
+    data = {"PFIX": "EST", "NUM": "001", "TITULO": "Planta piso 1", "DATA": "10/01/2025", "R": "A",
+            "REV_A": "A", "DATA_A": "11/01/2025"}
+    assert extracted_to_row(data)["DES_NUM"] == "EST-001"
+    assert validate_extracted_data(data) == (True, [], [])
+
+
+def test_prompt_keys_with_problems():
+    # Com as chaves do prompt (maiúsculas) as regras aplicam-se aos valores reais,
+    # não a campos em minúsculas inexistentes
+    data = {"NUM": "", "TITULO": "Planta piso 1", "DATA": "2025-01-10", "R": "a"}
+    is_valid, errors, warnings = validate_extracted_data(data)
+    assert not is_valid
+    assert "Número de desenho vazio ou inválido" in errors
+    assert "Formato de data inválido: '2025-01-10' (esperado DD/MM/YYYY)" in errors
+    assert "Revisão em minúscula: 'a' (esperado maiúscula)" in warnings
+
+
+def test_single_sheet_keeps_the_baseline_rules():
+    base = {"NUM": "EST-001", "TITULO": "Planta piso 1", "DATA": "10/01/2025", "R": "A"}
+
+    _, _, warnings = validate_extracted_data({**base, "R": ""})
+    assert warnings == ["Revisão vazia"]
+    _, _, warnings = validate_extracted_data({**base, "DATA": ""})
+    assert warnings == ["Data vazia"]
+
+    assert validate_extracted_data({**base, "DATA": "1/12/2025"}) == (True, [], [])
+    assert validate_extracted_data({**base, "DATA": "1/2/2025"})[1] == [
+        "Formato de data inválido: '1/2/2025' (esperado DD/MM/YYYY)"
+    ]
+    assert validate_extracted_data({**base, "DATA": "01/13/2025"})[1] == ["Mês inválido: 13"]
+    assert validate_extracted_data({**base, "DATA": "32/01/2025"})[1] == ["Dia inválido: 32"]
+    assert validate_extracted_data({**base, "DATA": "10/01/1999"})[2] == ["Ano fora do range esperado: 1999"]
+    assert validate_extracted_data({**base, "TITULO": ""})[2] == ["Título vazio"]
+
+
+def test_single_sheet_log_levels(caplog):
+    caplog.set_level("INFO", logger="jsj_validation")
+    validate_extracted_data({"NUM": "", "TITULO": "Planta", "DATA": "", "R": "A"}, "folha.pdf")
+    levels = {record.levelname for record in caplog.records}
+    assert levels == {"ERROR", "WARNING"}
+
+
+def test_legacy_lowercase_keys():
+    data = {"num_desenho": "EST-001", "titulo": "Planta piso 1", "data": "10/01/2025", "revisao": "B"}
+    assert validate_extracted_data(data) == (True, [], [])
+
+    is_valid, errors, _ = validate_extracted_data({**data, "revisao": "B1"})
+    assert not is_valid
+    assert errors == ["Revisão inválida: 'B1' (esperado letra A-Z ou '0')"]
+
+
+def test_error_reported_by_the_model():
+    data = {"num_desenho": "ERRO", "titulo": "folha.pdf", "data": "??/??/????", "error": "Falha IA"}
+    is_valid, errors, _ = validate_extracted_data(data)
+    assert not is_valid
+    assert "IA reportou erro: Falha IA" in errors
+
+
+def test_single_sheet_has_no_duplicate_rule():
+    _, errors, warnings = validate_extracted_data({"NUM": "001", "TITULO": "Planta", "DATA": "10/01/2025"})
+    assert not any("repetido" in message for message in errors + warnings)